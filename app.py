@@ -21,6 +21,7 @@ from blueprints.jwxt import bp as jwxt_bp
 from blueprints.stats import bp as stats_bp
 from blueprints.student_portal import student_portal_bp
 from config import Config
+from utils.file_store import HashingRequest
 from database import Database
 
 socketio = SocketIO()
@@ -29,6 +30,8 @@ socketio = SocketIO()
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    # 上传文件在 multipart 解析时边写边算哈希（见 utils/file_store.py）
+    app.request_class = HashingRequest
 
     # ---------------------------------------------------------
     # 【2】在此处重新注册模板过滤器 (Template Filters)
@@ -114,14 +117,14 @@ def create_app():
     # except Exception as e:
     #     print(f"Startup Warning (Export Templates): {e}")
 
-    # 3. 清理旧的 AI 欢迎语记录 (30 天以上)
-    try:
-        from blueprints.ai_welcome import cleanup_old_welcome_messages
-        cleaned = cleanup_old_welcome_messages(days=30)
-        if cleaned > 0:
-            print(f"[Startup] Cleaned {cleaned} old AI welcome records.")
-    except Exception as e:
-        print(f"Startup Warning (AI cleanup): {e}")
+    # 3. 启动后台维护调度器（清理旧记录、ANALYZE、VACUUM、计数器校验、批改核心目录对齐、仓库布局迁移
+    #    等按周期在后台执行，启动时不运行）
+    if Config.MAINTENANCE_ENABLED:
+        try:
+            from services.maintenance_service import get_maintenance_scheduler
+            get_maintenance_scheduler().start()
+        except Exception as e:
+            print(f"Startup Warning (Maintenance): {e}")
 
     # 4. 注册蓝图
     app.register_blueprint(admin_bp)
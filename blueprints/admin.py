@@ -2,7 +2,17 @@ import functools
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, g
 
+from config import Config
 from extensions import db
+from grading_core.factory import GraderFactory
+from services import library_index, storage_gc
+from services.archive_service import ArchiveService
+from services.maintenance_service import get_maintenance_scheduler
+from services.notification_bus import get_notification_bus
+from services.parse_pipeline import get_parse_pipeline
+from services.rate_limiter import get_rate_limiter
+from services.welcome_refresher import get_welcome_refresher
+from utils.file_converter import get_office_converter
 
 # url_prefix 设置为 /admin，所有路由自动加上 /admin
 bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -189,3 +199,139 @@ def delete_model(m_id):
 def toggle_model(m_id, state):
     db.toggle_model(m_id, bool(state))
     return redirect(url_for('admin.dashboard'))
+
+
+# --- 数据库运行状态 ---
+
+@bp.route('/api/db_pool_stats')
+@admin_required
+def db_pool_stats():
+    """只读连接池利用率（借出次数、等待次数/时长、峰值占用）"""
+    return jsonify(db.get_reader_pool_stats())
+
+
+@bp.route('/api/counters/reconcile', methods=['POST'])
+@admin_required
+def reconcile_counters():
+    """校验物化计数器与真实 COUNT 是否一致；repair=false 时只报告偏差"""
+    data = request.get_json(silent=True) or {}
+    repair = str(data.get('repair', True)).lower() not in ('false', '0')
+    drift = db.reconcile_counters(repair=repair)
+    return jsonify({'status': 'success', 'repaired': repair and bool(drift), 'drift': drift})
+
+
+@bp.route('/api/notification_bus/stats', methods=['GET'])
+@admin_required
+def notification_bus_stats():
+    """通知合并总线：最近各任务通知的发布次数与实际写库次数"""
+    return jsonify(get_notification_bus().get_stats())
+
+
+@bp.route('/api/rate_limiter/stats', methods=['GET'])
+@admin_required
+def rate_limiter_stats():
+    """AI 触发限流：判定次数、拒绝次数与判定耗时"""
+    return jsonify(get_rate_limiter().get_stats())
+
+
+@bp.route('/api/welcome_refresher/stats', methods=['GET'])
+@admin_required
+def welcome_refresher_stats():
+    """欢迎语预生成：进入页面的缓存命中率、预生成次数与当日 token 用量"""
+    return jsonify(get_welcome_refresher().get_stats())
+
+
+@bp.route('/api/parse_pipeline/stats', methods=['GET'])
+@admin_required
+def parse_pipeline_stats():
+    """文档解析流水线：本进程未完成任务数与各阶段排队数"""
+    return jsonify(get_parse_pipeline().get_stats())
+
+
+@bp.route('/api/office_converter/stats', methods=['GET'])
+@admin_required
+def office_converter_stats():
+    """Office 转 PDF：缓存命中、转换/失败/超时次数与 p50/p95 耗时"""
+    return jsonify(get_office_converter().get_stats())
+
+
+@bp.route('/api/library_index/stats', methods=['GET'])
+@admin_required
+def library_index_stats():
+    """文档库检索索引：已建索引的文件数、片段数、分词器与待重建队列"""
+    return jsonify(library_index.get_stats())
+
+
+@bp.route('/api/maintenance', methods=['GET'])
+@admin_required
+def maintenance_status():
+    """后台维护任务：下次运行时间、锁状态与最近运行记录"""
+    return jsonify(get_maintenance_scheduler().get_status())
+
+
+@bp.route('/api/maintenance/<name>/run', methods=['POST'])
+@admin_required
+def run_maintenance_job(name):
+    """立即执行一个维护任务（任务正在其他进程执行时返回 409）"""
+    if name not in Config.MAINTENANCE_JOBS:
+        return jsonify({'status': 'error', 'msg': '未知的维护任务'}), 404
+    result = get_maintenance_scheduler().run_job(name, force=True)
+    if result is None:
+        return jsonify({'status': 'error', 'msg': '任务正在执行中'}), 409
+    return jsonify({'status': 'success', 'run': result})
+
+
+@bp.route('/api/db/incremental_vacuum', methods=['POST'])
+@admin_required
+def enable_incremental_vacuum():
+    """旧库一次性切换为增量回收（完整 VACUUM，期间阻塞写入，请在低峰期执行）"""
+    return jsonify({'status': 'success', 'report': db.enable_incremental_vacuum()})
+
+
+@bp.route('/api/storage', methods=['GET'])
+@admin_required
+def storage_usage():
+    """磁盘用量（按存储类别、班级、用户）及当前可回收量，只统计不删除"""
+    return jsonify(storage_gc.collect(dry_run=True))
+
+
+@bp.route('/api/storage/gc', methods=['POST'])
+@admin_required
+def run_storage_gc():
+    """立即执行存储回收；dry_run=true 时只报告将要回收的文件"""
+    data = request.get_json(silent=True) or {}
+    dry_run = str(data.get('dry_run', False)).lower() in ('true', '1')
+    return jsonify({'status': 'success', 'report': storage_gc.collect(dry_run=dry_run)})
+
+
+@bp.route('/api/grader_catalog/check', methods=['POST'])
+@admin_required
+def check_grader_catalog():
+    """校验批改核心目录与磁盘文件是否一致；repair=false 时只报告差异"""
+    data = request.get_json(silent=True) or {}
+    repair = str(data.get('repair', True)).lower() not in ('false', '0')
+    return jsonify({'status': 'success', 'report': GraderFactory.check_catalog(repair=repair)})
+
+
+# --- 学年冷数据归档 ---
+
+@bp.route('/api/archive', methods=['GET'])
+@admin_required
+def archive_status():
+    """可归档学年及历史归档记录"""
+    service = ArchiveService(db)
+    return jsonify({'years': service.candidate_years(), 'runs': service.get_runs()})
+
+
+@bp.route('/api/archive', methods=['POST'])
+@admin_required
+def archive_run():
+    """将已结束学年迁移到归档库，返回迁移行数与归档前后的库大小/查询耗时对比"""
+    data = request.get_json(silent=True) or {}
+    academic_year = data.get('academic_year') or request.form.get('academic_year')
+    vacuum = str(data.get('vacuum', True)).lower() not in ('false', '0')
+    try:
+        report = ArchiveService(db).archive_year(academic_year, vacuum=vacuum)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'msg': str(e)}), 400
+    return jsonify({'status': 'success', 'report': report})
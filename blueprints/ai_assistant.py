@@ -6,18 +6,23 @@ AI 助手蓝图
 Feature: 002-global-ai-assistant
 """
 
-import asyncio
 import logging
+import time
+
 from flask import Blueprint, jsonify, request, g
 
 from extensions import db
+from services.ai_context_service import ConversationContextManager, estimate_tokens
 from services.ai_conversation_service import AIConversationService
+from services.rate_limiter import get_rate_limiter
+from utils.async_runner import run_async
 
 bp = Blueprint('ai_assistant', __name__)
 logger = logging.getLogger(__name__)
 
 # 初始化服务
 _conversation_service = None
+_context_manager = None
 
 
 def get_conversation_service() -> AIConversationService:
@@ -28,6 +33,14 @@ def get_conversation_service() -> AIConversationService:
     return _conversation_service
 
 
+def get_context_manager() -> ConversationContextManager:
+    """获取对话上下文管理器（懒加载）"""
+    global _context_manager
+    if _context_manager is None:
+        _context_manager = ConversationContextManager(get_conversation_service())
+    return _context_manager
+
+
 def require_login():
     """检查用户是否登录"""
     if 'user' not in g or not g.user:
@@ -218,23 +231,34 @@ def send_message(conversation_id: int):
         # 调用 AI 生成回复
         try:
             from services.ai_content_service import call_ai_for_conversation
+            from services.ai_prompts import get_conversation_system_prompt
 
-            # 获取最近消息作为上下文
-            recent_messages = service.get_recent_messages(conversation_id, limit=10)
+            # 滚动摘要 + token 预算内的最近消息作为上下文
+            context_manager = get_context_manager()
+            context = context_manager.build(conversation_id)
 
             # 调用 AI
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                ai_response = loop.run_until_complete(
-                    call_ai_for_conversation(
-                        user_info=g.user,
-                        messages=recent_messages,
-                        page_context=page_context
-                    )
+            started = time.perf_counter()
+            ai_response = run_async(
+                call_ai_for_conversation(
+                    user_info=g.user,
+                    messages=context['messages'],
+                    page_context=page_context,
+                    summary=context['summary']
                 )
-            finally:
-                loop.close()
+            )
+            latency_ms = int((time.perf_counter() - started) * 1000)
+
+            # 记录本轮提示词规模与耗时
+            system_prompt = get_conversation_system_prompt(
+                g.user.get('username', '老师'), page_context, context['summary'])
+            metadata = {
+                'prompt_tokens': estimate_tokens(system_prompt) + context['history_tokens'],
+                'context_messages': len(context['messages']),
+                'latency_ms': latency_ms,
+            }
+            if page_context:
+                metadata['page_context'] = page_context
 
             # 保存 AI 回复
             assistant_message = service.add_message(
@@ -242,11 +266,11 @@ def send_message(conversation_id: int):
                 role='assistant',
                 content=ai_response,
                 trigger_type='user_message',
-                metadata={'page_context': page_context} if page_context else None
+                metadata=metadata
             )
 
-            # 强制执行消息限制
-            service.enforce_message_limit(conversation_id, max_messages=100)
+            # 较早消息折叠进摘要、压缩消息数均在后台进行
+            context_manager.schedule_compaction(conversation_id, context)
 
         except Exception as ai_error:
             logger.error(f"AI 调用失败: {ai_error}")
@@ -331,8 +355,8 @@ def trigger_page_change():
     try:
         service = get_conversation_service()
 
-        # 检查速率限制
-        allowed, remaining = service.check_rate_limit(user_id, cooldown_seconds=60)
+        # 检查速率限制（令牌桶判定，放行即已扣除）
+        allowed, remaining = get_rate_limiter().acquire('assistant_proactive', user_id)
 
         if not allowed:
             return jsonify({
@@ -344,9 +368,6 @@ def trigger_page_change():
                 }
             })
 
-        # 更新速率限制
-        service.update_rate_limit(user_id)
-
         # 获取或创建活跃对话
         conversation = service.get_active_conversation(user_id)
 
@@ -354,17 +375,12 @@ def trigger_page_change():
         try:
             from services.ai_content_service import generate_page_greeting
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                greeting = loop.run_until_complete(
-                    generate_page_greeting(
-                        user_info=g.user,
-                        page_context=page_context
-                    )
+            greeting = run_async(
+                generate_page_greeting(
+                    user_info=g.user,
+                    page_context=page_context
                 )
-            finally:
-                loop.close()
+            )
 
             # 保存问候消息
             message = service.add_message(
@@ -433,8 +449,8 @@ def trigger_operation():
     try:
         service = get_conversation_service()
 
-        # 检查速率限制
-        allowed, remaining = service.check_rate_limit(user_id, cooldown_seconds=60)
+        # 检查速率限制（令牌桶判定，放行即已扣除）
+        allowed, remaining = get_rate_limiter().acquire('assistant_proactive', user_id)
 
         if not allowed:
             return jsonify({
@@ -446,9 +462,6 @@ def trigger_operation():
                 }
             })
 
-        # 更新速率限制
-        service.update_rate_limit(user_id)
-
         # 获取或创建活跃对话
         conversation = service.get_active_conversation(user_id)
 
@@ -456,19 +469,14 @@ def trigger_operation():
         try:
             from services.ai_content_service import generate_operation_feedback
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                feedback = loop.run_until_complete(
-                    generate_operation_feedback(
-                        user_info=g.user,
-                        operation_type=operation_type,
-                        operation_result=operation_result,
-                        details=operation_details
-                    )
+            feedback = run_async(
+                generate_operation_feedback(
+                    user_info=g.user,
+                    operation_type=operation_type,
+                    operation_result=operation_result,
+                    details=operation_details
                 )
-            finally:
-                loop.close()
+            )
 
             # 保存反馈消息
             message = service.add_message(
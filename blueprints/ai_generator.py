@@ -12,7 +12,7 @@ from grading_core.direct_grader_template import DIRECT_GRADER_TEMPLATE
 from grading_core.factory import GraderFactory
 from services.ai_service import AiService
 from services.file_service import FileService
-from utils.common import calculate_file_hash
+from utils.file_store import file_hash_of
 
 bp = Blueprint('ai_gen', __name__)
 
@@ -31,7 +31,6 @@ def ai_generator_page():
 @bp.route('/ai_core_list')
 def ai_core_list_page():
     """批改核心列表页面 - 显示所有核心和任务状态"""
-    GraderFactory.load_graders()
     strategies = GraderFactory.get_all_strategies()
     display_list = []
 
@@ -151,6 +150,9 @@ def create_task():
     _, exam_text = FileService.extract_text_from_file(exam_path)
     _, std_text = FileService.extract_text_from_file(std_path)
 
+    # 试卷与标准已整篇放入提示词，检索同课程资料时排除
+    source_ids = [r['id'] for r in (db.get_file_by_hash(file_hash_of(p)) for p in (exam_path, std_path)) if r]
+
     user_id = g.user['id']
     task_id = db.insert_ai_task(name, "pending", "提交中...", exam_path, std_path, strictness, extra_desc, max_score,
                                 user_id, course_name, extra_prompt)
@@ -161,7 +163,8 @@ def create_task():
     # 启动线程
     app_config = current_app.config
     t = threading.Thread(target=AiService.generate_grader_worker,
-                         args=(task_id, exam_text, std_text, strictness, extra_desc, extra_prompt, max_score, app_config, course_name, user_id, name))
+                         args=(task_id, exam_text, std_text, strictness, extra_desc, extra_prompt, max_score, app_config, course_name, user_id, name),
+                         kwargs={'exclude_file_ids': source_ids})
     t.start()
 
     # 刷新 AI 欢迎语缓存
@@ -252,6 +255,7 @@ def delete_grader():
                 g_cls = GraderFactory._graders.get(grader_id)
                 name = g_cls.NAME if g_cls else (task.get('name') or grader_id)
                 db.recycle_grader_record(grader_id, name, backup_name)
+                GraderFactory.catalog_remove(grader_id)
             except Exception as e:
                 print(f"[Delete Error] Move file failed: {e}")
 
@@ -283,16 +287,12 @@ def create_direct_grader():
         return jsonify({"msg": "课程名称不能为空"}), 400
 
     # 复用 FileService
-    exam_path, _ = FileService.handle_file_upload_or_reuse(f_exam, request.form.get('exam_file_id'), g.user['id'])
-    std_path, _ = FileService.handle_file_upload_or_reuse(f_std, request.form.get('standard_file_id'), g.user['id'])
+    ex_rec = FileService.resolve_file_record(f_exam, request.form.get('exam_file_id'), g.user['id'])
+    std_rec = FileService.resolve_file_record(f_std, request.form.get('standard_file_id'), g.user['id'])
 
-    if not exam_path or not std_path: return jsonify({"msg": "文件缺失"}), 400
+    if not ex_rec or not std_rec: return jsonify({"msg": "文件缺失"}), 400
 
     # 智能解析
-    with open(exam_path, 'rb') as f:
-        ex_rec = db.get_file_by_hash(calculate_file_hash(f))
-    with open(std_path, 'rb') as f:
-        std_rec = db.get_file_by_hash(calculate_file_hash(f))
 
     _, p_exam, _ = AiService.smart_parse_content(ex_rec['id'])
     _, p_std, _ = AiService.smart_parse_content(std_rec['id'])
@@ -318,6 +318,7 @@ def create_direct_grader():
     db.insert_ai_task(name, 'success', 'Direct Created', exam_path, std_path, 'direct', '', 0, g.user['id'], grader_id, course_name)
     GraderFactory._loaded = False
     GraderFactory.load_graders()
+    GraderFactory.catalog_register(grader_id)
 
     # 刷新 AI 欢迎语缓存
     try:
@@ -14,9 +14,13 @@ from extensions import db
 from services.ai_conversation_service import AIConversationService
 from services.ai_content_service import (
     generate_welcome_message,
+    get_cached_message,
     get_fallback_message_sync
 )
 from services.ai_prompts import get_conversation_system_prompt
+from services.rate_limiter import get_rate_limiter
+from services.welcome_refresher import get_welcome_refresher
+from utils.async_runner import run_async
 from ai_utils.ai_helper import call_ai_platform_chat
 
 bp = Blueprint('ai_welcome', __name__)
@@ -24,54 +28,15 @@ logger = logging.getLogger(__name__)
 
 
 def get_user_stats(user_id: int) -> dict:
-    """获取用户统计数据 (用于填充 Prompt)"""
-    conn = db.get_connection()
-
-    # 获取班级数
-    class_count_row = conn.execute(
-        'SELECT COUNT(*) as count FROM classes WHERE created_by=?',
-        (user_id,)
-    ).fetchone()
-    class_count = class_count_row['count'] if class_count_row else 0
-
-    # 获取学生总数
-    student_count_row = conn.execute('''
-                                     SELECT COUNT(DISTINCT s.student_id) as count
-                                     FROM students s
-                                              JOIN classes c ON s.class_id = c.id
-                                     WHERE c.created_by = ?
-                                     ''', (user_id,)).fetchone()
-    student_count = student_count_row['count'] if student_count_row else 0
-
-    # 获取评分核心数
-    grader_count_row = conn.execute(
-        'SELECT COUNT(*) as count FROM ai_tasks WHERE created_by=? AND grader_id IS NOT NULL',
-        (user_id,)
-    ).fetchone()
-    grader_count = grader_count_row['count'] if grader_count_row else 0
-
-    # 获取待处理任务数
-    pending_count_row = conn.execute('''
-                                     SELECT COUNT(*) as count
-                                     FROM ai_tasks
-                                     WHERE created_by = ?
-                                       AND status IN ('pending', 'processing')
-                                     ''', (user_id,)).fetchone()
-    pending_count = pending_count_row['count'] if pending_count_row else 0
-
-    # 获取已上传文件数
-    file_count_row = conn.execute(
-        'SELECT COUNT(*) as count FROM file_assets WHERE uploaded_by=?',
-        (user_id,)
-    ).fetchone()
-    file_count = file_count_row['count'] if file_count_row else 0
+    """获取用户统计数据 (用于填充 Prompt)，读取物化计数器而非逐项 COUNT"""
+    counters = db.get_user_counters(user_id)
 
     return {
-        'class_count': class_count,
-        'student_count': student_count,
-        'grader_count': grader_count,
-        'pending_task_count': pending_count,
-        'file_count': file_count
+        'class_count': counters['classes'],
+        'student_count': counters['students'],
+        'grader_count': counters['graders'],
+        'pending_task_count': counters['pending_tasks'],
+        'file_count': counters['files']
     }
 
 
@@ -121,13 +86,19 @@ def get_welcome_message():
     trigger_type = data.get('trigger_type', 'timer')
     action_details = data.get('action_details', '')
 
-    # 初始化服务
-    conversation_service = AIConversationService(db)
+    # 0. 进入页面：登记活跃以便后台预生成，并直接使用缓存（不占用速率限制）
+    if action_details == 'page_enter':
+        refresher = get_welcome_refresher()
+        refresher.touch(user_id, page_context, g.user)
+        cached = get_cached_message(user_id, page_context)
+        refresher.record_lookup(cached is not None)
+        if cached:
+            return jsonify({'status': 'success', 'data': cached.to_dict()})
 
-    # 1. 速率限制检查
-    # Timer 触发：60秒冷却；Action 触发：10秒冷却
-    cooldown = 60 if trigger_type == 'timer' else 10
-    allowed, remaining = conversation_service.check_rate_limit(user_id, cooldown_seconds=cooldown)
+    # 1. 速率限制检查 (Token消耗控制)
+    # Timer 触发：每分钟 1 次；Action 触发：每 10 秒 1 次
+    limit_name = 'welcome_timer' if trigger_type == 'timer' else 'welcome_action'
+    allowed, remaining = get_rate_limiter().acquire(limit_name, user_id)
 
     if not allowed:
         return jsonify({'status': 'silence', 'message': f'Rate limited. Try again in {remaining}s'})
@@ -137,32 +108,24 @@ def get_welcome_message():
         stats = get_user_stats(user_id)
         recent_actions = get_recent_actions(user_id)
 
-        # 记录本次触发时间 (Token消耗控制)
-        conversation_service.update_rate_limit(user_id)
-
         # 2. 调用 AI 生成
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            extra_context = {
-                "trigger_reason": trigger_type,
-                "action_details": action_details,
-                "last_action_desc": recent_actions[0] if recent_actions else "无"
-            }
-
-            message, status = loop.run_until_complete(
-                generate_welcome_message(
-                    user_id=user_id,
-                    page_context=page_context,
-                    user_info=g.user,
-                    stats=stats,
-                    recent_actions=recent_actions,
-                    force_refresh=True,  # 主动触发强制刷新
-                    extra_context=extra_context
-                )
+        extra_context = {
+            "trigger_reason": trigger_type,
+            "action_details": action_details,
+            "last_action_desc": recent_actions[0] if recent_actions else "无"
+        }
+
+        message, status = run_async(
+            generate_welcome_message(
+                user_id=user_id,
+                page_context=page_context,
+                user_info=g.user,
+                stats=stats,
+                recent_actions=recent_actions,
+                force_refresh=True,  # 主动触发强制刷新
+                extra_context=extra_context
             )
-        finally:
-            loop.close()
+        )
 
         if message:
             return jsonify({
@@ -309,15 +272,11 @@ def cleanup_old_welcome_messages(days: int = 30) -> int:
         ''', (cutoff_date,))
         welcome_count = cursor.rowcount
 
-        # 清理 ai_rate_limits 表中的旧记录
-        cursor.execute('''
-            DELETE FROM ai_rate_limits
-            WHERE last_proactive_trigger < ?
-        ''', (cutoff_date,))
-        rate_count = cursor.rowcount
-
         conn.commit()
 
+        # 清理长期未变化的限流令牌桶快照
+        rate_count = db.cleanup_rate_limit_buckets((datetime.now() - timedelta(days=days)).timestamp())
+
         total = welcome_count + rate_count
         if total > 0:
             logger.info(f"[AI Welcome] 清理了 {welcome_count} 条欢迎语和 {rate_count} 条速率限制记录 (超过 {days} 天)")
@@ -10,6 +10,7 @@ from config import Config
 from extensions import db
 from export_core.filename_generator import get_export_filename
 from grading_core.factory import GraderFactory
+from services.class_analytics_service import ClassAnalyticsService
 from services.file_service import FileService
 from services.grading_service import GradingService
 from services.score_document_service import ScoreDocumentService
@@ -72,7 +73,6 @@ def new_class():
 
             return redirect(url_for('grading.grading_view', class_id=cid))
 
-    GraderFactory.load_graders()
     strategies = GraderFactory.get_all_strategies()
     return render_template('newClass.html', strategies=strategies, user=g.user)
 
@@ -113,7 +113,8 @@ def run_batch_grading(class_id):
     使用线程池并发处理学生作业，并发数由 ThreadPoolExecutor 控制（设为 8），
     实际 AI 请求并发数由 ai_concurrency_manager 根据数据库配置动态控制。
     """
-    students = db.get_students_with_grades(class_id)
+    # 只需要学号和姓名，投影后不再为每个学生携带成绩字段
+    students = list(db.iter_students_with_grades(class_id, ('student_id', 'name')))
 
     # 清空旧成绩
     db.clear_grades(class_id)
@@ -125,7 +126,7 @@ def run_batch_grading(class_id):
     # max_workers 设置为 8，可以允许一定的文件 IO 并发，
     # 而 AI 调用的并发上限会被 ai_concurrency_manager 里的 Semaphore 自动限制（例如 3）
     success_count = 0
-    with ThreadPoolExecutor(max_workers=8) as executor:
+    with GradingService.grading(class_id), ThreadPoolExecutor(max_workers=8) as executor:
         # 提交所有任务
         future_to_student = {
             executor.submit(GradingService.grade_single_student, class_id, s['student_id']): s
@@ -177,14 +178,13 @@ def upload_zips(class_id):
             uploaded_files.append(file.filename)
             count += 1
 
-    # 匹配学生文件
-    students = db.get_students_with_grades(class_id)
+    # 匹配学生文件（流式读取学号/姓名）
     matched_students = []
+    total_students = 0
 
     all_files = os.listdir(raw_dir) if os.path.exists(raw_dir) else []
-    for s in students:
-        student_id = s['student_id']
-        name = s['name']
+    for student_id, name in db.iter_students_with_grades(class_id, ('student_id', 'name'), as_tuple=True):
+        total_students += 1
         matched_file = None
         for f in all_files:
             if str(student_id) in f or name in f:
@@ -201,7 +201,7 @@ def upload_zips(class_id):
         "msg": f"上传 {count} 个文件成功",
         "count": count,
         "matched_count": len(matched_students),
-        "total_students": len(students),
+        "total_students": total_students,
         "matched_students": matched_students
     })
 
@@ -216,32 +216,29 @@ def api_file_matches(class_id):
     ws_path = FileService.get_real_workspace_path(class_id)
     raw_dir = os.path.join(ws_path, 'raw_zips')
 
-    students = db.get_students_with_grades(class_id)
     matched_students = []
-    total_files = 0
-
-    if os.path.exists(raw_dir):
-        all_files = os.listdir(raw_dir)
-        total_files = len(all_files)
-        for s in students:
-            student_id = s['student_id']
-            name = s['name']
-            matched_file = None
-            for f in all_files:
-                if str(student_id) in f or name in f:
-                    matched_file = f
-                    break
-            if matched_file:
-                matched_students.append({
-                    'student_id': student_id,
-                    'name': name,
-                    'filename': matched_file
-                })
+    total_students = 0
+
+    all_files = os.listdir(raw_dir) if os.path.exists(raw_dir) else []
+    total_files = len(all_files)
+    for student_id, name in db.iter_students_with_grades(class_id, ('student_id', 'name'), as_tuple=True):
+        total_students += 1
+        matched_file = None
+        for f in all_files:
+            if str(student_id) in f or name in f:
+                matched_file = f
+                break
+        if matched_file:
+            matched_students.append({
+                'student_id': student_id,
+                'name': name,
+                'filename': matched_file
+            })
 
     return jsonify({
         "count": total_files,
         "matched_count": len(matched_students),
-        "total_students": len(students),
+        "total_students": total_students,
         "matched_students": matched_students
     })
 
@@ -276,6 +273,9 @@ def student_detail(class_id, student_id):
             pass
         return tree
 
+    if not os.path.exists(extract_path):
+        # 解压目录可能已被存储回收清理，按需从原始提交重新解压
+        GradingService.restore_extracted(class_id, student_id)
     file_tree = get_file_tree(extract_path) if os.path.exists(extract_path) else []
 
     zip_info = {"name": "未提交", "size": 0}
@@ -304,6 +304,8 @@ def preview_file(class_id, student_id):
     if not full_path.startswith(os.path.abspath(base_dir)):
         return jsonify({"msg": "Illegal path access"}), 403
 
+    if not os.path.exists(base_dir):
+        GradingService.restore_extracted(class_id, student_id)
     if not os.path.exists(full_path): return jsonify({"msg": "File not found"}), 404
     if os.path.isdir(full_path): return jsonify({"msg": "Cannot preview directory"}), 400
 
@@ -345,50 +347,24 @@ def export_excel(class_id):
     # 检查是否使用 AI 生成文件名
     use_ai = request.args.get('use_ai', '0') == '1'
 
-    # 确保 import json (已在头部添加)
-    with db.get_connection() as conn:
-        students_data = conn.execute('''
-                                     SELECT s.student_id,
-                                            s.name,
-                                            g.total_score,
-                                            g.score_details,
-                                            g.deduct_details,
-                                            g.filename
-                                     FROM students s
-                                              LEFT JOIN grades g ON s.student_id = g.student_id AND g.class_id = s.class_id
-                                     WHERE s.class_id = ?
-                                     ''', (class_id,)).fetchall()
-        cls = db.get_class_by_id(class_id)
-
+    cls = db.get_class_by_id(class_id)
     if not cls:
         return "班级不存在", 404
 
-    data_list = []
-    for row in students_data:
-        item = {
-            "学号": row['student_id'],
-            "姓名": row['name'],
-            "总分": row['total_score'] if row['total_score'] is not None else 0,
-            "扣分详情": row['deduct_details'],
-            "文件名": row['filename']
-        }
-        if row['score_details']:
-            try:
-                details = json.loads(row['score_details'])
-                for d in details:
-                    col_name = d.get('name', '未知项')
-                    item[col_name] = d.get('score', 0)
-            except:
-                pass
-        data_list.append(item)
+    # 分项成绩直接由 grade_items 透视得到，无需逐行解析 score_details JSON
+    # 透视结果以 tuple 流式读入 DataFrame，不再为每个学生构造中间 dict
+    item_columns, rows = db.iter_class_score_matrix(class_id, as_tuple=True)
+    dynamic_cols = [c['item_name'] for c in item_columns]
+    item_keys = [f'item_{i}' for i in range(len(item_columns))]
+
+    df = pd.DataFrame.from_records(rows, columns=list(db.SCORE_MATRIX_COLUMNS) + item_keys)
+    df['total_score'] = df['total_score'].fillna(0)
 
     # 构建 DataFrame
-    df = pd.DataFrame(data_list)
     fixed_cols = ['学号', '姓名']
     end_cols = ['总分', '扣分详情', '文件名']
-    dynamic_cols = [c for c in df.columns if c not in fixed_cols and c not in end_cols]
-    final_cols = fixed_cols + dynamic_cols + end_cols
-    df = df[final_cols]
+    df = df[['student_id', 'name'] + item_keys + ['total_score', 'deduct_details', 'filename']]
+    df.columns = fixed_cols + dynamic_cols + end_cols
 
     # === [改进] 智能文件名生成 ===
     # 使用新的文件名生成工具，支持完整的元数据和 AI 生成
@@ -417,8 +393,12 @@ def export_excel(class_id):
     print(f"[Export Excel] save_path: {save_path}")
     print(f"[Export Excel] send_file download_name: {download_filename}")
 
-    # 保存 Excel 文件
-    df.to_excel(save_path, index=False)
+    # 保存 Excel 文件（第二个工作表为题目分析）
+    analytics = ClassAnalyticsService.get_class_analytics(class_id)
+    with pd.ExcelWriter(save_path) as writer:
+        df.to_excel(writer, index=False)
+        if analytics['items']:
+            ClassAnalyticsService.to_dataframe(analytics).to_excel(writer, sheet_name='题目分析', index=False)
 
     # 返回文件（自动处理 Excel MIME type）
     return send_file(
@@ -440,6 +420,24 @@ def export_excel_with_ai(class_id):
     return export_excel(class_id)
 
 
+@bp.route('/api/class_analytics/<int:class_id>')
+def api_class_analytics(class_id):
+    """班级题目分析：各分项均分、中位数、标准差、及格率、分布、难度与区分度"""
+    cls = db.get_class_by_id(class_id)
+    if not cls or cls['created_by'] != g.user['id']:
+        return jsonify({"status": "error", "msg": "无权限访问"}), 403
+    return jsonify({"status": "success", "data": ClassAnalyticsService.get_class_analytics(class_id)})
+
+
+@bp.route('/api/dedup_stats/<int:class_id>')
+def api_dedup_stats(class_id):
+    """班级解压文件的去重统计：逻辑大小、实际占用与去重比"""
+    cls = db.get_class_by_id(class_id)
+    if not cls or cls['created_by'] != g.user['id']:
+        return jsonify({"status": "error", "msg": "无权限访问"}), 403
+    return jsonify({"status": "success", "data": GradingService.get_dedup_stats(class_id)})
+
+
 @bp.route('/api/export_to_library/<int:class_id>', methods=['POST'])
 def export_to_library(class_id):
     """导出成绩到文档库（Markdown格式）"""
@@ -1,4 +1,3 @@
-import asyncio
 import base64
 import json
 import mimetypes
@@ -8,17 +7,28 @@ import traceback
 import httpx
 from flask import Blueprint, render_template, request, jsonify, g, current_app
 
-from ai_utils.ai_helper import call_ai_platform_chat
+from config import Config
 from export_core.doc_config import DocumentTypeConfig
 from extensions import db
+from services import library_index
 from services.ai_service import AiService
+from services.ai_context_service import estimate_tokens
+from services.bulk_import_service import get_bulk_importer
 from services.file_service import FileService
+from services.parse_pipeline import ParseQueueFull, get_parse_pipeline
 # 确保这里正确导入了这两个函数
-from utils.common import calculate_file_hash, generate_title_from_content, create_text_asset, extract_title_and_content
+from utils.common import generate_title_from_content, create_text_asset
+from utils.file_store import as_hashing_upload
 
 bp = Blueprint('library', __name__)
 
 
+# ================= 辅助函数：解析任务响应 =================
+def _job_accepted(job_id, reused, **extra):
+    """解析任务已受理：202 + 任务 ID，前端轮询 /api/parse_jobs/<job_id>"""
+    return jsonify({"status": "accepted", "job_id": job_id, "reused": reused, **extra}), 202
+
+
 # ================= 辅助函数：数据清洗管道 =================
 def _clean_and_validate_students(raw_students):
     """
@@ -246,42 +256,22 @@ def parse_file_asset():
 
     file_name = f.filename.lower()
     try:
-        # 1. 保存/查重
-        path, _ = FileService.handle_file_upload_or_reuse(f, None, g.user['id'])
-        if not path: return jsonify({"msg": "文件保存失败"}), 400
-
-        # 2. 获取记录
-        with open(path, 'rb') as f_stream:
-            f_hash = calculate_file_hash(f_stream)
-        record = db.get_file_by_hash(f_hash)
+        # 1. 保存/查重（哈希在接收上传时已算出，直接得到记录）
+        record = FileService.save_upload(f, g.user['id'])
+        if not record: return jsonify({"msg": "文件保存失败"}), 400
 
-        # 3. 根据文档类型选择解析方法
+        # 2. 提交后台解析，立即返回任务 ID
         doc_type = request.form.get('doc_type')
-
+        pipeline = get_parse_pipeline()
         if doc_type == 'student_list':
             # 使用专门的学生名单解析函数
-            success, data, error_msg = AiService.parse_student_list_dedicated(record['id'], file_name)
-            if not success:
-                return jsonify({"msg": error_msg or "解析失败"}), 400
-
-            return jsonify({
-                "status": "success",
-                "file_id": record['id'],
-                "title": data.get('metadata', {}).get('class_name', record['original_name']),
-                "data": data
-            })
+            job_id, reused = pipeline.submit_student_list(record, file_name, g.user['id'])
         else:
             # 使用常规智能解析
-            success, content, meta = AiService.smart_parse_content(record['id'], doc_type)
-
-            if not success: return jsonify({"msg": content}), 400
-
-            return jsonify({
-                "status": "success",
-                "file_id": record['id'],
-                "title": record['original_name'],
-                "parsed_content": content
-            })
+            job_id, reused = pipeline.submit_file(record, doc_type, g.user['id'])
+        return _job_accepted(job_id, reused, file_id=record['id'], title=record['original_name'])
+    except ParseQueueFull as e:
+        return jsonify({"msg": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"msg": f"解析失败: {str(e)}"}), 500
@@ -322,7 +312,6 @@ def parse_and_save_pasted_document():
     if not content:
         return jsonify({"msg": "内容不能为空"}), 400
 
-    doc_label = "试卷" if doc_type == "exam" else "评分标准"
     standard_config = db.get_best_ai_config("standard") or db.get_best_ai_config("thinking")
 
     if not standard_config:
@@ -331,40 +320,11 @@ def parse_and_save_pasted_document():
         file_id, filename = create_text_asset(content, title, g.user['id'])
         return jsonify({"status": "success", "file_id": file_id, "title": filename, "msg": "未配置AI，已原样保存"})
 
-    # Prompt 要求返回 JSON
-    prompt = (
-        f"请对以下{doc_label}内容进行深度规整。\n"
-        "1. 去除无用的页眉页脚、乱码。\n"
-        "2. 将内容整理为清晰的 Standard Markdown 格式。\n"
-        "3. 根据文档类型和内容为文档起一个合理的标题。\n"
-        "4. **必须以纯 JSON 格式返回**，不要使用代码块标记，格式如下：\n"
-        "{\"title\": \"文档标题\", \"content\": \"Markdown格式的正文内容...\"}\n\n"
-        f"原始内容：\n{content}"
-    )
-
     try:
-        ai_text = asyncio.run(call_ai_platform_chat(
-            system_prompt="你是文档整理助手。你只输出 JSON。",
-            messages=[{"role": "user", "content": prompt}],
-            platform_config=standard_config
-        ))
-
-        # 使用增强版工具函数提取
-        title, normalized_content = extract_title_and_content(ai_text, doc_type)
-
-        if not normalized_content:
-            return jsonify({"msg": "AI 解析内容为空"}), 500
-
-        # [修复] 直接调用 common 模块函数
-        file_id, filename = create_text_asset(normalized_content, title, g.user['id'])
-
-        if not file_id:
-            return jsonify({"msg": "保存失败"}), 500
-
-        return jsonify({"status": "success", "file_id": file_id, "title": filename})
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"msg": f"解析保存失败: {str(e)}"}), 500
+        job_id, reused = get_parse_pipeline().submit_pasted(content, doc_type, g.user['id'], standard_config)
+        return _job_accepted(job_id, reused)
+    except ParseQueueFull as e:
+        return jsonify({"msg": str(e)}), 503
 
 
 @bp.route('/api/update_file_content', methods=['POST'])
@@ -543,19 +503,75 @@ def reparse_file():
         return jsonify({"msg": "文件不存在"}), 404
 
     try:
-        success, content, meta = AiService.smart_parse_content(file_id, doc_type)
+        job_id, reused = get_parse_pipeline().submit_file(file_record, doc_type, g.user['id'])
+        return _job_accepted(job_id, reused, file_id=file_id)
+    except ParseQueueFull as e:
+        return jsonify({"msg": str(e)}), 503
 
-        if not success:
-            return jsonify({"msg": content or "解析失败"}), 400
 
-        return jsonify({
-            "status": "success",
-            "msg": "解析成功",
-            "parsed_content": content[:500] if content else ""
-        })
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"msg": f"解析失败: {str(e)}"}), 500
+@bp.route('/api/bulk_import', methods=['POST'])
+def bulk_import():
+    """
+    批量导入：上传 zip（字段 archive），或由管理员指定 BULK_IMPORT_ROOT 下的服务器目录（字段 directory）。
+    立即返回任务 ID，汇总报告在任务完成后经 /api/parse_jobs/<job_id> 的 data 返回
+    """
+    if not g.user:
+        return jsonify({"msg": "Unauthorized"}), 401
+
+    archive = request.files.get('archive')
+    directory = request.form.get('directory') or (request.get_json(silent=True) or {}).get('directory')
+    importer = get_bulk_importer()
+    try:
+        if archive and archive.filename:
+            job_id, reused = importer.submit_archive(as_hashing_upload(archive), g.user['id'])
+        elif directory:
+            if not g.user.get('is_admin'):
+                return jsonify({"msg": "仅管理员可导入服务器目录"}), 403
+            job_id, reused = importer.submit_directory(directory, g.user['id'])
+        else:
+            return jsonify({"msg": "请上传 zip 文件或指定目录"}), 400
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    return _job_accepted(job_id, reused)
+
+
+@bp.route('/api/parse_jobs/<job_id>')
+def get_parse_job(job_id):
+    """查询解析任务状态（任务 ID 不可猜测；相同内容的任务在用户间共享）"""
+    if not g.user:
+        return jsonify({"msg": "Unauthorized"}), 401
+
+    job = get_parse_pipeline().get_job(job_id)
+    if not job:
+        return jsonify({"msg": "任务不存在"}), 404
+    return jsonify({
+        "job_id": job['id'],
+        "status": job['status'],
+        "stage": job['stage'],
+        "progress": job['progress'],
+        "msg": job['message'],
+        "data": job['result'],
+    })
+
+
+@bp.route('/api/library/passages')
+def api_library_passages():
+    """文档库检索：按 BM25 返回 token 预算内与查询最相关的片段"""
+    if not g.user: return jsonify({"msg": "Unauthorized"}), 401
+
+    query = (request.args.get('q') or '').strip()
+    if not query: return jsonify({"msg": "缺少查询内容"}), 400
+    try:
+        k = min(int(request.args.get('k', 8)), 50)
+        budget = int(request.args.get('budget', Config.RETRIEVAL_DEFAULT_TOKENS))
+        file_ids = [int(i) for i in request.args.get('file_ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"msg": "参数错误"}), 400
+
+    passages = library_index.retrieve(query, k=k, token_budget=budget, file_ids=file_ids or None,
+                                      course_name=request.args.get('course') or None)
+    return jsonify({"status": "success", "passages": passages,
+                    "tokens": sum(estimate_tokens(p['text']) for p in passages)})
 
 
 @bp.route('/api/ai_generate_document', methods=['POST'])
@@ -592,11 +608,17 @@ def ai_generate_document():
                 ok, text = FileService.extract_text_from_file(path)
                 if ok: doc_texts.append({"name": name, "content": text})
 
-        # B. 处理引用
+        # B. 处理引用：篇幅较长的库内素材只放入与要求最相关的片段
         for eid in existing_file_ids:
             rec = db.get_file_by_id(eid)
             if rec and rec.get('parsed_content'):
-                doc_texts.append({"name": f"[库]{rec['original_name']}", "content": rec['parsed_content']})
+                content = rec['parsed_content']
+                if prompt and estimate_tokens(content) > Config.RETRIEVAL_REFERENCE_TOKENS:
+                    passages = library_index.retrieve(prompt, k=20, token_budget=Config.RETRIEVAL_REFERENCE_TOKENS,
+                                                      file_ids=[rec['id']])
+                    if passages:
+                        content = "\n...\n".join(p['text'] for p in sorted(passages, key=lambda p: p['seq']))
+                doc_texts.append({"name": f"[库]{rec['original_name']}", "content": content})
 
         # C. 组装 Prompt
         sys_prompt = DocumentTypeConfig.get_prompt_by_type(doc_type)
@@ -766,7 +788,7 @@ def update_score_cell():
 
     conn = db.get_connection()
     grade_row = conn.execute(
-        "SELECT * FROM grades WHERE class_id=? AND student_id=?",
+        "SELECT score_details FROM grades WHERE class_id=? AND student_id=?",
         (source_class_id, student_id)
     ).fetchone()
 
@@ -788,11 +810,8 @@ def update_score_cell():
     else:
         return jsonify({"msg": f"未知字段: {field}"}), 400
 
-    conn.execute(
-        "UPDATE grades SET total_score=?, score_details=? WHERE class_id=? AND student_id=?",
-        (new_total, json.dumps(score_details, ensure_ascii=False), source_class_id, student_id)
-    )
-    conn.commit()
+    # 同步更新 grades 与 grade_items 分项行
+    db.update_grade_scores(source_class_id, student_id, new_total, score_details)
 
     from services.score_document_service import ScoreDocumentService
     try:
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, g, session
 
 from extensions import db
 from grading_core.factory import GraderFactory
+from services.stats_service import StatsService
 
 bp = Blueprint('main', __name__)
 
@@ -9,8 +10,6 @@ bp = Blueprint('main', __name__)
 @bp.route('/')
 def index():
     """仪表盘首页"""
-    from services.stats_service import StatsService
-
     user_id = g.user['id']
     stats_service = StatsService(session)
 
@@ -26,29 +25,11 @@ def index():
 @bp.route('/tasks')
 def tasks():
     """批改任务列表页面"""
-    classes = db.get_classes(user_id=g.user['id'])
-    GraderFactory.load_graders()
-
-    # 为每个班级添加统计信息
+    # 班级及学生数/已批改数一次查询取回；核心名称直接读注册表元数据，不再逐班级重载核心模块
+    classes = db.get_classes_with_counts(user_id=g.user['id'])
+    grader_names = GraderFactory.get_grader_names(cls['strategy'] for cls in classes)
     for cls in classes:
-        # 获取班级学生数
-        conn = db.get_connection()
-        student_count_row = conn.execute(
-            'SELECT COUNT(*) as count FROM students WHERE class_id=?',
-            (cls['id'],)
-        ).fetchone()
-        cls['student_count'] = student_count_row['count'] if student_count_row else 0
-
-        # 获取已批改数
-        graded_count_row = conn.execute(
-            'SELECT COUNT(*) as count FROM grades WHERE class_id=?',
-            (cls['id'],)
-        ).fetchone()
-        cls['graded_count'] = graded_count_row['count'] if graded_count_row else 0
-
-        grader = GraderFactory.get_grader(cls['strategy'])
-        grader_name = grader.NAME if grader else "未知核心或核心已删除"
-        cls['grader_name'] = grader_name
+        cls['grader_name'] = grader_names.get(cls['strategy'], "未知核心或核心已删除")
 
     return render_template('tasks.html', classes=classes, user=g.user)
 
@@ -5,6 +5,7 @@
 from flask import Blueprint, jsonify, request, g
 
 from extensions import db
+from services.notification_bus import get_notification_bus
 
 bp = Blueprint('notifications', __name__, url_prefix='/api/notifications')
 
@@ -49,6 +50,7 @@ def get_notifications():
     Query params:
         - limit: 返回数量限制 (默认 20)
         - include_read: 是否包含已读通知 (默认 false)
+        - include_archived: 是否包含已归档学年的历史通知 (默认 false)
     """
     if not g.user:
         return jsonify({'notifications': [], 'unread_count': 0})
@@ -56,9 +58,11 @@ def get_notifications():
     user_id = g.user['id']
     limit = request.args.get('limit', 20, type=int)
     include_read = request.args.get('include_read', 'false').lower() == 'true'
+    include_archived = request.args.get('include_archived', 'false').lower() == 'true'
 
     # 获取通知列表
-    notifications = db.get_notifications(user_id, limit=limit, include_read=include_read)
+    notifications = db.get_notifications(user_id, limit=limit, include_read=include_read,
+                                         include_archived=include_archived)
 
     # 格式化通知数据
     formatted_notifications = []
@@ -148,12 +152,11 @@ class NotificationService:
 
     @staticmethod
     def notify_task_processing(user_id, task_id, task_name, log_info=None):
-        """任务开始处理时更新通知"""
+        """任务处理进度：经通知总线合并，窗口期内只写入最新一条"""
         related_id = f"task_{task_id}"
 
-        # 更新现有通知或创建新通知
-        db.update_notification_by_related_id(
-            related_id=related_id,
+        get_notification_bus().publish(
+            user_id, related_id,
             notif_type='task_processing',
             title='正在生成批改核心',
             detail=log_info[:100] + '...' if log_info and len(log_info) > 100 else log_info
@@ -161,29 +164,31 @@ class NotificationService:
 
     @staticmethod
     def notify_task_success(user_id, task_id, task_name, grader_id):
-        """任务成功完成时更新通知"""
+        """任务成功完成时更新通知（立即写入）"""
         related_id = f"task_{task_id}"
         link = f"/grader/{grader_id}" if grader_id else None
 
-        db.update_notification_by_related_id(
-            related_id=related_id,
+        get_notification_bus().publish(
+            user_id, related_id,
             notif_type='task_success',
             title='批改核心生成完成',
             detail='点击查看详情',
-            link=link
+            link=link,
+            immediate=True
         )
 
     @staticmethod
     def notify_task_failed(user_id, task_id, task_name, error_message=None):
-        """任务失败时更新通知"""
+        """任务失败时更新通知（立即写入）"""
         related_id = f"task_{task_id}"
 
         detail = error_message[:100] + '...' if error_message and len(error_message) > 100 else error_message
-        db.update_notification_by_related_id(
-            related_id=related_id,
+        get_notification_bus().publish(
+            user_id, related_id,
             notif_type='task_failed',
             title='批改核心生成失败',
-            detail=detail
+            detail=detail,
+            immediate=True
         )
 
     @staticmethod
@@ -201,4 +206,5 @@ class NotificationService:
     def cleanup_task_notifications(task_id):
         """清理任务相关的通知（任务删除时调用）"""
         related_id = f"task_{task_id}"
+        get_notification_bus().discard(related_id)
         db.delete_notifications_by_related_id(related_id)
@@ -4,6 +4,8 @@
 """
 from flask import Blueprint, jsonify, session, g
 
+from services.stats_service import StatsService
+
 bp = Blueprint('stats', __name__, url_prefix='/api/stats')
 
 
@@ -23,8 +25,6 @@ def get_summary():
     if not g.user:
         return jsonify({'error': 'Unauthorized', 'message': '请先登录'}), 401
 
-    from services.stats_service import StatsService
-
     user_id = g.user['id']
     stats_service = StatsService(session)
 
@@ -45,8 +45,6 @@ def refresh():
     if not g.user:
         return jsonify({'error': 'Unauthorized', 'message': '请先登录'}), 401
 
-    from services.stats_service import StatsService
-
     user_id = g.user['id']
     stats_service = StatsService(session)
 
@@ -6,7 +6,7 @@ from flask import Blueprint, render_template, request, jsonify, g
 from extensions import db
 from services.ai_service import AiService
 from services.file_service import FileService
-from utils.common import calculate_file_hash, create_text_asset
+from utils.common import create_text_asset
 
 bp = Blueprint('student', __name__, url_prefix='/student')
 
@@ -103,11 +103,7 @@ def api_upload_parse():
         # 场景A: 文件上传
         if f:
             file_name = f.filename
-            path, _ = FileService.handle_file_upload_or_reuse(f, None, g.user['id'])
-            with open(path, 'rb') as f_stream:
-                f_hash = calculate_file_hash(f_stream)
-            record = db.get_file_by_hash(f_hash)
-            file_id = record['id']
+            file_id = FileService.save_upload(f, g.user['id'])['id']
 
         # 场景B: 文本粘贴
         elif content:
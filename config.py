@@ -22,16 +22,153 @@ class Config:
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 
     UPLOAD_FOLDER = os.path.join(base_dir, 'uploads')
-    FILE_REPO_FOLDER = os.path.join(base_dir, 'uploads', 'file_repo')
+    FILE_REPO_FOLDER = os.path.join(base_dir, 'uploads', 'file_repo')  # 内容寻址仓库，按哈希分片为 ab/cd/<hash><ext>
+    UPLOAD_SPOOL_MAX_MEMORY = 512 * 1024  # 上传文件超过该大小即写入仓库临时目录 (字节)
     WORKSPACE_FOLDER = os.path.join(base_dir, 'workspaces')
+    # 学生提交解压后的去重存储：按内容哈希分片为 ab/cd/<hash>，学生目录中的文件是指向它的硬链接（须与工作区同盘）
+    EXTRACT_STORE_FOLDER = os.path.join(WORKSPACE_FOLDER, '.blobs')
+    EXTRACT_DEDUP_ENABLED = os.getenv("EXTRACT_DEDUP_ENABLED", "1") != "0"
+    EXTRACT_DEDUP_MIN_BYTES = 4096  # 小于该大小的文件只计算哈希、不链接（节省不到一个磁盘块）
 
     SIGNATURES_FOLDER = os.path.join(UPLOAD_FOLDER, 'signatures')
 
     TEMPLATE_DIR = os.path.join(base_dir, 'export_core', 'templates')
 
+    # 数据库读写分离：只读连接池配置
+    DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))       # 只读连接数上限
+    DB_READER_MMAP_SIZE = int(os.getenv("DB_READER_MMAP_SIZE", str(256 * 1024 * 1024)))  # 只读连接 mmap 大小 (字节)
+    DB_READER_CACHE_SIZE = int(os.getenv("DB_READER_CACHE_SIZE", "-16000"))  # 只读连接页缓存 (负数为 KiB)
+    DB_READER_ACQUIRE_TIMEOUT = 30  # 池满时等待归还的超时 (秒)，超时抛出 sqlite3.OperationalError
+    DB_STATEMENT_CACHE_SIZE = 128  # 每个连接的预编译语句缓存条数
+    DB_ITER_BATCH_SIZE = int(os.getenv("DB_ITER_BATCH_SIZE", "500"))  # 流式查询每批 fetchmany 行数
+
+    # 进程级共享缓存（仪表盘统计等）：memory / sqlite / redis
+    SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "memory")
+    SHARED_CACHE_PATH = os.path.join(base_dir, 'data', 'cache.db')  # sqlite 后端文件
+    SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "redis://127.0.0.1:6379/0")  # redis 后端地址
+
+    # 班级成绩分析：结果按 (班级, 成绩版本号) 缓存，版本变化即失效
+    ANALYTICS_CACHE_TTL = 24 * 60 * 60  # 秒
+    ANALYTICS_PASS_RATIO = 0.6  # 及格线占满分比例
+    ANALYTICS_HISTOGRAM_BINS = 10  # 分数分布分段数
+    ANALYTICS_GROUP_RATIO = 0.27  # 区分度：高分组/低分组各占比例
+
+    # 通知合并：同一 (用户, 关联 ID) 的进度通知在窗口内只写最新状态 (秒)
+    NOTIFICATION_COALESCE_WINDOW = float(os.getenv("NOTIFICATION_COALESCE_WINDOW", "2.0"))
+
+    # AI 助手对话上下文：按 token 预算截取最近消息，更早的消息折叠进滚动摘要
+    AI_CONTEXT_TOKEN_BUDGET = int(os.getenv("AI_CONTEXT_TOKEN_BUDGET", "1500"))  # 历史消息的 token 预算（估算值）
+    AI_CONTEXT_SUMMARY_MAX_CHARS = 800  # 滚动摘要最大字数
+    AI_CONVERSATION_MAX_MESSAGES = 100  # 后台压缩时每个对话保留的消息数（只删除已折叠进摘要的消息）
+
+    # AI 触发限流（令牌桶）：名称 -> (桶容量, 每秒补充令牌数)
+    AI_RATE_LIMITS = {
+        'assistant_proactive': (1, 1 / 60),  # 助手页面切换/操作反馈：每用户每分钟 1 次
+        'welcome_timer': (1, 1 / 60),        # 欢迎语定时触发
+        'welcome_action': (1, 1 / 10),       # 欢迎语操作触发
+    }
+    AI_GLOBAL_RATE_LIMIT = (30, 0.5)  # 所有用户合计的全局桶
+    # memory - 进程内判定，定期快照到主库；sqlite - 独立 SQLite 文件，多 worker 进程共享
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_PATH = os.path.join(base_dir, 'data', 'rate_limit.db')
+    RATE_LIMIT_SNAPSHOT_INTERVAL = 30  # 内存桶快照周期 (秒)
+
+    # 后台维护调度：任务名 -> 运行周期 (秒)
+    MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "1") != "0"
+    MAINTENANCE_JOBS = {
+        'cleanup_records': 6 * 60 * 60,     # 过期欢迎语、旧通知、限流快照、运行记录、解析任务、PDF 页缓存、分块结果
+        'analyze': 24 * 60 * 60,            # 刷新查询规划器统计
+        'incremental_vacuum': 24 * 60 * 60,  # 回收空闲页
+        'wal_checkpoint': 60 * 60,          # 截断 WAL 文件
+        'storage_gc': 6 * 60 * 60,          # 回收孤立/过期的工作区、仓库文件、导出文件与签名
+        'cache_eviction': 15 * 60,          # 清除共享缓存中的过期条目
+        'library_index': 60 * 60,           # 补建文档库检索索引、清理已删除文件的片段
+        'reconcile_counters': 24 * 60 * 60,  # 校验物化计数器，修复异常退出等原因造成的偏差
+        'grader_catalog': 6 * 60 * 60,      # 批改核心目录与 graders 目录文件对齐
+        'file_repo_layout': 7 * 24 * 60 * 60,  # 旧版平铺的仓库文件迁入哈希分片目录
+    }
+    # 首次登记即到期的任务（回填/迁移）：在后台线程的第一次调度检查时执行，之后按周期运行
+    MAINTENANCE_DUE_ON_REGISTER = {'reconcile_counters', 'grader_catalog', 'file_repo_layout'}
+    MAINTENANCE_POLL_INTERVAL = 60  # 调度器检查周期 (秒)
+    MAINTENANCE_JITTER = 0.1  # 下次运行时间在周期基础上随机偏移的比例，避免多进程/多任务同时触发
+    MAINTENANCE_LOCK_SECONDS = 30 * 60  # 任务锁超时，执行者崩溃后由其他进程接管
+    MAINTENANCE_RETENTION_DAYS = 30  # 欢迎语、已读通知、运行记录、解析任务的保留天数
+    MAINTENANCE_VACUUM_PAGES = 2000  # 每次增量 VACUUM 最多回收页数
+    MAINTENANCE_ORPHAN_GRACE = 24 * 60 * 60  # 孤立文件至少闲置多久才清理 (秒)，避免误删上传中的文件
+
+    # 存储回收：以数据库为准判断可达性，回收不可达与过期的文件
+    GC_EXTRACTED_TTL = int(os.getenv("GC_EXTRACTED_TTL", str(14 * 24 * 60 * 60)))  # 解压目录闲置多久后删除 (秒)，查看时按需重新解压
+    GC_QUOTA_MIN_IDLE = int(os.getenv("GC_QUOTA_MIN_IDLE", str(24 * 60 * 60)))  # 超配额时只回收闲置至少这么久的解压目录 (秒)
+    GC_EXPORT_TTL = 24 * 60 * 60  # uploads/export_* 导出文件保留时长 (秒)
+    GC_CLASS_QUOTA_BYTES = int(os.getenv("GC_CLASS_QUOTA_BYTES", "0"))  # 单个班级工作区配额 (字节)，0 为不限
+    GC_USER_QUOTA_BYTES = int(os.getenv("GC_USER_QUOTA_BYTES", "0"))  # 教师名下各班工作区合计配额 (字节)，0 为不限
+    GC_BATCH_SIZE = 1000  # 仓库文件每批按哈希查询引用的数量
+    GC_BATCH_PAUSE = 0.0  # 每批之间的停顿 (秒)，降低对磁盘和数据库的持续压力
+
+    # Office 转 PDF：常驻 soffice 实例池（未安装 python3-uno 时为同样数量的子进程槽位）
+    OFFICE_BINARY = os.getenv("OFFICE_BINARY", "libreoffice")
+    OFFICE_POOL_SIZE = int(os.getenv("OFFICE_POOL_SIZE", "2"))
+    OFFICE_PROFILE_ROOT = os.path.join(base_dir, 'data', 'soffice')  # 每个实例独立的用户配置目录
+    OFFICE_START_TIMEOUT = 30  # 实例启动并接受连接的超时 (秒)
+    OFFICE_CONVERT_TIMEOUT = 120  # 单次转换超时，超时即杀掉实例 (秒)
+    OFFICE_MAX_JOBS_PER_INSTANCE = 200  # 实例处理该数量后回收重启，避免内存增长
+
+    # PDF 文本提取：页数达到阈值时按页段分给提取子进程并行提取，逐页结果缓存在 pdf_page_texts
+    PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PDF_PARALLEL_MIN_PAGES = 64  # 少于该页数时在当前线程提取（子进程启动开销大于收益）
+    PDF_PAGES_PER_TASK = 32  # 每个提取子进程提取的页数
+    PDF_EXTRACT_TIMEOUT = 120  # 单个提取子进程超时 (秒)，超时后在当前线程重新提取该页段
+
+    # 文档解析流水线：各阶段独立线程池的并发数
+    PARSE_STAGE_WORKERS = {
+        'convert': 2,  # LibreOffice 转 PDF（CPU/子进程）
+        'upload': 4,   # 上传到 Vision 平台并等待就绪
+        'model': 4,    # 调用 Vision / Text 模型（每个线程各自 asyncio.run，超出厂商并发上限的线程在厂商信号量上排队）
+        'post': 2,     # 拆包 JSON 并入库
+    }
+    PARSE_MAX_PENDING = 50  # 本进程内未完成任务上限，超出时拒绝新任务
+    PARSE_JOB_STALE_SECONDS = 30 * 60  # 进行中任务超过该时长无进展即视为中断 (秒)
+
+    # 大文档分块解析：文本超过阈值时按页/章节分块并发送文本模型，块结果按内容哈希缓存在 parse_chunk_results
+    PARSE_CHUNK_THRESHOLD = 50000  # 超过该字符数即分块（原先在此处截断）
+    PARSE_CHUNK_MIN_CHARS = 6000  # 块达到该大小后，遇到内容决定的边界即结束
+    PARSE_CHUNK_MAX_CHARS = 20000  # 块大小上限
+    PARSE_PDF_PAGE_MAX_CHARS = 5000  # 估算 PDF 文本上限用的每页字符数：页数 × 该值不超过分块阈值的 PDF 不预先提取文本
+    PARSE_CHUNK_WORKERS = 4  # 进程内同时请求模型的块数（各厂商另受 max_concurrent_requests 限制）
+
+    # 文档库检索：parsed_content 切片后建 FTS5 索引，按 BM25 取最相关的片段放入 AI 提示词
+    RETRIEVAL_PASSAGE_CHARS = 600  # 片段长度上限 (字符)
+    RETRIEVAL_MAX_QUERY_TERMS = 64  # 长查询（如整份试卷）只取出现次数最多的词
+    RETRIEVAL_CANDIDATES = 50  # BM25 候选片段数，再按 token 预算挑选
+    RETRIEVAL_DEFAULT_TOKENS = 3000  # 检索结果默认 token 预算
+    RETRIEVAL_GRADER_CONTEXT_TOKENS = 2000  # 生成批改核心时附带的同课程资料
+    RETRIEVAL_REFERENCE_TOKENS = 6000  # AI 生成文档时每份库内参考素材超过该值即改为检索片段
+    RETRIEVAL_SYNC_BATCH = 500  # 维护任务每次补建索引的文件数
+
+    # 学生名单表格解析：表头与列按关键词或内容格式向量化识别，班级名称与入学年份都能本地识别时不调用 AI
+    ROSTER_HEADER_SCAN_ROWS = 30  # 在前多少行中查找表头
+    ROSTER_SAMPLE_ROWS = 200  # 无表头时按前多少行的内容格式识别列
+    ROSTER_DETECT_MIN_RATIO = 0.8  # 按内容识别列时，符合格式的单元格比例下限
+    ROSTER_AI_SAMPLE_ROWS = 12  # 需要 AI 补充元数据时发送的行数
+
+    # 批量导入：zip 或服务器目录（目录导入仅限管理员，且必须位于 BULK_IMPORT_ROOT 下）
+    BULK_IMPORT_ROOT = os.getenv("BULK_IMPORT_ROOT", os.path.join(base_dir, 'imports'))
+    BULK_IMPORT_MAX_FILES = 2000  # 单次导入文件数上限
+    BULK_IMPORT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 单次导入解压后总大小上限 (字节)
+    BULK_IMPORT_HASH_WORKERS = 4  # 并行读取/计算哈希的线程数
+    BULK_IMPORT_PARSE_CONCURRENCY = 4  # 单次导入同时在解析流水线中的任务数
+    BULK_IMPORT_POLL_INTERVAL = 2  # 检查解析任务状态的间隔 (秒)
+
     # AI 欢迎语缓存配置
     AI_WELCOME_CACHE_TTL = 4 * 60 * 60  # 4小时缓存 (秒)
 
+    # AI 欢迎语后台预生成：活跃用户的缓存在过期前由后台线程低优先级刷新
+    AI_WELCOME_REFRESH_INTERVAL = 60  # 检查周期 (秒)
+    AI_WELCOME_REFRESH_LEAD = 10 * 60  # 距过期不足该时长即刷新 (秒)
+    AI_WELCOME_ACTIVE_WINDOW = 8 * 60 * 60  # 最近多久内访问过的 (用户, 页面) 视为活跃 (秒)
+    AI_WELCOME_REFRESH_MAX_PER_CYCLE = 5  # 每个周期最多刷新条数（逐条串行）
+    AI_WELCOME_DAILY_TOKEN_BUDGET = int(os.getenv("AI_WELCOME_DAILY_TOKEN_BUDGET", "200000"))  # 每日预生成 token 上限（估算值）
+
 
 # === 基础 Prompt (保持不变的部分) ===
 BASE_CREATOR_PROMPT = """
@@ -106,6 +243,16 @@ class BaseGrader(abc.ABC):
                     return self.file_map[alt.lower()], 1  # 用了别名，通常扣1分规范分
         return None, 0
 
+    def content_hash(self, file_path, *args, **kwargs):
+        # 文件内容的 SHA-256，解压时已算好的直接复用
+        file_hash = (self.file_hashes or {}).get(os.path.normpath(file_path))
+        return file_hash or 读文件计算 SHA-256
+
+    def cached_analysis(self, file_path, key, compute, *args, **kwargs):
+        # 按 (核心ID, key, 文件内容哈希) 缓存 compute(file_path) 的结果，内容相同的文件（如多名学生提交的同一份起始代码）只分析一次
+        # 结果在学生之间共享，不要原地修改
+        ...
+
     def read_text_content(self, file_path, *args, **kwargs):
         if not file_path or not os.path.exists(file_path):
             return None
@@ -132,6 +279,8 @@ class BaseGrader(abc.ABC):
         # 3. 失败
         result_obj.add_deduction(name + " 未检测到有效关键命令-" + full_pts)
         return 0
+
+- **耗时分析**: 编译、运行、解析文档等对单个文件的耗时分析，请用 `self.cached_analysis(path, "分析名", 函数)` 包装，函数只接收文件路径并返回结果；不要在 `grade` 中修改学生目录里的文件。
         
 """
 
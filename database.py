@@ -1,13 +1,166 @@
+import hashlib
+import json
 import os
+import queue
 import sqlite3
 import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import Config
+from utils import events
 
 
-class Database:
-    def __init__(self, db_path=Config.DB_PATH):
+def parsed_content_hash(content):
+    """parsed_content 的 SHA-256（写入 file_assets.parsed_content_hash，文档库索引据此判断内容是否变化）"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest() if content is not None else None
+
+
+class ReaderPool:
+    """
+    只读连接池
+
+    连接以 PRAGMA query_only 打开，并使用独立的 mmap_size / cache_size，
+    让文档库搜索、导出、统计等长查询不与写连接共享锁和页缓存。
+    同一线程内嵌套借用会复用同一个连接，因此每个连接的预编译语句缓存
+    (cached_statements) 在该线程内是连续命中的。
+    """
+
+    def __init__(self, db_path, size=None):
         self.db_path = db_path
+        self.size = max(1, Config.DB_READER_POOL_SIZE if size is None else size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            'acquisitions': 0,
+            'waits': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'peak_in_use': 0,
+            'timeouts': 0,
+        }
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=30.0,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute(f'PRAGMA mmap_size={int(Config.DB_READER_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA cache_size={int(Config.DB_READER_CACHE_SIZE)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                # 池已满：阻塞等待其他线程归还，并记录等待时长
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=Config.DB_READER_ACQUIRE_TIMEOUT)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f"reader pool exhausted: no connection returned within "
+                        f"{Config.DB_READER_ACQUIRE_TIMEOUT}s ({self.size} in use)") from None
+                waited = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._stats['wait_ms_total'] += waited
+                    self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], waited)
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['acquisitions'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        return conn
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        借出一个只读连接，退出上下文时归还
+        同一线程内嵌套借用共享一个租约，按引用计数归还：惰性迭代器即使乱序关闭（或由 GC 在其他线程关闭），
+        连接也只在最后一个使用者退出后才回到池中
+        """
+        lease = getattr(self._local, 'lease', None)
+        with self._lock:
+            if lease is not None and lease[1] > 0:
+                lease[1] += 1
+            else:
+                lease = None
+        if lease is None:
+            lease = [self._acquire(), 1]
+            self._local.lease = lease
+        try:
+            yield lease[0]
+        finally:
+            with self._lock:
+                lease[1] -= 1
+                last = lease[1] == 0
+            if last:
+                if getattr(self._local, 'lease', None) is lease:
+                    self._local.lease = None
+                self._release(lease[0])
+
+    def stats(self):
+        """连接池利用率快照"""
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+            })
+        acquisitions = data['acquisitions'] or 1
+        data['wait_ms_avg'] = round(data['wait_ms_total'] / acquisitions, 3)
+        data['wait_ms_total'] = round(data['wait_ms_total'], 3)
+        data['wait_ms_max'] = round(data['wait_ms_max'], 3)
+        return data
+
+
+class Database:
+    # 同一数据库文件的多个 Database 实例共享一个只读连接池
+    _reader_pools = {}
+    _reader_pools_lock = threading.Lock()
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.DB_PATH
         self._local = threading.local()
         # 优化 1: 确保数据库目录存在，防止权限导致的创建失败
         db_dir = os.path.dirname(self.db_path)
@@ -24,11 +177,14 @@ class Database:
             conn = sqlite3.connect(
                 self.db_path,
                 check_same_thread=False,
-                timeout=30.0
+                timeout=30.0,
+                cached_statements=Config.DB_STATEMENT_CACHE_SIZE
             )
             conn.row_factory = sqlite3.Row
 
             try:
+                # 新建库须在建表前设置增量回收（须早于 journal_mode）；已有库上为空操作，转换见 enable_incremental_vacuum
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
                 # 优化 4: 显式设置日志模式和同步模式，降低 shm/wal 文件的死锁概率
                 # synchronous=NORMAL 在 WAL 模式下既安全又高效
                 conn.execute('PRAGMA journal_mode=WAL')
@@ -43,6 +199,233 @@ class Database:
 
         return self._local.connection
 
+    @property
+    def reader_pool(self):
+        """当前数据库文件对应的只读连接池（懒加载，进程内共享）"""
+        key = os.path.abspath(self.db_path)
+        pool = self._reader_pools.get(key)
+        if pool is None:
+            with self._reader_pools_lock:
+                pool = self._reader_pools.get(key)
+                if pool is None:
+                    pool = ReaderPool(self.db_path)
+                    self._reader_pools[key] = pool
+        return pool
+
+    def read_connection(self):
+        """
+        只读连接（上下文管理器）
+        用于列表、搜索、导出、统计等不在写事务内的查询：
+            with db.read_connection() as conn:
+                rows = conn.execute(...).fetchall()
+        写操作及写流程中的读取仍使用 get_connection()
+        """
+        return self.reader_pool.connection()
+
+    def get_reader_pool_stats(self):
+        return self.reader_pool.stats()
+
+    def iter_rows(self, sql, params=(), as_tuple=False, batch_size=None, conn=None):
+        """
+        流式查询：按 fetchmany 分批惰性产出行，不一次性物化整个结果集
+            for sid, name in db.iter_rows("SELECT student_id, name FROM students WHERE class_id=?",
+                                          (class_id,), as_tuple=True):
+                ...
+        只读连接在迭代结束（或生成器被关闭/回收）前一直被占用，请尽快消费完毕。
+        :param as_tuple: True 时产出普通 tuple，否则产出 {列名: 值} dict
+        :param batch_size: 每批读取行数，默认 Config.DB_ITER_BATCH_SIZE
+        :param conn: 指定连接（如 history_connection），默认从只读连接池借用
+        """
+        if conn is None:
+            with self.read_connection() as conn:
+                yield from self.iter_rows(sql, params, as_tuple, batch_size, conn)
+            return
+
+        cur = conn.cursor()
+        cur.row_factory = None
+        try:
+            cur.execute(sql, params)
+            names = [d[0] for d in cur.description] if not as_tuple else None
+            size = batch_size or Config.DB_ITER_BATCH_SIZE
+            while True:
+                batch = cur.fetchmany(size)
+                if not batch:
+                    break
+                if as_tuple:
+                    yield from batch
+                else:
+                    for row in batch:
+                        yield dict(zip(names, row))
+        finally:
+            cur.close()
+
+    # ================= 学年归档库 (冷数据) =================
+
+    # 归档库中的表结构：列顺序与主库保持一致，历史视图通过 UNION ALL 透明合并
+    ARCHIVE_TABLES = {
+        'grades': (
+            'id INTEGER PRIMARY KEY, student_id TEXT, class_id INTEGER, total_score REAL, '
+            'score_details TEXT, deduct_details TEXT, status TEXT, filename TEXT',
+            ['CREATE INDEX IF NOT EXISTS {alias}.idx_arc_grades_class ON grades (class_id, student_id)'],
+        ),
+        'grade_items': (
+            'id INTEGER PRIMARY KEY, grade_id INTEGER, class_id INTEGER, item_name TEXT, '
+            'item_order INTEGER, score REAL, max_score REAL',
+            ['CREATE INDEX IF NOT EXISTS {alias}.idx_arc_grade_items_class ON grade_items (class_id, item_name)',
+             'CREATE INDEX IF NOT EXISTS {alias}.idx_arc_grade_items_order ON grade_items (class_id, item_order, item_name)'],
+        ),
+        'notifications': (
+            'id INTEGER PRIMARY KEY, user_id INTEGER, type TEXT, title TEXT, message TEXT, detail TEXT, '
+            'link TEXT, related_id TEXT, is_read BOOLEAN, created_at TIMESTAMP',
+            ['CREATE INDEX IF NOT EXISTS {alias}.idx_arc_notification_user ON notifications (user_id, created_at)'],
+        ),
+        'ai_messages': (
+            'id INTEGER PRIMARY KEY, conversation_id INTEGER, role TEXT, content TEXT, trigger_type TEXT, '
+            'metadata_json TEXT, created_at TIMESTAMP',
+            ['CREATE INDEX IF NOT EXISTS {alias}.idx_arc_message_conversation ON ai_messages (conversation_id, created_at)'],
+        ),
+        'ai_welcome_messages': (
+            'id INTEGER PRIMARY KEY, user_id INTEGER, page_context TEXT, message_content TEXT, '
+            'created_at TIMESTAMP, expires_at TIMESTAMP, context_snapshot TEXT, last_request_time TIMESTAMP',
+            [],
+        ),
+        'file_contents': (
+            'file_id INTEGER PRIMARY KEY, parsed_content TEXT',
+            [],
+        ),
+    }
+
+    @property
+    def archive_dir(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), 'archive')
+
+    def archive_path(self, academic_year):
+        return os.path.join(self.archive_dir, f'archive_{academic_year}.db')
+
+    @staticmethod
+    def archive_alias(academic_year):
+        return 'arc_' + str(academic_year).replace('-', '_')
+
+    def get_archived_years(self):
+        """已存在归档库文件的学年列表（新→旧）"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        years = [f[len('archive_'):-len('.db')] for f in os.listdir(self.archive_dir)
+                 if f.startswith('archive_') and f.endswith('.db')]
+        return sorted(years, reverse=True)
+
+    def init_archive_tables(self, conn, alias):
+        """在已 ATTACH 的归档库 alias 中建表（可重复调用）"""
+        for table, (columns, indexes) in self.ARCHIVE_TABLES.items():
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {alias}.{table} ({columns})')
+            for idx_sql in indexes:
+                conn.execute(idx_sql.format(alias=alias))
+
+    @contextmanager
+    def history_connection(self, years=None):
+        """
+        历史查询连接：主库以只读方式打开，并按需只读 ATTACH 学年归档库
+        不存在的归档文件会被跳过；SQLite 单连接最多 ATTACH 10 个库。
+        :param years: 学年列表，默认全部已归档学年
+        :yield: (conn, aliases) aliases 为 {学年: 别名}
+        """
+        years = self.get_archived_years() if years is None else years
+        conn = sqlite3.connect(f'{Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro', uri=True,
+                               check_same_thread=False, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        aliases = {}
+        try:
+            for year in list(dict.fromkeys(years))[:9]:
+                path = self.archive_path(year)
+                if not os.path.exists(path):
+                    continue
+                alias = self.archive_alias(year)
+                conn.execute('ATTACH DATABASE ? AS ' + alias, (f'{Path(path).as_uri()}?mode=ro',))
+                aliases[year] = alias
+            yield conn, aliases
+        finally:
+            conn.close()
+
+    def _get_class_archived_year(self, class_id):
+        with self.read_connection() as conn:
+            row = conn.execute("SELECT archived_year FROM classes WHERE id=?", (class_id,)).fetchone()
+        return row['archived_year'] if row and row['archived_year'] else None
+
+    @contextmanager
+    def _class_grades_source(self, class_id):
+        """
+        班级成绩的数据源：未归档班级直接读主库；已归档班级合并归档库
+        （归档后在主库重新批改的学生以主库记录为准）
+        :yield: (conn, grades 表表达式, grade_items 表表达式)
+        """
+        year = self._get_class_archived_year(class_id)
+        if not year or not os.path.exists(self.archive_path(year)):
+            with self.read_connection() as conn:
+                yield conn, 'grades', 'grade_items'
+            return
+
+        cid = int(class_id)
+        with self.history_connection([year]) as (conn, aliases):
+            alias = aliases[year]
+            arc_grades = (f"SELECT * FROM {alias}.grades a WHERE a.class_id = {cid} AND NOT EXISTS "
+                          f"(SELECT 1 FROM main.grades h WHERE h.class_id = {cid} AND h.student_id = a.student_id)")
+            grades = f"(SELECT * FROM main.grades WHERE class_id = {cid} UNION ALL {arc_grades})"
+            items = (f"(SELECT * FROM main.grade_items WHERE class_id = {cid} UNION ALL "
+                     f"SELECT * FROM {alias}.grade_items WHERE class_id = {cid} "
+                     f"AND grade_id IN (SELECT id FROM ({arc_grades})))")
+            yield conn, grades, items
+
+    def _archived_graded_counts(self, classes):
+        """
+        已归档班级在归档库中的成绩数（不含归档后在主库重新批改的学生），物化计数器只统计主库
+        :param classes: [(class_id, archived_year), ...]
+        :return: {class_id: 成绩数}
+        """
+        by_year = {}
+        for class_id, year in classes:
+            by_year.setdefault(year, []).append(int(class_id))
+        counts = {}
+        years = [y for y in by_year if os.path.exists(self.archive_path(y))]
+        for i in range(0, len(years), 9):
+            with self.history_connection(years[i:i + 9]) as (conn, aliases):
+                for year, alias in aliases.items():
+                    ids = by_year[year]
+                    rows = conn.execute(f'''
+                        SELECT a.class_id, COUNT(*) FROM {alias}.grades a
+                        WHERE a.class_id IN ({','.join('?' * len(ids))}) AND NOT EXISTS
+                              (SELECT 1 FROM main.grades h WHERE h.class_id = a.class_id AND h.student_id = a.student_id)
+                        GROUP BY a.class_id
+                    ''', ids).fetchall()
+                    counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def _search_archived_file_ids(self, pattern):
+        """在各学年归档库的解析内容中做 LIKE 搜索，返回命中的文件 ID"""
+        ids = set()
+        years = self.get_archived_years()
+        for i in range(0, len(years), 9):
+            with self.history_connection(years[i:i + 9]) as (conn, aliases):
+                for alias in aliases.values():
+                    ids.update(row[0] for row in conn.execute(
+                        f"SELECT file_id FROM {alias}.file_contents WHERE parsed_content LIKE ?", (pattern,)))
+        return ids
+
+    def _purge_archive_rows(self, academic_year, statements):
+        """
+        在学年归档库中执行删除，与主库的删除保持一致（归档库不存在时跳过）
+        :param statements: [(sql, params), ...]，表名即归档库中的表名
+        """
+        path = self.archive_path(academic_year)
+        if not os.path.exists(path):
+            return
+        conn = sqlite3.connect(path, timeout=30.0)
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
     def close(self):
         """显式关闭连接，确保 shm/wal 文件能够正常同步回主库"""
         if hasattr(self._local, 'connection'):
@@ -438,7 +821,7 @@ class Database:
                        ''')
 
         # 16. AI 速率限制表 [NEW]
-        # 用于控制主动触发的频率限制
+        # 旧版按冷却时间戳限流，已由 23. rate_limit_buckets 取代，保留以兼容旧库
         cursor.execute('''
                        CREATE TABLE IF NOT EXISTS ai_rate_limits
                        (
@@ -449,6 +832,197 @@ class Database:
                        )
                        ''')
 
+        # 17. 成绩分项表 [NEW]
+        # 将 grades.score_details 中的 JSON 分项拆成行，按题目统计/透视导出时直接走 SQL 聚合
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS grade_items
+                       (
+                           id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                           grade_id   INTEGER NOT NULL,           -- 关联 grades.id
+                           class_id   INTEGER NOT NULL,           -- 冗余班级 ID，便于按班级聚合
+                           item_name  TEXT    NOT NULL,           -- 分项名称 (如 "一、环境搭建")
+                           item_order INTEGER NOT NULL,           -- 分项在 score_details 中的顺序
+                           score      REAL,                       -- 分项得分
+                           max_score  REAL,                       -- 分项满分 (批改核心未提供时为 NULL)
+                           FOREIGN KEY (grade_id) REFERENCES grades (id) ON DELETE CASCADE
+                       )
+                       ''')
+
+        # 18. 归档运行记录表 [NEW]
+        # 每次把已结束学年迁入归档库时记录迁移行数、库文件大小及查询耗时对比
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS archive_runs
+                       (
+                           id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                           academic_year TEXT NOT NULL,       -- 学年，如 2024-2025
+                           archive_path  TEXT,                -- 归档库文件路径
+                           report        TEXT,                -- JSON: 迁移行数、大小与耗时对比
+                           created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                       )
+                       ''')
+
+        # 19. 物化计数器表 [NEW]
+        # 由触发器在 classes/students/grades/ai_tasks/file_assets 增删改时同事务维护，
+        # 页面直接读取预聚合数值，reconcile_counters() 负责校验与修复偏差
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS counters
+                       (
+                           scope    TEXT    NOT NULL,          -- user / class
+                           scope_id INTEGER NOT NULL,          -- 用户 ID / 班级 ID
+                           name     TEXT    NOT NULL,          -- 计数项，见 COUNTER_QUERIES
+                           value    INTEGER NOT NULL DEFAULT 0,
+                           PRIMARY KEY (scope, scope_id, name)
+                       ) WITHOUT ROWID
+                       ''')
+
+        # 20. 用户-学号引用计数 [NEW]
+        # 同一学号可出现在同一教师的多个班级，用引用计数维护"去重学生数"
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS counter_student_refs
+                       (
+                           user_id    INTEGER NOT NULL,
+                           student_id TEXT    NOT NULL,
+                           refs       INTEGER NOT NULL DEFAULT 0,
+                           PRIMARY KEY (user_id, student_id)
+                       ) WITHOUT ROWID
+                       ''')
+
+        # 21. 批改核心目录表 [NEW]
+        # 核心生成/编辑/恢复/删除时写入，列表页与计数只读此表，无需导入核心代码
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS grader_catalog
+                       (
+                           grader_id   TEXT PRIMARY KEY,
+                           name        TEXT,
+                           course      TEXT,
+                           type        TEXT      DEFAULT 'logic', -- logic / direct
+                           filename    TEXT,                      -- graders 目录下的文件名
+                           source_hash TEXT,                      -- 源文件 SHA-256，用于一致性校验
+                           description TEXT,
+                           strictness  TEXT      DEFAULT 'standard',
+                           created_by  INTEGER,
+                           created_at  TIMESTAMP,
+                           updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                       )
+                       ''')
+
+        # 22. 班级成绩版本号 [NEW]
+        # grades 每次增删改由触发器 +1，成绩分析等派生结果以 (class_id, version) 作为缓存键
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS class_grade_versions
+                       (
+                           class_id        INTEGER PRIMARY KEY,
+                           version         INTEGER NOT NULL DEFAULT 0,
+                           last_student_id TEXT                -- 最近一次写入的学号，供增量更新校验
+                       )
+                       ''')
+
+        # 23. 限流令牌桶快照 [NEW]
+        # 令牌桶在进程内判定，定期把变化的桶写入此表，重启后恢复（取代逐次读写 ai_rate_limits）
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS rate_limit_buckets
+                       (
+                           bucket     TEXT PRIMARY KEY,   -- 限流名:用户 ID，全局桶为 global:*
+                           tokens     REAL NOT NULL,
+                           updated_at REAL NOT NULL       -- Unix 时间戳
+                       ) WITHOUT ROWID
+                       ''')
+
+        # 24. 维护任务表 [NEW]
+        # 后台维护调度器的任务定义与下次运行时间；lock_owner/lock_expires_at 保证多进程下同一任务只有一个执行者
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS maintenance_jobs
+                       (
+                           name             TEXT PRIMARY KEY,
+                           interval_seconds INTEGER NOT NULL,
+                           next_run_at      REAL NOT NULL,   -- Unix 时间戳
+                           lock_owner       TEXT,            -- 执行者标识 (主机:进程:随机串)
+                           lock_expires_at  REAL,
+                           last_status      TEXT,            -- success / failed
+                           last_finished_at REAL
+                       )
+                       ''')
+
+        # 25. 维护运行记录表 [NEW]
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS maintenance_runs
+                       (
+                           id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                           job         TEXT NOT NULL,
+                           runner      TEXT,
+                           started_at  REAL NOT NULL,
+                           finished_at REAL,
+                           status      TEXT,                 -- success / failed
+                           result      TEXT                  -- JSON: 任务返回的统计，或错误信息
+                       )
+                       ''')
+
+        # 26. 文档解析任务表 [NEW]
+        # 上传解析在后台流水线中执行，请求只返回任务 ID；dedupe_key 相同的进行中任务直接复用
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS parse_jobs
+                       (
+                           id         TEXT PRIMARY KEY,
+                           kind       TEXT NOT NULL,        -- content / student_list / pasted / bulk_import
+                           dedupe_key TEXT NOT NULL,        -- 类型 + 文件哈希(粘贴内容哈希) + 文档类型
+                           file_id    INTEGER,
+                           doc_type   TEXT,
+                           user_id    INTEGER,
+                           status     TEXT DEFAULT 'queued', -- queued / running / success / failed
+                           stage      TEXT,                 -- convert / upload / model / post
+                           progress   INTEGER DEFAULT 0,    -- 0-100
+                           message    TEXT,
+                           result     TEXT,                 -- JSON: 成功时返回给前端的数据
+                           created_at REAL NOT NULL,        -- Unix 时间戳
+                           updated_at REAL NOT NULL
+                       )
+                       ''')
+
+        # 27. PDF 逐页文本缓存 [NEW]
+        # 按 (文件哈希, 页码) 缓存提取结果，重复解析同一 PDF 时只提取缺失的页
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS pdf_page_texts
+                       (
+                           file_hash TEXT NOT NULL,
+                           page      INTEGER NOT NULL,      -- 从 0 开始
+                           text      TEXT NOT NULL,
+                           PRIMARY KEY (file_hash, page)
+                       ) WITHOUT ROWID
+                       ''')
+
+        # 28. 分块解析结果缓存 [NEW]
+        # 以 (文档类型, 块文本) 的 SHA-256 为键缓存每块的模型输出，文档修改后未变的块直接复用
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS parse_chunk_results
+                       (
+                           chunk_hash TEXT PRIMARY KEY,
+                           content    TEXT NOT NULL,
+                           metadata   TEXT NOT NULL,        -- JSON 对象
+                           used_at    REAL NOT NULL         -- 最近一次写入或命中的 Unix 时间戳
+                       ) WITHOUT ROWID
+                       ''')
+
+        # 29. 文档库检索片段 (FTS5) [NEW]
+        # tokens 为预先分好的词（jieba 或二元组，空格分隔），text 为片段原文；
+        # rowid = 文件ID * LIBRARY_PASSAGE_STRIDE + 片段序号，按文件替换时按 rowid 区间删除
+        cursor.execute('''
+                       CREATE VIRTUAL TABLE IF NOT EXISTS library_passages
+                       USING fts5(tokens, text UNINDEXED, tokenize = 'unicode61')
+                       ''')
+
+        # 30. 文档库检索索引状态 [NEW]
+        cursor.execute('''
+                       CREATE TABLE IF NOT EXISTS library_index_files
+                       (
+                           file_id       INTEGER PRIMARY KEY,
+                           content_hash  TEXT NOT NULL,       -- 建索引时 parsed_content 的 SHA-256
+                           content_chars INTEGER NOT NULL,    -- 建索引时 parsed_content 的字符数（批量核对用）
+                           tokenizer     TEXT NOT NULL,       -- jieba / bigram
+                           passages      INTEGER NOT NULL,
+                           indexed_at    REAL NOT NULL
+                       )
+                       ''')
+
         # 创建索引
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_model_capability ON ai_models (capability)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_hash ON file_assets (file_hash)')
@@ -458,6 +1032,12 @@ class Database:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_welcome_expires ON ai_welcome_messages(expires_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_user ON ai_conversations(user_id, status)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_conversation ON ai_messages(conversation_id, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_grade_items_grade ON grade_items(grade_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_grade_items_class_item ON grade_items(class_id, item_name, score)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_grade_items_class_order ON grade_items(class_id, item_order, item_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_students_class ON students(class_id, student_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_maintenance_runs_job ON maintenance_runs(job, started_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_parse_jobs_dedupe ON parse_jobs(dedupe_key, status)')
 
         conn.commit()
         self._init_super_admin(cursor, conn)
@@ -474,6 +1054,7 @@ class Database:
         self._migrate_table(cursor, conn, "ai_tasks", "extra_prompt", "TEXT DEFAULT ''")  # Feature 001: Extra prompt for logic core generation
         self._migrate_table(cursor, conn, "users", "has_seen_help", "BOOLEAN DEFAULT 0")
         self._migrate_table(cursor, conn, "file_assets", "parsed_content", "TEXT")
+        self._migrate_table(cursor, conn, "file_assets", "parsed_content_hash", "TEXT")
         self._migrate_table(cursor, conn, "file_assets", "meta_info", "TEXT")
         self._migrate_table(cursor, conn, "file_assets", "version", "INTEGER DEFAULT 1")
         self._migrate_table(cursor, conn, "file_assets", "doc_category", "TEXT DEFAULT 'exam'")
@@ -495,6 +1076,22 @@ class Database:
         # [NEW] 成绩文档同步功能：file_assets 添加 source_class_id 字段
         self._migrate_table(cursor, conn, "file_assets", "source_class_id", "INTEGER")
 
+        # [NEW] 成绩分项表：从已有 score_details JSON 回填
+        self._backfill_grade_items(cursor, conn)
+
+        # [NEW] 冷数据归档：标记已迁移到学年归档库的数据
+        self._migrate_table(cursor, conn, "classes", "archived_year", "TEXT")
+        self._migrate_table(cursor, conn, "file_assets", "archived_year", "TEXT")
+        self._migrate_table(cursor, conn, "ai_conversations", "archived_year", "TEXT")
+
+        # [NEW] AI 助手滚动摘要：summary_upto_id 及之前的消息已折叠进 summary
+        self._migrate_table(cursor, conn, "ai_conversations", "summary", "TEXT")
+        self._migrate_table(cursor, conn, "ai_conversations", "summary_upto_id", "INTEGER DEFAULT 0")
+
+        # [NEW] 物化计数器：触发器依赖上面迁移出的列，放在最后创建
+        self._init_counters(cursor, conn)
+        self._init_grade_versions(cursor, conn)
+
     def _migrate_table(self, cursor, conn, table, column, type_def):
         """辅助函数：检查列是否存在，不存在则添加"""
         try:
@@ -507,6 +1104,255 @@ class Database:
             except Exception as e:
                 print(f"[DB] Migration failed for {column}: {e}")
 
+    # ================= 物化计数器 =================
+
+    # 计数项的真实值（用于初始化与校验）：name -> (scope, 返回 scope_id, value 的聚合 SQL)
+    COUNTER_QUERIES = {
+        'classes': ('user', "SELECT COALESCE(created_by, 0), COUNT(*) FROM classes GROUP BY 1"),
+        'students': ('user', '''SELECT COALESCE(c.created_by, 0), COUNT(DISTINCT s.student_id)
+                                FROM students s JOIN classes c ON s.class_id = c.id GROUP BY 1'''),
+        'graders': ('user', "SELECT COALESCE(created_by, 0), COUNT(*) FROM ai_tasks "
+                            "WHERE grader_id IS NOT NULL GROUP BY 1"),
+        'pending_tasks': ('user', "SELECT COALESCE(created_by, 0), COUNT(*) FROM ai_tasks "
+                                  "WHERE status IN ('pending', 'processing') GROUP BY 1"),
+        'files': ('user', "SELECT COALESCE(uploaded_by, 0), COUNT(*) FROM file_assets GROUP BY 1"),
+        'class_students': ('class', "SELECT class_id, COUNT(*) FROM students WHERE class_id IS NOT NULL GROUP BY 1"),
+        'class_graded': ('class', "SELECT class_id, COUNT(*) FROM grades WHERE class_id IS NOT NULL GROUP BY 1"),
+    }
+
+    # 维护计数器的触发器。{bump} 展开为对 counters 的 UPSERT 增量
+    COUNTER_TRIGGERS = {
+        'trg_counter_classes_ins': ('AFTER INSERT ON classes', [
+            ('user', 'COALESCE(NEW.created_by, 0)', 'classes', '1')]),
+        'trg_counter_classes_del': ('AFTER DELETE ON classes', [
+            ('user', 'COALESCE(OLD.created_by, 0)', 'classes', '-1')]),
+        'trg_counter_grades_ins': ('AFTER INSERT ON grades WHEN NEW.class_id IS NOT NULL', [
+            ('class', 'NEW.class_id', 'class_graded', '1')]),
+        'trg_counter_grades_del': ('AFTER DELETE ON grades WHEN OLD.class_id IS NOT NULL', [
+            ('class', 'OLD.class_id', 'class_graded', '-1')]),
+        'trg_counter_ai_tasks_ins': ('AFTER INSERT ON ai_tasks', [
+            ('user', 'COALESCE(NEW.created_by, 0)', 'graders', '(NEW.grader_id IS NOT NULL)'),
+            ('user', 'COALESCE(NEW.created_by, 0)', 'pending_tasks', "(NEW.status IN ('pending', 'processing'))")]),
+        'trg_counter_ai_tasks_del': ('AFTER DELETE ON ai_tasks', [
+            ('user', 'COALESCE(OLD.created_by, 0)', 'graders', '-(OLD.grader_id IS NOT NULL)'),
+            ('user', 'COALESCE(OLD.created_by, 0)', 'pending_tasks', "-(OLD.status IN ('pending', 'processing'))")]),
+        'trg_counter_ai_tasks_upd': ('AFTER UPDATE OF status, grader_id, created_by ON ai_tasks', [
+            ('user', 'COALESCE(OLD.created_by, 0)', 'graders', '-(OLD.grader_id IS NOT NULL)'),
+            ('user', 'COALESCE(OLD.created_by, 0)', 'pending_tasks', "-(OLD.status IN ('pending', 'processing'))"),
+            ('user', 'COALESCE(NEW.created_by, 0)', 'graders', '(NEW.grader_id IS NOT NULL)'),
+            ('user', 'COALESCE(NEW.created_by, 0)', 'pending_tasks', "(NEW.status IN ('pending', 'processing'))")]),
+        'trg_counter_files_ins': ('AFTER INSERT ON file_assets', [
+            ('user', 'COALESCE(NEW.uploaded_by, 0)', 'files', '1')]),
+        'trg_counter_files_del': ('AFTER DELETE ON file_assets', [
+            ('user', 'COALESCE(OLD.uploaded_by, 0)', 'files', '-1')]),
+        'trg_counter_files_upd': ('AFTER UPDATE OF uploaded_by ON file_assets', [
+            ('user', 'COALESCE(OLD.uploaded_by, 0)', 'files', '-1'),
+            ('user', 'COALESCE(NEW.uploaded_by, 0)', 'files', '1')]),
+    }
+
+    # 学生增删：班级人数 + 教师去重学生数（引用计数从 0->1 / 1->0 时才变化）
+    STUDENT_COUNTER_TRIGGERS = {
+        'trg_counter_students_ins': '''
+            CREATE TRIGGER IF NOT EXISTS trg_counter_students_ins AFTER INSERT ON students
+            WHEN NEW.class_id IS NOT NULL
+            BEGIN
+                INSERT INTO counters (scope, scope_id, name, value) VALUES ('class', NEW.class_id, 'class_students', 1)
+                    ON CONFLICT (scope, scope_id, name) DO UPDATE SET value = value + 1;
+                INSERT INTO counter_student_refs (user_id, student_id, refs)
+                    SELECT COALESCE(created_by, 0), NEW.student_id, 1 FROM classes
+                    WHERE id = NEW.class_id AND NEW.student_id IS NOT NULL
+                    ON CONFLICT (user_id, student_id) DO UPDATE SET refs = refs + 1;
+                INSERT INTO counters (scope, scope_id, name, value)
+                    SELECT 'user', r.user_id, 'students', 1
+                    FROM counter_student_refs r JOIN classes c ON r.user_id = COALESCE(c.created_by, 0)
+                    WHERE c.id = NEW.class_id AND r.student_id = NEW.student_id AND r.refs = 1
+                    ON CONFLICT (scope, scope_id, name) DO UPDATE SET value = value + 1;
+            END
+        ''',
+        'trg_counter_students_del': '''
+            CREATE TRIGGER IF NOT EXISTS trg_counter_students_del AFTER DELETE ON students
+            WHEN OLD.class_id IS NOT NULL
+            BEGIN
+                UPDATE counters SET value = value - 1
+                    WHERE scope = 'class' AND scope_id = OLD.class_id AND name = 'class_students';
+                UPDATE counter_student_refs SET refs = refs - 1
+                    WHERE user_id = (SELECT COALESCE(created_by, 0) FROM classes WHERE id = OLD.class_id)
+                      AND student_id = OLD.student_id;
+                UPDATE counters SET value = value - 1
+                    WHERE scope = 'user' AND name = 'students'
+                      AND scope_id IN (SELECT user_id FROM counter_student_refs
+                                       WHERE user_id = (SELECT COALESCE(created_by, 0) FROM classes WHERE id = OLD.class_id)
+                                         AND student_id = OLD.student_id AND refs <= 0);
+                DELETE FROM counter_student_refs
+                    WHERE user_id = (SELECT COALESCE(created_by, 0) FROM classes WHERE id = OLD.class_id)
+                      AND student_id = OLD.student_id AND refs <= 0;
+            END
+        ''',
+    }
+
+    def _init_counters(self, cursor, conn):
+        """创建计数器触发器；计数器表为空时（首次迁移）按真实值初始化"""
+        for name, (event, bumps) in self.COUNTER_TRIGGERS.items():
+            body = ''.join(
+                f"INSERT INTO counters (scope, scope_id, name, value) VALUES ('{scope}', {scope_id}, '{counter}', {delta}) "
+                f"ON CONFLICT (scope, scope_id, name) DO UPDATE SET value = value + excluded.value; "
+                for scope, scope_id, counter, delta in bumps
+            )
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body}END")
+        for sql in self.STUDENT_COUNTER_TRIGGERS.values():
+            cursor.execute(sql)
+        conn.commit()
+
+        if cursor.execute("SELECT 1 FROM counters LIMIT 1").fetchone() is None:
+            self.reconcile_counters(repair=True, conn=conn)
+
+    def reconcile_counters(self, repair=True, conn=None):
+        """
+        校验物化计数器与真实 COUNT 是否一致
+        :param repair: 发现偏差时是否用真实值重建计数器
+        :return: 偏差列表 [{'scope', 'scope_id', 'name', 'stored', 'actual'}, ...]
+        """
+        conn = conn or self.get_connection()
+        if not repair:
+            return self._counter_drift(conn, repair)
+        # 读取真实值与重建在同一个写事务内，期间提交的 save_grade 等触发器增量不会被旧的真实值覆盖
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            drift = self._counter_drift(conn, repair)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return drift
+
+    def _counter_drift(self, conn, repair):
+        actual = {}
+        for name, (scope, sql) in self.COUNTER_QUERIES.items():
+            for scope_id, value in conn.execute(sql).fetchall():
+                if value:
+                    actual[(scope, scope_id, name)] = value
+        stored = {(r[0], r[1], r[2]): r[3] for r in
+                  conn.execute("SELECT scope, scope_id, name, value FROM counters").fetchall() if r[3]}
+
+        drift = [
+            {'scope': k[0], 'scope_id': k[1], 'name': k[2], 'stored': stored.get(k, 0), 'actual': actual.get(k, 0)}
+            for k in sorted(set(actual) | set(stored), key=str)
+            if stored.get(k, 0) != actual.get(k, 0)
+        ]
+
+        if repair and (drift or not stored):
+            conn.execute("DELETE FROM counters")
+            conn.executemany("INSERT INTO counters (scope, scope_id, name, value) VALUES (?, ?, ?, ?)",
+                             [(k[0], k[1], k[2], v) for k, v in actual.items()])
+            conn.execute("DELETE FROM counter_student_refs")
+            conn.execute('''
+                         INSERT INTO counter_student_refs (user_id, student_id, refs)
+                         SELECT COALESCE(c.created_by, 0), s.student_id, COUNT(*)
+                         FROM students s JOIN classes c ON s.class_id = c.id
+                         WHERE s.student_id IS NOT NULL
+                         GROUP BY 1, 2
+                         ''')
+        if drift:
+            print(f"[DB] Counter drift detected: {len(drift)} entries{' (repaired)' if repair else ''}")
+        return drift
+
+    def get_user_counters(self, user_id):
+        """用户级计数器：classes / students / graders / pending_tasks / files"""
+        with self.read_connection() as conn:
+            rows = conn.execute("SELECT name, value FROM counters WHERE scope = 'user' AND scope_id = ?",
+                                (user_id,)).fetchall()
+        counters = {name: 0 for name, (scope, _) in self.COUNTER_QUERIES.items() if scope == 'user'}
+        counters.update({row['name']: row['value'] for row in rows})
+        return counters
+
+    # ================= 班级成绩版本号 =================
+
+    GRADE_VERSION_TRIGGERS = {
+        'trg_grade_version_ins': 'AFTER INSERT ON grades WHEN NEW.class_id IS NOT NULL',
+        'trg_grade_version_upd': 'AFTER UPDATE ON grades WHEN NEW.class_id IS NOT NULL',
+        'trg_grade_version_del': 'AFTER DELETE ON grades WHEN OLD.class_id IS NOT NULL',
+    }
+
+    def _init_grade_versions(self, cursor, conn):
+        for name, event in self.GRADE_VERSION_TRIGGERS.items():
+            row = 'OLD' if 'DELETE' in event else 'NEW'
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} {event}
+                BEGIN
+                    INSERT INTO class_grade_versions (class_id, version, last_student_id)
+                        VALUES ({row}.class_id, 1, {row}.student_id)
+                        ON CONFLICT (class_id) DO UPDATE SET version = version + 1,
+                                                             last_student_id = excluded.last_student_id;
+                END
+            ''')
+        conn.commit()
+
+    def get_class_grades_version(self, class_id):
+        """班级成绩版本号：该班 grades 的任何写入都会使其递增"""
+        with self.read_connection() as conn:
+            row = conn.execute("SELECT version FROM class_grade_versions WHERE class_id=?", (class_id,)).fetchone()
+        return row['version'] if row else 0
+
+    def _backfill_grade_items(self, cursor, conn):
+        """一次性迁移：grade_items 为空而 grades 已有分项成绩时，解析 JSON 回填"""
+        if cursor.execute("SELECT 1 FROM grade_items LIMIT 1").fetchone():
+            return
+        rows = cursor.execute(
+            "SELECT id, class_id, score_details FROM grades WHERE score_details IS NOT NULL AND score_details != '[]'"
+        ).fetchall()
+        if not rows:
+            return
+        print(f"[DB] Backfilling grade_items from {len(rows)} grades...")
+        try:
+            for row in rows:
+                self._write_grade_items(conn, row['id'], row['class_id'], row['score_details'])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB] grade_items backfill failed: {e}")
+
+    @staticmethod
+    def _parse_score_items(score_details):
+        """
+        将 score_details (JSON 字符串或列表) 解析为 grade_items 行
+        :return: [(item_order, item_name, score, max_score), ...]
+        """
+        import json
+        if isinstance(score_details, str):
+            try:
+                score_details = json.loads(score_details or '[]')
+            except (ValueError, TypeError):
+                return []
+        if not isinstance(score_details, list):
+            return []
+
+        def to_float(v):
+            try:
+                return float(v) if v is not None and v != '' else None
+            except (ValueError, TypeError):
+                return None
+
+        items = []
+        for idx, d in enumerate(score_details):
+            if not isinstance(d, dict):
+                continue
+            name = str(d.get('name') or f'题{idx + 1}')
+            max_score = d.get('max_score', d.get('full_score'))
+            items.append((idx, name, to_float(d.get('score')), to_float(max_score)))
+        return items
+
+    def _write_grade_items(self, conn, grade_id, class_id, score_details):
+        """写入某条成绩的分项行（调用方负责 commit）"""
+        items = self._parse_score_items(score_details)
+        if items:
+            conn.executemany('''
+                INSERT INTO grade_items (grade_id, class_id, item_name, item_order, score, max_score)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(grade_id, class_id, name, order, score, max_score)
+                  for order, name, score, max_score in items])
+
     def _init_super_admin(self, cursor, conn):
         admin_user = Config.ADMIN_USERNAME
         cursor.execute('SELECT id FROM users WHERE username = ?', (admin_user,))
@@ -542,19 +1388,19 @@ class Database:
         优化：即使 academic_year 为空，也根据 course_name 分组
         注意：文档库为共享设计，所有用户可见所有分类
         """
-        conn = self.get_connection()
-        # 文档库共享设计：所有人可见所有文档分类
-        sql = '''
-              SELECT DISTINCT
-                  COALESCE(academic_year, '未分类') as academic_year,
-                  semester,
-                  course_name,
-                  cohort_tag
-              FROM file_assets
-              WHERE course_name IS NOT NULL AND course_name != ''
-              ORDER BY academic_year DESC, semester ASC, course_name
-              '''
-        return [dict(row) for row in conn.execute(sql).fetchall()]
+        with self.read_connection() as conn:
+            # 文档库共享设计：所有人可见所有文档分类
+            sql = '''
+                  SELECT DISTINCT
+                      COALESCE(academic_year, '未分类') as academic_year,
+                      semester,
+                      course_name,
+                      cohort_tag
+                  FROM file_assets
+                  WHERE course_name IS NOT NULL AND course_name != ''
+                  ORDER BY academic_year DESC, semester ASC, course_name
+                  '''
+            return [dict(row) for row in conn.execute(sql).fetchall()]
 
     def get_files_by_filter(self, user_id, doc_category=None, year=None, course=None, cohort=None, search=None, is_admin=False, include_unparsed=False):
         """
@@ -562,7 +1408,6 @@ class Database:
         :param include_unparsed: 是否包含未解析的文件
         注意：文档库为共享设计，所有用户可见所有文档（编辑/删除权限在前端按 is_owner 控制）
         """
-        conn = self.get_connection()
         # 文档库共享设计：所有人可见所有文档
         sql = "SELECT f.*, u.username as uploader_name FROM file_assets f LEFT JOIN users u ON f.uploaded_by = u.id WHERE 1=1"
         params = []
@@ -583,14 +1428,20 @@ class Database:
             sql += " AND f.cohort_tag = ?"
             params.append(cohort)
 
-        # [增强] 模糊搜索：支持文件名和内容搜索
+        # [增强] 模糊搜索：支持文件名和内容搜索（已归档的解析内容在学年归档库中搜索）
         if search:
-            sql += " AND (f.original_name LIKE ? OR f.parsed_content LIKE ? OR f.course_name LIKE ?)"
             search_pattern = f"%{search}%"
+            sql += " AND (f.original_name LIKE ? OR f.parsed_content LIKE ? OR f.course_name LIKE ?"
             params.extend([search_pattern, search_pattern, search_pattern])
+            archived_ids = self._search_archived_file_ids(search_pattern)
+            if archived_ids:
+                sql += " OR f.id IN (SELECT value FROM json_each(?))"
+                params.append(json.dumps(sorted(archived_ids)))
+            sql += ")"
 
         sql += " ORDER BY f.created_at DESC"
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
     # ================= 签名集管理 [NEW] =================
     def add_signature(self, name, file_hash, file_path, user_id):
@@ -600,7 +1451,6 @@ class Database:
         conn.commit()
 
     def get_signatures(self, search=None, user_id=None):
-        conn = self.get_connection()
         sql = '''
               SELECT s.*, u.username as uploader_name
               FROM signatures s
@@ -613,7 +1463,8 @@ class Database:
             params.append(f"%{search}%")
 
         sql += " ORDER BY s.created_at DESC"
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
     def get_signature_by_id(self, sig_id):
         conn = self.get_connection()
@@ -634,15 +1485,20 @@ class Database:
         conn = self.get_connection()
         conn.execute("UPDATE ai_tasks SET status=? WHERE id=?", (status, task_id))
         conn.commit()
+        if status in ('success', 'failed'):
+            events.emit(events.TASK_FINISHED, task_id=task_id, status=status)
 
     # [新增] 更新文件的解析内容
     def update_file_parsed_content(self, file_id, content):
         conn = self.get_connection()
-        conn.execute("UPDATE file_assets SET parsed_content = ? WHERE id = ?", (content, file_id))
+        conn.execute("UPDATE file_assets SET parsed_content = ?, parsed_content_hash = ? WHERE id = ?",
+                     (content, parsed_content_hash(content), file_id))
         conn.commit()
+        events.emit(events.FILE_CONTENT_UPDATED, file_id=file_id)
 
     # [新增] 更新文件的元数据信息
-    def update_file_metadata(self, file_id, meta_info, doc_category=None, course_name=None, academic_year=None):
+    def update_file_metadata(self, file_id, meta_info, doc_category=None, course_name=None, academic_year=None,
+                             semester=None):
         """
         更新文件的元数据
         :param file_id: 文件 ID
@@ -650,6 +1506,7 @@ class Database:
         :param doc_category: 文档类别 (可选更新)
         :param course_name: 课程名称 (可选更新)
         :param academic_year: 学年 (可选更新)
+        :param semester: 学期 (可选更新)
         """
         import json
         conn = self.get_connection()
@@ -667,6 +1524,9 @@ class Database:
         if academic_year is not None:
             updates.append("academic_year = ?")
             params.append(academic_year)
+        if semester is not None:
+            updates.append("semester = ?")
+            params.append(semester)
 
         params.append(file_id)
         sql = f"UPDATE file_assets SET {', '.join(updates)} WHERE id = ?"
@@ -729,10 +1589,24 @@ class Database:
         return dict(row) if row else None
 
     def get_file_by_id(self, file_id):
-        """根据ID获取文件记录"""
+        """根据ID获取文件记录（已归档的解析内容从学年归档库读回）"""
         conn = self.get_connection()
         row = conn.execute("SELECT * FROM file_assets WHERE id=?", (file_id,)).fetchone()
-        return dict(row) if row else None
+        if not row:
+            return None
+        record = dict(row)
+        if record.get('archived_year') and record.get('parsed_content') is None:
+            record['parsed_content'] = self._get_archived_file_content(record['id'], record['archived_year'])
+        return record
+
+    def _get_archived_file_content(self, file_id, academic_year):
+        with self.history_connection([academic_year]) as (conn, aliases):
+            alias = aliases.get(academic_year)
+            if not alias:
+                return None
+            row = conn.execute(f"SELECT parsed_content FROM {alias}.file_contents WHERE file_id=?",
+                               (file_id,)).fetchone()
+        return row['parsed_content'] if row else None
 
     # ================= [新增] 文件资产管理逻辑 =================
     def save_file_asset(self, file_hash, original_name, file_size, physical_path, user_id):
@@ -745,6 +1619,7 @@ class Database:
                            VALUES (?, ?, ?, ?, ?)
                            ''', (file_hash, original_name, file_size, physical_path, user_id))
             conn.commit()
+            events.emit(events.FILE_UPLOADED, file_id=cursor.lastrowid, user_id=user_id)
             return cursor.lastrowid
         except sqlite3.IntegrityError:
             # 如果哈希冲突（极低概率并发导致），返回已存在的 ID
@@ -753,7 +1628,6 @@ class Database:
 
     def get_user_recent_files(self, user_id, limit=20, search_name=None):
         """获取用户最近使用的文件，支持搜索"""
-        conn = self.get_connection()
         sql = "SELECT * FROM file_assets WHERE uploaded_by=? "
         params = [user_id]
 
@@ -764,7 +1638,8 @@ class Database:
         sql += " ORDER BY created_at DESC LIMIT ?"
         params.append(limit)
 
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
     def get_files(self, limit=50, search_name=None, extensions=None, doc_category=None):
         """获取所有文件，支持搜索和扩展名筛选
@@ -775,7 +1650,6 @@ class Database:
             extensions: 扩展名列表，如 ['.pdf', '.docx']，为空则不筛选
             doc_category: 文档类别筛选，如 'exam', 'course_material'，为空则不筛选
         """
-        conn = self.get_connection()
         sql = "SELECT * FROM file_assets WHERE 1=1 "
         params = []
 
@@ -796,25 +1670,45 @@ class Database:
         sql += " ORDER BY created_at DESC LIMIT ?"
         params.append(limit)
 
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
     def get_user_parsed_files(self, user_id):
         """获取已解析的文件（附带作者信息）"""
+        with self.read_connection() as conn:
+            sql = '''
+                  SELECT file_assets.*, users.username AS uploader_name
+                  FROM file_assets
+                  LEFT JOIN users ON file_assets.uploaded_by = users.id
+                  WHERE parsed_content IS NOT NULL OR archived_year IS NOT NULL
+                  ORDER BY created_at DESC
+                  '''
+            return [dict(row) for row in conn.execute(sql).fetchall()]
+
+    def get_file_asset_locations(self):
+        """全部文件资产的 (id, file_hash, physical_path)，供仓库布局迁移"""
+        return list(self.iter_rows('SELECT id, file_hash, physical_path FROM file_assets', as_tuple=True))
+
+    def update_file_asset_paths(self, updates):
+        """
+        批量更新物理路径（一次事务）
+        :param updates: [(physical_path, file_id), ...]
+        """
+        if not updates:
+            return
         conn = self.get_connection()
-        sql = '''
-              SELECT file_assets.*, users.username AS uploader_name
-              FROM file_assets
-              LEFT JOIN users ON file_assets.uploaded_by = users.id
-              WHERE parsed_content IS NOT NULL
-              ORDER BY created_at DESC
-              '''
-        return [dict(row) for row in conn.execute(sql).fetchall()]
+        conn.executemany("UPDATE file_assets SET physical_path=? WHERE id=?", updates)
+        conn.commit()
 
     def delete_file_asset(self, file_id):
-        """删除文件资产记录"""
+        """删除文件资产记录（连同学年归档库中的解析内容）"""
         conn = self.get_connection()
+        row = conn.execute("SELECT archived_year FROM file_assets WHERE id=?", (file_id,)).fetchone()
         conn.execute("DELETE FROM file_assets WHERE id=?", (file_id,))
         conn.commit()
+        if row and row['archived_year']:
+            self._purge_archive_rows(row['archived_year'], [("DELETE FROM file_contents WHERE file_id=?", (file_id,))])
+        events.emit(events.FILE_DELETED, file_id=file_id)
 
 
     # ================= AI 配置相关 (Admin用) =================
@@ -913,11 +1807,33 @@ class Database:
 
     def get_classes(self, user_id=None):
         """只获取当前用户创建的班级"""
-        conn = self.get_connection()
-        if user_id:
-            return [dict(row) for row in
-                    conn.execute("SELECT * FROM classes WHERE created_by=? ORDER BY id DESC", (user_id,)).fetchall()]
-        return [dict(row) for row in conn.execute("SELECT * FROM classes ORDER BY id DESC").fetchall()]
+        with self.read_connection() as conn:
+            if user_id:
+                return [dict(row) for row in
+                        conn.execute("SELECT * FROM classes WHERE created_by=? ORDER BY id DESC", (user_id,)).fetchall()]
+            return [dict(row) for row in conn.execute("SELECT * FROM classes ORDER BY id DESC").fetchall()]
+
+    def get_classes_with_counts(self, user_id):
+        """当前用户的班级，附带学生数/已批改数（一次查询，计数来自物化计数器）"""
+        sql = '''
+              SELECT c.*,
+                     COALESCE(cs.value, 0) AS student_count,
+                     COALESCE(cg.value, 0) AS graded_count
+              FROM classes c
+                       LEFT JOIN counters cs
+                                 ON cs.scope = 'class' AND cs.scope_id = c.id AND cs.name = 'class_students'
+                       LEFT JOIN counters cg
+                                 ON cg.scope = 'class' AND cg.scope_id = c.id AND cg.name = 'class_graded'
+              WHERE c.created_by = ?
+              ORDER BY c.id DESC
+              '''
+        rows = list(self.iter_rows(sql, (user_id,)))
+        archived = [(row['id'], row['archived_year']) for row in rows if row.get('archived_year')]
+        if archived:
+            counts = self._archived_graded_counts(archived)
+            for row in rows:
+                row['graded_count'] += counts.get(row['id'], 0)
+        return rows
 
     def get_class_by_id(self, class_id):
         conn = self.get_connection()
@@ -943,6 +1859,7 @@ class Database:
         cur.execute("INSERT INTO classes (name, course, workspace_path, strategy, created_by) VALUES (?, ?, ?, ?, ?)",
                     (name, course, workspace_path, strategy, user_id))
         conn.commit()
+        events.emit(events.CLASS_CREATED, class_id=cur.lastrowid, user_id=user_id)
         return cur.lastrowid
 
     def update_class_details(self, class_id, semester=None, hours=None, credits=None, description=None):
@@ -983,8 +1900,8 @@ class Database:
         return cur.lastrowid
 
     def get_textbooks(self):
-        conn = self.get_connection()
-        return [dict(r) for r in conn.execute('SELECT * FROM textbooks ORDER BY created_at DESC').fetchall()]
+        with self.read_connection() as conn:
+            return [dict(r) for r in conn.execute('SELECT * FROM textbooks ORDER BY created_at DESC').fetchall()]
 
     def add_class_textbook(self, class_id, textbook_id):
         conn = self.get_connection()
@@ -1033,10 +1950,15 @@ class Database:
 
     def delete_class(self, class_id):
         conn = self.get_connection()
+        owner = conn.execute("SELECT created_by, archived_year FROM classes WHERE id=?", (class_id,)).fetchone()
         conn.execute("DELETE FROM students WHERE class_id=?", (class_id,))
+        conn.execute("DELETE FROM grade_items WHERE class_id=?", (class_id,))
         conn.execute("DELETE FROM grades WHERE class_id=?", (class_id,))
         conn.execute("DELETE FROM classes WHERE id=?", (class_id,))
         conn.commit()
+        if owner and owner['archived_year']:
+            self._purge_archived_grades(class_id, owner['archived_year'])
+        events.emit(events.CLASS_DELETED, class_id=class_id, user_id=owner['created_by'] if owner else None)
 
     def update_class_workspace(self, class_id, workspace_path):
         conn = self.get_connection()
@@ -1049,67 +1971,297 @@ class Database:
                      (student_id, name, class_id))
         conn.commit()
 
+    # 学生+成绩查询可投影的列（列名 -> SQL 表达式）
+    STUDENT_GRADE_COLUMNS = {
+        'id': 's.id',
+        'student_id': 's.student_id',
+        'name': 's.name',
+        'gender': 's.gender',
+        'class_id': 's.class_id',
+        'total_score': 'g.total_score',
+        'score_details': 'g.score_details',
+        'deduct_details': 'g.deduct_details',
+        'status': 'g.status',
+        'filename': 'g.filename',
+    }
+
+    def iter_students_with_grades(self, class_id, columns=None, as_tuple=False):
+        """
+        流式产出班级学生及成绩（get_students_with_grades 的惰性、可投影版本）
+        :param columns: 需要的列名序列（见 STUDENT_GRADE_COLUMNS），默认全部；
+                        只取学生列时不会 JOIN 成绩表
+        :param as_tuple: True 时按 columns 顺序产出 tuple
+        """
+        columns = list(columns or self.STUDENT_GRADE_COLUMNS)
+        unknown = set(columns) - set(self.STUDENT_GRADE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        select = ', '.join(f"{self.STUDENT_GRADE_COLUMNS[c]} AS {c}" for c in columns)
+
+        if not any(self.STUDENT_GRADE_COLUMNS[c].startswith('g.') for c in columns):
+            sql = f"SELECT {select} FROM students s WHERE s.class_id = ? ORDER BY s.id"
+            yield from self.iter_rows(sql, (class_id,), as_tuple)
+            return
+
+        with self._class_grades_source(class_id) as (conn, grades, _):
+            sql = f'''
+                  SELECT {select}
+                  FROM students s
+                           LEFT JOIN {grades} g ON s.student_id = g.student_id AND g.class_id = s.class_id
+                  WHERE s.class_id = ?
+                  ORDER BY s.id
+                  '''
+            yield from self.iter_rows(sql, (class_id,), as_tuple, conn=conn)
+
+    def get_student_ids(self, class_id):
+        """班级学号列表（批量批改等只需要学号的场景）"""
+        return [sid for (sid,) in self.iter_students_with_grades(class_id, ('student_id',), as_tuple=True)]
+
     def get_students_with_grades(self, class_id):
-        conn = self.get_connection()
-        # 移除 task1_score, task2_score，改为 score_details
-        sql = '''
-              SELECT s.*,
-                     g.total_score,
-                     g.score_details,
-                     g.deduct_details,
-                     g.status,
-                     g.filename
-              FROM students s
-                       LEFT JOIN grades g ON s.student_id = g.student_id AND g.class_id = s.class_id
-              WHERE s.class_id = ? \
-              '''
-        return [dict(row) for row in conn.execute(sql, (class_id,)).fetchall()]
+        with self._class_grades_source(class_id) as (conn, grades, _):
+            # 移除 task1_score, task2_score，改为 score_details
+            sql = f'''
+                  SELECT s.*,
+                         g.total_score,
+                         g.score_details,
+                         g.deduct_details,
+                         g.status,
+                         g.filename
+                  FROM students s
+                           LEFT JOIN {grades} g ON s.student_id = g.student_id AND g.class_id = s.class_id
+                  WHERE s.class_id = ?
+                  '''
+            return [dict(row) for row in conn.execute(sql, (class_id,)).fetchall()]
 
     def get_student_detail(self, class_id, student_id):
-        conn = self.get_connection()
-        sql = '''
-              SELECT s.*, \
-                     g.total_score,
-                     g.score_details, \
-                     g.deduct_details, \
-                     g.status, \
-                     g.filename
-              FROM students s
-                       LEFT JOIN grades g ON s.student_id = g.student_id AND g.class_id = s.class_id
-              WHERE s.student_id = ? \
-                AND s.class_id = ? \
-              '''
-        row = conn.execute(sql, (student_id, class_id)).fetchone()
+        with self._class_grades_source(class_id) as (conn, grades, _):
+            sql = f'''
+                  SELECT s.*,
+                         g.total_score,
+                         g.score_details,
+                         g.deduct_details,
+                         g.status,
+                         g.filename
+                  FROM students s
+                           LEFT JOIN {grades} g ON s.student_id = g.student_id AND g.class_id = s.class_id
+                  WHERE s.student_id = ?
+                    AND s.class_id = ?
+                  '''
+            row = conn.execute(sql, (student_id, class_id)).fetchone()
         return dict(row) if row else None
 
     def clear_grades(self, class_id):
         conn = self.get_connection()
+        conn.execute("DELETE FROM grade_items WHERE class_id=?", (class_id,))
         conn.execute("DELETE FROM grades WHERE class_id=?", (class_id,))
         conn.commit()
+        year = self._get_class_archived_year(class_id)
+        if year:
+            self._purge_archived_grades(class_id, year)
+
+    def _purge_archived_grades(self, class_id, academic_year):
+        self._purge_archive_rows(academic_year, [
+            ("DELETE FROM grade_items WHERE class_id=?", (class_id,)),
+            ("DELETE FROM grades WHERE class_id=?", (class_id,)),
+        ])
+
+    def _upsert_grade(self, conn, student_id, class_id, values):
+        """
+        写入学生在班级中的成绩：已有记录原地更新（清空旧分项），否则插入（调用方负责 commit）
+        每次保存只对 grades 产生一次写入，成绩版本号随之只前进 1
+        :return: grade_id
+        """
+        ids = [r[0] for r in conn.execute("SELECT id FROM grades WHERE student_id=? AND class_id=? ORDER BY id",
+                                          (student_id, class_id)).fetchall()]
+        columns = ('total_score', 'score_details', 'deduct_details', 'status', 'filename')
+        if not ids:
+            cur = conn.execute(f'''
+                         INSERT INTO grades (student_id, class_id, {', '.join(columns)})
+                         VALUES (?, ?, ?, ?, ?, ?, ?)
+                         ''', (student_id, class_id) + tuple(values))
+            return cur.lastrowid
+
+        grade_id = ids[0]
+        if len(ids) > 1:
+            # 历史遗留的重复记录
+            extra = ','.join('?' * (len(ids) - 1))
+            conn.execute(f"DELETE FROM grade_items WHERE grade_id IN ({extra})", ids[1:])
+            conn.execute(f"DELETE FROM grades WHERE id IN ({extra})", ids[1:])
+        conn.execute("DELETE FROM grade_items WHERE grade_id=?", (grade_id,))
+        conn.execute(f"UPDATE grades SET {', '.join(c + '=?' for c in columns)} WHERE id=?",
+                     tuple(values) + (grade_id,))
+        return grade_id
 
     def save_grade(self, student_id, class_id, total, score_details_json, deduct_details, status, filename):
         conn = self.get_connection()
-        # 使用 REPLACE INTO 或先删后插 (这里保持原有逻辑，先删后插)
-        conn.execute("DELETE FROM grades WHERE student_id=? AND class_id=?", (student_id, class_id))
+        grade_id = self._upsert_grade(conn, student_id, class_id,
+                                      (total, score_details_json, deduct_details, status, filename))
+        # 同一事务内写入分项行，保证与 score_details 一致
+        self._write_grade_items(conn, grade_id, class_id, score_details_json)
+        conn.commit()
+        events.emit(events.GRADE_SAVED, class_id=class_id, student_id=student_id)
 
-        conn.execute('''
-                     INSERT INTO grades (student_id, class_id, total_score, score_details,
-                                         deduct_details, status, filename)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)
-                     ''', (student_id, class_id, total, score_details_json, deduct_details, status, filename))
+    def update_grade_scores(self, class_id, student_id, total, score_details):
+        """
+        修改已有成绩的总分和分项（在线编辑登分表时使用），同步重写 grade_items
+        :param score_details: 分项列表 [{"name": ..., "score": ...}, ...]
+        :return: 是否找到成绩记录
+        """
+        import json
+        conn = self.get_connection()
+        row = conn.execute("SELECT id FROM grades WHERE class_id=? AND student_id=?",
+                           (class_id, student_id)).fetchone()
+        if not row:
+            return False
+        conn.execute("UPDATE grades SET total_score=?, score_details=? WHERE id=?",
+                     (total, json.dumps(score_details, ensure_ascii=False), row['id']))
+        conn.execute("DELETE FROM grade_items WHERE grade_id=?", (row['id'],))
+        self._write_grade_items(conn, row['id'], class_id, score_details)
         conn.commit()
+        events.emit(events.GRADE_SAVED, class_id=class_id, student_id=student_id)
+        return True
 
     def save_grade_error(self, student_id, class_id, msg, filename):
         conn = self.get_connection()
-        conn.execute("DELETE FROM grades WHERE student_id=? AND class_id=?", (student_id, class_id))
-
         # 错误时，score_details 存为空列表 JSON
-        conn.execute('''
-                     INSERT INTO grades (student_id, class_id, total_score, score_details,
-                                         deduct_details, status, filename)
-                     VALUES (?, ?, 0, '[]', ?, "ERROR", ?)
-                     ''', (student_id, class_id, msg, filename))
+        self._upsert_grade(conn, student_id, class_id, (0, '[]', msg, 'ERROR', filename))
         conn.commit()
+        events.emit(events.GRADE_SAVED, class_id=class_id, student_id=student_id)
+
+    # ================= 成绩分项统计 (grade_items) =================
+
+    def get_grade_item_columns(self, class_id):
+        """
+        获取班级成绩的分项列（按题目顺序）
+        按分项位置分组：同一份成绩中重名的分项各占一列，列名取该位置最常见的名称
+        :return: [{'item_name', 'item_order', 'max_score', 'top_score'}, ...]
+                 max_score 为批改核心声明的满分，top_score 为班级实际最高分
+        """
+        with self._class_grades_source(class_id) as (conn, _, items):
+            sql = f'''
+                  SELECT (SELECT n.item_name FROM {items} n
+                          WHERE n.class_id = gi.class_id AND n.item_order = gi.item_order
+                          GROUP BY n.item_name ORDER BY COUNT(*) DESC, MIN(n.id) LIMIT 1) AS item_name,
+                         item_order,
+                         MAX(max_score)  AS max_score,
+                         MAX(score)      AS top_score
+                  FROM {items} gi
+                  WHERE class_id = ?
+                  GROUP BY item_order
+                  ORDER BY item_order
+                  '''
+            return [dict(row) for row in conn.execute(sql, (class_id,)).fetchall()]
+
+    def get_grade_item_stats(self, class_id):
+        """按分项（位置）聚合班级成绩：人数、平均分、最高/最低分"""
+        with self._class_grades_source(class_id) as (conn, _, items):
+            sql = f'''
+                  SELECT (SELECT n.item_name FROM {items} n
+                          WHERE n.class_id = gi.class_id AND n.item_order = gi.item_order
+                          GROUP BY n.item_name ORDER BY COUNT(*) DESC, MIN(n.id) LIMIT 1) AS item_name,
+                         item_order,
+                         COUNT(score)           AS graded_count,
+                         ROUND(AVG(score), 2)   AS avg_score,
+                         MIN(score)             AS min_score,
+                         MAX(score)             AS top_score,
+                         MAX(max_score)         AS max_score
+                  FROM {items} gi
+                  WHERE class_id = ?
+                  GROUP BY item_order
+                  ORDER BY item_order
+                  '''
+            return [dict(row) for row in conn.execute(sql, (class_id,)).fetchall()]
+
+    def get_grade_item_distribution(self, class_id, item_order, bucket_size=10):
+        """
+        单个分项的分数分布（按分项位置 item_order 定位，与 get_grade_item_columns 的列一致）
+        :param bucket_size: 分段宽度，如 10 表示 0-9.x / 10-19.x ...
+        :return: [{'bucket': 下界, 'count': 人数}, ...]
+        """
+        with self._class_grades_source(class_id) as (conn, _, items):
+            sql = f'''
+                  SELECT CAST(score / ? AS INTEGER) * ? AS bucket, COUNT(*) AS count
+                  FROM {items}
+                  WHERE class_id = ? AND item_order = ? AND score IS NOT NULL
+                  GROUP BY bucket
+                  ORDER BY bucket
+                  '''
+            return [dict(row) for row in conn.execute(sql, (bucket_size, bucket_size, class_id, item_order)).fetchall()]
+
+    def get_class_grade_items_long(self, class_id, student_id=None):
+        """
+        长表形式的班级成绩（一条 SQL，同一快照内带出成绩版本号），供成绩分析载入矩阵
+        批改失败 (ERROR) 的成绩不计入；指定 student_id 时只取该学生
+        :return: (version, last_student_id, [(student_id, total_score, item_name, item_order, score, max_score), ...])
+                 无分项的成绩 item_name 为 None
+        """
+        student_filter = 'AND g.student_id = ?' if student_id is not None else ''
+        params = [class_id, class_id] + ([student_id] if student_id is not None else [])
+        with self._class_grades_source(class_id) as (conn, grades, items):
+            sql = f'''
+                  SELECT v.version, v.last_student_id, g.student_id, g.total_score,
+                         gi.item_name, gi.item_order, gi.score, gi.max_score
+                  FROM (SELECT COALESCE(MAX(version), 0) AS version, MAX(last_student_id) AS last_student_id
+                        FROM class_grade_versions WHERE class_id = ?) v
+                           LEFT JOIN {grades} g
+                                     ON g.class_id = ? AND COALESCE(g.status, '') != 'ERROR' {student_filter}
+                           LEFT JOIN {items} gi ON gi.grade_id = g.id
+                  ORDER BY g.id, gi.item_order
+                  '''
+            rows = list(self.iter_rows(sql, params, as_tuple=True, conn=conn))
+        return rows[0][0], rows[0][1], [row[2:] for row in rows if row[2] is not None]
+
+    # 成绩透视表的固定列（分项列在其后）
+    SCORE_MATRIX_COLUMNS = ('student_id', 'name', 'gender', 'total_score', 'deduct_details', 'status', 'filename')
+
+    def iter_class_score_matrix(self, class_id, as_tuple=False):
+        """
+        流式成绩透视表：每个学生一行，每个分项一列（一条 SQL 完成透视）
+        :return: (columns, rows)
+                 columns: get_grade_item_columns 的结果
+                 rows: 惰性迭代器；as_tuple=False 时每行为
+                       {'student_id', 'name', 'gender', 'total_score', 'deduct_details',
+                        'status', 'filename', 'items': [score 或 None, ...]}
+                       as_tuple=True 时为 SCORE_MATRIX_COLUMNS + 各分项分数组成的扁平 tuple
+        """
+        columns = self.get_grade_item_columns(class_id)
+        return columns, self._iter_score_matrix_rows(class_id, columns, as_tuple)
+
+    def _iter_score_matrix_rows(self, class_id, columns, as_tuple):
+        pivot_cols = ''.join(
+            f", MAX(CASE WHEN gi.item_order = ? THEN gi.score END) AS item_{i}" for i in range(len(columns))
+        )
+        params = [c['item_order'] for c in columns] + [class_id]
+        fixed = len(self.SCORE_MATRIX_COLUMNS)
+
+        with self._class_grades_source(class_id) as (conn, grades, items):
+            sql = f'''
+                  SELECT s.student_id,
+                         s.name,
+                         s.gender,
+                         g.total_score,
+                         g.deduct_details,
+                         g.status,
+                         g.filename{pivot_cols}
+                  FROM students s
+                           LEFT JOIN {grades} g ON s.student_id = g.student_id AND g.class_id = s.class_id
+                           LEFT JOIN {items} gi ON gi.grade_id = g.id
+                  WHERE s.class_id = ?
+                  GROUP BY s.id
+                  ORDER BY s.id
+                  '''
+            for row in self.iter_rows(sql, params, as_tuple=True, conn=conn):
+                if as_tuple:
+                    yield row
+                else:
+                    item = dict(zip(self.SCORE_MATRIX_COLUMNS, row))
+                    item['items'] = list(row[fixed:])
+                    yield item
+
+    def get_class_score_matrix(self, class_id):
+        """成绩透视表（一次性物化版本），返回值见 iter_class_score_matrix"""
+        columns, rows = self.iter_class_score_matrix(class_id)
+        return columns, list(rows)
 
     # ================= AI 任务相关 =================
     def insert_ai_task(self, name, status="pending", log_info="等待队列中...",
@@ -1123,6 +2275,7 @@ class Database:
             (name, status, log_info, exam_path, standard_path, strictness, extra_desc, max_score, user_id, grader_id, course_name, extra_prompt)
         )
         conn.commit()
+        events.emit(events.TASK_CREATED, task_id=cur.lastrowid, user_id=user_id)
         return cur.lastrowid
 
     def update_ai_task(self, task_id, status=None, log_info=None, grader_id=None, course_name=None):
@@ -1147,6 +2300,8 @@ class Database:
             params.append(task_id)
             conn.execute(f"UPDATE ai_tasks SET {', '.join(updates)} WHERE id=?", params)
             conn.commit()
+            if status in ('success', 'failed'):
+                events.emit(events.TASK_FINISHED, task_id=task_id, status=status)
 
     def update_task_status_by_grader_id(self, grader_id, status):
         """[新增] 根据 grader_id 更新任务状态 (用于删除/恢复同步)"""
@@ -1156,15 +2311,15 @@ class Database:
 
     def get_ai_tasks(self, limit=20):
         """获取任务，并联表查询创建者名称"""
-        conn = self.get_connection()
-        sql = '''
-              SELECT t.*, u.username as creator_name
-              FROM ai_tasks t
-                       LEFT JOIN users u ON t.created_by = u.id
-              ORDER BY t.created_at DESC \
-              LIMIT ? \
-              '''
-        return [dict(row) for row in conn.execute(sql, (limit,)).fetchall()]
+        with self.read_connection() as conn:
+            sql = '''
+                  SELECT t.*, u.username as creator_name
+                  FROM ai_tasks t
+                           LEFT JOIN users u ON t.created_by = u.id
+                  ORDER BY t.created_at DESC \
+                  LIMIT ? \
+                  '''
+            return [dict(row) for row in conn.execute(sql, (limit,)).fetchall()]
 
     def get_ai_task_by_id(self, task_id):
         conn = self.get_connection()
@@ -1185,6 +2340,49 @@ class Database:
         row = conn.execute(sql, (grader_id,)).fetchone()
         return dict(row) if row else None
 
+    # --- 批改核心目录 ---
+
+    GRADER_CATALOG_COLUMNS = ('grader_id', 'name', 'course', 'type', 'filename', 'source_hash',
+                              'description', 'strictness', 'created_by', 'created_at')
+
+    def upsert_grader_catalog(self, entries):
+        """写入/覆盖批改核心目录条目 (entries: dict 列表，键见 GRADER_CATALOG_COLUMNS)"""
+        if not entries:
+            return
+        cols = self.GRADER_CATALOG_COLUMNS
+        conn = self.get_connection()
+        conn.executemany(f'''
+            INSERT INTO grader_catalog ({', '.join(cols)}, updated_at)
+            VALUES ({', '.join('?' * len(cols))}, CURRENT_TIMESTAMP)
+            ON CONFLICT(grader_id) DO UPDATE SET
+                {', '.join(f'{c} = excluded.{c}' for c in cols[1:])},
+                updated_at = CURRENT_TIMESTAMP
+        ''', [tuple(entry.get(c) for c in cols) for entry in entries])
+        conn.commit()
+        events.emit(events.GRADER_CATALOG_CHANGED, grader_ids=[entry.get('grader_id') for entry in entries])
+
+    def delete_grader_catalog(self, *grader_ids):
+        if not grader_ids:
+            return
+        conn = self.get_connection()
+        conn.executemany("DELETE FROM grader_catalog WHERE grader_id=?", [(gid,) for gid in grader_ids])
+        conn.commit()
+        events.emit(events.GRADER_CATALOG_CHANGED, grader_ids=list(grader_ids))
+
+    def get_grader_catalog(self):
+        """全部批改核心（附创建者用户名），按创建时间倒序"""
+        sql = '''
+              SELECT c.*, u.username AS creator_name
+              FROM grader_catalog c
+                       LEFT JOIN users u ON c.created_by = u.id
+              ORDER BY COALESCE(c.created_at, '0') DESC
+              '''
+        return list(self.iter_rows(sql))
+
+    def count_grader_catalog(self):
+        with self.read_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM grader_catalog").fetchone()[0]
+
     # --- 回收站逻辑 ---
 
     def recycle_grader_record(self, grader_id, original_name, backup_filename):
@@ -1194,9 +2392,9 @@ class Database:
         conn.commit()
 
     def get_recycled_graders(self):
-        conn = self.get_connection()
-        return [dict(row) for row in
-                conn.execute("SELECT * FROM grader_recycle_bin ORDER BY deleted_at DESC").fetchall()]
+        with self.read_connection() as conn:
+            return [dict(row) for row in
+                    conn.execute("SELECT * FROM grader_recycle_bin ORDER BY deleted_at DESC").fetchall()]
 
     def restore_grader_record(self, recycle_id):
         conn = self.get_connection()
@@ -1260,13 +2458,13 @@ class Database:
 
     def get_student_details(self, student_list_id):
         """获取学生名单的所有学生详细信息"""
-        conn = self.get_connection()
-        rows = conn.execute('''
-            SELECT * FROM student_details
-            WHERE student_list_id = ?
-            ORDER BY student_id
-            ''', (student_list_id,)).fetchall()
-        return [dict(row) for row in rows]
+        with self.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT * FROM student_details
+                WHERE student_list_id = ?
+                ORDER BY student_id
+                ''', (student_list_id,)).fetchall()
+            return [dict(row) for row in rows]
 
     def update_student_detail(self, detail_id, student_id, name, gender, email, phone, status):
         """更新学生详细信息"""
@@ -1329,8 +2527,6 @@ class Database:
         :param fetch_all: 是否获取所有数据 (权限: 普通用户可使用任何人的数据 -> True)
         :param search: 模糊搜索关键词 (班级名/学院/年份)
         """
-        conn = self.get_connection()
-
         sql = '''
               SELECT sl.*, u.username as uploader_name, fa.original_name as source_file
               FROM student_lists sl
@@ -1355,7 +2551,7 @@ class Database:
 
         sql += " ORDER BY sl.created_at DESC"
 
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        return list(self.iter_rows(sql, params))
 
     def delete_student_list(self, list_id):
         """删除学生名单记录及所有关联的学生"""
@@ -1486,15 +2682,18 @@ class Database:
             related_id=f"task_{task_id}"
         )
 
-    def get_notifications(self, user_id, limit=20, include_read=False):
+    def get_notifications(self, user_id, limit=20, include_read=False, include_archived=False):
         """
         获取用户的通知列表
         :param user_id: 用户 ID
         :param limit: 返回数量限制
         :param include_read: 是否包含已读通知
+        :param include_archived: 是否合并学年归档库中的历史通知（仅在 include_read 时生效）
         :return: 通知列表
         """
-        conn = self.get_connection()
+        if include_read and include_archived and self.get_archived_years():
+            return self._get_notifications_with_history(user_id, limit)
+
         sql = '''
             SELECT * FROM notifications
             WHERE user_id = ?
@@ -1507,16 +2706,25 @@ class Database:
         sql += " ORDER BY created_at DESC LIMIT ?"
         params.append(limit)
 
-        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        return list(self.iter_rows(sql, params))
+
+    def _get_notifications_with_history(self, user_id, limit):
+        columns = 'id, user_id, type, title, message, detail, link, related_id, is_read, created_at'
+        with self.history_connection() as (conn, aliases):
+            parts = [f"SELECT {columns} FROM main.notifications WHERE user_id = ?"]
+            parts += [f"SELECT {columns} FROM {alias}.notifications WHERE user_id = ?" for alias in aliases.values()]
+            sql = " UNION ALL ".join(parts) + " ORDER BY created_at DESC LIMIT ?"
+            params = [user_id] * len(parts) + [limit]
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
     def get_unread_notification_count(self, user_id):
         """获取用户未读通知数量"""
-        conn = self.get_connection()
-        row = conn.execute('''
-            SELECT COUNT(*) as count FROM notifications
-            WHERE user_id = ? AND is_read = 0
-        ''', (user_id,)).fetchone()
-        return row['count'] if row else 0
+        with self.read_connection() as conn:
+            row = conn.execute('''
+                SELECT COUNT(*) as count FROM notifications
+                WHERE user_id = ? AND is_read = 0
+            ''', (user_id,)).fetchone()
+            return row['count'] if row else 0
 
     def mark_notification_read(self, notification_id, user_id):
         """标记单条通知为已读"""
@@ -1554,13 +2762,14 @@ class Database:
         conn.commit()
 
     def clean_old_notifications(self, days=30):
-        """清理超过指定天数的已读通知"""
+        """清理超过指定天数的已读通知，返回删除条数"""
         conn = self.get_connection()
-        conn.execute('''
+        cursor = conn.execute('''
             DELETE FROM notifications
             WHERE is_read = 1 AND created_at < datetime('now', ?)
         ''', (f'-{days} days',))
         conn.commit()
+        return cursor.rowcount
 
     def update_notification_by_related_id(self, related_id, notif_type=None, title=None, detail=None, link=None):
         """
@@ -1592,6 +2801,403 @@ class Database:
             conn.execute(sql, params)
             conn.commit()
 
+    def apply_notification_updates(self, updates):
+        """
+        批量按关联 ID 更新通知（同一事务、一次提交），供通知合并总线落库
+        :param updates: [(related_id, notif_type, title, detail, link), ...]，None 表示该字段不变
+        """
+        if not updates:
+            return
+        conn = self.get_connection()
+        conn.executemany('''
+            UPDATE notifications
+            SET type   = COALESCE(?, type),
+                title  = COALESCE(?, title),
+                detail = COALESCE(?, detail),
+                link   = COALESCE(?, link),
+                is_read = 0
+            WHERE related_id = ?
+        ''', [(notif_type, title, detail, link, related_id)
+              for related_id, notif_type, title, detail, link in updates])
+        conn.commit()
+
+    def save_rate_limit_buckets(self, buckets):
+        """
+        写入令牌桶快照（一次事务）
+        :param buckets: [(bucket, tokens, updated_at), ...]
+        """
+        if not buckets:
+            return
+        conn = self.get_connection()
+        conn.executemany('''
+            INSERT INTO rate_limit_buckets (bucket, tokens, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+        ''', buckets)
+        conn.commit()
+
+    def load_rate_limit_buckets(self):
+        """读取全部令牌桶快照 [(bucket, tokens, updated_at), ...]"""
+        return [tuple(row) for row in self.get_connection().execute(
+            'SELECT bucket, tokens, updated_at FROM rate_limit_buckets')]
+
+    def cleanup_rate_limit_buckets(self, before):
+        """删除 before（Unix 时间戳）之前未再变化的桶快照（早已回满，无需保留）"""
+        conn = self.get_connection()
+        cursor = conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (before,))
+        conn.commit()
+        return cursor.rowcount
+
+    # ================= 后台维护 [NEW] =================
+
+    def sync_maintenance_jobs(self, jobs):
+        """
+        登记维护任务：新任务写入首次运行时间，已有任务只更新周期（保留下次运行时间）
+        :param jobs: [(name, interval_seconds, first_run_at), ...]
+        """
+        conn = self.get_connection()
+        conn.executemany('''
+            INSERT INTO maintenance_jobs (name, interval_seconds, next_run_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET interval_seconds = excluded.interval_seconds
+        ''', jobs)
+        conn.commit()
+
+    def claim_maintenance_job(self, name, owner, now, lock_seconds, force=False):
+        """
+        原子地领取一个到期任务（条件 UPDATE，多进程下只有一个成功）
+        :param force: 忽略下次运行时间（手动触发），但仍需锁空闲
+        :return: 是否领取成功
+        """
+        conn = self.get_connection()
+        cursor = conn.execute('''
+            UPDATE maintenance_jobs SET lock_owner = ?, lock_expires_at = ?
+            WHERE name = ? AND (? OR next_run_at <= ?)
+              AND (lock_owner IS NULL OR lock_expires_at < ?)
+        ''', (owner, now + lock_seconds, name, 1 if force else 0, now, now))
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def finish_maintenance_job(self, name, owner, started_at, finished_at, status, result, next_run_at):
+        """释放任务锁、写入下次运行时间并记录运行历史（同一事务）"""
+        import json
+        conn = self.get_connection()
+        with conn:
+            conn.execute('''
+                UPDATE maintenance_jobs
+                SET lock_owner = NULL, lock_expires_at = NULL, next_run_at = ?,
+                    last_status = ?, last_finished_at = ?
+                WHERE name = ? AND lock_owner = ?
+            ''', (next_run_at, status, finished_at, name, owner))
+            conn.execute('''
+                INSERT INTO maintenance_runs (job, runner, started_at, finished_at, status, result)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, owner, started_at, finished_at, status, json.dumps(result, ensure_ascii=False)))
+
+    def get_maintenance_jobs(self):
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute('SELECT * FROM maintenance_jobs ORDER BY name')]
+
+    def get_maintenance_runs(self, job=None, limit=50):
+        import json
+        sql = 'SELECT * FROM maintenance_runs'
+        params = []
+        if job:
+            sql += ' WHERE job = ?'
+            params.append(job)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        with self.read_connection() as conn:
+            runs = [dict(row) for row in conn.execute(sql, params)]
+        for run in runs:
+            run['result'] = json.loads(run['result']) if run['result'] else None
+        return runs
+
+    def prune_maintenance_runs(self, before):
+        """删除 before（Unix 时间戳）之前的运行记录"""
+        conn = self.get_connection()
+        cursor = conn.execute('DELETE FROM maintenance_runs WHERE started_at < ?', (before,))
+        conn.commit()
+        return cursor.rowcount
+
+    def analyze(self, analysis_limit=1000):
+        """刷新查询规划器统计信息（analysis_limit 限制每个索引的采样行数）"""
+        conn = self.get_connection()
+        conn.execute(f'PRAGMA analysis_limit={int(analysis_limit)}')
+        conn.execute('ANALYZE')
+        conn.commit()
+
+    def get_page_stats(self):
+        """主库页统计：{'page_count', 'freelist_count', 'page_size', 'auto_vacuum'}"""
+        conn = self.get_connection()
+        return {pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                for pragma in ('page_count', 'freelist_count', 'page_size', 'auto_vacuum')}
+
+    def incremental_vacuum(self, max_pages):
+        """
+        回收空闲页：auto_vacuum=INCREMENTAL 时每次最多回收 max_pages 页；
+        旧库（auto_vacuum=NONE）跳过，不在定时任务中做完整 VACUUM（由管理员调用 enable_incremental_vacuum 转换）
+        :return: 回收前后的页统计
+        """
+        before = self.get_page_stats()
+        if before['auto_vacuum'] != 2:
+            return {'before': before, 'skipped': 'auto_vacuum is not INCREMENTAL'}
+        self.get_connection().execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+        return {'before': before, 'after': self.get_page_stats()}
+
+    def enable_incremental_vacuum(self):
+        """
+        把旧库切换为 auto_vacuum=INCREMENTAL：需要一次完整 VACUUM 重写整个库，期间阻塞所有写入，只由管理员手动执行
+        :return: 转换前后的页统计
+        """
+        conn = self.get_connection()
+        before = self.get_page_stats()
+        if before['auto_vacuum'] != 2:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        return {'before': before, 'after': self.get_page_stats()}
+
+    def checkpoint_wal(self):
+        """WAL 检查点并截断 -wal 文件，返回 (busy, wal 页数, 已写回页数)"""
+        return tuple(self.get_connection().execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
+
+    def get_class_owners(self):
+        """{班级ID: 创建者ID}"""
+        with self.read_connection() as conn:
+            return dict(conn.execute('SELECT id, created_by FROM classes').fetchall())
+
+    def get_referenced_repo_names(self, file_hashes):
+        """
+        一批哈希中仍被 file_assets 引用的仓库文件名（按文件名比较，不受部署目录变化影响）
+        :return: {哈希: 文件名}
+        """
+        file_hashes = list(file_hashes)
+        if not file_hashes:
+            return {}
+        placeholders = ','.join('?' * len(file_hashes))
+        with self.read_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT file_hash, physical_path FROM file_assets
+                WHERE file_hash IN ({placeholders}) AND physical_path IS NOT NULL
+            ''', file_hashes).fetchall()
+        return {row[0]: os.path.basename(row[1].replace('\\', '/')) for row in rows}
+
+    def get_signature_hashes(self):
+        with self.read_connection() as conn:
+            return {row[0] for row in conn.execute('SELECT DISTINCT file_hash FROM signatures')}
+
+    def get_file_usage_by_user(self):
+        """文档库按上传者、文档类别统计：[{'user_id', 'doc_category', 'files', 'bytes'}]"""
+        with self.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT uploaded_by, doc_category, COUNT(*), COALESCE(SUM(file_size), 0)
+                FROM file_assets GROUP BY uploaded_by, doc_category
+            ''').fetchall()
+        return [{'user_id': r[0], 'doc_category': r[1], 'files': r[2], 'bytes': r[3]} for r in rows]
+
+    # ================= 文档解析任务 [NEW] =================
+
+    def create_parse_job(self, job_id, kind, dedupe_key, file_id, doc_type, user_id, now):
+        conn = self.get_connection()
+        conn.execute('''
+            INSERT INTO parse_jobs (id, kind, dedupe_key, file_id, doc_type, user_id, status, progress,
+                                    created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?)
+        ''', (job_id, kind, dedupe_key, file_id, doc_type, user_id, now, now))
+        conn.commit()
+
+    def update_parse_job(self, job_id, now, status=None, stage=None, progress=None, message=None, result=None):
+        """更新任务状态，未传入的字段保持不变；result 为 dict 时序列化为 JSON"""
+        import json
+        fields = {'status': status, 'stage': stage, 'progress': progress, 'message': message,
+                  'result': json.dumps(result, ensure_ascii=False) if result is not None else None}
+        updates = [(k, v) for k, v in fields.items() if v is not None]
+        sql = ', '.join([f'{k} = ?' for k, _ in updates] + ['updated_at = ?'])
+        conn = self.get_connection()
+        conn.execute(f'UPDATE parse_jobs SET {sql} WHERE id = ?', [v for _, v in updates] + [now, job_id])
+        conn.commit()
+
+    def get_parse_job(self, job_id):
+        import json
+        with self.read_connection() as conn:
+            row = conn.execute('SELECT * FROM parse_jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def find_active_parse_job(self, dedupe_key, since):
+        """查找 since 之后仍有进展的同内容进行中任务 ID"""
+        with self.read_connection() as conn:
+            row = conn.execute('''
+                SELECT id FROM parse_jobs
+                WHERE dedupe_key = ? AND status IN ('queued', 'running') AND updated_at >= ?
+                ORDER BY created_at DESC LIMIT 1
+            ''', (dedupe_key, since)).fetchone()
+        return row[0] if row else None
+
+    def prune_parse_jobs(self, before):
+        """删除 before（Unix 时间戳）之前结束或中断的任务"""
+        conn = self.get_connection()
+        cursor = conn.execute('DELETE FROM parse_jobs WHERE updated_at < ?', (before,))
+        conn.commit()
+        return cursor.rowcount
+
+    # ================= PDF 逐页文本缓存 [NEW] =================
+
+    def get_pdf_page_texts(self, file_hash):
+        """{页码: 文本}"""
+        with self.read_connection() as conn:
+            return dict(conn.execute('SELECT page, text FROM pdf_page_texts WHERE file_hash = ?', (file_hash,)))
+
+    def save_pdf_page_texts(self, file_hash, pages):
+        """pages: [(页码, 文本), ...]"""
+        conn = self.get_connection()
+        conn.executemany('INSERT OR REPLACE INTO pdf_page_texts (file_hash, page, text) VALUES (?, ?, ?)',
+                         [(file_hash, page, text) for page, text in pages])
+        conn.commit()
+
+    def prune_pdf_page_texts(self):
+        """删除源文件已不在 file_assets 中的缓存"""
+        conn = self.get_connection()
+        cursor = conn.execute('''
+            DELETE FROM pdf_page_texts
+            WHERE file_hash NOT IN (SELECT file_hash FROM file_assets)
+        ''')
+        conn.commit()
+        return cursor.rowcount
+
+    # ================= 分块解析结果缓存 [NEW] =================
+
+    def get_parse_chunk_results(self, chunk_hashes):
+        """{块哈希: (content, metadata)}，只包含已缓存的块"""
+        import json
+        if not chunk_hashes:
+            return {}
+        placeholders = ','.join('?' * len(chunk_hashes))
+        with self.read_connection() as conn:
+            rows = conn.execute(f'SELECT chunk_hash, content, metadata FROM parse_chunk_results '
+                                f'WHERE chunk_hash IN ({placeholders})', list(chunk_hashes)).fetchall()
+        return {row[0]: (row[1], json.loads(row[2])) for row in rows}
+
+    def save_parse_chunk_results(self, results, now):
+        """results: [(块哈希, content, metadata), ...]"""
+        import json
+        conn = self.get_connection()
+        conn.executemany('INSERT OR REPLACE INTO parse_chunk_results (chunk_hash, content, metadata, used_at) '
+                         'VALUES (?, ?, ?, ?)',
+                         [(h, content, json.dumps(meta, ensure_ascii=False), now) for h, content, meta in results])
+        conn.commit()
+
+    def touch_parse_chunk_results(self, chunk_hashes, now):
+        """刷新命中块的 used_at，避免仍在使用的结果被清理"""
+        conn = self.get_connection()
+        conn.executemany('UPDATE parse_chunk_results SET used_at = ? WHERE chunk_hash = ?',
+                         [(now, h) for h in chunk_hashes])
+        conn.commit()
+
+    def prune_parse_chunk_results(self, before):
+        """删除 before（Unix 时间戳）之后未再使用的块结果"""
+        conn = self.get_connection()
+        cursor = conn.execute('DELETE FROM parse_chunk_results WHERE used_at < ?', (before,))
+        conn.commit()
+        return cursor.rowcount
+
+    # ================= 文档库检索索引 [NEW] =================
+
+    LIBRARY_PASSAGE_STRIDE = 100000  # 每个文件最多的片段数
+
+    def get_library_index_entry(self, file_id):
+        """(content_hash, tokenizer)；未建索引返回 None"""
+        with self.read_connection() as conn:
+            row = conn.execute('SELECT content_hash, tokenizer FROM library_index_files WHERE file_id = ?',
+                               (file_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def replace_library_passages(self, file_id, content_hash, content_chars, tokenizer, passages, now):
+        """
+        在一个事务内替换文件的全部片段
+        :param passages: [(tokens, text), ...]，按文中顺序
+        """
+        base = file_id * self.LIBRARY_PASSAGE_STRIDE
+        passages = passages[:self.LIBRARY_PASSAGE_STRIDE]
+        conn = self.get_connection()
+        with conn:
+            conn.execute('DELETE FROM library_passages WHERE rowid BETWEEN ? AND ?',
+                         (base, base + self.LIBRARY_PASSAGE_STRIDE - 1))
+            conn.executemany('INSERT INTO library_passages (rowid, tokens, text) VALUES (?, ?, ?)',
+                             [(base + seq, tokens, text) for seq, (tokens, text) in enumerate(passages)])
+            conn.execute('''
+                INSERT OR REPLACE INTO library_index_files
+                    (file_id, content_hash, content_chars, tokenizer, passages, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (file_id, content_hash, content_chars, tokenizer, len(passages), now))
+
+    def delete_library_passages(self, file_id):
+        base = file_id * self.LIBRARY_PASSAGE_STRIDE
+        conn = self.get_connection()
+        with conn:
+            conn.execute('DELETE FROM library_passages WHERE rowid BETWEEN ? AND ?',
+                         (base, base + self.LIBRARY_PASSAGE_STRIDE - 1))
+            conn.execute('DELETE FROM library_index_files WHERE file_id = ?', (file_id,))
+
+    def get_library_index_pending(self, tokenizer, limit):
+        """
+        需要（重新）建索引的文件 ID：有解析内容但未建索引、分词器不同或内容哈希已变化
+        （写入时未记录哈希的旧数据按字符数比较；归档文件的解析内容已迁出主库，保留其原有索引）
+        """
+        with self.read_connection() as conn:
+            return [row[0] for row in conn.execute('''
+                SELECT f.id FROM file_assets f
+                LEFT JOIN library_index_files i ON i.file_id = f.id
+                WHERE f.parsed_content IS NOT NULL
+                  AND (i.file_id IS NULL OR i.tokenizer != ?
+                       OR (f.parsed_content_hash IS NOT NULL AND i.content_hash != f.parsed_content_hash)
+                       OR (f.parsed_content_hash IS NULL AND i.content_chars != length(f.parsed_content)))
+                ORDER BY f.id LIMIT ?
+            ''', (tokenizer, limit))]
+
+    def get_library_index_orphans(self):
+        """已建索引但文件记录已删除的文件 ID"""
+        with self.read_connection() as conn:
+            return [row[0] for row in conn.execute('''
+                SELECT file_id FROM library_index_files
+                WHERE file_id NOT IN (SELECT id FROM file_assets)
+            ''')]
+
+    def search_library_passages(self, match_expr, limit, file_ids=None, course_name=None, exclude_file_ids=None):
+        """
+        按 BM25 检索片段（得分越小越相关）
+        :return: [{'file_id', 'seq', 'original_name', 'course_name', 'text', 'score'}, ...]
+        """
+        stride = self.LIBRARY_PASSAGE_STRIDE
+        sql = f'''
+            SELECT f.id AS file_id, library_passages.rowid % {stride} AS seq, f.original_name, f.course_name,
+                   library_passages.text, bm25(library_passages) AS score
+            FROM library_passages
+            JOIN file_assets f ON f.id = library_passages.rowid / {stride}
+            WHERE library_passages MATCH ?
+        '''
+        params = [match_expr]
+        if file_ids:
+            sql += f" AND f.id IN ({','.join('?' * len(file_ids))})"
+            params.extend(file_ids)
+        if exclude_file_ids:
+            sql += f" AND f.id NOT IN ({','.join('?' * len(exclude_file_ids))})"
+            params.extend(exclude_file_ids)
+        if course_name:
+            sql += " AND f.course_name = ?"
+            params.append(course_name)
+        sql += " ORDER BY score, library_passages.rowid LIMIT ?"
+        params.append(limit)
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def get_library_index_stats(self):
+        with self.read_connection() as conn:
+            row = conn.execute('SELECT COUNT(*), COALESCE(SUM(passages), 0) FROM library_index_files').fetchone()
+            by_tokenizer = dict(conn.execute('SELECT tokenizer, COUNT(*) FROM library_index_files GROUP BY 1'))
+        return {'files': row[0], 'passages': row[1], 'tokenizers': by_tokenizer}
+
     # ================= 成绩文档同步功能 [NEW] =================
 
     def get_file_asset_by_path(self, path):
@@ -1617,12 +3223,13 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO file_assets
-            (file_hash, original_name, file_size, physical_path, parsed_content,
+            (file_hash, original_name, file_size, physical_path, parsed_content, parsed_content_hash,
              meta_info, doc_category, course_name, source_class_id, uploaded_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             data['file_hash'], data['original_name'], data['file_size'],
-            data.get('physical_path'), data['parsed_content'], data['meta_info'],
+            data.get('physical_path'), data['parsed_content'], parsed_content_hash(data['parsed_content']),
+            data['meta_info'],
             data['doc_category'], data.get('course_name'), data.get('source_class_id'),
             data.get('uploaded_by')
         ))
@@ -1,5 +1,3 @@
-import json
-
 from openpyxl.styles import Alignment
 from openpyxl.utils import get_column_letter
 from export_core.base_template import BaseExportTemplate
@@ -89,23 +87,10 @@ class MachineTestScoreExporter(BaseExportTemplate, BaseExcelExporter):
                 class_id = class_row['id']
 
         if class_id:
-            # 获取该班级所有学生及成绩
-            db_students = db.get_students_with_grades(class_id)
+            # 获取该班级所有学生及成绩（分项来自 grade_items 透视，按题目顺序对应列下标）
+            _, db_students = db.iter_class_score_matrix(class_id)
             for stu in db_students:
-                # 解析 score_details JSON 字符串
-                # 假设 score_details 存的是 [{"name": "Task1", "score": 10}, ...] 或简单的 dict
-                details = {}
-                try:
-                    raw_details = json.loads(stu['score_details']) if stu['score_details'] else []
-                    # 如果是列表，转为字典方便按索引取
-                    if isinstance(raw_details, list):
-                        for idx, d in enumerate(raw_details):
-                            # 尝试匹配题目顺序，这里简单按索引匹配
-                            details[idx] = d.get('score', 0)
-                    elif isinstance(raw_details, dict):
-                        details = raw_details  # 暂不处理 dict 情况，按列表索引为准
-                except:
-                    pass
+                details = {idx: score for idx, score in enumerate(stu['items']) if score is not None}
 
                 students_data.append({
                     'student_id': stu['student_id'],
@@ -3,6 +3,14 @@ import json
 import os
 import re
 import abc
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 按内容哈希缓存的单文件分析结果（多个学生提交了相同文件时只分析一次）
+_ANALYSIS_CACHE_SIZE = 4096
+_analysis_cache = OrderedDict()
+_analysis_lock = threading.Lock()
 
 
 class GradingResult:
@@ -68,6 +76,9 @@ class BaseGrader(abc.ABC):
     # 课程名称
     COURSE = "Generic Course"
 
+    # 批改前由 GradingService 填入：{文件绝对路径: 内容 SHA-256}
+    file_hashes = None
+
     def __init__(self):
         self.file_map = {}  # 文件名索引 {lowercase_name: full_path}
 
@@ -123,6 +134,35 @@ class BaseGrader(abc.ABC):
 
         return None, 0
 
+    def content_hash(self, file_path, *args, **kwargs):
+        """文件内容的 SHA-256：优先取解压时已算好的哈希，否则读文件计算"""
+        file_hash = (self.file_hashes or {}).get(os.path.normpath(file_path))
+        if file_hash:
+            return file_hash
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def cached_analysis(self, file_path, key, compute, *args, **kwargs):
+        """
+        按文件内容缓存分析结果：内容相同的文件（如多个学生提交的同一份起始代码）只调用一次 compute
+        :param key: 分析名称，同一文件的不同分析互不覆盖
+        :param compute: compute(file_path) -> 结果，结果会在学生之间共享，不要原地修改
+        """
+        cache_key = (self.ID, key, self.content_hash(file_path))
+        with _analysis_lock:
+            if cache_key in _analysis_cache:
+                _analysis_cache.move_to_end(cache_key)
+                return _analysis_cache[cache_key]
+        result = compute(file_path)
+        with _analysis_lock:
+            _analysis_cache[cache_key] = result
+            if len(_analysis_cache) > _ANALYSIS_CACHE_SIZE:
+                _analysis_cache.popitem(last=False)
+        return result
+
     def read_text_content(self, file_path, *args, **kwargs):
         """健壮的文本读取，自动尝试多种编码"""
         if not file_path or not os.path.exists(file_path):
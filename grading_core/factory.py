@@ -1,8 +1,12 @@
 # grading_core/factory.py
+import ast
+import hashlib
 import importlib
 import inspect
+import os
 import pkgutil
 import sys
+import threading
 
 from config import Config
 from grading_core.base import BaseGrader
@@ -11,16 +15,36 @@ from grading_core.base import BaseGrader
 class GraderFactory:
     _graders = {}
     _loaded = False
+    _module_stamps = {}   # 模块名 -> (mtime_ns, size)，用于判断文件是否变化
+    _grader_modules = {}  # grader ID -> 注册它的模块名
+    _dir_stamp = None     # graders 目录的 mtime，文件增删时变化
+    _catalog_ready = False  # 本进程已确认目录非空或已按磁盘回填过
+    _catalog_lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
 
     @classmethod
     def load_graders(cls):
-        """动态加载 graders 目录下的所有模块 (支持热重载)"""
-        # 每次加载前清空当前字典，确保加载的是最新状态
-        cls._graders = {}
+        """动态加载 graders 目录下的所有模块 (支持热重载：只重新导入文件有变化的模块)"""
+        cls._dir_stamp = cls._stamp(Config.GRADERS_DIR)
+        seen = set()
 
         # 遍历包下的所有模块
         for _, name, _ in pkgutil.iter_modules([Config.GRADERS_DIR]):
             module_name = f'grading_core.graders.{name}'
+            seen.add(module_name)
+            stamp = cls._stamp(os.path.join(Config.GRADERS_DIR, f'{name}.py'))
+            if stamp is not None and module_name in sys.modules and cls._module_stamps.get(module_name) == stamp:
+                continue
+
+            cls._unregister_module(module_name)
+            cls._module_stamps[module_name] = stamp
             try:
                 # === 核心修改：热重载逻辑 ===
                 if module_name in sys.modules:
@@ -40,12 +64,37 @@ class GraderFactory:
                             attribute is not BaseGrader):
                         # 注册到字典中
                         cls._graders[attribute.ID] = attribute
+                        cls._grader_modules[attribute.ID] = module_name
                         # print(f"Loaded/Reloaded grader: {attribute.NAME} ({attribute.ID})")
             except Exception as e:
                 print(f"Failed to load grader module {name}: {e}")
 
+        # 文件已被删除/移入回收站的模块
+        for module_name in set(cls._module_stamps) - seen:
+            cls._unregister_module(module_name)
+            cls._module_stamps.pop(module_name, None)
+
         cls._loaded = True
 
+    @classmethod
+    def _unregister_module(cls, module_name):
+        for grader_id in [gid for gid, mod in cls._grader_modules.items() if mod == module_name]:
+            cls._graders.pop(grader_id, None)
+            cls._grader_modules.pop(grader_id, None)
+
+    @classmethod
+    def get_grader_names(cls, strategy_ids):
+        """
+        按 ID 读取批改核心显示名：只读注册表中的类属性，不实例化、不重载模块
+        仅在首次调用，或存在未知 ID 且 graders 目录有文件增删时增量刷新一次注册表
+        :return: {strategy_id: NAME}，未知 ID 不在结果中
+        """
+        strategy_ids = set(strategy_ids)
+        if not cls._loaded or (not strategy_ids <= cls._graders.keys()
+                               and cls._stamp(Config.GRADERS_DIR) != cls._dir_stamp):
+            cls.load_graders()
+        return {sid: getattr(cls._graders[sid], 'NAME', sid) for sid in strategy_ids if sid in cls._graders}
+
     @classmethod
     def get_grader(cls, strategy_id):
         cls.load_graders()
@@ -55,10 +104,140 @@ class GraderFactory:
         # 默认返回第一个或报错，这里做简单处理
         return None
 
+    # ================= 批改核心目录 (grader_catalog) =================
+
+    @staticmethod
+    def read_source_metadata(path):
+        """
+        静态解析核心源文件（ast，不导入执行），提取类属性 ID / NAME / COURSE
+        :return: (source_hash, [{'grader_id', 'name', 'course', 'type', 'filename', 'source_hash'}, ...])，
+                 语法错误时列表为空
+        """
+        with open(path, 'rb') as f:
+            source = f.read()
+        source_hash = hashlib.sha256(source).hexdigest()
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return source_hash, []
+
+        entries = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            attrs = {}
+            for stmt in node.body:
+                if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                        and isinstance(stmt.targets[0], ast.Name)
+                        and isinstance(stmt.value, ast.Constant)):
+                    attrs[stmt.targets[0].id] = stmt.value.value
+            grader_id = attrs.get('ID')
+            if not isinstance(grader_id, str):
+                continue
+            is_direct = bool(attrs.get('is_ai_grader')) or 'DirectGrader' in node.name or grader_id.startswith('direct')
+            entries.append({
+                'grader_id': grader_id,
+                'name': attrs.get('NAME', grader_id),
+                'course': attrs.get('COURSE', '未分类'),
+                'type': 'direct' if is_direct else 'logic',
+                'filename': os.path.basename(path),
+                'source_hash': source_hash,
+            })
+        return source_hash, entries
+
+    @staticmethod
+    def _with_task_info(db, entries):
+        """补充生成任务中的描述、严格度、创建者与创建时间"""
+        for entry in entries:
+            task = db.get_task_by_grader_id(entry['grader_id'])
+            if task and task.get('status') != 'success':
+                task = None
+            entry.update({
+                'description': (task.get('extra_desc') or '暂无额外描述') if task else '系统内置或无描述',
+                'strictness': (task.get('strictness') or 'standard') if task else 'standard',
+                'created_by': task.get('created_by') if task else None,
+                'created_at': task.get('created_at') if task else None,
+            })
+        return entries
+
+    @classmethod
+    def catalog_register(cls, grader_id):
+        """
+        核心生成/编辑/恢复后调用：按磁盘上的源文件写入目录
+        :return: 写入的条目数（文件不存在或无法解析时为 0）
+        """
+        from extensions import db
+
+        path = os.path.join(Config.GRADERS_DIR, f"{grader_id}.py")
+        if not os.path.exists(path):
+            return 0
+        _, entries = cls.read_source_metadata(path)
+        db.upsert_grader_catalog(cls._with_task_info(db, entries))
+        return len(entries)
+
+    @staticmethod
+    def catalog_remove(grader_id):
+        """核心删除（移入回收站）后调用"""
+        from extensions import db
+        db.delete_grader_catalog(grader_id)
+
+    @classmethod
+    def check_catalog(cls, repair=False):
+        """
+        目录与磁盘文件的一致性校验
+        :param repair: 是否按磁盘文件修复目录
+        :return: {'missing': 磁盘有目录无, 'orphaned': 目录有磁盘无, 'stale': 源文件哈希/元数据不一致,
+                  'unparsable': 无法解析的文件名, 'checked': 文件数}
+        """
+        from extensions import db
+
+        catalog = {row['grader_id']: row for row in db.get_grader_catalog()}
+        on_disk = {}
+        unparsable = []
+        checked = 0
+        for _, name, _ in pkgutil.iter_modules([Config.GRADERS_DIR]):
+            path = os.path.join(Config.GRADERS_DIR, f'{name}.py')
+            if not os.path.isfile(path):
+                continue
+            checked += 1
+            _, entries = cls.read_source_metadata(path)
+            if not entries:
+                unparsable.append(os.path.basename(path))
+            for entry in entries:
+                on_disk[entry['grader_id']] = entry
+
+        missing = sorted(set(on_disk) - set(catalog))
+        orphaned = sorted(set(catalog) - set(on_disk))
+        stale = sorted(gid for gid in set(on_disk) & set(catalog)
+                       if any(on_disk[gid][k] != catalog[gid][k]
+                              for k in ('name', 'course', 'type', 'filename', 'source_hash')))
+
+        if repair:
+            db.upsert_grader_catalog(cls._with_task_info(db, [on_disk[gid] for gid in missing + stale]))
+            db.delete_grader_catalog(*orphaned)
+
+        return {'missing': missing, 'orphaned': orphaned, 'stale': stale,
+                'unparsable': unparsable, 'checked': checked, 'repaired': repair}
+
+    @classmethod
+    def ensure_catalog(cls):
+        """目录为空（如升级后首次启动）时同步按磁盘文件回填，不等待维护任务；每个进程只检查一次"""
+        if cls._catalog_ready:
+            return
+        from extensions import db
+
+        with cls._catalog_lock:
+            if cls._catalog_ready:
+                return
+            if not db.count_grader_catalog():
+                report = cls.check_catalog(repair=True)
+                print(f"[GraderCatalog] catalog empty, backfilled {len(report['missing'])} graders from disk")
+            cls._catalog_ready = True
+
     @classmethod
     def get_all_strategies(cls):
         """
-        返回所有可用策略的详细列表，包含数据库元数据
+        返回所有可用策略的详细列表（只读 grader_catalog，不导入核心代码）
 
         Returns:
             list of dict: [{
@@ -72,57 +251,16 @@ class GraderFactory:
                 'creator': creator_name
             }]
         """
-        cls.load_graders()
-        strategies = []
-
-        # 引入 DB 避免循环导入
         from extensions import db
 
-        # 获取所有任务信息用于增强展示
-        # 这里为了性能，可以只查 ai_tasks 表
-        conn = db.get_connection()
-        tasks = conn.execute(
-            "SELECT grader_id, extra_desc, strictness, created_at, created_by, status FROM ai_tasks WHERE status='success'").fetchall()
-        task_map = {t['grader_id']: dict(t) for t in tasks if t['grader_id']}
-
-        # 获取用户名映射
-        users = conn.execute("SELECT id, username FROM users").fetchall()
-        user_map = {u['id']: u['username'] for u in users}
-
-        for grader_id, grader_cls in cls._graders.items():
-            # 基础信息来自 Python 类
-            info = {
-                'id': grader_id,
-                'name': getattr(grader_cls, 'NAME', grader_id),
-                'course': getattr(grader_cls, 'COURSE', '未分类'),
-                'description': '系统内置或无描述',
-                'strictness': 'standard',
-                'type': 'logic',  # 默认为 logic, direct 会被覆盖
-                'created_at': '',
-                'creator': 'System'
-            }
-
-            # 尝试判断类型
-            if getattr(grader_cls, 'is_ai_grader', False) or 'DirectGrader' in grader_cls.__name__:
-                info['type'] = 'direct'
-
-            # 融合数据库信息
-            task_info = task_map.get(grader_id)
-            if task_info:
-                info['description'] = task_info.get('extra_desc') or '暂无额外描述'
-                info['strictness'] = task_info.get('strictness', 'standard')
-                info['created_at'] = task_info.get('created_at', '')
-
-                creator_id = task_info.get('created_by')
-                if creator_id:
-                    info['creator'] = user_map.get(creator_id, 'Unknown')
-
-                # 如果是 Direct 类型，确保类型标识正确
-                if 'direct' in grader_id:
-                    info['type'] = 'direct'
-
-            strategies.append(info)
-
-        # 按创建时间倒序
-        strategies.sort(key=lambda x: x['created_at'] or '0', reverse=True)
-        return strategies
\ No newline at end of file
+        cls.ensure_catalog()
+        return [{
+            'id': row['grader_id'],
+            'name': row['name'],
+            'course': row['course'],
+            'description': row['description'],
+            'strictness': row['strictness'],
+            'type': row['type'],
+            'created_at': row['created_at'] or '',
+            'creator': (row['creator_name'] or 'Unknown') if row['created_by'] else 'System',
+        } for row in db.get_grader_catalog()]
@@ -246,6 +246,15 @@ def get_cached_message(user_id: int, page_context: str) -> Optional[WelcomeMessa
         return None
 
 
+def get_cache_expiry(user_id: int, page_context: str) -> Optional[datetime]:
+    """最新一条缓存的过期时间（不论是否已过期），无缓存返回 None"""
+    row = db.get_connection().execute('''
+        SELECT MAX(expires_at) FROM ai_welcome_messages
+        WHERE user_id = ? AND page_context = ?
+    ''', (user_id, page_context)).fetchone()
+    return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
 def save_to_cache(user_id: int, page_context: str, message_content: str,
                   context: MessageContext, ttl_seconds: int = None) -> WelcomeMessage:
     """
@@ -356,6 +365,31 @@ def cleanup_expired_messages() -> int:
 
 # ==================== AI 生成 ====================
 
+def build_welcome_prompt(context: MessageContext, extra_context: Dict[str, Any] = None) -> str:
+    """按页面选择提示词模板并填充上下文"""
+    # 选择合适的提示词模板
+    try:
+        page_enum = PageContext(context.page_context)
+        prompt_template = PAGE_SPECIFIC_PROMPTS.get(page_enum, PAGE_SPECIFIC_PROMPTS[PageContext.DASHBOARD])
+    except ValueError:
+        prompt_template = PAGE_SPECIFIC_PROMPTS[PageContext.DASHBOARD]
+
+    # 格式化提示词
+    prompt_vars = context.to_prompt_dict()
+
+    # 合并 extra_context (用于 trigger_reason, action_details 等)
+    if extra_context:
+        prompt_vars.update(extra_context)
+
+    # 确保所有必需的模板变量都有默认值
+    prompt_vars.setdefault('trigger_reason', 'timer')
+    prompt_vars.setdefault('action_details', '')
+    prompt_vars.setdefault('last_action_desc', '无')
+    prompt_vars.setdefault('last_action', prompt_vars.get('recent_actions_str', '无'))
+
+    return prompt_template.format(**prompt_vars)
+
+
 async def generate_welcome_message(
     user_id: int,
     page_context: str,
@@ -389,28 +423,7 @@ async def generate_welcome_message(
 
     # 构建上下文
     context = MessageContext.from_request(user_info, stats, page_context, recent_actions)
-
-    # 选择合适的提示词模板
-    try:
-        page_enum = PageContext(page_context)
-        prompt_template = PAGE_SPECIFIC_PROMPTS.get(page_enum, PAGE_SPECIFIC_PROMPTS[PageContext.DASHBOARD])
-    except ValueError:
-        prompt_template = PAGE_SPECIFIC_PROMPTS[PageContext.DASHBOARD]
-
-    # 格式化提示词
-    prompt_vars = context.to_prompt_dict()
-
-    # 合并 extra_context (用于 trigger_reason, action_details 等)
-    if extra_context:
-        prompt_vars.update(extra_context)
-
-    # 确保所有必需的模板变量都有默认值
-    prompt_vars.setdefault('trigger_reason', 'timer')
-    prompt_vars.setdefault('action_details', '')
-    prompt_vars.setdefault('last_action_desc', '无')
-    prompt_vars.setdefault('last_action', prompt_vars.get('recent_actions_str', '无'))
-
-    full_prompt = prompt_template.format(**prompt_vars)
+    full_prompt = build_welcome_prompt(context, extra_context)
 
     # 调用 AI 生成
     try:
@@ -527,7 +540,8 @@ def get_fallback_message_sync(time_period: str = None) -> str:
 async def call_ai_for_conversation(
     user_info: Dict[str, Any],
     messages: List,
-    page_context: str = None
+    page_context: str = None,
+    summary: str = None
 ) -> str:
     """
     调用 AI 进行多轮对话
@@ -536,6 +550,7 @@ async def call_ai_for_conversation(
         user_info: 用户信息
         messages: 历史消息列表 (Message 对象列表)
         page_context: 当前页面上下文
+        summary: 较早对话的滚动摘要
 
     Returns:
         AI 回复内容
@@ -550,7 +565,8 @@ async def call_ai_for_conversation(
     # 构建系统提示词
     system_prompt = get_conversation_system_prompt(
         username=user_info.get('username', '老师'),
-        page_context=page_context
+        page_context=page_context,
+        summary=summary
     )
 
     # 构建消息历史
@@ -600,6 +616,42 @@ async def call_ai_for_conversation(
         return content if content else "抱歉，我暂时无法回复。请稍后再试。"
 
 
+async def summarize_conversation(previous_summary: Optional[str], messages: List) -> str:
+    """
+    把已有摘要与新增的较早消息合并为新的滚动摘要
+
+    Args:
+        previous_summary: 已有摘要（可为空）
+        messages: 需要折叠进摘要的消息 (Message 对象列表，按时间升序)
+
+    Returns:
+        新摘要
+    """
+    from services.ai_prompts import get_conversation_summary_prompt
+
+    max_chars = Config.AI_CONTEXT_SUMMARY_MAX_CHARS
+    transcript = "\n".join(
+        f"{'老师' if msg.role == 'user' else '助教'}: {msg.content}" for msg in messages
+    )
+    payload = {
+        "system_prompt": get_conversation_summary_prompt(max_chars),
+        "messages": [],
+        "new_message": f"已有摘要：\n{previous_summary or '（无）'}\n\n新增对话：\n{transcript}",
+        "model_capability": "standard"
+    }
+
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post(Config.AI_ASSISTANT_CHAT_ENDPOINT, json=payload)
+
+        if response.status_code != 200:
+            raise Exception(f"AI 服务返回错误: {response.status_code}")
+
+        content = response.json().get("response_text", "").strip()
+        if not content:
+            raise Exception("AI 返回空摘要")
+        return content[:max_chars]
+
+
 async def generate_page_greeting(
     user_info: Dict[str, Any],
     page_context: str
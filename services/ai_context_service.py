@@ -0,0 +1,120 @@
+# services/ai_context_service.py
+"""
+AI 助手对话上下文管理
+每轮对话只发送「滚动摘要 + token 预算内的最近消息」，不再固定发送最近 10 条原文。
+落在窗口之外、尚未折叠的较早消息由后台协程合并进摘要，
+摘要更新后再做消息数压缩（只删除已折叠进摘要的消息）。
+"""
+
+import asyncio
+import functools
+import logging
+import re
+import threading
+
+from config import Config
+from services.ai_conversation_service import AIConversationService
+from utils.async_runner import submit_async
+
+logger = logging.getLogger(__name__)
+
+_CJK_RE = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个，其余按 4 个字符 1 个"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ConversationContextManager:
+    """按 token 预算构建对话上下文，并在后台维护滚动摘要"""
+
+    SCAN_LIMIT = 60  # 构建窗口时最多回看的消息条数
+
+    def __init__(self, service: AIConversationService):
+        self.service = service
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def build(self, conversation_id: int) -> dict:
+        """
+        构建本轮上下文（最后一条为当前用户消息，总是保留）
+
+        :return: {
+            'messages': 窗口内消息（按时间升序）,
+            'summary': 滚动摘要,
+            'history_tokens': 窗口内消息的估算 token 数,
+            'pending_ids': 窗口外、尚未折叠进摘要的消息 ID 区间 (after_id, upto_id) 或 None
+        }
+        """
+        summary, summary_upto_id = self.service.get_summary_state(conversation_id)
+        candidates = self.service.get_messages_between(
+            conversation_id, summary_upto_id, newest_first=True, limit=self.SCAN_LIMIT
+        )
+
+        budget = Config.AI_CONTEXT_TOKEN_BUDGET
+        window, used = [], 0
+        for msg in candidates:
+            if msg.role not in ('user', 'assistant'):
+                continue
+            tokens = estimate_tokens(msg.content)
+            if window and used + tokens > budget:
+                break
+            window.append(msg)
+            used += tokens
+        window.reverse()
+
+        # 窗口外（或超出回看范围）还有未折叠的较早消息
+        pending = None
+        if window and (candidates[-1].id < window[0].id or len(candidates) == self.SCAN_LIMIT):
+            pending = (summary_upto_id, window[0].id - 1)
+
+        return {
+            'messages': window,
+            'summary': summary,
+            'history_tokens': used,
+            'pending_ids': pending,
+        }
+
+    def schedule_compaction(self, conversation_id: int, context: dict):
+        """
+        本轮回复后调用：窗口外有未折叠消息时，后台刷新摘要并压缩消息数
+        同一对话同时只会有一个刷新任务
+        """
+        if not context.get('pending_ids'):
+            return
+        with self._lock:
+            if conversation_id in self._refreshing:
+                return
+            self._refreshing.add(conversation_id)
+        submit_async(self._compact(conversation_id, context['summary'], *context['pending_ids']))
+
+    async def _compact(self, conversation_id: int, summary: str, after_id: int, upto_id: int):
+        from services.ai_content_service import summarize_conversation
+
+        # SQLite 读写是阻塞调用，放到线程池执行，不占用事件循环
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await loop.run_in_executor(
+                None, self.service.get_messages_between, conversation_id, after_id, upto_id)
+            messages = [msg for msg in rows if msg.role in ('user', 'assistant')]
+            if messages:
+                new_summary = await summarize_conversation(summary, messages)
+                saved = await loop.run_in_executor(
+                    None, self.service.save_summary, conversation_id, new_summary, upto_id)
+                if not saved:
+                    return
+            deleted = await loop.run_in_executor(None, functools.partial(
+                self.service.enforce_message_limit,
+                conversation_id, max_messages=Config.AI_CONVERSATION_MAX_MESSAGES, summarized_only=True
+            ))
+            logger.info(f"[AI Context] conversation {conversation_id}: summarized up to #{upto_id}, "
+                        f"pruned {deleted} messages")
+        except Exception as e:
+            logger.warning(f"[AI Context] summary refresh failed for conversation {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(conversation_id)
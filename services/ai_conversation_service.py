@@ -1,7 +1,8 @@
 """
 AI Conversation Service
 
-Core service layer for AI assistant conversations, messages, and rate limiting.
+Core service layer for AI assistant conversations and messages.
+Rate limiting lives in services/rate_limiter.py.
 All user stories depend on this service.
 
 Feature: 002-global-ai-assistant
@@ -93,28 +94,11 @@ class Message:
         }
 
 
-@dataclass
-class RateLimitRecord:
-    """速率限制记录数据类"""
-    user_id: int
-    last_proactive_trigger: Optional[datetime] = None
-    updated_at: Optional[datetime] = None
-
-    @classmethod
-    def from_row(cls, row: dict) -> 'RateLimitRecord':
-        """从数据库行构建 RateLimitRecord 对象"""
-        return cls(
-            user_id=row['user_id'],
-            last_proactive_trigger=row.get('last_proactive_trigger'),
-            updated_at=row.get('updated_at')
-        )
-
-
 class AIConversationService:
     """
     AI 对话服务
 
-    提供对话会话、消息、速率限制的 CRUD 操作。
+    提供对话会话、消息的 CRUD 操作。
     """
 
     def __init__(self, db):
@@ -292,6 +276,13 @@ class AIConversationService:
         offset = max(0, offset)
         order_clause = 'DESC' if order.lower() == 'desc' else 'ASC'
 
+        # 已迁入学年归档库的对话：合并归档消息
+        row = conn.execute('SELECT archived_year FROM ai_conversations WHERE id = ?',
+                           (conversation_id,)).fetchone()
+        if row and row['archived_year']:
+            return self._get_archived_messages(conversation_id, row['archived_year'],
+                                               limit, offset, order_clause)
+
         # 获取总数
         total_row = conn.execute(
             'SELECT COUNT(*) as total FROM ai_messages WHERE conversation_id = ?',
@@ -311,6 +302,26 @@ class AIConversationService:
 
         return messages, total
 
+    def _get_archived_messages(self, conversation_id: int, academic_year: str,
+                               limit: int, offset: int, order_clause: str) -> tuple[List[Message], int]:
+        """从主库与学年归档库合并读取对话消息"""
+        with self.db.history_connection([academic_year]) as (conn, aliases):
+            source = 'SELECT * FROM main.ai_messages WHERE conversation_id = ?'
+            params = [conversation_id]
+            alias = aliases.get(academic_year)
+            if alias:
+                source += f' UNION ALL SELECT * FROM {alias}.ai_messages WHERE conversation_id = ?'
+                params.append(conversation_id)
+
+            total = conn.execute(f'SELECT COUNT(*) AS total FROM ({source})', params).fetchone()['total']
+            rows = conn.execute(f'''
+                SELECT * FROM ({source})
+                ORDER BY created_at {order_clause}
+                LIMIT ? OFFSET ?
+            ''', params + [limit, offset]).fetchall()
+
+        return [Message.from_row(dict(row)) for row in rows], total
+
     def get_recent_messages(self, conversation_id: int, limit: int = 10) -> List[Message]:
         """
         获取最近的消息（用于构建 AI 上下文）
@@ -348,12 +359,66 @@ class AIConversationService:
 
         return [Message.from_row(dict(row)) for row in rows]
 
-    def enforce_message_limit(self, conversation_id: int, max_messages: int = 100) -> int:
+    # ==================== 上下文摘要 ====================
+
+    def get_summary_state(self, conversation_id: int) -> tuple[Optional[str], int]:
+        """
+        获取对话的滚动摘要
+
+        :return: (摘要, 已折叠进摘要的最大消息 ID)
+        """
+        conn = self.db.get_connection()
+        row = conn.execute(
+            'SELECT summary, summary_upto_id FROM ai_conversations WHERE id = ?',
+            (conversation_id,)
+        ).fetchone()
+        if not row:
+            return None, 0
+        return row['summary'], row['summary_upto_id'] or 0
+
+    def save_summary(self, conversation_id: int, summary: str, upto_id: int) -> bool:
+        """
+        保存滚动摘要（只允许向前推进，避免并发刷新时旧结果覆盖新结果）
+
+        :return: 是否写入
+        """
+        conn = self.db.get_connection()
+        cursor = conn.execute('''
+            UPDATE ai_conversations SET summary = ?, summary_upto_id = ?
+            WHERE id = ? AND COALESCE(summary_upto_id, 0) < ?
+        ''', (summary, upto_id, conversation_id, upto_id))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def get_messages_between(self, conversation_id: int, after_id: int, upto_id: int = None,
+                             newest_first: bool = False, limit: int = None) -> List[Message]:
+        """
+        获取 ID 在 (after_id, upto_id] 区间内的对话消息
+
+        :param newest_first: 是否按 ID 倒序（构建上下文窗口时从最新消息往前取）
+        :param limit: 最多返回条数
+        """
+        sql = 'SELECT * FROM ai_messages WHERE conversation_id = ? AND id > ?'
+        params = [conversation_id, after_id]
+        if upto_id is not None:
+            sql += ' AND id <= ?'
+            params.append(upto_id)
+        sql += f" ORDER BY id {'DESC' if newest_first else 'ASC'}"
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        conn = self.db.get_connection()
+        return [Message.from_row(dict(row)) for row in conn.execute(sql, params).fetchall()]
+
+    def enforce_message_limit(self, conversation_id: int, max_messages: int = 100,
+                              summarized_only: bool = False) -> int:
         """
         强制执行消息数量限制，删除最旧的消息
 
         :param conversation_id: 对话 ID
         :param max_messages: 最大消息数
+        :param summarized_only: 只删除已折叠进滚动摘要的消息
         :return: 删除的消息数
         """
         conn = self.db.get_connection()
@@ -372,97 +437,22 @@ class AIConversationService:
         delete_count = current_count - max_messages
 
         # 删除最旧的消息
-        conn.execute('''
+        summarized_filter = ''
+        params = [conversation_id]
+        if summarized_only:
+            summarized_filter = 'AND id <= ?'
+            params.append(self.get_summary_state(conversation_id)[1])
+        params.append(delete_count)
+
+        cursor = conn.execute(f'''
             DELETE FROM ai_messages
             WHERE id IN (
                 SELECT id FROM ai_messages
-                WHERE conversation_id = ?
+                WHERE conversation_id = ? {summarized_filter}
                 ORDER BY created_at ASC
                 LIMIT ?
             )
-        ''', (conversation_id, delete_count))
+        ''', params)
         conn.commit()
 
-        return delete_count
-
-    # ==================== 速率限制 ====================
-
-    def check_rate_limit(self, user_id: int, cooldown_seconds: int = 60) -> tuple[bool, int]:
-        """
-        检查用户是否受速率限制
-
-        :param user_id: 用户 ID
-        :param cooldown_seconds: 冷却时间（秒）
-        :return: (是否允许, 剩余冷却秒数)
-        """
-        conn = self.db.get_connection()
-        row = conn.execute(
-            'SELECT * FROM ai_rate_limits WHERE user_id = ?',
-            (user_id,)
-        ).fetchone()
-
-        if not row:
-            return True, 0
-
-        last_trigger = row['last_proactive_trigger']
-        if not last_trigger:
-            return True, 0
-
-        # 解析时间戳
-        if isinstance(last_trigger, str):
-            try:
-                last_trigger = datetime.fromisoformat(last_trigger.replace('Z', '+00:00'))
-            except ValueError:
-                # 尝试其他格式
-                try:
-                    last_trigger = datetime.strptime(last_trigger, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    return True, 0
-
-        # 计算剩余冷却时间
-        now = datetime.now()
-        if last_trigger.tzinfo:
-            now = datetime.now(last_trigger.tzinfo)
-
-        elapsed = (now - last_trigger).total_seconds()
-        remaining = cooldown_seconds - elapsed
-
-        if remaining <= 0:
-            return True, 0
-
-        return False, int(remaining)
-
-    def update_rate_limit(self, user_id: int):
-        """
-        更新用户的速率限制记录
-
-        :param user_id: 用户 ID
-        """
-        conn = self.db.get_connection()
-
-        # 使用 UPSERT 语法
-        conn.execute('''
-            INSERT INTO ai_rate_limits (user_id, last_proactive_trigger, updated_at)
-            VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id) DO UPDATE SET
-                last_proactive_trigger = CURRENT_TIMESTAMP,
-                updated_at = CURRENT_TIMESTAMP
-        ''', (user_id,))
-        conn.commit()
-
-    def get_rate_limit_record(self, user_id: int) -> Optional[RateLimitRecord]:
-        """
-        获取用户的速率限制记录
-
-        :param user_id: 用户 ID
-        :return: RateLimitRecord 对象或 None
-        """
-        conn = self.db.get_connection()
-        row = conn.execute(
-            'SELECT * FROM ai_rate_limits WHERE user_id = ?',
-            (user_id,)
-        ).fetchone()
-
-        if row:
-            return RateLimitRecord.from_row(dict(row))
-        return None
+        return cursor.rowcount
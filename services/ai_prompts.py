@@ -241,16 +241,32 @@ def get_page_context_display(page_context: str) -> str:
 
 # ==================== AI 对话助手提示词 (Feature 002) ====================
 
-def get_conversation_system_prompt(username: str, page_context: str = None) -> str:
-    """对话模式的系统提示词"""
+def get_conversation_system_prompt(username: str, page_context: str = None, summary: str = None) -> str:
+    """对话模式的系统提示词（summary 为较早对话的滚动摘要）"""
     page_display = get_page_context_display(page_context)
 
-    return f"""{PERSONA_INSTRUCTION}
+    prompt = f"""{PERSONA_INSTRUCTION}
 
 你正在与 {username} 老师聊天。当前他在「{page_display}」页面。
 用户主动找你聊天，请保持“老油条”的人设，幽默地回答他的问题，或者陪他插科打诨。
 如果涉及系统功能（如怎么批改、怎么导出），请在调侃后给出准确的步骤。
 回复要简短有力，不要长篇大论。
+"""
+    if summary:
+        prompt += f"""
+此前对话的摘要（更早的消息已省略）：
+{summary}
+"""
+    return prompt
+
+
+def get_conversation_summary_prompt(max_chars: int) -> str:
+    """滚动摘要的系统提示词"""
+    return f"""你负责压缩一段助教与高校老师的对话记录，供后续对话作为背景。
+请把「已有摘要」与「新增对话」合并成一份新的摘要：
+- 保留老师的问题、已确认的事实、给出的操作步骤和尚未解决的事项
+- 省略寒暄、玩笑和重复内容
+- 使用第三人称陈述，不超过 {max_chars} 字，直接输出摘要正文
 """
 
 
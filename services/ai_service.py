@@ -6,16 +6,19 @@ import re
 import uuid
 
 import httpx
-import pandas as pd
 
 from ai_utils.ai_helper import call_ai_platform_chat
 from ai_utils.volc_file_manager import VolcFileManager
-from config import BASE_CREATOR_PROMPT, STRICT_MODE_PROMPT, LOOSE_MODE_PROMPT, EXAMPLE_PROMPT
+from config import Config, BASE_CREATOR_PROMPT, STRICT_MODE_PROMPT, LOOSE_MODE_PROMPT, EXAMPLE_PROMPT
 from config import NAME_GENERATION_PROMPT, COURSE_EXTRACTION_PROMPT
+from database import parsed_content_hash
 from export_core.doc_config import DocumentTypeConfig
 from extensions import db
 from grading_core.factory import GraderFactory
+from services import roster_service
 from services.file_service import FileService
+from utils import events
+from utils.async_runner import run_async
 from utils.file_converter import convert_to_pdf
 
 
@@ -23,13 +26,33 @@ class AiService:
     @staticmethod
     def smart_parse_content(file_id, doc_category_hint="exam"):
         """
-        智能解析统一入口：
+        智能解析统一入口（同步执行各阶段）：
+        0. 文本超过 PARSE_CHUNK_THRESHOLD 的长文档分块解析 (services/chunked_parse.py)
         1. 优先尝试 Vision 模式 (V3) - 升级适配多模态 input_file/input_image
         2. 失败则回退到 Text 模式 (V2)
         3. 均失败则回退到本地 Python 提取
+        后台解析流水线 (services/parse_pipeline.py) 按同样的阶段分别在各自的线程池中执行。
         """
+        state = AiService.parse_begin(file_id, doc_category_hint)
+        if 'result' not in state:
+            for stage in (AiService.parse_convert, AiService.parse_upload, AiService.parse_model):
+                stage(state)
+            AiService.parse_finish(state)
+        return state['result']
+
+    # --- 解析阶段：每个阶段读写同一个 state 字典，阶段结束前设置 state['result'] 即表示解析已完成 ---
+
+    VISION_EXTS = ['.docx', '.doc', '.pdf', '.jpg', '.png', '.jpeg', '.bmp']
+    DIRECT_EXTS = ['.pdf', '.jpg', '.png', '.jpeg', '.bmp']
+
+    @staticmethod
+    def parse_begin(file_id, doc_category_hint="exam"):
+        """读取文件记录；记录不存在或已有解析结果（缓存命中）时直接给出 result"""
+        state = {'file_id': file_id, 'doc_type': doc_category_hint, 'errors': []}
         record = db.get_file_by_id(file_id)
-        if not record: return False, "文件记录不存在", {}
+        if not record:
+            state['result'] = (False, "文件记录不存在", {})
+            return state
 
         # 缓存命中
         if record.get('parsed_content'):
@@ -37,84 +60,125 @@ class AiService:
                 meta = json.loads(record.get('meta_info', '{}'))
             except:
                 meta = {}
-            return True, record['parsed_content'], meta
+            state['result'] = (True, record['parsed_content'], meta)
+            return state
 
         physical_path = record['physical_path']
         ext = os.path.splitext(physical_path)[1].lower()
-        error_log = []
-
-        # 1. 尝试 Vision 解析
         vision_config = db.get_best_ai_config("vision")
-        # 支持的文件类型扩展
-        if vision_config and ext in ['.docx', '.doc', '.pdf', '.jpg', '.png', '.jpeg', '.bmp']:
-            try:
-                target_path = physical_path
-                # 非 PDF/图片 则尝试转换为 PDF (如 docx)
-                if ext not in ['.pdf', '.jpg', '.png', '.jpeg', '.bmp']:
-                    converted = convert_to_pdf(physical_path)
-                    if converted and os.path.exists(converted):
-                        target_path = converted
-
-                # 获取最终用于上传的文件扩展名
-                final_ext = os.path.splitext(target_path)[1].lower()
+        state.update({
+            'physical_path': physical_path,
+            'vision_config': vision_config if ext in AiService.VISION_EXTS else None,
+            'target_path': physical_path,
+        })
+        return state
 
-                uploader = VolcFileManager(api_key=vision_config['api_key'], base_url=vision_config.get('base_url'))
-                remote_id = uploader.upload_file(target_path)
+    @staticmethod
+    def parse_convert(state):
+        """转换阶段：长文档准备分块；非 PDF/图片 (如 docx) 尝试转换为 PDF 供 Vision 模型使用"""
+        from services import chunked_parse
+
+        if chunked_parse.prepare(state):
+            return
+        if not state.get('vision_config'):
+            return
+        if os.path.splitext(state['physical_path'])[1].lower() in AiService.DIRECT_EXTS:
+            return
+        try:
+            converted = convert_to_pdf(state['physical_path'])
+            if converted and os.path.exists(converted):
+                state['target_path'] = converted
+        except Exception as e:
+            state['errors'].append(f"Convert error: {e}")
 
-                if remote_id:
-                    prompt_text = DocumentTypeConfig.get_prompt_by_type(doc_category_hint)
-                    prompt_text += "\n【特别指令】请保持表格结构，识别勾选框，并以JSON格式返回 {content:..., metadata:...}。"
+    @staticmethod
+    def parse_upload(state):
+        """上传阶段：把待识别文件上传到 Vision 平台"""
+        vision_config = state.get('vision_config')
+        if not vision_config:
+            return
+        try:
+            uploader = VolcFileManager(api_key=vision_config['api_key'], base_url=vision_config.get('base_url'))
+            state['remote_id'] = uploader.upload_file(state['target_path'])
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            state['errors'].append(f"Vision error: {e}")
 
-                    # [修正] 构建多模态 content 列表
-                    content_list = []
+    @staticmethod
+    def parse_model(state):
+        """模型阶段：长文档分块解析；否则 Vision 识别，失败则提取文本后回退到 Text 模式"""
+        if state.get('chunks'):
+            from services import chunked_parse
+            chunked_parse.run(state)
+            return
 
-                    # 1. 添加文件 (根据类型区分)
-                    if final_ext == '.pdf':
-                        content_list.append({"type": "input_file", "file_id": remote_id})
-                    elif final_ext in ['.jpg', '.png', '.jpeg', '.bmp']:
-                        content_list.append({"type": "input_image", "file_id": remote_id})
-                    else:
-                        # 兜底：默认为 input_file
-                        content_list.append({"type": "input_file", "file_id": remote_id})
+        doc_category_hint = state['doc_type']
+        remote_id = state.get('remote_id')
 
-                    # 2. 添加文本提示词
-                    content_list.append({"type": "input_text", "text": prompt_text})
+        # 1. 尝试 Vision 解析
+        if remote_id:
+            prompt_text = DocumentTypeConfig.get_prompt_by_type(doc_category_hint)
+            prompt_text += "\n【特别指令】请保持表格结构，识别勾选框，并以JSON格式返回 {content:..., metadata:...}。"
+
+            # 获取最终用于上传的文件扩展名，构建多模态 content 列表
+            final_ext = os.path.splitext(state['target_path'])[1].lower()
+            if final_ext in ['.jpg', '.png', '.jpeg', '.bmp']:
+                content_list = [{"type": "input_image", "file_id": remote_id}]
+            else:
+                # PDF 及兜底：input_file
+                content_list = [{"type": "input_file", "file_id": remote_id}]
+            content_list.append({"type": "input_text", "text": prompt_text})
 
-                    resp = asyncio.run(call_ai_platform_chat(
-                        system_prompt="你是高校教学资料结构化专家。",
-                        messages=[{"role": "user", "content": content_list}],  # 不再使用 file_ids
-                        platform_config=vision_config
-                    ))
-                    if resp and "[PARSE_ERROR]" not in resp:
-                        return AiService._process_ai_json_response(resp, file_id, doc_category_hint)
+            try:
+                resp = run_async(call_ai_platform_chat(
+                    system_prompt="你是高校教学资料结构化专家。",
+                    messages=[{"role": "user", "content": content_list}],
+                    platform_config=state['vision_config']
+                ))
+                if resp and "[PARSE_ERROR]" not in resp:
+                    state['response'] = resp
+                    return
             except Exception as e:
                 import traceback
                 traceback.print_exc()
-                error_log.append(f"Vision error: {e}")
-
-        # 2. 回退到 Text 模式
-        success, raw_text = FileService.extract_text_from_file(physical_path)
-        if success and raw_text:
-            standard_config = db.get_best_ai_config("thinking") or db.get_best_ai_config("standard")
-            if standard_config:
-                prompt = DocumentTypeConfig.get_prompt_by_type(doc_category_hint)
-                prompt += f"\n请整理以下内容并返回JSON：\n{raw_text[:50000]}"
-                try:
-                    resp = asyncio.run(call_ai_platform_chat(
-                        system_prompt="你是文档结构化专家。",
-                        messages=[{"role": "user", "content": prompt}],
-                        platform_config=standard_config
-                    ))
-                    return AiService._process_ai_json_response(resp, file_id, doc_category_hint)
-                except Exception as e:
-                    error_log.append(f"Text AI error: {e}")
-
-        # 3. 彻底失败，保存纯文本
-        if success and raw_text:
-            db.update_file_parsed_content(file_id, raw_text)
-            return True, raw_text, {}
+                state['errors'].append(f"Vision error: {e}")
+
+        # 2. 回退到 Text 模式（转换阶段已提取过文本时直接使用）
+        raw_text = state.get('raw_text')
+        if not raw_text:
+            success, raw_text = FileService.extract_text_from_file(state['physical_path'])
+            if not (success and raw_text):
+                return
+            state['raw_text'] = raw_text
+        standard_config = db.get_best_ai_config("thinking") or db.get_best_ai_config("standard")
+        if standard_config:
+            prompt = DocumentTypeConfig.get_prompt_by_type(doc_category_hint)
+            prompt += f"\n请整理以下内容并返回JSON：\n{raw_text[:50000]}"
+            try:
+                state['response'] = run_async(call_ai_platform_chat(
+                    system_prompt="你是文档结构化专家。",
+                    messages=[{"role": "user", "content": prompt}],
+                    platform_config=standard_config
+                ))
+            except Exception as e:
+                state['errors'].append(f"Text AI error: {e}")
 
-        return False, f"所有解析策略均失败: {'; '.join(error_log)}", {}
+    @staticmethod
+    def parse_finish(state):
+        """后处理阶段：拆包 AI 返回的 JSON（或分块合并结果）并入库；AI 均失败时保存纯文本"""
+        if state.get('merged'):
+            content, meta = state['merged']
+            state['result'] = AiService._save_parsed_content(state['file_id'], state['doc_type'], content, meta)
+        elif state.get('response'):
+            state['result'] = AiService._process_ai_json_response(state['response'], state['file_id'], state['doc_type'])
+        elif state.get('raw_text'):
+            # 彻底失败，保存纯文本
+            db.update_file_parsed_content(state['file_id'], state['raw_text'])
+            state['result'] = (True, state['raw_text'], {})
+        else:
+            state['result'] = (False, f"所有解析策略均失败: {'; '.join(state['errors'])}", {})
+        return state['result']
 
     @staticmethod
     def _parse_academic_year_semester(full_str):
@@ -140,53 +204,79 @@ class AiService:
 
         return academic_year, semester
 
+    @staticmethod
+    def _load_ai_json(json_text):
+        """从模型输出中取出 JSON 对象（兼容代码块包裹和前后的说明文字）"""
+        cleaned = json_text.strip()
+        match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', cleaned, re.DOTALL)
+        if match:
+            cleaned = match.group(1)
+        else:
+            s, e = cleaned.find('{'), cleaned.rfind('}')
+            if s != -1 and e != -1: cleaned = cleaned[s:e + 1]
+        return json.loads(cleaned)
+
     @staticmethod
     def _process_ai_json_response(json_text, file_id, doc_category):
         try:
-            cleaned = json_text.strip()
-            match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', cleaned, re.DOTALL)
-            if match:
-                cleaned = match.group(1)
-            else:
-                s, e = cleaned.find('{'), cleaned.rfind('}')
-                if s != -1 and e != -1: cleaned = cleaned[s:e + 1]
-
-            data = json.loads(cleaned)
+            data = AiService._load_ai_json(json_text)
             content = data.get("content", "")
             meta = data.get("metadata", {})
             if not content: content = json_text
-
-            if meta.get('academic_year_semester') and (not meta.get('academic_year') or not meta.get('semester')):
-                parsed_year, parsed_semester = AiService._parse_academic_year_semester(
-                    meta.get('academic_year_semester'))
-                if parsed_year and not meta.get('academic_year'): meta['academic_year'] = parsed_year
-                if parsed_semester and not meta.get('semester'): meta['semester'] = parsed_semester
-
-            if meta.get('academic_year') and meta.get('semester') and not meta.get('academic_year_semester'):
-                meta['academic_year_semester'] = f"{meta.get('academic_year')}学年度{meta.get('semester')}"
-
-            conn = db.get_connection()
-            conn.execute('''UPDATE file_assets
-                            SET parsed_content=?,
-                                meta_info=?,
-                                doc_category=?,
-                                academic_year=?,
-                                semester=?,
-                                course_name=?,
-                                cohort_tag=?
-                            WHERE id = ?''',
-                         (content, json.dumps(meta, ensure_ascii=False), doc_category,
-                          meta.get('academic_year'), str(meta.get('semester', '')), meta.get('course_name'),
-                          meta.get('cohort_tag'), file_id))
-            conn.commit()
-            return True, content, meta
+            return AiService._save_parsed_content(file_id, doc_category, content, meta)
         except Exception as e:
             db.update_file_parsed_content(file_id, json_text)
             return True, json_text, {}
 
+    @staticmethod
+    def _save_parsed_content(file_id, doc_category, content, meta):
+        """补全学年学期字段后写入解析结果，返回 (True, content, meta)"""
+        if meta.get('academic_year_semester') and (not meta.get('academic_year') or not meta.get('semester')):
+            parsed_year, parsed_semester = AiService._parse_academic_year_semester(
+                meta.get('academic_year_semester'))
+            if parsed_year and not meta.get('academic_year'): meta['academic_year'] = parsed_year
+            if parsed_semester and not meta.get('semester'): meta['semester'] = parsed_semester
+
+        if meta.get('academic_year') and meta.get('semester') and not meta.get('academic_year_semester'):
+            meta['academic_year_semester'] = f"{meta.get('academic_year')}学年度{meta.get('semester')}"
+
+        # AI 未识别出的字段保留已有值（如批量导入时从路径推断的课程、学年）
+        conn = db.get_connection()
+        conn.execute('''UPDATE file_assets
+                        SET parsed_content=?,
+                            parsed_content_hash=?,
+                            meta_info=?,
+                            doc_category=?,
+                            academic_year=COALESCE(?, academic_year),
+                            semester=COALESCE(?, semester),
+                            course_name=COALESCE(?, course_name),
+                            cohort_tag=COALESCE(?, cohort_tag)
+                        WHERE id = ?''',
+                     (content, parsed_content_hash(content), json.dumps(meta, ensure_ascii=False), doc_category,
+                      meta.get('academic_year') or None, str(meta.get('semester') or '') or None,
+                      meta.get('course_name') or None, meta.get('cohort_tag') or None, file_id))
+        conn.commit()
+        if file_id:
+            events.emit(events.FILE_CONTENT_UPDATED, file_id=file_id)
+        return True, content, meta
+
+    @staticmethod
+    def _related_materials(exam_text, course_name, exclude_file_ids=None):
+        """从文档库检索与试卷相关的同课程资料片段；检索失败不影响生成"""
+        if not course_name or Config.RETRIEVAL_GRADER_CONTEXT_TOKENS <= 0:
+            return ""
+        try:
+            from services import library_index
+            passages = library_index.retrieve(exam_text, k=12, token_budget=Config.RETRIEVAL_GRADER_CONTEXT_TOKENS,
+                                              course_name=course_name, exclude_file_ids=exclude_file_ids)
+            return library_index.format_passages(passages)
+        except Exception as e:
+            print(f"[Grader] related material retrieval failed: {e}")
+            return ""
+
     @staticmethod
     def generate_grader_worker(task_id, exam_text, std_text, strictness, extra_desc, extra_prompt, max_score,
-                               app_config, course_name, user_id=None, task_name=None):
+                               app_config, course_name, user_id=None, task_name=None, exclude_file_ids=None):
         from blueprints.notifications import NotificationService
 
         # 1. 统一生成系统级 ID，不依赖 AI
@@ -222,6 +312,11 @@ class AiService:
             if extra_prompt: prompt_parts.append(f"### 7. 额外生成提示\n{extra_prompt}")
 
             prompt_parts.append(f"### 8. 输入素材\n---试卷---\n{exam_text}\n---标准---\n{std_text}")
+
+            # 同课程的教材、往年试卷等：只附带与本试卷最相关的片段
+            related = AiService._related_materials(exam_text, course_name, exclude_file_ids)
+            if related:
+                prompt_parts.append(f"### 9. 同课程参考资料（节选，仅供理解题意）\n{related}")
             prompt_parts.append(EXAMPLE_PROMPT)
             final_prompt = "\n".join(prompt_parts)
 
@@ -255,12 +350,15 @@ class AiService:
             GraderFactory._loaded = False
             GraderFactory.load_graders()
 
+            # 先写入目录再标记成功：任务完成时的统计缓存失效发生在目录提交之后
             if grader_id in GraderFactory._graders:
+                GraderFactory.catalog_register(grader_id)
                 update_status("success", "生成成功", grader_id)
             else:
                 # 尝试再次强制加载
                 GraderFactory.load_graders()
                 if grader_id in GraderFactory._graders:
+                    GraderFactory.catalog_register(grader_id)
                     update_status("success", "生成成功", grader_id)
                 else:
                     update_status("failed", "代码生成但加载失败(语法错误?)", grader_id)
@@ -366,8 +464,8 @@ class AiService:
             if not line:
                 continue
 
-            # 检测表格分隔线
-            if line.startswith('|---') or line.startswith('| ='):
+            # 检测表格分隔线（含 _students_to_markdown_table 生成的 "| --- | --- |"）
+            if re.match(r'^\|\s*:?[-=]{3,}', line):
                 data_started = True
                 continue
 
@@ -412,9 +510,9 @@ class AiService:
     def parse_student_list_dedicated(file_id, file_name):
         """
         专门的学生名单解析函数：
-        1. 对于 Excel/CSV 文件，使用 pandas 纯逻辑读取全部原始数据
-        2. 直接从表格中提取学生列表（学号、姓名、性别等）
-        3. AI 仅用于提取班级元数据（班级名称、学院、入学年份等）
+        1. 对于 Excel/CSV 文件，流式读取全部工作表的原始数据
+        2. 向量化识别表头与列，直接提取学生列表（学号、姓名、性别等）
+        3. AI 仅用于补充本地无法识别的班级元数据（班级名称、学院、入学年份等）
         4. 减少格式转换可能带来的错误
 
         返回: (success, data, error_message)
@@ -442,39 +540,21 @@ class AiService:
         physical_path = record['physical_path']
         ext = os.path.splitext(physical_path)[1].lower()
 
-        # 1. 优先使用 pandas 直接读取 Excel/CSV 文件并提取学生数据
-        if ext in ['.xlsx', '.xls', '.csv']:
+        # 1. Excel/CSV 直接读取全部工作表并本地识别列（services/roster_service.py）
+        if ext in roster_service.ROSTER_EXTS:
             try:
-                # 读取 Excel/CSV 文件
-                if ext in ['.xlsx', '.xls']:
-                    df = pd.read_excel(physical_path, engine='openpyxl' if ext == '.xlsx' else 'xlrd')
-                else:
-                    # 尝试多种编码
-                    encodings = ['utf-8', 'gb18030', 'gbk', 'latin1']
-                    df = None
-                    for enc in encodings:
-                        try:
-                            df = pd.read_csv(physical_path, encoding=enc)
-                            break
-                        except:
-                            continue
-                    if df is None:
-                        raise Exception("无法读取CSV文件，编码可能不支持")
-
-                # 清理列名（去除空格）
-                df.columns = [str(c).strip() for c in df.columns]
-
-                # 删除全空的行
-                df = df.dropna(how='all')
-
-                # 直接从DataFrame提取学生数据
-                students, has_gender = AiService._extract_students_from_dataframe(df)
-
+                roster = roster_service.parse_roster(physical_path, file_name or record.get('original_name', ''))
+                students = roster['students']
                 if not students:
                     return False, None, "未能从文件中提取到学生数据，请检查文件格式是否包含学号和姓名列"
+                print(f"[学生名单解析] 提取 {len(students)} 名学生，本地识别元数据: {roster['metadata']}")
 
-                # 使用 AI 提取班级元数据
-                meta = AiService._extract_metadata_with_ai(df, file_id, file_name)
+                # 本地已识别出班级名称与入学年份时跳过 AI；否则由 AI 补充，本地识别到的字段优先
+                if roster['confident']:
+                    meta = dict(roster_service.DEFAULT_METADATA)
+                else:
+                    meta = AiService._extract_metadata_with_ai(roster['sample'], file_id, file_name)
+                meta.update(roster['metadata'])
 
                 # 保存解析结果
                 markdown_table = AiService._students_to_markdown_table(students, meta)
@@ -488,7 +568,7 @@ class AiService:
                 return True, {
                     "metadata": meta,
                     "students": students,
-                    "has_gender": has_gender,
+                    "has_gender": roster['has_gender'],
                     "student_count": len(students)
                 }, None
 
@@ -523,26 +603,6 @@ class AiService:
 
         return False, None, "解析失败，请确保文件格式正确"
 
-    @staticmethod
-    def _dataframe_to_student_list_text(df):
-        """
-        将 DataFrame 转换为结构化文本，供 AI 分析
-        保留原始数据格式，减少转换错误
-        """
-        lines = []
-
-        # 添加表头
-        headers = list(df.columns)
-        lines.append(" | ".join(headers))
-        lines.append("-" * len(" | ".join(headers)))
-
-        # 添加数据行（限制前500行避免过长）
-        for idx, row in df.head(500).iterrows():
-            values = [str(v).strip() if pd.notna(v) else "" for v in row.values]
-            lines.append(" | ".join(values))
-
-        return "\n".join(lines)
-
     @staticmethod
     def _extract_students_from_text(text):
         """
@@ -639,136 +699,13 @@ class AiService:
 
         return "\n".join(lines)
 
-    @staticmethod
-    def _extract_students_from_dataframe(df):
-        """
-        直接从 DataFrame 提取学生数据（不使用 AI）
-        自动识别学号、姓名、性别等列
-        返回: (students_list, has_gender)
-        """
-        students = []
-
-        # 打印调试信息
-        print(f"[学生名单解析] Excel列名: {df.columns.tolist()}")
-        print(f"[学生名单解析] 前5行数据:\n{df.head(5).to_string()}")
-
-        # 查找列索引
-        columns = df.columns.tolist()
-        sid_idx = -1
-        name_idx = -1
-        gender_idx = -1
-        email_idx = -1
-        phone_idx = -1
-
-        # 列名映射（支持多种命名方式）
-        for i, col in enumerate(columns):
-            col_clean = str(col).strip().lower()
-            print(f"[学生名单解析] 列{i}: '{col}' -> 清理后: '{col_clean}'")
-
-            # 学号列匹配 - 更精确的匹配
-            if sid_idx == -1:
-                # 精确匹配学号列（避免匹配到其他包含'id'的列）
-                if col_clean == '学号' or col_clean == 'student_id' or col_clean == 'studentid':
-                    sid_idx = i
-                elif col_clean in ['student', 'id', '编号', '号']:
-                    # 确保不匹配到姓名、性别等列
-                    if not any(k in col_clean for k in ['姓名', 'name', '性别', 'gender']):
-                        sid_idx = i
-
-            # 姓名列匹配
-            if name_idx == -1 and col_clean in ['姓名', 'name', '名字', 'student_name', 'studentname']:
-                name_idx = i
-
-            # 性别列匹配
-            if gender_idx == -1 and col_clean in ['性别', 'gender', '男女性别']:
-                gender_idx = i
-
-            # 邮箱列匹配
-            if email_idx == -1 and col_clean in ['邮箱', 'email', '邮件', 'mail']:
-                email_idx = i
-
-            # 电话列匹配
-            if phone_idx == -1 and col_clean in ['电话', 'phone', '手机', '联系电话', '联系方式', 'tel']:
-                phone_idx = i
-
-        print(f"[学生名单解析] 识别结果: 学号列={sid_idx}, 姓名列={name_idx}, 性别列={gender_idx}")
-
-        # 如果找不到学号和姓名列，尝试其他方式
-        if sid_idx == -1 or name_idx == -1:
-            print(f"[学生名单解析] 无法自动识别列名，尝试使用前两列")
-            # 尝试使用前两列作为学号和姓名
-            if len(columns) >= 2:
-                sid_idx = 0
-                name_idx = 1
-            else:
-                print(f"[学生名单解析] 列数不足，无法提取数据")
-                return [], False
-
-        # 提取学生数据
-        for idx, row in df.iterrows():
-            # 获取学号
-            if pd.isna(row.iloc[sid_idx]) or str(row.iloc[sid_idx]).strip() == '':
-                continue
-
-            student_id = str(row.iloc[sid_idx]).strip()
-
-            # 过滤掉表头行（如果学号列包含"学号"字样，说明是表头被当作数据了）
-            if student_id in ['学号', 'student', 'id', '编号', 'student_id', 'studentid']:
-                print(f"[学生名单解析] 跳过表头行 {idx}: 学号='{student_id}'")
-                continue
-
-            # 过滤掉分隔行（如"---"等）
-            if student_id.replace('-', '').replace('_', '').replace('=', '').replace(' ', '').strip() == '':
-                print(f"[学生名单解析] 跳过分隔行 {idx}: 学号='{student_id}'")
-                continue
-
-            # 获取姓名
-            if name_idx >= 0 and not pd.isna(row.iloc[name_idx]):
-                name = str(row.iloc[name_idx]).strip()
-            else:
-                name = ''
-
-            # 过滤掉表头行（姓名列检查）
-            if name in ['姓名', 'name', '名字', 'student_name', 'studentname']:
-                print(f"[学生名单解析] 跳过表头行 {idx}: 姓名='{name}'")
-                continue
-
-            # 跳过姓名为空的记录
-            if not name:
-                continue
-
-            student = {
-                "student_id": student_id,
-                "name": name
-            }
-
-            # 可选字段
-            if gender_idx >= 0 and not pd.isna(row.iloc[gender_idx]):
-                student["gender"] = str(row.iloc[gender_idx]).strip()
-            if email_idx >= 0 and not pd.isna(row.iloc[email_idx]):
-                student["email"] = str(row.iloc[email_idx]).strip()
-            if phone_idx >= 0 and not pd.isna(row.iloc[phone_idx]):
-                student["phone"] = str(row.iloc[phone_idx]).strip()
-
-            students.append(student)
-
-        print(f"[学生名单解析] 成功提取 {len(students)} 名学生")
-        has_gender = gender_idx >= 0 and any(s.get('gender') for s in students)
-        return students, has_gender
-
     @staticmethod
     def _extract_metadata_with_ai(df, file_id, file_name):
         """
         使用 AI 从 DataFrame 中提取班级元数据
         包括：班级名称、学院、系部、入学年份、培养类型等
         """
-        meta = {
-            "class_name": "",
-            "college": "",
-            "department": "",
-            "enrollment_year": "",
-            "education_type": "普本"
-        }
+        meta = dict(roster_service.DEFAULT_METADATA)
 
         try:
             # 准备数据摘要给 AI 分析
@@ -0,0 +1,243 @@
+# services/archive_service.py
+"""
+学年冷数据归档服务
+把已结束学年的成绩、分项、通知、已归档的 AI 对话、欢迎语缓存以及文件解析内容
+迁移到 data/archive/archive_<学年>.db，主库只保留热数据与 archived_year 标记。
+读取时由 Database.history_connection 只读 ATTACH 归档库，对调用方透明。
+"""
+
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from utils.academic_year import academic_year_bounds, infer_academic_year, is_academic_year_closed, \
+    parse_academic_year
+
+
+class ArchiveService:
+    """学年归档服务类"""
+
+    # 归档前后用于对比耗时的热查询（仪表盘 / 列表页的典型查询）
+    PROBE_QUERIES = [
+        "SELECT class_id, COUNT(*), AVG(total_score) FROM grades GROUP BY class_id",
+        "SELECT class_id, item_name, AVG(score) FROM grade_items GROUP BY class_id, item_name",
+        "SELECT * FROM notifications ORDER BY created_at DESC LIMIT 50",
+        "SELECT id, original_name, length(parsed_content) FROM file_assets "
+        "WHERE parsed_content IS NOT NULL ORDER BY created_at DESC",
+    ]
+    PROBE_ROUNDS = 5
+
+    def __init__(self, db):
+        self.db = db
+
+    # ================= 对外接口 =================
+
+    def candidate_years(self):
+        """
+        可归档的学年：从最早数据所在学年到上一学年（当前学年永不归档）
+        :return: [{'academic_year', 'archived'}, ...]
+        """
+        with self.db.read_connection() as conn:
+            row = conn.execute('''
+                SELECT MIN(t) AS earliest FROM (
+                    SELECT MIN(created_at) AS t FROM classes
+                    UNION ALL SELECT MIN(created_at) FROM notifications
+                    UNION ALL SELECT MIN(created_at) FROM file_assets
+                    UNION ALL SELECT MIN(created_at) FROM ai_conversations
+                )
+            ''').fetchone()
+        if not row or not row['earliest']:
+            return []
+
+        archived = set(self.db.get_archived_years())
+        earliest = datetime.strptime(row['earliest'][:19], '%Y-%m-%d %H:%M:%S')
+        first = parse_academic_year(infer_academic_year(earliest))
+        current = parse_academic_year(infer_academic_year())
+        years = [f"{y}-{y + 1}" for y in range(first, current)]
+        return [{'academic_year': y, 'archived': y in archived} for y in reversed(years)]
+
+    def get_runs(self, limit=20):
+        with self.db.read_connection() as conn:
+            rows = conn.execute("SELECT * FROM archive_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        runs = []
+        for row in rows:
+            item = dict(row)
+            item['report'] = json.loads(item['report']) if item['report'] else {}
+            runs.append(item)
+        return runs
+
+    def archive_year(self, academic_year, vacuum=True):
+        """
+        将指定学年迁移到归档库（可重复执行：归档后重新批改的成绩会在下次执行时覆盖归档记录）
+        :param academic_year: 学年，如 "2024-2025"
+        :param vacuum: 迁移后是否 VACUUM 主库以回收空间
+        :return: 归档报告 dict
+        """
+        parse_academic_year(academic_year)
+        if not is_academic_year_closed(academic_year):
+            raise ValueError(f"学年 {academic_year} 尚未结束，不能归档")
+
+        start, end = academic_year_bounds(academic_year)
+        archive_path = self.db.archive_path(academic_year)
+        os.makedirs(self.db.archive_dir, exist_ok=True)
+
+        before = self._measure()
+        alias = self.db.archive_alias(academic_year)
+
+        # 独立连接 + 手动事务：ATTACH 不能在事务内执行，也避免污染线程共享的写连接
+        conn = sqlite3.connect(self.db.db_path, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('ATTACH DATABASE ? AS ' + alias, (archive_path,))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.init_archive_tables(conn, alias)
+                moved = {
+                    'grades': 0, 'grade_items': 0, 'classes': 0,
+                    'notifications': self._move_notifications(conn, alias, start, end),
+                    'ai_messages': 0, 'ai_conversations': 0,
+                    'ai_welcome_messages': self._move_welcome_messages(conn, alias, end),
+                    'file_contents': 0,
+                }
+                moved.update(self._move_class_grades(conn, alias, academic_year, start, end))
+                moved.update(self._move_conversations(conn, alias, academic_year, start, end))
+                moved['file_contents'] = self._move_file_contents(conn, alias, academic_year, start, end)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('DETACH DATABASE ' + alias)
+
+            if vacuum:
+                conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+
+        after = self._measure()
+        report = {
+            'academic_year': academic_year,
+            'moved': moved,
+            'archive_size': os.path.getsize(archive_path),
+            'before': before,
+            'after': after,
+        }
+        self.db.get_connection().execute(
+            "INSERT INTO archive_runs (academic_year, archive_path, report) VALUES (?, ?, ?)",
+            (academic_year, archive_path, json.dumps(report, ensure_ascii=False))
+        )
+        self.db.get_connection().commit()
+        return report
+
+    # ================= 迁移步骤（均在同一事务内） =================
+
+    @staticmethod
+    def _move_class_grades(conn, alias, academic_year, start, end):
+        """学期属于该学年（或无学期且创建于该学年）的班级：成绩与分项迁出"""
+        class_ids = [r[0] for r in conn.execute('''
+            SELECT id FROM classes
+            WHERE archived_year = ?
+               OR (archived_year IS NULL AND (
+                      semester LIKE ? OR (COALESCE(semester, '') = '' AND created_at >= ? AND created_at < ?)))
+        ''', (academic_year, academic_year + '%', start, end)).fetchall()]
+        if not class_ids:
+            return {'classes': 0, 'grades': 0, 'grade_items': 0}
+
+        ph = ','.join('?' * len(class_ids))
+        # 归档后重新批改的学生：先清掉归档库里的旧记录，再整体迁入
+        stale = f'''SELECT a.id FROM {alias}.grades a JOIN main.grades h
+                    ON h.class_id = a.class_id AND h.student_id = a.student_id
+                    WHERE a.class_id IN ({ph})'''
+        conn.execute(f"DELETE FROM {alias}.grade_items WHERE grade_id IN ({stale})", class_ids)
+        conn.execute(f"DELETE FROM {alias}.grades WHERE id IN ({stale})", class_ids)
+
+        items = conn.execute(f'''
+            INSERT OR REPLACE INTO {alias}.grade_items
+            SELECT id, grade_id, class_id, item_name, item_order, score, max_score
+            FROM main.grade_items WHERE class_id IN ({ph})
+        ''', class_ids).rowcount
+        grades = conn.execute(f'''
+            INSERT OR REPLACE INTO {alias}.grades
+            SELECT id, student_id, class_id, total_score, score_details, deduct_details, status, filename
+            FROM main.grades WHERE class_id IN ({ph})
+        ''', class_ids).rowcount
+        conn.execute(f"DELETE FROM main.grade_items WHERE class_id IN ({ph})", class_ids)
+        conn.execute(f"DELETE FROM main.grades WHERE class_id IN ({ph})", class_ids)
+        conn.execute(f"UPDATE classes SET archived_year = ? WHERE id IN ({ph})", [academic_year] + class_ids)
+        return {'classes': len(class_ids), 'grades': grades, 'grade_items': items}
+
+    @staticmethod
+    def _move_notifications(conn, alias, start, end):
+        where = "created_at >= ? AND created_at < ?"
+        moved = conn.execute(f'''
+            INSERT OR IGNORE INTO {alias}.notifications
+            SELECT id, user_id, type, title, message, detail, link, related_id, is_read, created_at
+            FROM main.notifications WHERE {where}
+        ''', (start, end)).rowcount
+        conn.execute(f"DELETE FROM main.notifications WHERE {where}", (start, end))
+        return moved
+
+    @staticmethod
+    def _move_welcome_messages(conn, alias, end):
+        """欢迎语缓存：该学年结束前生成的全部迁出（早已过期，仅作审计留存）"""
+        moved = conn.execute(f'''
+            INSERT OR IGNORE INTO {alias}.ai_welcome_messages
+            SELECT id, user_id, page_context, message_content, created_at, expires_at,
+                   context_snapshot, last_request_time
+            FROM main.ai_welcome_messages WHERE created_at < ?
+        ''', (end,)).rowcount
+        conn.execute("DELETE FROM main.ai_welcome_messages WHERE created_at < ?", (end,))
+        return moved
+
+    @staticmethod
+    def _move_conversations(conn, alias, academic_year, start, end):
+        """只迁移用户已归档、且最后活跃于该学年的对话；对话记录本身保留在主库"""
+        conv_ids = [r[0] for r in conn.execute('''
+            SELECT id FROM ai_conversations
+            WHERE status = 'archived' AND archived_year IS NULL
+              AND last_active_at >= ? AND last_active_at < ?
+        ''', (start, end)).fetchall()]
+        if not conv_ids:
+            return {'ai_conversations': 0, 'ai_messages': 0}
+
+        ph = ','.join('?' * len(conv_ids))
+        moved = conn.execute(f'''
+            INSERT OR IGNORE INTO {alias}.ai_messages
+            SELECT id, conversation_id, role, content, trigger_type, metadata_json, created_at
+            FROM main.ai_messages WHERE conversation_id IN ({ph})
+        ''', conv_ids).rowcount
+        conn.execute(f"DELETE FROM main.ai_messages WHERE conversation_id IN ({ph})", conv_ids)
+        conn.execute(f"UPDATE ai_conversations SET archived_year = ? WHERE id IN ({ph})",
+                     [academic_year] + conv_ids)
+        return {'ai_conversations': len(conv_ids), 'ai_messages': moved}
+
+    @staticmethod
+    def _move_file_contents(conn, alias, academic_year, start, end):
+        """文件元数据留在主库（去重依赖 file_hash），只迁出体积最大的解析内容"""
+        where = '''archived_year IS NULL AND parsed_content IS NOT NULL
+                   AND (academic_year = ? OR (COALESCE(academic_year, '') = ''
+                        AND created_at >= ? AND created_at < ?))'''
+        params = (academic_year, start, end)
+        moved = conn.execute(f'''
+            INSERT OR REPLACE INTO {alias}.file_contents
+            SELECT id, parsed_content FROM main.file_assets WHERE {where}
+        ''', params).rowcount
+        conn.execute(f"UPDATE file_assets SET parsed_content = NULL, archived_year = ? WHERE {where}",
+                     (academic_year,) + params)
+        return moved
+
+    # ================= 归档前后对比 =================
+
+    def _measure(self):
+        """主库文件大小（含 WAL）与热查询耗时"""
+        size = sum(os.path.getsize(p) for p in (self.db.db_path, self.db.db_path + '-wal') if os.path.exists(p))
+        timings = []
+        with self.db.read_connection() as conn:
+            for sql in self.PROBE_QUERIES:
+                started = time.perf_counter()
+                for _ in range(self.PROBE_ROUNDS):
+                    conn.execute(sql).fetchall()
+                timings.append(round((time.perf_counter() - started) * 1000 / self.PROBE_ROUNDS, 3))
+        return {'db_size': size, 'probe_ms': timings, 'probe_ms_total': round(sum(timings), 3)}
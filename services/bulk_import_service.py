@@ -0,0 +1,310 @@
+# services/bulk_import_service.py
+"""
+批量导入
+把 zip 包或服务器目录中的课程资料一次性导入资料库：
+1. 多线程边读边算哈希，file_assets 中已有的、或本批内重复的文件直接跳过
+2. 从文件名和目录推断文档类别、课程名、学年学期并写入 file_assets
+3. 新文件按 BULK_IMPORT_PARSE_CONCURRENCY 的并发额度依次送入解析流水线
+导入本身作为 parse_jobs 中 kind='bulk_import' 的任务，进度与最终汇总报告经 /api/parse_jobs/<job_id> 查询。
+"""
+
+import functools
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import Config
+from extensions import db
+from services.ai_service import AiService
+from services.file_service import FileService
+from services.parse_pipeline import ParseQueueFull, get_parse_pipeline, update_job
+from utils.file_store import HashingUpload, tmp_dir
+
+SUPPORTED_EXTS = {'.pdf', '.docx', '.doc', '.txt', '.md', '.xlsx', '.xls', '.csv', '.jpg', '.jpeg', '.png', '.bmp'}
+
+# 按顺序匹配，先匹配更具体的（如「试卷参考答案」应归为评分细则）
+CATEGORY_KEYWORDS = [
+    ('standard', ('评分标准', '评分细则', '参考答案', '标准答案', '答案', 'rubric', 'answer')),
+    ('syllabus', ('教学大纲', '课程大纲', '大纲', 'syllabus')),
+    ('plan', ('考核计划', '考核方案', '考核办法')),
+    ('score_sheet', ('登分表', '成绩表', '成绩单')),
+    ('student_list', ('学生名单', '花名册', '名单', 'roster')),
+    ('exam', ('试卷', '试题', '考试', '期末', '期中', '测验', 'exam', 'quiz')),
+]
+NOT_PARSED = {'student_list'}  # 学生名单走专用解析且不落库，导入时不解析
+BOOK_TITLE = re.compile(r'《([^》]+)》')
+SEMESTER = re.compile(r'第[一二三 ]+学期|[上下]学期')
+YEAR = re.compile(r'\d{4}\s*[-－—–~至]\s*\d{4}|\d{4}年|学年')
+
+
+def _category_of(text):
+    lowered = text.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(k in lowered for k in keywords):
+            return category
+    return None
+
+
+def infer_document_meta(rel_path):
+    """
+    从相对路径推断 {'doc_category', 'course_name', 'academic_year', 'semester'}（推断不出为 None）
+    例：高等数学/2024-2025学年第一学期/期末试卷A.docx -> exam / 高等数学 / 2024-2025 / 第一学期
+    """
+    parts = [p for p in re.split(r'[\\/]+', rel_path) if p]
+    stem = os.path.splitext(parts[-1])[0]
+    dirs = parts[:-1]
+
+    # 类别：文件名优先，其次由近及远的目录
+    category = None
+    for text in [stem] + dirs[::-1]:
+        category = _category_of(text)
+        if category:
+            break
+
+    # 课程名：文件名中的《》，其次离文件最近的「非类别、非学年学期」目录
+    course = None
+    match = BOOK_TITLE.search(stem)
+    if match:
+        course = match.group(1).strip()
+    else:
+        for name in dirs[::-1]:
+            if not (_category_of(name) or SEMESTER.search(name) or YEAR.search(name)):
+                course = name.strip()
+                break
+
+    academic_year, semester = AiService._parse_academic_year_semester('/'.join(parts))
+    if not semester:
+        match = SEMESTER.search('/'.join(parts))
+        semester = match.group(0) if match else None
+    return {'doc_category': category, 'course_name': course or None,
+            'academic_year': academic_year, 'semester': semester}
+
+
+def _zip_member_name(info):
+    """未设置 UTF-8 标志的 zip（Windows 中文系统常见）文件名按 GBK 还原"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def _skip_reason(rel_path):
+    name = os.path.basename(rel_path)
+    if name.startswith('.') or name.startswith('~$') or '__MACOSX' in rel_path:
+        return '系统/临时文件'
+    if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTS:
+        return '不支持的文件类型'
+    return None
+
+
+class BulkImporter:
+    """批量导入任务调度"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bulk-import')
+
+    # ================= 提交 =================
+
+    def submit_archive(self, upload, user_id):
+        """
+        :param upload: 上传的 zip (HashingUpload)，转存到仓库临时目录后在后台读取
+        :return: (job_id, 是否复用了进行中的任务)
+        """
+        archive_hash = upload.hexdigest()
+        path = os.path.join(tmp_dir(), f"import-{uuid.uuid4().hex}.zip")
+        upload.commit(path)
+        try:
+            with zipfile.ZipFile(path) as zf:
+                entries = [(_zip_member_name(info), info.filename, info.file_size)
+                           for info in zf.infolist() if not info.is_dir()]
+            self._check_limits(entries)
+        except (zipfile.BadZipFile, ValueError) as e:
+            os.remove(path)
+            raise ValueError("不是有效的 zip 文件" if isinstance(e, zipfile.BadZipFile) else str(e))
+
+        @contextmanager
+        def open_member(member):
+            with zipfile.ZipFile(path) as zf, zf.open(member) as stream:  # 每个读取线程独立打开
+                yield stream
+
+        sources = [(name, functools.partial(open_member, member)) for name, member, _ in entries]
+        return self._submit(f"bulk_import:{user_id}:{archive_hash}", sources, user_id,
+                            cleanup=lambda: os.path.exists(path) and os.remove(path))
+
+    def submit_directory(self, directory, user_id):
+        """导入 BULK_IMPORT_ROOT 下的服务器目录"""
+        root = os.path.realpath(Config.BULK_IMPORT_ROOT)
+        target = os.path.realpath(os.path.join(root, directory))
+        if os.path.commonpath([root, target]) != root or not os.path.isdir(target):
+            raise ValueError("目录不存在或不在允许导入的范围内")
+
+        entries = []
+        for current, dirnames, filenames in os.walk(target):
+            dirnames.sort()
+            for name in sorted(filenames):
+                full = os.path.join(current, name)
+                entries.append((os.path.relpath(full, target), full, os.path.getsize(full)))
+        self._check_limits(entries)
+
+        sources = [(rel, functools.partial(open, full, 'rb')) for rel, full, _ in entries]
+        key = hashlib.sha256(target.encode('utf-8')).hexdigest()
+        return self._submit(f"bulk_import:{user_id}:{key}", sources, user_id)
+
+    @staticmethod
+    def _check_limits(entries):
+        if len(entries) > Config.BULK_IMPORT_MAX_FILES:
+            raise ValueError(f"文件数超过上限 ({Config.BULK_IMPORT_MAX_FILES})")
+        if sum(size for _, _, size in entries) > Config.BULK_IMPORT_MAX_BYTES:
+            raise ValueError("文件总大小超过上限")
+
+    def _submit(self, dedupe_key, sources, user_id, cleanup=None):
+        now = time.time()
+        existing = db.find_active_parse_job(dedupe_key, now - Config.PARSE_JOB_STALE_SECONDS)
+        if existing:
+            if cleanup:
+                cleanup()
+            return existing, True
+        job_id = uuid.uuid4().hex
+        db.create_parse_job(job_id, 'bulk_import', dedupe_key, None, None, user_id, now)
+        self._executor.submit(self._run, job_id, sources, user_id, cleanup)
+        return job_id, False
+
+    # ================= 执行 =================
+
+    def _run(self, job_id, sources, user_id, cleanup):
+        try:
+            update_job(job_id, user_id, status='running', stage='hash', progress=0,
+                       message=f"正在读取 {len(sources)} 个文件")
+            items = self._store_all(job_id, sources, user_id)
+            self._parse_all(job_id, items, user_id)
+            report = self._report(items)
+            update_job(job_id, user_id, status='success', progress=100, result=report,
+                       message="导入完成：新增 {imported}，已存在 {duplicate}，跳过 {skipped}，失败 {failed}".format(
+                           **report['counts']))
+        except Exception as e:
+            traceback.print_exc()
+            update_job(job_id, user_id, status='failed', message=f"批量导入失败: {e}")
+        finally:
+            if cleanup:
+                cleanup()
+
+    def _store_all(self, job_id, sources, user_id):
+        """并行读取并入库；返回每个文件的处理结果"""
+        claimed = set()
+        lock = threading.Lock()
+        done = [0]
+
+        def store(source):
+            rel_path, open_stream = source
+            item = {'path': rel_path, 'status': 'skipped'}
+            reason = _skip_reason(rel_path)
+            if reason:
+                item['message'] = reason
+                return item
+            try:
+                upload = HashingUpload()
+                with open_stream() as stream:
+                    shutil.copyfileobj(stream, upload, 1024 * 1024)
+                f_hash = upload.hexdigest()
+                with lock:
+                    duplicate_in_batch = f_hash in claimed
+                    claimed.add(f_hash)
+                if duplicate_in_batch:
+                    upload.close()
+                    item.update(status='duplicate', message="与本批其他文件内容相同")
+                    return item
+
+                record, created = FileService.save_hashed(upload, os.path.basename(rel_path), user_id)
+                item.update(file_id=record['id'], status='imported' if created else 'duplicate')
+                if created:
+                    meta = infer_document_meta(rel_path)
+                    db.update_file_metadata(record['id'], {**meta, 'source_path': rel_path}, **meta)
+                    item.update(meta)
+                else:
+                    item['message'] = "资料库中已存在"
+            except Exception as e:
+                item.update(status='failed', message=str(e))
+            finally:
+                with lock:
+                    done[0] += 1
+                    if done[0] % 20 == 0:
+                        update_job(job_id, user_id, progress=int(30 * done[0] / len(sources)))
+            return item
+
+        with ThreadPoolExecutor(max_workers=Config.BULK_IMPORT_HASH_WORKERS,
+                                thread_name_prefix='bulk-import-hash') as pool:
+            return list(pool.map(store, sources))
+
+    def _parse_all(self, job_id, items, user_id):
+        """新文件按并发额度送入解析流水线并等待完成"""
+        pending = deque(item for item in items
+                        if item['status'] == 'imported' and item.get('doc_category') not in NOT_PARSED)
+        total = len(pending)
+        running = {}
+        pipeline = get_parse_pipeline()
+        update_job(job_id, user_id, stage='parse', progress=30, message=f"正在解析 {total} 个新文件")
+
+        while pending or running:
+            while pending and len(running) < Config.BULK_IMPORT_PARSE_CONCURRENCY:
+                item = pending[0]
+                try:
+                    parse_job_id, _ = pipeline.submit_file(db.get_file_by_id(item['file_id']),
+                                                           item.get('doc_category') or 'exam', user_id)
+                except ParseQueueFull:
+                    break  # 流水线已满，等已提交的任务完成后再试
+                except Exception as e:
+                    item.update(parse_status='failed', message=str(e))
+                    pending.popleft()
+                    continue
+                pending.popleft()
+                item['parse_job_id'] = parse_job_id
+                running[parse_job_id] = item
+
+            time.sleep(Config.BULK_IMPORT_POLL_INTERVAL)
+            for parse_job_id in list(running):
+                job = pipeline.get_job(parse_job_id)
+                if job is None or job['status'] in ('success', 'failed'):
+                    item = running.pop(parse_job_id)
+                    item['parse_status'] = job['status'] if job else 'failed'
+                    if item['parse_status'] == 'failed':
+                        item['message'] = job['message'] if job else "解析任务丢失"
+            finished = total - len(pending) - len(running)
+            update_job(job_id, user_id, progress=30 + int(70 * finished / total) if total else 100)
+
+    @staticmethod
+    def _report(items):
+        counts = Counter(item['status'] for item in items)
+        parse_counts = Counter(item['parse_status'] for item in items if 'parse_status' in item)
+        return {
+            'counts': {'total': len(items), 'imported': counts['imported'], 'duplicate': counts['duplicate'],
+                       'skipped': counts['skipped'], 'failed': counts['failed'],
+                       'parsed': parse_counts['success'], 'parse_failed': parse_counts['failed']},
+            'by_category': dict(Counter(item.get('doc_category') or 'unknown'
+                                        for item in items if item['status'] == 'imported')),
+            'files': items,
+        }
+
+
+_importer = None
+_importer_lock = threading.Lock()
+
+
+def get_bulk_importer():
+    """进程级批量导入调度器"""
+    global _importer
+    if _importer is None:
+        with _importer_lock:
+            if _importer is None:
+                _importer = BulkImporter()
+    return _importer
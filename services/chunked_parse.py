@@ -0,0 +1,251 @@
+# services/chunked_parse.py
+"""
+大文档分块解析
+文本超过 Config.PARSE_CHUNK_THRESHOLD 字符的文档不再整篇交给 Vision 模型或截断后交给文本模型：
+PDF 按页、其他文档按章节标题切成单元，再把连续单元合并为块，各块并发请求文本模型
+（进程内最多 PARSE_CHUNK_WORKERS 块，各厂商另受 max_concurrent_requests 限制）。
+每块的结果以 SHA-256(文档类型 + 块文本) 为键缓存在 parse_chunk_results 表。
+块边界由单元自身内容决定（块达到最小长度后，遇到哈希命中的单元即结束），
+文档小幅修改后只有被改动的块（偶尔连带下一块）需要重新请求模型。
+合并时按块序拼接正文，metadata 按固定规则合并，同样的输入总得到同样的结果。
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_utils.ai_helper import call_ai_platform_chat
+from config import Config
+from export_core.doc_config import DocumentTypeConfig
+from extensions import db
+from services.ai_service import AiService
+from services.file_service import FileService
+from utils.async_runner import run_async
+from utils.pdf_text import iter_pdf_pages, page_count
+
+IMAGE_EXTS = ('.jpg', '.png', '.jpeg', '.bmp')
+BOUNDARY_DIVISOR = 4  # 约每 4 个单元出现一个内容边界
+
+# 章节标题：第X章/节/部分/单元、"一、"、Markdown 标题
+_HEADING = re.compile(r'^\s*(第[一二三四五六七八九十百零\d]+[章节部分篇单元]|[一二三四五六七八九十]+[、．.]|#{1,3}\s)')
+
+CHUNK_PROMPT = (
+    "\n【分块说明】以下是一份长文档中的连续片段。只整理片段本身，不要补写片段之外的内容；"
+    "metadata 中只填写能从该片段确定的字段。\n请整理以下内容并返回JSON：\n"
+)
+
+
+# ================= 分块 =================
+
+def _split_long(text, limit):
+    """把超过 limit 的单元按空行、换行依次细分，仍超长的行直接截断"""
+    if len(text) <= limit:
+        return [text]
+    for sep in ('\n\n', '\n'):
+        parts = text.split(sep)
+        if len(parts) > 1:
+            pieces, current = [], ''
+            for part in parts:
+                candidate = current + sep + part if current else part
+                if current and len(candidate) > limit:
+                    pieces.extend(_split_long(current, limit))
+                    current = part
+                else:
+                    current = candidate
+            pieces.extend(_split_long(current, limit))
+            return pieces
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+def split_units(text):
+    """按章节标题把文本切成单元（标题行归属其后的内容）"""
+    units, current = [], []
+    for line in text.splitlines():
+        if _HEADING.match(line) and any(l.strip() for l in current):
+            units.append('\n'.join(current))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        units.append('\n'.join(current))
+    return [piece for unit in units for piece in _split_long(unit, Config.PARSE_CHUNK_MAX_CHARS)]
+
+
+def _is_boundary(unit):
+    return int(hashlib.sha1(unit.encode('utf-8')).hexdigest()[:8], 16) % BOUNDARY_DIVISOR == 0
+
+
+def build_chunks(units):
+    """把连续单元合并为块：达到最小长度后遇到边界单元即结束，超过上限前强制结束"""
+    chunks, current, size = [], [], 0
+    for unit in units:
+        if current and size + len(unit) > Config.PARSE_CHUNK_MAX_CHARS:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit)
+        if size >= Config.PARSE_CHUNK_MIN_CHARS and _is_boundary(unit):
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def chunk_key(doc_type, text):
+    return hashlib.sha256(f"{doc_type}\0{text}".encode('utf-8')).hexdigest()
+
+
+# ================= 解析与合并 =================
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.PARSE_CHUNK_WORKERS, thread_name_prefix='parse-chunk')
+    return _executor
+
+
+def _parse_one(chunk, doc_type, config):
+    """
+    请求模型整理一个块，返回 (content, metadata)
+    在线程池中经 run_async 在本线程执行：厂商并发锁是阻塞式的，不能在共享事件循环上同时等待多个块
+    """
+    resp = run_async(call_ai_platform_chat(
+        system_prompt="你是文档结构化专家。",
+        messages=[{"role": "user", "content": DocumentTypeConfig.get_prompt_by_type(doc_type) + CHUNK_PROMPT + chunk}],
+        platform_config=config
+    ))
+    if not resp or "[PARSE_ERROR]" in resp:
+        raise ValueError("模型未返回有效内容")
+    data = AiService._load_ai_json(resp)
+    meta = data.get('metadata')
+    return data.get('content') or chunk, meta if isinstance(meta, dict) else {}
+
+
+def parse_chunks(chunks, doc_type, config):
+    """
+    并发解析未缓存的块
+    :return: (按块序的 [(content, metadata) 或 None(失败)], 错误列表)；失败的块不写入缓存
+    """
+    keys = [chunk_key(doc_type, chunk) for chunk in chunks]
+    cached = db.get_parse_chunk_results(set(keys))
+    if cached:
+        db.touch_parse_chunk_results(list(cached), time.time())
+
+    futures = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in cached and key not in futures:
+            futures[key] = _get_executor().submit(_parse_one, chunk, doc_type, config)
+
+    fresh, errors = {}, []
+    for key, future in futures.items():
+        try:
+            fresh[key] = future.result()
+        except Exception as e:
+            errors.append(f"Chunk error: {e}")
+    if fresh:
+        db.save_parse_chunk_results([(key, content, meta) for key, (content, meta) in fresh.items()], time.time())
+    print(f"[ChunkedParse] {len(chunks)} chunks: {len(cached)} cached, {len(fresh)} parsed, {len(errors)} failed")
+
+    return [cached.get(key) or fresh.get(key) for key in keys], errors
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == [] or value == {}
+
+
+def _merge_meta(target, source):
+    """先出现的标量优先；列表按块序追加未出现过的元素；字典递归合并"""
+    for key, value in source.items():
+        if _is_empty(value):
+            continue
+        current = target.get(key)
+        if _is_empty(current):
+            target[key] = copy.deepcopy(value)
+        elif isinstance(current, list) and isinstance(value, list):
+            seen = {json.dumps(item, ensure_ascii=False, sort_keys=True) for item in current}
+            for item in value:
+                marker = json.dumps(item, ensure_ascii=False, sort_keys=True)
+                if marker not in seen:
+                    seen.add(marker)
+                    current.append(copy.deepcopy(item))
+        elif isinstance(current, dict) and isinstance(value, dict):
+            _merge_meta(current, value)
+
+
+def merge_results(results):
+    """按块序合并为 (content, metadata)"""
+    content = '\n\n'.join(text.strip() for text, _ in results if text and text.strip())
+    meta = {}
+    for _, chunk_meta in results:
+        _merge_meta(meta, chunk_meta)
+    return content, meta
+
+
+# ================= 解析阶段接入 =================
+
+def _may_exceed_threshold(path, ext):
+    """
+    不提取文本，估算文档是否可能超过分块阈值：
+    PDF 按页数 × PARSE_PDF_PAGE_MAX_CHARS，docx 按正文 XML 解压后的字节数，其他文本类按文件字节数（字符数不会超过字节数）
+    """
+    threshold = Config.PARSE_CHUNK_THRESHOLD
+    try:
+        if ext == '.pdf':
+            return page_count(path) * Config.PARSE_PDF_PAGE_MAX_CHARS > threshold
+        if ext == '.docx':
+            with zipfile.ZipFile(path) as zf:
+                return zf.getinfo('word/document.xml').file_size > threshold
+        return os.path.getsize(path) > threshold
+    except Exception:
+        return True  # 无法估算时按原流程提取
+
+
+def prepare(state):
+    """
+    转换阶段调用：提取文本，超过阈值时把分块写入 state['chunks'] 并跳过 Vision
+    先按页数/大小估算，不可能超过阈值的文档不提取文本，直接走 Vision（失败时模型阶段再提取）
+    :return: 是否走分块解析
+    """
+    path = state['physical_path']
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTS or not _may_exceed_threshold(path, ext):
+        return False
+    success, raw_text = FileService.extract_text_from_file(path)
+    if not (success and raw_text):
+        return False
+    state['raw_text'] = raw_text
+    if len(raw_text) <= Config.PARSE_CHUNK_THRESHOLD:
+        return False
+
+    if ext == '.pdf':
+        units = [piece for _, text in iter_pdf_pages(path) if text.strip()
+                 for piece in _split_long(text, Config.PARSE_CHUNK_MAX_CHARS)]
+    else:
+        units = split_units(raw_text)
+    state['chunks'] = build_chunks(units)
+    state['vision_config'] = None
+    return True
+
+
+def run(state):
+    """模型阶段调用：解析各块并把合并结果写入 state['merged']；没有可用模型或全部失败时保留纯文本兜底"""
+    config = db.get_best_ai_config("thinking") or db.get_best_ai_config("standard")
+    if not config:
+        return
+    results, errors = parse_chunks(state['chunks'], state['doc_type'], config)
+    state['errors'].extend(errors)
+    if any(results):
+        # 失败的块以原文占位，保证正文完整
+        state['merged'] = merge_results([result or (chunk, {}) for result, chunk in zip(results, state['chunks'])])
@@ -0,0 +1,280 @@
+# services/class_analytics_service.py
+"""
+班级成绩分析（题目分析）
+一次查询把班级成绩载入 NumPy 矩阵（学生 × 分项），向量化计算各分项的
+平均分、中位数、标准差、及格率、分数分布、难度与区分度。
+结果按 (class_id, 成绩版本号) 存入共享缓存；进程内保留矩阵，
+单个学生成绩写入 (GRADE_SAVED) 时只重读该学生一行并原地更新。
+"""
+
+import threading
+import warnings
+from collections import Counter
+
+import numpy as np
+
+from config import Config
+from extensions import db
+from utils import events
+from utils.shared_cache import get_shared_cache
+
+
+class _ScoreMatrix:
+    """
+    班级成绩矩阵：scores[i, j] 为第 i 个学生第 j 个分项得分，缺失为 NaN
+    分项按位置 item_order 区分（与成绩表 get_grade_item_columns 一致），重名的分项各占一列，列名取该位置最常见的名称
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.students = []
+        self.student_index = {}
+        self.items = []          # [(item_name, item_order)]
+        self.item_index = {}     # item_order -> 列号
+        self.max_scores = np.zeros(0)
+        self.scores = np.zeros((0, 0))
+        self.totals = np.zeros(0)
+
+    @classmethod
+    def from_rows(cls, version, rows):
+        matrix = cls(version)
+        grouped = {}
+        for student_id, total, item_name, item_order, score, max_score in rows:
+            grouped.setdefault(student_id, [total]).append((item_name, item_order, score, max_score))
+        names = {}
+        for entries in grouped.values():
+            for item_name, item_order, _, _ in entries[1:]:
+                if item_order is not None:
+                    names.setdefault(item_order, Counter())[item_name] += 1
+        for item_order in sorted(names):
+            matrix._add_item(names[item_order].most_common(1)[0][0], item_order)
+
+        matrix.students = list(grouped)
+        matrix.student_index = {sid: i for i, sid in enumerate(matrix.students)}
+        matrix.scores = np.full((len(matrix.students), len(matrix.items)), np.nan)
+        matrix.totals = np.full(len(matrix.students), np.nan)
+        for i, entries in enumerate(grouped.values()):
+            matrix._fill_row(i, entries[0], entries[1:])
+        return matrix
+
+    def _add_item(self, item_name, item_order):
+        self.item_index[item_order] = len(self.items)
+        self.items.append((item_name, item_order))
+        self.max_scores = np.append(self.max_scores, np.nan)
+        self.scores = np.hstack([self.scores, np.full((self.scores.shape[0], 1), np.nan)])
+
+    def _fill_row(self, i, total, entries):
+        self.totals[i] = total if total is not None else np.nan
+        self.scores[i, :] = np.nan
+        for _, item_order, score, max_score in entries:
+            if item_order is None:
+                continue
+            j = self.item_index[item_order]
+            self.scores[i, j] = score if score is not None else np.nan
+            if max_score is not None and not (self.max_scores[j] >= max_score):
+                self.max_scores[j] = max_score
+
+    def apply_student(self, student_id, rows):
+        """用该学生的最新成绩行替换矩阵中的一行（rows 为空表示成绩已删除或批改失败）"""
+        if not rows:
+            i = self.student_index.pop(student_id, None)
+            if i is not None:
+                self.students.pop(i)
+                self.scores = np.delete(self.scores, i, axis=0)
+                self.totals = np.delete(self.totals, i)
+                self.student_index = {sid: k for k, sid in enumerate(self.students)}
+            return
+
+        entries = [(item_name, item_order, score, max_score) for _, _, item_name, item_order, score, max_score in rows]
+        for item_name, item_order, _, _ in entries:
+            if item_order is not None and item_order not in self.item_index:
+                self._add_item(item_name, item_order)
+
+        i = self.student_index.get(student_id)
+        if i is None:
+            i = len(self.students)
+            self.students.append(student_id)
+            self.student_index[student_id] = i
+            self.scores = np.vstack([self.scores, np.full((1, len(self.items)), np.nan)])
+            self.totals = np.append(self.totals, np.nan)
+        self._fill_row(i, rows[0][1], entries)
+
+
+class ClassAnalyticsService:
+    """班级成绩分析服务类"""
+
+    CACHE_PREFIX = 'analytics:'
+
+    _matrices = {}  # class_id -> _ScoreMatrix（进程内，随 GRADE_SAVED 增量更新）
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_class_analytics(cls, class_id):
+        """
+        获取班级成绩分析
+        :return: {
+            'class_id', 'version', 'graded_count',
+            'total': {...},
+            'items': [{'item_name', 'item_order', 'max_score', 'count', 'mean', 'median', 'std',
+                       'min', 'max', 'pass_rate', 'difficulty', 'discrimination',
+                       'histogram': {'edges': [...], 'counts': [...]}}, ...]
+        }
+        """
+        version = db.get_class_grades_version(class_id)
+        cache = get_shared_cache()
+        key = f"{cls.CACHE_PREFIX}{class_id}:{version}"
+        cached = cache.get(key)
+        if cached:
+            return cached
+
+        with cls._lock:
+            matrix = cls._matrices.get(class_id)
+        if matrix is None or matrix.version != version:
+            # 全量载入在锁外进行，不阻塞其他班级的增量更新
+            version, _, rows = db.get_class_grade_items_long(class_id)
+            loaded = _ScoreMatrix.from_rows(version, rows)
+            with cls._lock:
+                matrix = cls._matrices.get(class_id)
+                if matrix is None or matrix.version < loaded.version:
+                    cls._matrices[class_id] = matrix = loaded
+        with cls._lock:
+            result = cls.compute(matrix)
+        result['class_id'] = class_id
+
+        cache.set(f"{cls.CACHE_PREFIX}{class_id}:{result['version']}", result, Config.ANALYTICS_CACHE_TTL)
+        return result
+
+    @classmethod
+    def apply_grade(cls, class_id, student_id):
+        """
+        单个学生成绩写入后的增量更新：只重读该学生一行
+        仅当版本号恰好前进 1 且这次写入正是该学生（期间没有其他未观察到的写入）时原地更新，
+        否则丢弃矩阵待下次全量载入；查询在锁外进行，持锁时重新检查版本号
+        """
+        with cls._lock:
+            if class_id not in cls._matrices:
+                return
+        version, last_student_id, rows = db.get_class_grade_items_long(class_id, student_id)
+        with cls._lock:
+            matrix = cls._matrices.get(class_id)
+            if matrix is None or matrix.version >= version:
+                return
+            if version != matrix.version + 1 or str(last_student_id) != str(student_id):
+                cls._matrices.pop(class_id, None)
+                return
+            matrix.apply_student(student_id, rows)
+            matrix.version = version
+
+    # 导出用的列名
+    EXPORT_COLUMNS = [
+        ('item_name', '题目'), ('max_score', '满分'), ('count', '人数'), ('mean', '平均分'),
+        ('median', '中位数'), ('std', '标准差'), ('min', '最低分'), ('max', '最高分'),
+        ('pass_rate', '及格率'), ('difficulty', '难度'), ('discrimination', '区分度'),
+    ]
+
+    @classmethod
+    def to_dataframe(cls, analytics):
+        """分析结果转为导出表格（每个分项一行，末行为总分）"""
+        import pandas as pd
+
+        rows = analytics['items'] + [dict(analytics['total'], item_name='总分')]
+        df = pd.DataFrame.from_records(rows, columns=[key for key, _ in cls.EXPORT_COLUMNS])
+        df.columns = [label for _, label in cls.EXPORT_COLUMNS]
+        return df
+
+    # ================= 向量化统计 =================
+
+    @staticmethod
+    def compute(matrix):
+        scores, totals = matrix.scores, matrix.totals
+        item_max = matrix.max_scores.copy()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            # 未声明满分的分项以班级最高分代替
+            observed_max = np.nanmax(scores, axis=0) if scores.size else item_max
+            item_max = np.where(np.isnan(item_max), observed_max, item_max)
+
+            total_max = np.nansum(matrix.max_scores) if not np.isnan(matrix.max_scores).any() else np.nan
+            if not total_max or np.isnan(total_max):
+                total_max = 100.0
+
+            # 区分度：按总分排序取高分组/低分组
+            order = np.argsort(np.where(np.isnan(totals), -np.inf, totals), kind='stable')
+            k = max(1, int(round(len(order) * Config.ANALYTICS_GROUP_RATIO))) if len(order) >= 2 else 0
+            upper, lower = order[len(order) - k:], order[:k]
+
+            items = ClassAnalyticsService._column_stats(scores, item_max, upper, lower)
+            total = ClassAnalyticsService._column_stats(totals[:, None], np.array([total_max]), upper, lower)[0]
+
+        for (item_name, item_order), stats in zip(matrix.items, items):
+            stats['item_name'] = item_name
+            stats['item_order'] = item_order
+        return {
+            'version': matrix.version,
+            'graded_count': len(matrix.students),
+            'total': total,
+            'items': items,
+        }
+
+    @staticmethod
+    def _column_stats(scores, max_scores, upper, lower):
+        """对矩阵每一列（分项）同时计算统计量"""
+        n_items = scores.shape[1]
+        if n_items == 0:
+            return []
+        bins = Config.ANALYTICS_HISTOGRAM_BINS
+        valid = ~np.isnan(scores)
+        count = valid.sum(axis=0)
+        safe_max = np.where(max_scores > 0, max_scores, np.nan)
+
+        mean = np.nanmean(scores, axis=0)
+        median = np.nanmedian(scores, axis=0) if scores.shape[0] else np.full(n_items, np.nan)
+        std = np.nanstd(scores, axis=0)
+        low = np.nanmin(scores, axis=0) if scores.shape[0] else np.full(n_items, np.nan)
+        high = np.nanmax(scores, axis=0) if scores.shape[0] else np.full(n_items, np.nan)
+        passed = (scores >= Config.ANALYTICS_PASS_RATIO * safe_max).sum(axis=0)
+        pass_rate = np.where(count > 0, passed / np.maximum(count, 1), np.nan)
+        difficulty = mean / safe_max
+        discrimination = ((np.nanmean(scores[upper], axis=0) - np.nanmean(scores[lower], axis=0)) / safe_max
+                          if len(upper) else np.full(n_items, np.nan))
+
+        # 分数分布：各列得分率落入 bins 段，偏移列号后一次 bincount
+        ratio = np.where(valid, scores / np.where(np.isnan(safe_max), 1, safe_max), 0)
+        bucket = np.clip(np.floor(ratio * bins), 0, bins - 1).astype(np.int64)
+        flat = (bucket + np.arange(n_items) * bins)[valid]
+        histogram = np.bincount(flat, minlength=n_items * bins).reshape(n_items, bins)
+
+        def num(value, digits=2):
+            return None if np.isnan(value) else round(float(value), digits)
+
+        result = []
+        for j in range(n_items):
+            step = (max_scores[j] / bins) if not np.isnan(safe_max[j]) else None
+            result.append({
+                'max_score': num(max_scores[j]),
+                'count': int(count[j]),
+                'mean': num(mean[j]),
+                'median': num(median[j]),
+                'std': num(std[j]),
+                'min': num(low[j]),
+                'max': num(high[j]),
+                'pass_rate': num(pass_rate[j], 4),
+                'difficulty': num(difficulty[j], 4),
+                'discrimination': num(discrimination[j], 4),
+                'histogram': {
+                    'edges': [round(float(step) * b, 2) for b in range(bins + 1)] if step else [],
+                    'counts': histogram[j].tolist(),
+                },
+            })
+        return result
+
+
+@events.subscribe(events.GRADE_SAVED)
+def _on_grade_saved(class_id, student_id, **_):
+    ClassAnalyticsService.apply_grade(class_id, student_id)
+
+
+@events.subscribe(events.CLASS_DELETED)
+def _on_class_deleted(class_id, **_):
+    with ClassAnalyticsService._lock:
+        ClassAnalyticsService._matrices.pop(class_id, None)
@@ -2,12 +2,13 @@
 import os
 import re
 
-import PyPDF2
 from docx import Document
 
 from config import Config
 from extensions import db
-from utils.common import calculate_file_hash, is_content_garbage
+from utils.common import is_content_garbage
+from utils.file_store import as_hashing_upload, repo_path
+from utils.pdf_text import iter_pdf_pages
 
 
 class FileService:
@@ -26,10 +27,8 @@ class FileService:
         text = ""
         try:
             if ext == '.pdf':
-                reader = PyPDF2.PdfReader(file_path)
-                for page in reader.pages:
-                    extracted = page.extract_text()
-                    if extracted: text += extracted + "\n"
+                # 逐页提取（大文件多进程并行，按页缓存）
+                text = "".join(extracted + "\n" for _, extracted in iter_pdf_pages(file_path) if extracted)
             elif ext == '.docx':
                 doc = Document(file_path)
                 for para in doc.paragraphs:
@@ -69,24 +68,54 @@ class FileService:
     @staticmethod
     def handle_file_upload_or_reuse(file_obj, existing_file_id, user_id):
         """处理文件上传或复用逻辑"""
+        record = FileService.resolve_file_record(file_obj, existing_file_id, user_id)
+        if not record:
+            return None, None
+        name = record['original_name'] if existing_file_id else file_obj.filename
+        return record['physical_path'], name
+
+    @staticmethod
+    def resolve_file_record(file_obj, existing_file_id, user_id):
+        """复用已选文件或保存新上传文件，返回 file_assets 记录（均未提供时返回 None）"""
         if existing_file_id:
             record = db.get_file_by_id(existing_file_id)
-            if record: return record['physical_path'], record['original_name']
+            if record: return record
             raise Exception("选中的文件记录不存在")
 
         if file_obj and file_obj.filename:
-            f_hash = calculate_file_hash(file_obj)
-            existing_record = db.get_file_by_hash(f_hash)
+            return FileService.save_upload(file_obj, user_id)
+
+        return None
 
-            # 即使数据库有记录，如果物理文件不存在，也需要重新保存
-            if existing_record and os.path.exists(existing_record['physical_path']):
-                return existing_record['physical_path'], file_obj.filename
+    @staticmethod
+    def save_upload(file_obj, user_id):
+        """
+        上传文件入库：哈希在接收上传时已同步算出，先查重，未命中才把临时文件原子移入分片仓库
+        :return: file_assets 记录
+        """
+        record, _ = FileService.save_hashed(as_hashing_upload(file_obj), file_obj.filename, user_id)
+        return record
+
+    @staticmethod
+    def save_hashed(upload, filename, user_id):
+        """
+        把已写完的 HashingUpload 入库（上传与批量导入共用）
+        :return: (file_assets 记录, 是否为新文件)
+        """
+        f_hash = upload.hexdigest()
+        existing_record = db.get_file_by_hash(f_hash)
 
-            ext = os.path.splitext(file_obj.filename)[1]
-            physical_path = os.path.normpath(os.path.join(Config.FILE_REPO_FOLDER, f"{f_hash}{ext}"))
-            file_obj.save(physical_path)
+        # 即使数据库有记录，如果物理文件不存在，也需要重新保存
+        if existing_record and os.path.exists(existing_record['physical_path']):
+            upload.close()
+            return existing_record, False
 
-            db.save_file_asset(f_hash, file_obj.filename, os.path.getsize(physical_path), physical_path, user_id)
-            return physical_path, file_obj.filename
+        physical_path = repo_path(f_hash, os.path.splitext(filename)[1])
+        size = upload.size
+        upload.commit(physical_path)
 
-        return None, None
+        if existing_record:
+            db.update_file_asset_paths([(physical_path, existing_record['id'])])
+        else:
+            db.save_file_asset(f_hash, filename, size, physical_path, user_id)
+        return db.get_file_by_hash(f_hash), existing_record is None
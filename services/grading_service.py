@@ -2,6 +2,9 @@
 import logging
 import os
 import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
 
 import patoolib
 # [NEW] 引入并发库和系统库
@@ -11,13 +14,37 @@ import multiprocessing
 from extensions import db
 from grading_core.factory import GraderFactory
 from services.file_service import FileService
+from utils.extract_store import dedup_stats, dedupe_tree, hash_tree
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 正在批改的班级 -> 进行中的批改数（存储回收不按配额清理这些班级的解压目录）
+_active_classes = {}
+_active_lock = threading.Lock()
+
 
 class GradingService:
 
+    @staticmethod
+    @contextmanager
+    def grading(class_id):
+        """登记班级批改进行中，可嵌套"""
+        with _active_lock:
+            _active_classes[class_id] = _active_classes.get(class_id, 0) + 1
+        try:
+            yield
+        finally:
+            with _active_lock:
+                _active_classes[class_id] -= 1
+                if not _active_classes[class_id]:
+                    del _active_classes[class_id]
+
+    @staticmethod
+    def is_grading(class_id):
+        with _active_lock:
+            return class_id in _active_classes
+
     # [NEW] 新增：批量并发批改入口
     @staticmethod
     def grade_all_students(class_id):
@@ -31,8 +58,9 @@ class GradingService:
         if not cls_info:
             return 0, 0, 0
 
-        students = db.get_students_with_grades(class_id)
-        if not students:
+        # 只投影学号列，避免为全班物化完整的学生+成绩记录
+        student_ids = db.get_student_ids(class_id)
+        if not student_ids:
             return 0, 0, 0
 
         # 2. 加载评分策略，判断并发模式
@@ -63,10 +91,9 @@ class GradingService:
 
         logger.info(f"Class {class_id} grading started. Mode: {concurrency_mode}, Workers: {max_workers}")
 
-        # 3. 构造任务列表
+        # 3. 任务列表即上面取得的学号列表
         # 过滤掉不需要批改的学生？通常是全量覆盖或者前端传参，这里假设是对所有学生进行批改
         # 如果需要只批改未交的，可以在这里过滤
-        student_ids = [s['student_id'] for s in students]
 
         success_count = 0
         fail_count = 0
@@ -74,7 +101,7 @@ class GradingService:
         # 4. 执行并发批改
         # 使用 ThreadPoolExecutor，因为涉及大量文件IO和可能的DB等待
         # SQLite 在 database.py 中已经配置了 local connection，是线程安全的
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with GradingService.grading(class_id), concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交任务字典 {future: student_id}
             future_to_sid = {
                 executor.submit(GradingService.grade_single_student, class_id, sid): sid
@@ -94,11 +121,19 @@ class GradingService:
                     logger.error(f"Unhandled exception for student {sid}: {exc}")
                     fail_count += 1
 
-        return success_count, fail_count, len(students)
+        stats = GradingService.get_dedup_stats(class_id)
+        logger.info(f"Class {class_id} extracted {stats['logical_bytes']} bytes, "
+                    f"{stats['physical_bytes']} on disk (dedup ratio {stats['dedup_ratio']})")
+        return success_count, fail_count, len(student_ids)
 
     @staticmethod
     def grade_single_student(class_id, student_id):
-        """核心批改逻辑 (保持不变，作为原子 Worker 被调用)"""
+        """核心批改逻辑 (作为原子 Worker 被调用)"""
+        with GradingService.grading(class_id):
+            return GradingService._grade_single_student(class_id, student_id)
+
+    @staticmethod
+    def _grade_single_student(class_id, student_id):
         # 注意：db.get_connection() 使用了 threading.local()，
         # 所以在不同线程中调用此函数时，会获取独立的数据库连接，保证线程安全。
 
@@ -127,26 +162,15 @@ class GradingService:
 
         # 查找文件
         if not os.path.exists(raw_dir): return False, "无上传文件", None
-        matched_file = None
         # [Performance] os.listdir 在高并发下略慢，但对于几百个文件通常没问题
-        for f in os.listdir(raw_dir):
-            if str(student_id) in f or name in f:
-                matched_file = f
-                break
+        matched_file = GradingService.match_submission(os.listdir(raw_dir), student_id, name)
 
         if not matched_file:
             db.save_grade_error(student_id, class_id, "未找到提交文件", "")
             return False, "未找到提交文件", None
 
-        # 解压
         # [Thread Safety] 每个学生有独立的 extract 目录，互不冲突，安全。
         student_extract_dir = os.path.join(extract_base, str(student_id))
-        if os.path.exists(student_extract_dir):
-            try:
-                shutil.rmtree(student_extract_dir)
-            except:
-                pass
-        os.makedirs(student_extract_dir, exist_ok=True)
 
         try:
             archive_path = os.path.join(raw_dir, matched_file)
@@ -160,17 +184,23 @@ class GradingService:
             if not grader: return False, "评分策略加载失败", matched_file
 
             try:
-                # patoolib 内部通常调用外部 7z/unrar 进程，并发执行是安全的
-                patoolib.extract_archive(archive_path, outdir=student_extract_dir, verbosity=-1)
+                # 解压到新目录后替换旧目录，不会写穿旧目录中指向去重存储的硬链接
+                GradingService._extract_submission(archive_path, student_extract_dir, replace=True)
             except Exception as e:
                 # 简单的异常处理，不影响其他线程
                 if "rar" in matched_file.lower(): raise Exception("解压RAR失败，请检查服务器组件")
                 raise e
 
+            # 哈希交给批改核心复用单文件分析结果；批改期间文件仍是独立副本，批改完成后才换成硬链接
+            file_hashes = hash_tree(student_extract_dir)
+            grader.file_hashes = {os.path.normpath(os.path.join(student_extract_dir, rel)): h
+                                  for rel, h in file_hashes.items()}
+
             # 调用 AI 批改核心 / 逻辑核心
             # 这里的 grader.grade 必须要保证线程安全。
             # 如果是 AI 核心，它会调用 request，本身就是阻塞IO，适合多线程。
-            result = grader.grade(student_extract_dir, {"sid": str(student_id), "name": name})
+            result = grader.grade(student_extract_dir,
+                                  {"sid": str(student_id), "name": name, "file_hashes": file_hashes})
 
             status = "PASS" if result.is_pass else "FAIL"
 
@@ -180,6 +210,7 @@ class GradingService:
             # 如果出现 database is locked，可以将 save_grade 放入队列由主线程统一写，但目前的规模直接写更简单。
             db.save_grade(str(student_id), class_id, result.total_score, result.get_details_json(),
                           result.get_deduct_str(), status, matched_file)
+            GradingService._dedupe_extracted(student_extract_dir, file_hashes)
 
             return True, "批改完成", {
                 "total_score": result.total_score,
@@ -190,4 +221,80 @@ class GradingService:
         except Exception as e:
             msg = f"系统异常: {str(e)}"
             db.save_grade_error(str(student_id), class_id, msg, matched_file)
-            return False, msg, matched_file
\ No newline at end of file
+            return False, msg, matched_file
+
+    @staticmethod
+    def _dedupe_extracted(extract_dir, file_hashes=None):
+        """成绩保存后尽力把解压目录换成去重存储中的硬链接；失败只保留独立副本，不影响批改结果"""
+        try:
+            dedupe_tree(extract_dir, file_hashes)
+        except OSError as e:
+            logger.warning(f"Dedupe extracted files failed for {extract_dir}: {e}")
+
+    @staticmethod
+    def _extract_submission(archive_path, extract_dir, replace):
+        """
+        解压到同级临时目录再改名为 extract_dir
+        :param replace: True 时替换已有目录；False 时已有目录（如并发的另一次恢复已完成）则保留它
+        :return: 是否放入了新解压的目录
+        """
+        parent = os.path.dirname(extract_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(extract_dir)}-", dir=parent)
+        try:
+            # patoolib 内部通常调用外部 7z/unrar 进程，并发执行是安全的
+            patoolib.extract_archive(archive_path, outdir=tmp_dir, verbosity=-1)
+            for attempt in range(3):
+                if replace:
+                    shutil.rmtree(extract_dir, ignore_errors=True)
+                try:
+                    os.rename(tmp_dir, extract_dir)
+                    return True
+                except OSError:
+                    # 目标目录在此期间被并发的解压放入
+                    if not os.path.isdir(extract_dir) or attempt == 2:
+                        raise
+                    if not replace:
+                        return False
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def match_submission(file_names, student_id, name):
+        """在 raw_zips 文件名中查找学生的提交（文件名含学号或姓名）"""
+        for f in file_names:
+            if str(student_id) in f or (name and name in f):
+                return f
+        return None
+
+    @staticmethod
+    def get_dedup_stats(class_id):
+        """班级解压目录的去重统计（见 utils.extract_store.dedup_stats）"""
+        ws_path = FileService.get_real_workspace_path(class_id)
+        return dedup_stats(os.path.join(ws_path, 'extracted'))
+
+    @staticmethod
+    def restore_extracted(class_id, student_id):
+        """
+        解压目录被存储回收清理后，从 raw_zips 中的原始提交重新解压（不重新批改）
+        :return: 解压目录；没有可用的提交时返回 None
+        """
+        ws_path = FileService.get_real_workspace_path(class_id)
+        raw_dir = os.path.join(ws_path, 'raw_zips')
+        student = db.get_student_detail(class_id, student_id)
+        if not student or not os.path.isdir(raw_dir):
+            return None
+        matched_file = GradingService.match_submission(os.listdir(raw_dir), student_id, student['name'])
+        if not matched_file:
+            return None
+
+        extract_dir = os.path.join(ws_path, 'extracted', str(student_id))
+        try:
+            restored = GradingService._extract_submission(os.path.join(raw_dir, matched_file), extract_dir,
+                                                          replace=False)
+        except Exception as e:
+            logger.warning(f"Restore extracted files failed for {class_id}/{student_id}: {e}")
+            return None
+        if restored:
+            GradingService._dedupe_extracted(extract_dir)
+        return extract_dir
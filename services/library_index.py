@@ -0,0 +1,212 @@
+# services/library_index.py
+"""
+文档库检索索引（BM25，不依赖向量模型）
+file_assets.parsed_content 按行切成约 RETRIEVAL_PASSAGE_CHARS 字的片段，分词后写入 SQLite FTS5 表
+library_passages，检索时由 FTS5 内置的 bm25() 排序。分词优先使用 jieba（搜索引擎模式），
+未安装时退回中文二元组 + 英文单词；更换分词器后由维护任务逐步重建。
+解析内容写入或修改 (FILE_CONTENT_UPDATED) 时在后台线程只重建该文件的片段，文件删除时同步删除；
+维护任务 library_index 补建遗漏的文件并清理已删除文件的片段。
+retrieve 在 token 预算内返回与查询最相关的片段，生成批改核心、AI 生成文档时用它代替整篇粘贴参考资料。
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from database import parsed_content_hash
+from extensions import db
+from services.ai_context_service import estimate_tokens
+from utils import events
+
+_TOKEN_RE = re.compile(r'[a-z0-9_]+|[㐀-䶿一-鿿]+')
+
+
+def _bigram_tokens(text):
+    """英文/数字按单词，连续汉字按相邻二元组（单个汉字保留原字）"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _load_tokenizer():
+    try:
+        import jieba
+    except ImportError:
+        return 'bigram', _bigram_tokens
+    jieba.setLogLevel(logging.WARNING)
+
+    def cut(text):
+        # 只保留 FTS5 unicode61 视为单个词的 token（去掉标点、空白及含符号的词）
+        return [w for w in (t.strip().lower() for t in jieba.cut_for_search(text)) if _TOKEN_RE.fullmatch(w)]
+
+    return 'jieba', cut
+
+
+TOKENIZER, tokenize = _load_tokenizer()
+
+
+def split_passages(text, size):
+    """按行把文本合并为不超过 size 字的片段（空行丢弃，超长的行直接截断）"""
+    passages, current = [], ''
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        while len(line) > size:
+            if current:
+                passages.append(current)
+                current = ''
+            passages.append(line[:size])
+            line = line[size:]
+        if current and len(current) + 1 + len(line) > size:
+            passages.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        passages.append(current)
+    return passages
+
+
+# ================= 建索引 =================
+
+def index_file(file_id):
+    """
+    重建一个文件的片段；内容与分词器均未变化时跳过
+    :return: 写入的片段数，跳过时返回 None
+    """
+    record = db.get_file_by_id(file_id)
+    if not record:
+        db.delete_library_passages(file_id)
+        return 0
+    content = record.get('parsed_content') or ''
+    content_hash = parsed_content_hash(content)
+    if db.get_library_index_entry(file_id) == (content_hash, TOKENIZER):
+        return None
+
+    passages = []
+    for text in split_passages(content, Config.RETRIEVAL_PASSAGE_CHARS):
+        tokens = tokenize(text)
+        if tokens:
+            passages.append((' '.join(tokens), text))
+    db.replace_library_passages(file_id, content_hash, len(content), TOKENIZER, passages, time.time())
+    return len(passages)
+
+
+def sync():
+    """维护任务：清理已删除文件的片段，补建一批未建索引或已变化的文件"""
+    orphans = db.get_library_index_orphans()
+    for file_id in orphans:
+        db.delete_library_passages(file_id)
+    indexed = 0
+    for file_id in db.get_library_index_pending(TOKENIZER, Config.RETRIEVAL_SYNC_BATCH):
+        if index_file(file_id) is not None:
+            indexed += 1
+    return {'indexed': indexed, 'removed': len(orphans), 'tokenizer': TOKENIZER}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_queued = set()  # 已排队尚未开始的文件，同一文件连续多次修改只重建一次
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='library-index')
+    return _executor
+
+
+def _run(fn, file_id):
+    with _executor_lock:
+        _queued.discard((fn, file_id))
+    try:
+        fn(file_id)
+    except Exception as e:
+        print(f"[LibraryIndex] {fn.__name__}({file_id}) failed: {e}")
+
+
+def _schedule(fn, file_id):
+    with _executor_lock:
+        if (fn, file_id) in _queued:
+            return
+        _queued.add((fn, file_id))
+    _get_executor().submit(_run, fn, file_id)
+
+
+@events.subscribe(events.FILE_CONTENT_UPDATED)
+def _on_content_updated(file_id, **_):
+    if file_id:
+        _schedule(index_file, int(file_id))
+
+
+@events.subscribe(events.FILE_DELETED)
+def _on_file_deleted(file_id, **_):
+    if file_id:
+        _schedule(db.delete_library_passages, int(file_id))
+
+
+# ================= 检索 =================
+
+def query_terms(text):
+    """查询词：按在查询中出现的次数取前 RETRIEVAL_MAX_QUERY_TERMS 个（次数相同按首次出现顺序）"""
+    counts = Counter(tokenize(text or ''))
+    return sorted(counts, key=lambda term: -counts[term])[:Config.RETRIEVAL_MAX_QUERY_TERMS]
+
+
+def retrieve(query, k=8, token_budget=None, file_ids=None, course_name=None, exclude_file_ids=None):
+    """
+    BM25 检索片段
+    :param token_budget: 返回片段的估算 token 总数上限（默认 RETRIEVAL_DEFAULT_TOKENS）
+    :param file_ids: 只在这些文件中检索
+    :param course_name: 只在该课程的文件中检索
+    :param exclude_file_ids: 排除的文件（如已整篇放入提示词的素材）
+    :return: 按相关度排序的 [{'file_id', 'seq', 'original_name', 'course_name', 'text', 'score'}, ...]
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    budget = token_budget or Config.RETRIEVAL_DEFAULT_TOKENS
+    rows = db.search_library_passages(' OR '.join(f'"{term}"' for term in terms),
+                                      max(k * 4, Config.RETRIEVAL_CANDIDATES),
+                                      file_ids=file_ids, course_name=course_name, exclude_file_ids=exclude_file_ids)
+    picked, used = [], 0
+    for row in rows:
+        cost = estimate_tokens(row['text'])
+        if used + cost > budget:
+            continue
+        picked.append(row)
+        used += cost
+        if len(picked) >= k:
+            break
+    return picked
+
+
+def format_passages(passages):
+    """拼成提示词中的参考资料：按文件分组（组按最相关片段的顺序），组内按原文顺序"""
+    groups = {}
+    for passage in passages:
+        groups.setdefault(passage['file_id'], []).append(passage)
+    blocks = []
+    for items in groups.values():
+        items.sort(key=lambda p: p['seq'])
+        blocks.append(f"--- {items[0]['original_name']} ---\n" + "\n...\n".join(p['text'] for p in items))
+    return "\n\n".join(blocks)
+
+
+def get_stats():
+    stats = db.get_library_index_stats()
+    stats['tokenizer'] = TOKENIZER
+    with _executor_lock:
+        stats['queued'] = len(_queued)
+    return stats
@@ -0,0 +1,175 @@
+# services/maintenance_service.py
+"""
+后台维护调度
+进程内后台线程按 Config.MAINTENANCE_JOBS 周期执行清理、ANALYZE、增量 VACUUM、
+WAL 截断、存储回收、缓存过期淘汰、文档库检索索引补建、计数器校验、批改核心目录对齐与仓库布局迁移。任务及下次运行时间持久化在 maintenance_jobs 表，
+每次执行前以条件 UPDATE 领取任务锁，多个进程同时运行调度器时同一任务只有一个执行者；
+每次运行写入 maintenance_runs。维护不在请求路径上、也不在启动时执行。
+"""
+
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+from config import Config
+from extensions import db
+from utils.file_store import migrate_flat_layout
+from utils.shared_cache import get_shared_cache
+
+
+class MaintenanceScheduler:
+    """维护任务调度器"""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._thread = None
+        self._jobs = {
+            'cleanup_records': self.cleanup_records,
+            'analyze': self.analyze,
+            'incremental_vacuum': self.incremental_vacuum,
+            'wal_checkpoint': self.wal_checkpoint,
+            'storage_gc': self.storage_gc,
+            'cache_eviction': self.cache_eviction,
+            'library_index': self.library_index,
+            'reconcile_counters': self.reconcile_counters,
+            'grader_catalog': self.grader_catalog,
+            'file_repo_layout': self.file_repo_layout,
+        }
+
+    # ================= 调度 =================
+
+    def start(self):
+        """
+        登记任务并启动后台线程，启动时不执行任何维护。首次运行时间为一个周期之后；
+        MAINTENANCE_DUE_ON_REGISTER 中的任务首次登记即到期，由后台线程的第一次检查执行
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        now = time.time()
+        db.sync_maintenance_jobs([
+            (name, interval, now if name in Config.MAINTENANCE_DUE_ON_REGISTER else self._next_run(now, interval))
+            for name, interval in Config.MAINTENANCE_JOBS.items() if name in self._jobs])
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def run_due(self):
+        """执行所有到期且领取成功的任务，返回 {任务名: 运行结果}"""
+        results = {}
+        for name in Config.MAINTENANCE_JOBS:
+            if name in self._jobs:
+                result = self.run_job(name)
+                if result is not None:
+                    results[name] = result
+        return results
+
+    def run_job(self, name, force=False):
+        """
+        领取并执行一个任务
+        :param force: 手动触发，忽略下次运行时间
+        :return: {'status', 'result', 'duration_ms'}；未到期或已被其他进程领取时返回 None
+        """
+        started = time.time()
+        if not db.claim_maintenance_job(name, self.owner, started, Config.MAINTENANCE_LOCK_SECONDS, force):
+            return None
+        try:
+            result, status = self._jobs[name](), 'success'
+        except Exception as e:
+            result, status = {'error': str(e)}, 'failed'
+        finished = time.time()
+        db.finish_maintenance_job(name, self.owner, started, finished, status, result,
+                                  self._next_run(finished, Config.MAINTENANCE_JOBS[name]))
+        return {'status': status, 'result': result, 'duration_ms': int((finished - started) * 1000)}
+
+    def get_status(self, limit=50):
+        """任务列表与最近运行记录"""
+        return {'owner': self.owner, 'jobs': db.get_maintenance_jobs(), 'runs': db.get_maintenance_runs(limit=limit)}
+
+    @staticmethod
+    def _next_run(now, interval):
+        return now + interval * (1 + random.uniform(-Config.MAINTENANCE_JITTER, Config.MAINTENANCE_JITTER))
+
+    def _run(self):
+        while True:
+            time.sleep(Config.MAINTENANCE_POLL_INTERVAL * random.uniform(0.8, 1.2))
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"[Maintenance] scheduler tick failed: {e}")
+
+    # ================= 任务 =================
+
+    @staticmethod
+    def cleanup_records():
+        from blueprints.ai_welcome import cleanup_old_welcome_messages
+        from services.ai_content_service import cleanup_expired_messages
+
+        days = Config.MAINTENANCE_RETENTION_DAYS
+        return {
+            'welcome_and_rate_limits': cleanup_old_welcome_messages(days=days),
+            'expired_welcome_cache': cleanup_expired_messages(),
+            'read_notifications': db.clean_old_notifications(days=days),
+            'parse_jobs': db.prune_parse_jobs(time.time() - days * 86400),
+            'pdf_page_texts': db.prune_pdf_page_texts(),
+            'parse_chunk_results': db.prune_parse_chunk_results(time.time() - days * 86400),
+            'maintenance_runs': db.prune_maintenance_runs(time.time() - days * 86400),
+        }
+
+    @staticmethod
+    def analyze():
+        db.analyze()
+        return {}
+
+    @staticmethod
+    def incremental_vacuum():
+        return db.incremental_vacuum(Config.MAINTENANCE_VACUUM_PAGES)
+
+    @staticmethod
+    def wal_checkpoint():
+        busy, wal_pages, checkpointed = db.checkpoint_wal()
+        return {'busy': busy, 'wal_pages': wal_pages, 'checkpointed': checkpointed}
+
+    @staticmethod
+    def storage_gc():
+        """回收不可达与过期的文件（工作区、文件仓库、导出文件、签名），只记录汇总"""
+        from services import storage_gc
+        return storage_gc.collect(detail=False)
+
+    @staticmethod
+    def cache_eviction():
+        return {'evicted': get_shared_cache().purge_expired()}
+
+    @staticmethod
+    def library_index():
+        from services import library_index
+        return library_index.sync()
+
+    @staticmethod
+    def reconcile_counters():
+        return {'repaired': len(db.reconcile_counters(repair=True))}
+
+    @staticmethod
+    def grader_catalog():
+        from grading_core.factory import GraderFactory
+        report = GraderFactory.check_catalog(repair=True)
+        return {key: len(value) if isinstance(value, list) else value for key, value in report.items()}
+
+    @staticmethod
+    def file_repo_layout():
+        return migrate_flat_layout(db)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_maintenance_scheduler():
+    """进程级维护调度器"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = MaintenanceScheduler()
+    return _scheduler
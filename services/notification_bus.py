@@ -0,0 +1,132 @@
+# services/notification_bus.py
+"""
+通知合并总线
+长任务的进度通知按 (user_id, related_id) 合并：窗口期内只保留最新状态，
+由后台线程批量落库（一次事务）。创建、成功、失败等关键状态立即写入，
+并丢弃该通知尚未落库的进度更新，保证最终状态不被旧进度覆盖。
+"""
+
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from extensions import db
+
+
+class NotificationBus:
+    """进度通知合并写入"""
+
+    STATS_KEEP = 200  # 保留最近多少个关联 ID 的写入统计
+
+    def __init__(self, window=None):
+        self.window = Config.NOTIFICATION_COALESCE_WINDOW if window is None else window
+        self._pending = OrderedDict()  # (user_id, related_id) -> [first_ts, (notif_type, title, detail, link)]
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 串行化落库，保证进度与最终状态的写入顺序
+        self._thread = None
+        self._stats = OrderedDict()  # related_id -> {'published': n, 'written': n}
+
+    # ================= 对外接口 =================
+
+    def publish(self, user_id, related_id, notif_type=None, title=None, detail=None, link=None, immediate=False):
+        """
+        发布一次通知状态更新
+        :param immediate: 关键状态（成功/失败等）立即写入；否则在窗口期内与后续更新合并
+        """
+        key = (user_id, related_id)
+        state = (notif_type, title, detail, link)
+        self._count(related_id, 'published')
+
+        if immediate:
+            with self._write_lock:
+                with self._lock:
+                    self._pending.pop(key, None)
+                self._write([(key, state)])
+            return
+
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry:
+                entry[1] = self._merge(entry[1], state)
+            else:
+                self._pending[key] = [time.monotonic(), state]
+        self._ensure_worker()
+
+    def discard(self, related_id):
+        """丢弃该关联 ID 尚未落库的更新（如任务/通知已被删除）"""
+        with self._lock:
+            for key in [key for key in self._pending if key[1] == related_id]:
+                del self._pending[key]
+
+    def flush(self, force=True):
+        """
+        落库待写更新
+        :param force: True 时写入全部；False 时只写入已超过合并窗口的
+        """
+        with self._write_lock:
+            now = time.monotonic()
+            with self._lock:
+                due = [key for key, (first, _) in self._pending.items() if force or now - first >= self.window]
+                batch = [(key, self._pending.pop(key)[1]) for key in due]
+            self._write(batch)
+
+    def get_stats(self):
+        """各关联 ID 的发布次数与实际写入次数"""
+        with self._lock:
+            return {related_id: dict(counts) for related_id, counts in self._stats.items()}
+
+    # ================= 内部实现 =================
+
+    @staticmethod
+    def _merge(old, new):
+        """新状态覆盖旧状态，未提供的字段沿用旧值"""
+        return tuple(n if n is not None else o for o, n in zip(old, new))
+
+    def _write(self, batch):
+        if not batch:
+            return
+        db.apply_notification_updates([(related_id,) + state for (_, related_id), state in batch])
+        for (_, related_id), _ in batch:
+            self._count(related_id, 'written')
+
+    def _count(self, related_id, field):
+        with self._lock:
+            counts = self._stats.setdefault(related_id, {'published': 0, 'written': 0})
+            counts[field] += 1
+            self._stats.move_to_end(related_id)
+            while len(self._stats) > self.STATS_KEEP:
+                self._stats.popitem(last=False)
+
+    def _ensure_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='notification-bus', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.window / 2 or 0.1)
+            try:
+                self.flush(force=False)
+            except Exception as e:
+                print(f"[NotificationBus] flush failed: {e}")
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_notification_bus():
+    """进程级通知总线（退出时落库剩余更新）"""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = NotificationBus()
+                atexit.register(_bus.flush)
+    return _bus
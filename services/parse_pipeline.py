@@ -0,0 +1,228 @@
+# services/parse_pipeline.py
+"""
+文档解析流水线
+解析分为 convert / upload / model / post 四个阶段，每个阶段有独立的有界线程池
+（Config.PARSE_STAGE_WORKERS），慢的模型调用不会占满转换或入库的线程，也不再占用 Flask worker。
+任务状态持久化在 parse_jobs 表，前端凭任务 ID 轮询；每次状态变化同时 emit PARSE_JOB_UPDATED。
+相同内容（类型 + 文件哈希 + 文档类型）已有进行中的任务时直接返回该任务 ID，不重复解析。
+"""
+
+import hashlib
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_utils.ai_helper import call_ai_platform_chat
+from config import Config
+from extensions import db
+from services.ai_service import AiService
+from utils import events
+from utils.async_runner import run_async
+from utils.common import create_text_asset, extract_title_and_content
+
+STAGES = ('convert', 'upload', 'model', 'post')
+STAGE_PROGRESS = {'convert': 10, 'upload': 30, 'model': 50, 'post': 90}  # 进入该阶段时的进度
+
+
+class ParseQueueFull(Exception):
+    """本进程未完成的解析任务已达上限"""
+
+
+# ================= 各类任务的阶段函数 =================
+# 阶段函数读写同一个 state 字典；最后一个阶段设置 state['payload']（返回给前端的数据）表示成功，
+# 设置 state['error'] 或抛出异常表示失败。
+
+def _content_payload(state):
+    """把 AiService 解析阶段的 result 转为任务结果"""
+    success, content, _ = state['result']
+    if not success:
+        state['error'] = content or "解析失败"
+        return
+    state['payload'] = {
+        'file_id': state['file_id'],
+        'title': state['title'],
+        'parsed_content': content[:500] if content else "",
+    }
+
+
+def _finish_content(state):
+    AiService.parse_finish(state)
+    _content_payload(state)
+
+
+def _parse_student_list(state):
+    success, data, error_msg = AiService.parse_student_list_dedicated(state['file_id'], state['file_name'])
+    if not success:
+        state['error'] = error_msg or "解析失败"
+        return
+    state['payload'] = {
+        'file_id': state['file_id'],
+        'title': data.get('metadata', {}).get('class_name', state['title']),
+        'data': data,
+    }
+
+
+def _normalize_pasted(state):
+    """让 AI 把粘贴内容整理成 {title, content} JSON"""
+    doc_label = "试卷" if state['doc_type'] == "exam" else "评分标准"
+    prompt = (
+        f"请对以下{doc_label}内容进行深度规整。\n"
+        "1. 去除无用的页眉页脚、乱码。\n"
+        "2. 将内容整理为清晰的 Standard Markdown 格式。\n"
+        "3. 根据文档类型和内容为文档起一个合理的标题。\n"
+        "4. **必须以纯 JSON 格式返回**，不要使用代码块标记，格式如下：\n"
+        "{\"title\": \"文档标题\", \"content\": \"Markdown格式的正文内容...\"}\n\n"
+        f"原始内容：\n{state['content']}"
+    )
+    # run_async 在本工作线程上 asyncio.run：厂商并发信号量只阻塞本线程
+    state['response'] = run_async(call_ai_platform_chat(
+        system_prompt="你是文档整理助手。你只输出 JSON。",
+        messages=[{"role": "user", "content": prompt}],
+        platform_config=state['ai_config']
+    ))
+
+
+def _save_pasted(state):
+    title, normalized_content = extract_title_and_content(state['response'] or '', state['doc_type'])
+    if not normalized_content:
+        state['error'] = "AI 解析内容为空"
+        return
+    file_id, filename = create_text_asset(normalized_content, title, state['user_id'])
+    if not file_id:
+        state['error'] = "保存失败"
+        return
+    state['payload'] = {'file_id': file_id, 'title': filename}
+
+
+def update_job(job_id, user_id, status=None, stage=None, progress=None, message=None, result=None):
+    """持久化任务状态并发出 PARSE_JOB_UPDATED（批量导入等复用 parse_jobs 的任务也经此更新）"""
+    db.update_parse_job(job_id, time.time(), status=status, stage=stage, progress=progress,
+                        message=message, result=result)
+    events.emit(events.PARSE_JOB_UPDATED, job_id=job_id, user_id=user_id,
+                status=status, stage=stage, progress=progress)
+
+
+class ParsePipeline:
+    """分阶段解析任务调度"""
+
+    def __init__(self):
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=Config.PARSE_STAGE_WORKERS[stage],
+                                      thread_name_prefix=f'parse-{stage}')
+            for stage in STAGES
+        }
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    # ================= 提交 =================
+
+    def submit_file(self, record, doc_type, user_id):
+        """常规智能解析（文件已有解析结果时任务直接完成）"""
+        state = AiService.parse_begin(record['id'], doc_type)
+        state['title'] = record['original_name']
+        if 'result' in state:
+            _content_payload(state)
+            steps = []
+        else:
+            steps = [('convert', AiService.parse_convert), ('upload', AiService.parse_upload),
+                     ('model', AiService.parse_model), ('post', _finish_content)]
+        return self._submit('content', f"content:{record['file_hash']}:{doc_type}",
+                            state, steps, record['id'], doc_type, user_id)
+
+    def submit_student_list(self, record, file_name, user_id):
+        """学生名单专用解析（表格读取 + AI 提取班级信息）"""
+        state = {'file_id': record['id'], 'file_name': file_name, 'title': record['original_name']}
+        return self._submit('student_list', f"student_list:{record['file_hash']}",
+                            state, [('model', _parse_student_list)], record['id'], 'student_list', user_id)
+
+    def submit_pasted(self, content, doc_type, user_id, ai_config):
+        """粘贴内容：AI 规整后存为新文档（按用户去重，结果归属提交者）"""
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        state = {'content': content, 'doc_type': doc_type, 'user_id': user_id, 'ai_config': ai_config}
+        return self._submit('pasted', f"pasted:{user_id}:{content_hash}:{doc_type}",
+                            state, [('model', _normalize_pasted), ('post', _save_pasted)], None, doc_type, user_id)
+
+    def get_job(self, job_id):
+        """任务状态；进行中但长时间无进展的（所在进程已退出）报告为中断"""
+        job = db.get_parse_job(job_id)
+        if job and job['status'] in ('queued', 'running') and \
+                job['updated_at'] < time.time() - Config.PARSE_JOB_STALE_SECONDS:
+            job['status'], job['message'] = 'failed', "解析任务已中断，请重新提交"
+        return job
+
+    def get_stats(self):
+        with self._lock:
+            pending = self._pending
+        return {'pending': pending, 'max_pending': Config.PARSE_MAX_PENDING,
+                'queued': {stage: executor._work_queue.qsize() for stage, executor in self._executors.items()}}
+
+    # ================= 内部实现 =================
+
+    def _submit(self, kind, dedupe_key, state, steps, file_id, doc_type, user_id):
+        """
+        :return: (job_id, 是否复用了进行中的任务)
+        :raises ParseQueueFull: 本进程未完成任务过多
+        """
+        with self._lock:
+            now = time.time()
+            existing = db.find_active_parse_job(dedupe_key, now - Config.PARSE_JOB_STALE_SECONDS)
+            if existing:
+                return existing, True
+            if self._pending >= Config.PARSE_MAX_PENDING:
+                raise ParseQueueFull("解析队列已满，请稍后再试")
+            job_id = uuid.uuid4().hex
+            db.create_parse_job(job_id, kind, dedupe_key, file_id, doc_type, user_id, now)
+            self._pending += 1
+
+        state['job_id'], state['user_id'] = job_id, user_id
+        if steps:
+            self._executors[steps[0][0]].submit(self._run_step, state, steps, 0)
+        else:
+            self._finish(state)
+        return job_id, False
+
+    def _run_step(self, state, steps, index):
+        stage, fn = steps[index]
+        try:
+            self._update(state, status='running', stage=stage, progress=STAGE_PROGRESS[stage])
+            fn(state)
+        except Exception as e:
+            traceback.print_exc()
+            state['error'] = f"解析失败: {e}"
+
+        if 'error' in state or index + 1 == len(steps):
+            self._finish(state)
+        else:
+            self._executors[steps[index + 1][0]].submit(self._run_step, state, steps, index + 1)
+
+    def _finish(self, state):
+        try:
+            if 'payload' in state:
+                self._update(state, status='success', progress=100, message="解析成功", result=state['payload'])
+            else:
+                self._update(state, status='failed', message=state.get('error') or "解析失败")
+        except Exception as e:
+            print(f"[ParsePipeline] failed to record result of job {state['job_id']}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @staticmethod
+    def _update(state, **fields):
+        update_job(state['job_id'], state.get('user_id'), **fields)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_parse_pipeline():
+    """进程级解析流水线"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ParsePipeline()
+    return _pipeline
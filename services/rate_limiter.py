@@ -0,0 +1,195 @@
+# services/rate_limiter.py
+"""
+AI 触发限流（令牌桶）
+每次判定同时检查「限流名:用户」桶与全局桶，两者都有令牌才放行并同时扣除。
+后端由 Config.RATE_LIMIT_BACKEND 选择：
+    memory - 进程内判定，变化的桶由后台线程定期快照到主库 rate_limit_buckets，启动时恢复
+    sqlite - 独立 SQLite 文件（Config.RATE_LIMIT_PATH），多 worker 进程共享同一组桶，
+             不占用主库写锁
+"""
+
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+from extensions import db
+
+GLOBAL_BUCKET = 'global:*'
+
+
+def _refill(state, capacity, rate, now):
+    """按经过时间补充令牌；不存在的桶视为满桶"""
+    if state is None:
+        return float(capacity)
+    tokens, updated_at = state
+    return min(float(capacity), tokens + max(0.0, now - updated_at) * rate)
+
+
+def _decide(levels, specs, cost):
+    """
+    :param levels: 各桶补充后的令牌数
+    :return: (是否放行, 需等待秒数)
+    """
+    wait = 0.0
+    for tokens, (_, _, rate) in zip(levels, specs):
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate if rate > 0 else math.inf)
+    return wait == 0.0, wait
+
+
+class MemoryBucketStore:
+    """进程内令牌桶"""
+
+    def __init__(self):
+        self._buckets = {}  # bucket -> (tokens, updated_at)
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def take(self, specs, cost, now):
+        """specs: [(bucket, capacity, rate), ...]，全部足够时才同时扣除"""
+        with self._lock:
+            levels = [_refill(self._buckets.get(bucket), capacity, rate, now) for bucket, capacity, rate in specs]
+            allowed, wait = _decide(levels, specs, cost)
+            if allowed:
+                for (bucket, _, _), tokens in zip(specs, levels):
+                    self._buckets[bucket] = (tokens - cost, now)
+                    self._dirty.add(bucket)
+            return allowed, wait
+
+    def load(self, rows):
+        with self._lock:
+            for bucket, tokens, updated_at in rows:
+                self._buckets.setdefault(bucket, (tokens, updated_at))
+
+    def drain_dirty(self):
+        """取出自上次快照以来变化过的桶"""
+        with self._lock:
+            rows = [(bucket,) + self._buckets[bucket] for bucket in self._dirty]
+            self._dirty.clear()
+            return rows
+
+
+class SQLiteBucketStore:
+    """基于独立 SQLite 文件的令牌桶，供多进程部署共享"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                bucket     TEXT PRIMARY KEY,
+                tokens     REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def _conn(self):
+        if not hasattr(self._local, 'connection'):
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+        return self._local.connection
+
+    def take(self, specs, cost, now):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ','.join('?' * len(specs))
+            states = {row[0]: (row[1], row[2]) for row in conn.execute(
+                f'SELECT bucket, tokens, updated_at FROM rate_limit_buckets WHERE bucket IN ({placeholders})',
+                [bucket for bucket, _, _ in specs])}
+            levels = [_refill(states.get(bucket), capacity, rate, now) for bucket, capacity, rate in specs]
+            allowed, wait = _decide(levels, specs, cost)
+            if allowed:
+                conn.executemany('''
+                    INSERT INTO rate_limit_buckets (bucket, tokens, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                ''', [(bucket, tokens - cost, now) for (bucket, _, _), tokens in zip(specs, levels)])
+            conn.execute('COMMIT')
+            return allowed, wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class RateLimiter:
+    """按 Config.AI_RATE_LIMITS 中的限流名判定"""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._stats = {'decisions': 0, 'denied': 0, 'total_ns': 0, 'max_ns': 0}
+
+    def acquire(self, name, user_id, cost=1):
+        """
+        尝试为用户消耗令牌
+        :return: (是否允许, 剩余冷却秒数)
+        """
+        capacity, rate = Config.AI_RATE_LIMITS[name]
+        specs = [(f'{name}:{user_id}', capacity, rate), (GLOBAL_BUCKET,) + tuple(Config.AI_GLOBAL_RATE_LIMIT)]
+
+        started = time.perf_counter_ns()
+        allowed, wait = self.store.take(specs, cost, time.time())
+        elapsed = time.perf_counter_ns() - started
+
+        with self._lock:
+            self._stats['decisions'] += 1
+            self._stats['denied'] += 0 if allowed else 1
+            self._stats['total_ns'] += elapsed
+            self._stats['max_ns'] = max(self._stats['max_ns'], elapsed)
+        return allowed, (0 if allowed else int(math.ceil(min(wait, 86400))))
+
+    def snapshot(self):
+        """把内存桶的变化写入主库（sqlite 后端本身即持久化，无需快照）"""
+        if isinstance(self.store, MemoryBucketStore):
+            db.save_rate_limit_buckets(self.store.drain_dirty())
+
+    def get_stats(self):
+        """判定次数、拒绝次数与判定耗时"""
+        with self._lock:
+            stats = dict(self._stats)
+        decisions = stats.pop('decisions')
+        total_ns, max_ns = stats.pop('total_ns'), stats.pop('max_ns')
+        return {
+            'backend': type(self.store).__name__,
+            'decisions': decisions,
+            'denied': stats['denied'],
+            'mean_us': round(total_ns / decisions / 1000, 2) if decisions else None,
+            'max_us': round(max_ns / 1000, 2),
+        }
+
+    def _run_snapshots(self):
+        while True:
+            time.sleep(Config.RATE_LIMIT_SNAPSHOT_INTERVAL)
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"[RateLimiter] snapshot failed: {e}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """进程级限流器；memory 后端启动时从主库恢复快照，并定期、退出时写回"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if Config.RATE_LIMIT_BACKEND == 'sqlite':
+                    limiter = RateLimiter(SQLiteBucketStore(Config.RATE_LIMIT_PATH))
+                else:
+                    store = MemoryBucketStore()
+                    store.load(db.load_rate_limit_buckets())
+                    limiter = RateLimiter(store)
+                    threading.Thread(target=limiter._run_snapshots, name='rate-limit-snapshot', daemon=True).start()
+                    atexit.register(limiter.snapshot)
+                _limiter = limiter
+    return _limiter
@@ -0,0 +1,217 @@
+# services/roster_service.py
+"""
+学生名单表格解析
+xlsx 以 openpyxl 只读模式逐行流式读取全部工作表；csv 只读一次文件，在内存中依次尝试编码解码。
+表头行与学号/姓名/性别等列用 pandas 向量化匹配：先在前几行中找表头关键词，
+没有表头时按各列内容符合学号、姓名格式的比例识别；有效行校验、去重也按列整体完成。
+班级元数据先从表头上方的标题行、工作表名和文件名中识别，班级名称与入学年份都识别到时不再调用 AI。
+"""
+
+import csv
+import io
+import os
+import re
+
+import pandas as pd
+
+from config import Config
+
+ROSTER_EXTS = ('.xlsx', '.xls', '.csv')
+CSV_ENCODINGS = ('utf-8-sig', 'gb18030', 'big5', 'latin1')
+
+# 表头关键词（去空白、小写后精确匹配）
+COLUMN_ALIASES = {
+    'student_id': ('学号', '学生学号', '学籍号', 'student_id', 'studentid', 'student', 'id', '编号', '号'),
+    'name': ('姓名', '学生姓名', 'name', '名字', 'student_name', 'studentname'),
+    'gender': ('性别', 'gender', '男女性别'),
+    'email': ('邮箱', '电子邮箱', 'email', '邮件', 'mail'),
+    'phone': ('电话', '手机', '手机号', '联系电话', '联系方式', 'phone', 'tel'),
+}
+OPTIONAL_FIELDS = ('gender', 'email', 'phone')
+
+STUDENT_ID_VALUE = r'[A-Za-z0-9][A-Za-z0-9\-_]*'  # 有效学号
+STUDENT_ID_LIKE = r'[A-Za-z]?\d{6,14}'  # 无表头时识别学号列
+CHINESE_NAME_LIKE = r'[一-龥·]{2,6}'  # 无表头时识别姓名列
+GENDER_VALUES = ('男', '女')
+
+DEFAULT_METADATA = {
+    "class_name": "",
+    "college": "",
+    "department": "",
+    "enrollment_year": "",
+    "education_type": "普本",
+}
+EDUCATION_TYPES = ('专升本', '专科', '高职', '普本')
+
+
+# ================= 读取 =================
+
+def _decode(raw):
+    for enc in CSV_ENCODINGS:
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("无法读取CSV文件，编码可能不支持")
+
+
+def load_sheets(path):
+    """[(工作表名, DataFrame)]；不区分表头，单元格保持原始值"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            return [(ws.title, pd.DataFrame.from_records(list(ws.iter_rows(values_only=True))))
+                    for ws in workbook.worksheets]
+        finally:
+            workbook.close()
+    if ext == '.xls':
+        return list(pd.read_excel(path, sheet_name=None, header=None, dtype=object, engine='xlrd').items())
+    with open(path, 'rb') as f:
+        text = _decode(f.read())
+    # csv 模块可处理标题行与数据行列数不一致的情况
+    return [('', pd.DataFrame.from_records(list(csv.reader(io.StringIO(text)))))]
+
+
+def _as_text(df):
+    """全部单元格转为去空白的字符串：空单元格为 ''，Excel 中以浮点数保存的整数学号去掉 '.0'"""
+    if df.empty:
+        return df
+    df = df.astype(object).where(df.notna(), '')
+    text = df.apply(lambda col: col.astype(str).str.strip())
+    text = text.replace(r'^(-?\d+)\.0$', r'\1', regex=True)
+    return text.loc[(text != '').any(axis=1)].reset_index(drop=True)
+
+
+# ================= 识别 =================
+
+def _ratio(matches, text):
+    """各列中匹配的单元格占非空单元格的比例"""
+    return matches.sum() / (text != '').sum().clip(lower=1)
+
+
+def detect_columns(text):
+    """
+    识别表头行与各字段所在列
+    :return: (表头行位置，无表头为 None; {字段: 列位置}; 是否可信)
+    """
+    head = text.iloc[:Config.ROSTER_HEADER_SCAN_ROWS]
+    lowered = head.apply(lambda col: col.str.lower().str.replace(r'\s+', '', regex=True))
+    matches = {field: lowered.isin(aliases) for field, aliases in COLUMN_ALIASES.items()}
+    is_header = matches['student_id'].any(axis=1) & matches['name'].any(axis=1)
+    if is_header.any():
+        row = int(is_header.values.argmax())
+        columns = {field: int(m.iloc[row].values.argmax()) for field, m in matches.items() if m.iloc[row].any()}
+        return row, columns, True
+
+    # 无表头：按列内容格式识别
+    sample = text.iloc[:Config.ROSTER_SAMPLE_ROWS]
+    min_ratio = Config.ROSTER_DETECT_MIN_RATIO
+    sid_ratio = _ratio(sample.apply(lambda col: col.str.fullmatch(STUDENT_ID_LIKE)), sample)
+    name_ratio = _ratio(sample.apply(lambda col: col.str.fullmatch(CHINESE_NAME_LIKE)), sample)
+    sid_col = sid_ratio.idxmax()
+    name_ratio = name_ratio.drop(sid_col)
+    if sid_ratio[sid_col] >= min_ratio and not name_ratio.empty and name_ratio.max() >= min_ratio:
+        columns = {'student_id': int(sid_col), 'name': int(name_ratio.idxmax())}
+        gender_ratio = _ratio(sample.isin(GENDER_VALUES), sample).drop(list(columns.values()))
+        if not gender_ratio.empty and gender_ratio.max() >= min_ratio:
+            columns['gender'] = int(gender_ratio.idxmax())
+        return None, columns, True
+
+    # 兜底：前两列视为学号、姓名（靠有效行校验过滤标题等非数据行）
+    if text.shape[1] >= 2:
+        return None, {'student_id': 0, 'name': 1}, False
+    return None, {}, False
+
+
+def _valid_rows(frame):
+    """有效学生行：学号为字母数字、姓名非空，且不是重复出现的表头"""
+    sid, name = frame['student_id'], frame['name']
+    return (sid.str.fullmatch(STUDENT_ID_VALUE)
+            & (name != '')
+            & ~sid.str.lower().isin(COLUMN_ALIASES['student_id'])
+            & ~name.str.lower().isin(COLUMN_ALIASES['name']))
+
+
+def extract_sheet(text):
+    """
+    从一个工作表中提取学生
+    :return: (学生 DataFrame，列为识别到的字段; 第一条学生记录之前的标题文本; 是否可信)；识别失败返回 None
+    """
+    if text.empty:
+        return None
+    header_row, columns, confident = detect_columns(text)
+    if 'student_id' not in columns or 'name' not in columns:
+        return None
+    start = header_row + 1 if header_row is not None else 0
+    data = text.iloc[start:]
+    frame = pd.DataFrame({field: data.iloc[:, pos] for field, pos in columns.items()})
+    valid = _valid_rows(frame)
+    if not valid.any():
+        return None
+
+    first = int(valid.values.argmax()) + start
+    title_rows = text.iloc[:header_row if header_row is not None else first]
+    title = ' '.join(cell for cell in title_rows.values.ravel() if cell)
+    return frame[valid], title, confident
+
+
+def detect_metadata(source):
+    """从标题文本中识别班级元数据，只返回识别到的字段"""
+    source = re.sub(r'学生名单|花名册|名单', ' ', source)
+    meta = {}
+    match = re.search(r'((?:20\d{2}级)?[一-龥A-Za-z0-9（）()]+?[0-9一二三四五六七八九十]+班)', source)
+    if match:
+        meta['class_name'] = match.group(1)
+    match = re.search(r'(20\d{2})\s*级', source) or re.search(r'(?<!\d)(20\d{2})(?!\d)', source)
+    if match:
+        meta['enrollment_year'] = match.group(1)
+    match = re.search(r'([一-龥]{2,20}?学院)', source)
+    if match:
+        meta['college'] = match.group(1)
+    for education_type in EDUCATION_TYPES:
+        if education_type in source:
+            meta['education_type'] = education_type
+            break
+    return meta
+
+
+# ================= 入口 =================
+
+def parse_roster(path, file_name=''):
+    """
+    解析名单表格的全部工作表
+    :return: {'students': [...], 'has_gender': bool, 'metadata': 本地识别到的元数据,
+              'confident': 列与元数据是否均可信（可信时无需 AI）, 'sample': 供 AI 分析的前几行}
+    """
+    frames, titles, sample, columns_confident = [], [], None, True
+    for sheet_name, raw in load_sheets(path):
+        text = _as_text(raw)
+        result = extract_sheet(text)
+        if result is None:
+            continue
+        frame, title, confident = result
+        frames.append(frame)
+        titles.extend(t for t in (title, sheet_name) if t)
+        columns_confident = columns_confident and confident
+        if sample is None:
+            sample = text.head(Config.ROSTER_AI_SAMPLE_ROWS)
+            sample.columns = [f"列{i + 1}" for i in range(sample.shape[1])]
+
+    if not frames:
+        return {'students': [], 'has_gender': False, 'metadata': {}, 'confident': False, 'sample': None}
+
+    students = pd.concat(frames, ignore_index=True).drop_duplicates('student_id', keep='first')
+    has_gender = 'gender' in students and bool((students['gender'].fillna('') != '').any())
+    records = students.to_dict('records')
+    if any(field in students for field in OPTIONAL_FIELDS):
+        # 可选字段为空时不出现在记录中
+        records = [{k: v for k, v in r.items() if k in ('student_id', 'name') or (isinstance(v, str) and v)}
+                   for r in records]
+
+    metadata = detect_metadata(' '.join(titles + [os.path.splitext(file_name)[0]]))
+    confident = columns_confident and bool(metadata.get('class_name') and metadata.get('enrollment_year'))
+    return {'students': records, 'has_gender': has_gender, 'metadata': metadata,
+            'confident': confident, 'sample': sample}
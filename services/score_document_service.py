@@ -6,9 +6,11 @@ import hashlib
 import json
 import logging
 import re
+from contextlib import closing
 from datetime import datetime
 
 from extensions import db
+from services.class_analytics_service import ClassAnalyticsService
 from utils.academic_year import infer_academic_year_semester
 
 
@@ -107,9 +109,10 @@ class ScoreDocumentService:
         """
         try:
             # 1. 验证：至少有一个学生有成绩
-            students = db.get_students_with_grades(class_id)
-            graded = [s for s in students if s.get('total_score') is not None]
-            if not graded:
+            # any() 提前结束时显式关闭迭代器，立即归还只读连接
+            with closing(db.iter_students_with_grades(class_id, ('total_score',), as_tuple=True)) as scores:
+                has_grades = any(total is not None for (total,) in scores)
+            if not has_grades:
                 logging.info(f"[ScoreDoc] Class {class_id}: No graded students, skipping")
                 return None
 
@@ -211,33 +214,34 @@ class ScoreDocumentService:
         metadata['academic_year_semester'] = academic_year_semester
         # === END 元数据追溯逻辑 ===
 
-        # 统计信息
-        students = db.get_students_with_grades(class_id)
-        graded = [s for s in students if s.get('total_score') is not None]
-        passed = [s for s in graded if s.get('status') == 'PASS' or (s.get('total_score') or 0) >= 60]
-
-        metadata['student_count'] = len(students)
-        metadata['graded_count'] = len(graded)
-        if graded:
-            total = sum(s.get('total_score', 0) or 0 for s in graded)
-            metadata['average_score'] = round(total / len(graded), 2)
-            metadata['pass_rate'] = round(len(passed) / len(graded), 2)
+        # 统计信息（流式累加，只读取总分和状态两列）
+        student_count = graded_count = passed_count = 0
+        total = 0
+        for score, status in db.iter_students_with_grades(class_id, ('total_score', 'status'), as_tuple=True):
+            student_count += 1
+            if score is None:
+                continue
+            graded_count += 1
+            total += score
+            if status == 'PASS' or score >= 60:
+                passed_count += 1
+
+        metadata['student_count'] = student_count
+        metadata['graded_count'] = graded_count
+        if graded_count:
+            metadata['average_score'] = round(total / graded_count, 2)
+            metadata['pass_rate'] = round(passed_count / graded_count, 2)
         else:
             metadata['average_score'] = 0
             metadata['pass_rate'] = 0
 
         # === 大题分数元数据 (T005) ===
-        # 从第一个有 score_details 的学生获取大题信息
-        question_scores = []
-        for s in graded:
-            if s.get('score_details'):
-                try:
-                    details = json.loads(s['score_details'])
-                    if isinstance(details, list):
-                        _, question_scores = aggregate_main_questions(details)
-                        break
-                except (json.JSONDecodeError, TypeError):
-                    pass
+        # 大题列表来自 grade_items 聚合；满分优先取批改核心声明的 max_score，否则取班级实际最高分
+        question_scores = [
+            {'name': c['item_name'], 'max_score': c['max_score'] if c['max_score'] is not None else (c['top_score'] or 0)}
+            for c in db.get_grade_item_columns(class_id)
+            if is_main_question(c['item_name'])
+        ]
 
         metadata['question_scores'] = question_scores
         metadata['total_max_score'] = sum(q.get('max_score', 0) for q in question_scores) if question_scores else 0
@@ -257,9 +261,7 @@ class ScoreDocumentService:
         Returns:
             str: Markdown 内容
         """
-        students = db.get_students_with_grades(class_id)
-        if not students:
-            raise ValueError(f"No students found for class {class_id}")
+        item_columns, students = db.iter_class_score_matrix(class_id)
 
         # 构建文档头部
         lines = [
@@ -284,27 +286,16 @@ class ScoreDocumentService:
             "",
         ])
 
-        # 获取分项成绩列名（从第一个有成绩的学生获取）- 仅保留大题 (T006)
-        score_columns = []
-        for s in students:
-            if s.get('score_details'):
-                try:
-                    details = json.loads(s['score_details'])
-                    if isinstance(details, list):
-                        # 仅保留大题列名
-                        score_columns = [
-                            d.get('name', f'题{i+1}')
-                            for i, d in enumerate(details)
-                            if is_main_question(d.get('name', ''))
-                        ]
-                        break
-                except:
-                    pass
+        # 分项成绩列名 - 仅保留大题 (T006)，记录其在透视结果中的下标
+        score_columns = [
+            (col_idx, c['item_name']) for col_idx, c in enumerate(item_columns)
+            if is_main_question(c['item_name'])
+        ]
 
         # 构建表头
         header = "| 序号 | 学号 | 姓名 | 性别 |"
         separator = "|------|------|------|------|"
-        for col in score_columns:
+        for _, col in score_columns:
             header += f" {col} |"
             separator += "------|"
         header += " 总分 | 状态 |"
@@ -313,26 +304,14 @@ class ScoreDocumentService:
         lines.append(header)
         lines.append(separator)
 
-        # 填充数据行
+        # 填充数据行（透视结果逐行流式读取）
+        has_students = False
         for idx, s in enumerate(students):
+            has_students = True
             student_id = s.get('student_id', '')
             name = s.get('name', '')
             gender = s.get('gender', '') or '-'
 
-            # 解析分项成绩 - 仅保留大题 (T006)
-            scores = {}
-            if s.get('score_details'):
-                try:
-                    details = json.loads(s['score_details'])
-                    if isinstance(details, list):
-                        for i, d in enumerate(details):
-                            col_name = d.get('name', f'题{i+1}')
-                            # 仅保留大题分数
-                            if is_main_question(col_name):
-                                scores[col_name] = d.get('score', '-')
-                except:
-                    pass
-
             total = s.get('total_score')
             total_str = str(int(total)) if total is not None else '-'
 
@@ -347,14 +326,47 @@ class ScoreDocumentService:
                 status_str = '未批改'
 
             row = f"| {idx + 1} | {student_id} | {name} | {gender} |"
-            for col in score_columns:
-                row += f" {scores.get(col, '-')} |"
+            for col_idx, _ in score_columns:
+                score = s['items'][col_idx]
+                row += f" {score if score is not None else '-'} |"
             row += f" {total_str} | {status_str} |"
 
             lines.append(row)
 
+        if not has_students:
+            raise ValueError(f"No students found for class {class_id}")
+
+        lines.extend(ScoreDocumentService._build_analytics_section(class_id))
+
         return "\n".join(lines)
 
+    @staticmethod
+    def _build_analytics_section(class_id):
+        """题目分析表（来自 ClassAnalyticsService，按成绩版本号缓存）"""
+        analytics = ClassAnalyticsService.get_class_analytics(class_id)
+        if not analytics['items']:
+            return []
+
+        def fmt(value, percent=False):
+            if value is None:
+                return '-'
+            return f"{value * 100:.1f}%" if percent else f"{value:g}"
+
+        lines = [
+            "",
+            "## 题目分析",
+            "",
+            "| 题目 | 满分 | 平均分 | 中位数 | 标准差 | 及格率 | 难度 | 区分度 |",
+            "|------|------|------|------|------|------|------|------|",
+        ]
+        for item in analytics['items'] + [dict(analytics['total'], item_name='总分')]:
+            lines.append(
+                f"| {item['item_name']} | {fmt(item['max_score'])} | {fmt(item['mean'])} | {fmt(item['median'])} "
+                f"| {fmt(item['std'])} | {fmt(item['pass_rate'], True)} | {fmt(item['difficulty'])} "
+                f"| {fmt(item['discrimination'])} |"
+            )
+        return lines
+
     @staticmethod
     def _generate_filename(metadata):
         """
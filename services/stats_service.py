@@ -2,14 +2,16 @@
 """
 统计数据服务
 负责聚合仪表盘所需的统计数据，包括班级数、学生数、批改核心数、待处理任务数等
-支持会话级缓存以提高性能
+缓存放在进程级共享缓存中（按用户分键），由领域事件主动失效，TTL 仅作兜底
 """
 
-import os
-from datetime import datetime, timedelta
-from database import Database
+import functools
+from datetime import datetime
+
+from extensions import db
 from grading_core.factory import GraderFactory
-from config import Config
+from utils import events
+from utils.shared_cache import get_shared_cache
 
 
 class StatsService:
@@ -18,41 +20,47 @@ class StatsService:
     # 缓存键前缀
     CACHE_KEY_STATS = 'dashboard_stats'
     CACHE_KEY_ACTIVITIES = 'recent_activities'
-    CACHE_TTL_SECONDS = 300  # 5分钟缓存
+    CACHE_TTL_SECONDS = 300  # 5分钟兜底过期，正常情况下由事件失效
 
-    def __init__(self, session):
+    def __init__(self, session=None):
         """
         初始化统计服务
-        :param session: Flask session 对象，用于缓存
+        :param session: Flask session 对象（可选）。仅用于清理旧版本写入 Cookie 的缓存，缩小 Cookie 体积
         """
-        self.session = session
-        self.db = Database()
-
-    def _get_cache(self, key):
-        """从会话中获取缓存数据"""
-        cache_entry = self.session.get(key)
-        if cache_entry:
-            timestamp = cache_entry.get('timestamp')
-            if timestamp:
-                cached_time = datetime.fromisoformat(timestamp)
-                if datetime.now() - cached_time < timedelta(seconds=self.CACHE_TTL_SECONDS):
-                    return cache_entry.get('data')
-        return None
-
-    def _set_cache(self, key, data):
-        """将数据存入会话缓存"""
-        self.session[key] = {
-            'data': data,
-            'timestamp': datetime.now().isoformat()
-        }
-
-    def _clear_cache(self, key=None):
-        """清除缓存"""
-        if key:
-            self.session.pop(key, None)
+        self.db = db
+        self.cache = get_shared_cache()
+        if session is not None:
+            for key in (self.CACHE_KEY_STATS, self.CACHE_KEY_ACTIVITIES):
+                session.pop(key, None)
+
+    @staticmethod
+    def _cache_key(user_id, key):
+        return f'stats:{user_id}:{key}'
+
+    def _get_cache(self, user_id, key):
+        """从共享缓存中获取数据"""
+        return self.cache.get(self._cache_key(user_id, key))
+
+    def _set_cache(self, user_id, key, data):
+        """将数据存入共享缓存"""
+        self.cache.set(self._cache_key(user_id, key), data, self.CACHE_TTL_SECONDS)
+
+    def _clear_cache(self, user_id):
+        """清除指定用户的缓存"""
+        StatsService.invalidate(user_id)
+
+    @staticmethod
+    def invalidate(user_id=None):
+        """
+        使统计缓存失效
+        :param user_id: 用户ID；为 None 时清除所有用户（如全局的批改核心数变化）
+        """
+        cache = get_shared_cache()
+        if user_id is None:
+            cache.delete_prefix('stats:')
         else:
-            self.session.pop(self.CACHE_KEY_STATS, None)
-            self.session.pop(self.CACHE_KEY_ACTIVITIES, None)
+            cache.delete(StatsService._cache_key(user_id, StatsService.CACHE_KEY_STATS),
+                         StatsService._cache_key(user_id, StatsService.CACHE_KEY_ACTIVITIES))
 
     def get_dashboard_stats(self, user_id):
         """
@@ -66,44 +74,26 @@ class StatsService:
         }
         """
         # 尝试从缓存获取
-        cached = self._get_cache(self.CACHE_KEY_STATS)
+        cached = self._get_cache(user_id, self.CACHE_KEY_STATS)
         if cached:
             return cached
 
-        # 查询班级数量
-        classes = self.db.get_classes(user_id)
-        class_count = len(classes)
-
-        # 查询学生总数（去重）
-        conn = self.db.get_connection()
-        student_count_row = conn.execute('''
-            SELECT COUNT(DISTINCT s.student_id) as count
-            FROM students s
-            JOIN classes c ON s.class_id = c.id
-            WHERE c.created_by = ?
-        ''', (user_id,)).fetchone()
-        student_count = student_count_row['count'] if student_count_row else 0
-
-        # 查询批改核心数量
-        grader_count = len(GraderFactory.get_all_strategies())
-
-        # 查询待处理任务数
-        pending_tasks_row = conn.execute('''
-            SELECT COUNT(*) as count
-            FROM ai_tasks
-            WHERE created_by = ? AND status IN ('pending', 'processing')
-        ''', (user_id,)).fetchone()
-        pending_task_count = pending_tasks_row['count'] if pending_tasks_row else 0
+        # 班级数、去重学生数、待处理任务数来自物化计数器（一次索引查询）
+        counters = self.db.get_user_counters(user_id)
+
+        # 批改核心数量直接读核心目录表（目录为空时先按磁盘回填）
+        GraderFactory.ensure_catalog()
+        grader_count = self.db.count_grader_catalog()
 
         stats = {
-            'class_count': class_count,
-            'student_count': student_count,
+            'class_count': counters['classes'],
+            'student_count': counters['students'],
             'grader_count': grader_count,
-            'pending_task_count': pending_task_count
+            'pending_task_count': counters['pending_tasks']
         }
 
         # 存入缓存
-        self._set_cache(self.CACHE_KEY_STATS, stats)
+        self._set_cache(user_id, self.CACHE_KEY_STATS, stats)
 
         return stats
 
@@ -118,20 +108,28 @@ class StatsService:
         }
         """
         # 尝试从缓存获取
-        cached = self._get_cache(self.CACHE_KEY_ACTIVITIES)
+        cached = self._get_cache(user_id, self.CACHE_KEY_ACTIVITIES)
         if cached:
             return cached
 
-        conn = self.db.get_connection()
-
-        # 获取最近创建的班级（使用 id 作为时间代理，因为 classes 表没有 created_at）
-        recent_classes_rows = conn.execute('''
-            SELECT id, name, course
-            FROM classes
-            WHERE created_by = ?
-            ORDER BY id DESC
-            LIMIT ?
-        ''', (user_id, limit)).fetchall()
+        with self.db.read_connection() as conn:
+            # 获取最近创建的班级（使用 id 作为时间代理，因为 classes 表没有 created_at）
+            recent_classes_rows = conn.execute('''
+                SELECT id, name, course
+                FROM classes
+                WHERE created_by = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
+
+            # 获取最近生成的批改核心（从 ai_tasks 表）
+            recent_graders_rows = conn.execute('''
+                SELECT id, name, grader_id, created_at
+                FROM ai_tasks
+                WHERE created_by = ? AND grader_id IS NOT NULL
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
 
         recent_classes = []
         for row in recent_classes_rows:
@@ -144,15 +142,6 @@ class StatsService:
                 'created_at_relative': '最近'
             })
 
-        # 获取最近生成的批改核心（从 ai_tasks 表）
-        recent_graders_rows = conn.execute('''
-            SELECT id, name, grader_id, created_at
-            FROM ai_tasks
-            WHERE created_by = ? AND grader_id IS NOT NULL
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (user_id, limit)).fetchall()
-
         recent_graders = []
         for row in recent_graders_rows:
             created_at = None
@@ -178,7 +167,7 @@ class StatsService:
         }
 
         # 存入缓存
-        self._set_cache(self.CACHE_KEY_ACTIVITIES, activities)
+        self._set_cache(user_id, self.CACHE_KEY_ACTIVITIES, activities)
 
         return activities
 
@@ -217,7 +206,7 @@ class StatsService:
         :param user_id: 用户ID
         :return: dict 包含最新的统计数据和活动
         """
-        self._clear_cache()
+        self._clear_cache(user_id)
 
         stats = self.get_dashboard_stats(user_id)
         activities = self.get_recent_activities(user_id)
@@ -240,3 +229,35 @@ class StatsService:
             **stats,
             **activities
         }
+
+
+# ================= 领域事件 -> 缓存失效 =================
+
+@functools.lru_cache(maxsize=1024)
+def _class_owner(class_id):
+    # 班级归属不会变化，批量批改时避免每条成绩都查一次
+    cls = db.get_class_by_id(class_id)
+    return cls['created_by'] if cls else None
+
+
+@events.subscribe(events.CLASS_CREATED)
+@events.subscribe(events.CLASS_DELETED)
+@events.subscribe(events.TASK_CREATED)
+@events.subscribe(events.FILE_UPLOADED)
+def _invalidate_user_stats(user_id=None, **_):
+    if user_id is not None:
+        StatsService.invalidate(user_id)
+
+
+@events.subscribe(events.GRADE_SAVED)
+def _invalidate_class_owner_stats(class_id, **_):
+    owner = _class_owner(class_id)
+    if owner is not None:
+        StatsService.invalidate(owner)
+
+
+@events.subscribe(events.TASK_FINISHED)
+@events.subscribe(events.GRADER_CATALOG_CHANGED)
+def _invalidate_all_stats(**_):
+    # 批改核心数来自 grader_catalog：目录写入提交后再失效，避免并发读取把旧计数写回缓存
+    StatsService.invalidate()
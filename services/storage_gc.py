@@ -0,0 +1,355 @@
+# services/storage_gc.py
+"""
+存储回收与磁盘用量统计
+以数据库为准判断文件是否可达，回收以下不可达或过期的文件：
+- file_repo：file_assets 未引用的仓库文件（含旧版放在原文件旁的转换 PDF）、源文件已无记录的转换缓存、
+  中断上传遗留的临时文件
+- workspaces：已删除班级的整个工作区；extracted/ 下已不在班级名单中的学生目录；
+  闲置超过 GC_EXTRACTED_TTL 且 raw_zips 中仍有原始提交的解压目录（查看详情时按需重新解压）
+- uploads/export_*：导出的成绩表、文档只用于一次下载，超过 GC_EXPORT_TTL 删除
+- signatures：signatures 表中已无记录的签名图片
+- workspaces/.blobs：解压去重存储中已没有学生文件链接的内容（硬链接数为 1）
+班级工作区超过 GC_CLASS_QUOTA_BYTES、或教师名下各班工作区合计超过 GC_USER_QUOTA_BYTES 时，
+按闲置时间从旧到新回收闲置至少 GC_QUOTA_MIN_IDLE、可重新解压的解压目录；extracted/ 目录在 GC_QUOTA_MIN_IDLE 内有变化
+（批改每个学生时都会在其中新建临时解压目录，任何进程中的批改都会更新它）或本进程正在批改的班级整体跳过；
+原始提交和文档库文件不会因配额被删除，仍超额的列在 over_quota 中。
+
+目录用 os.scandir 逐层遍历（不一次性列出整棵目录树），仓库文件每 GC_BATCH_SIZE 个一批按哈希查询引用，
+文件数再多也只占用一批的内存。孤立文件至少闲置 MAINTENANCE_ORPHAN_GRACE 才回收，避免误删写入中的文件。
+dry_run=True 时只统计，报告中的 reclaimed 为将要回收的量。
+"""
+
+import os
+import shutil
+import time
+
+from config import Config
+from extensions import db
+from services.grading_service import GradingService
+from utils.file_store import CONVERTED_DIR_NAME, HASH_NAME, TMP_DIR_NAME, converted_path, repo_path
+
+EXPORT_PREFIX = 'export_'
+
+
+# ================= 遍历 =================
+
+def scan_files(root, skip=()):
+    """
+    逐层遍历 root 下的全部文件，产出 (DirEntry, stat)；不跟随符号链接，遍历中消失的目录和文件直接跳过
+    :param skip: 不进入的目录（完整路径）
+    """
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in skip:
+                            stack.append(entry.path)
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                yield entry, stat
+
+
+def tree_usage(root, exclusive=False):
+    """
+    目录下的 (文件数, 字节数)
+    :param exclusive: 只计硬链接数为 1 的文件（链接到去重存储的文件占用计入 extract_blobs）
+    """
+    files = size = 0
+    for _, stat in scan_files(root):
+        files += 1
+        if not exclusive or stat.st_nlink <= 1:
+            size += stat.st_size
+    return files, size
+
+
+def _unchanged_since(path, mtime):
+    try:
+        return os.stat(path, follow_symlinks=False).st_mtime == mtime
+    except OSError:
+        return False
+
+
+def _idle_since(path, cutoff):
+    """目录自 cutoff 以来没有新建/删除/改名条目（批改、恢复解压都会在 extracted/ 下新建临时目录再改名）"""
+    try:
+        return os.stat(path, follow_symlinks=False).st_mtime < cutoff
+    except OSError:
+        return False
+
+
+def _add(counters, key, files, size):
+    item = counters.setdefault(key, {'files': 0, 'bytes': 0})
+    item['files'] += files
+    item['bytes'] += size
+
+
+class _Collector:
+    """一次回收：统计保留下来的用量与回收量（dry_run 时只统计）"""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.now = time.time()
+        self.orphan_cutoff = self.now - Config.MAINTENANCE_ORPHAN_GRACE
+        self.usage = {}  # 存储类别 -> 保留的用量
+        self.reclaimed = {}  # 回收原因 -> 回收量
+        self.classes = {}  # 班级ID -> 工作区保留的用量
+        self.errors = 0
+
+    def keep(self, category, files, size, class_id=None):
+        _add(self.usage, category, files, size)
+        if class_id is not None:
+            _add(self.classes, class_id, files, size)
+
+    def remove(self, reason, path, files, size, is_dir=False):
+        """删除文件或目录并计入回收量；删除失败时返回 False"""
+        if not self.dry_run:
+            try:
+                if is_dir:
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.errors += 1
+                print(f"[StorageGC] remove {path} failed: {e}")
+                return False
+        _add(self.reclaimed, reason, files, size)
+        return True
+
+    # ---- 文件仓库 ----
+
+    def sweep_repo(self):
+        root = Config.FILE_REPO_FOLDER
+        tmp_root, converted_root = os.path.join(root, TMP_DIR_NAME), os.path.join(root, CONVERTED_DIR_NAME)
+
+        for entry, stat in scan_files(tmp_root):
+            if stat.st_mtime < self.orphan_cutoff:
+                self.remove('tmp', entry.path, 1, stat.st_size)
+            else:
+                self.keep('tmp', 1, stat.st_size)
+
+        for category, files in (('converted', scan_files(converted_root)),
+                                ('repo', scan_files(root, skip={tmp_root, converted_root}))):
+            batch = []
+            for entry, stat in files:
+                stem = os.path.splitext(entry.name)[0]
+                if stat.st_mtime >= self.orphan_cutoff:
+                    self.keep(category, 1, stat.st_size)
+                elif not HASH_NAME.fullmatch(stem):
+                    self.remove(f'{category}_orphans', entry.path, 1, stat.st_size)
+                else:
+                    batch.append((stem, entry, stat))
+                    if len(batch) >= Config.GC_BATCH_SIZE:
+                        self._check_repo_batch(category, batch)
+                        batch = []
+            self._check_repo_batch(category, batch)
+
+    def _check_repo_batch(self, category, batch):
+        """仓库文件须是 file_assets 记录的文件名且位于其分片路径；转换缓存须对应仍有记录的源文件"""
+        if not batch:
+            return
+        referenced = db.get_referenced_repo_names({stem for stem, _, _ in batch})
+        for stem, entry, stat in batch:
+            ext = os.path.splitext(entry.name)[1]
+            if category == 'repo':
+                reachable = (referenced.get(stem) == entry.name
+                             and os.path.normcase(entry.path) == os.path.normcase(repo_path(stem, ext)))
+            else:
+                reachable = (stem in referenced
+                             and os.path.normcase(entry.path) == os.path.normcase(converted_path(stem, ext)))
+            if reachable:
+                self.keep(category, 1, stat.st_size)
+            else:
+                self.remove(f'{category}_orphans', entry.path, 1, stat.st_size)
+        if Config.GC_BATCH_PAUSE:
+            time.sleep(Config.GC_BATCH_PAUSE)
+
+    # ---- 班级工作区 ----
+
+    def sweep_workspaces(self, class_ids):
+        """
+        :return: 配额回收候选 [(闲置起始时间, 班级ID, 路径, 文件数, 字节数)]，即未过期、可重新解压的解压目录
+                 （闲置不足 GC_QUOTA_MIN_IDLE 的目录、及近期有解压活动的班级不列入）
+        """
+        candidates = []
+        if not os.path.isdir(Config.WORKSPACE_FOLDER):
+            return candidates
+        with os.scandir(Config.WORKSPACE_FOLDER) as it:
+            workspaces = [entry for entry in it if entry.is_dir(follow_symlinks=False)]
+
+        for entry in workspaces:
+            if os.path.normcase(entry.path) == os.path.normcase(Config.EXTRACT_STORE_FOLDER):
+                continue
+            class_id = int(entry.name) if entry.name.isdigit() else None
+            if class_id not in class_ids:
+                files, size = tree_usage(entry.path)
+                # 只回收以班级ID命名的工作区，其他目录仅计入用量
+                if class_id is not None and entry.stat().st_mtime < self.orphan_cutoff:
+                    self.remove('deleted_class_workspaces', entry.path, files, size, is_dir=True)
+                else:
+                    self.keep('workspaces_other', files, size)
+                continue
+            candidates.extend(self._sweep_class(class_id, entry.path))
+        return candidates
+
+    def _sweep_class(self, class_id, ws_path):
+        raw_dir, extract_base = os.path.join(ws_path, 'raw_zips'), os.path.join(ws_path, 'extracted')
+
+        submissions = []
+        for entry, stat in scan_files(raw_dir):
+            submissions.append(entry.name)
+            self.keep('submissions', 1, stat.st_size, class_id)
+        for _, stat in scan_files(ws_path, skip={raw_dir, extract_base}):
+            self.keep('workspaces_other', 1, stat.st_size, class_id)
+        if not os.path.isdir(extract_base):
+            return []
+
+        names = dict(db.iter_students_with_grades(class_id, ('student_id', 'name'), as_tuple=True))
+        stale_cutoff = self.now - Config.GC_EXTRACTED_TTL
+        quota_cutoff = self.now - Config.GC_QUOTA_MIN_IDLE
+        class_idle = _idle_since(extract_base, quota_cutoff)
+        candidates = []
+        with os.scandir(extract_base) as it:
+            trees = list(it)
+        for entry in trees:
+            if not entry.is_dir(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                self.keep('workspaces_other', 1, stat.st_size, class_id)
+                continue
+            # 目录自身的修改时间即最近一次解压时间（解压出的文件保留压缩包内的原始时间）
+            extracted_at = entry.stat(follow_symlinks=False).st_mtime
+            files, size = tree_usage(entry.path, exclusive=True)
+            if entry.name not in names:
+                if extracted_at < self.orphan_cutoff:
+                    self.remove('extracted_orphans', entry.path, files, size, is_dir=True)
+                    continue
+            elif GradingService.match_submission(submissions, entry.name, names[entry.name]):
+                if extracted_at < stale_cutoff and self.remove('extracted_stale', entry.path, files, size, is_dir=True):
+                    continue
+                if class_idle and extracted_at < quota_cutoff:
+                    candidates.append((extracted_at, class_id, entry.path, files, size))
+            self.keep('extracted', files, size, class_id)
+        return candidates
+
+    def enforce_quotas(self, candidates, owners):
+        """
+        超出班级或教师配额时，按闲置时间从旧到新回收可重新解压的解压目录
+        删除前重新检查：班级正在批改（本进程）、extracted/ 在扫描后有新的解压活动（任意进程）、
+        或目录在扫描后被重新解压（修改时间变化）的跳过
+        """
+        class_quota, user_quota = Config.GC_CLASS_QUOTA_BYTES, Config.GC_USER_QUOTA_BYTES
+        class_bytes = {class_id: item['bytes'] for class_id, item in self.classes.items()}
+        user_bytes = {}
+        for class_id, size in class_bytes.items():
+            user_bytes[owners[class_id]] = user_bytes.get(owners[class_id], 0) + size
+
+        if class_quota or user_quota:
+            for extracted_at, class_id, path, files, size in sorted(candidates):
+                owner = owners[class_id]
+                if not ((class_quota and class_bytes[class_id] > class_quota)
+                        or (user_quota and user_bytes[owner] > user_quota)):
+                    continue
+                if (GradingService.is_grading(class_id)
+                        or not _idle_since(os.path.dirname(path), self.now - Config.GC_QUOTA_MIN_IDLE)
+                        or not _unchanged_since(path, extracted_at)):
+                    continue
+                if self.remove('extracted_quota', path, files, size, is_dir=True):
+                    class_bytes[class_id] -= size
+                    user_bytes[owner] -= size
+                    _add(self.usage, 'extracted', -files, -size)
+                    _add(self.classes, class_id, -files, -size)
+
+        return {
+            'classes': sorted(c for c, size in class_bytes.items() if class_quota and size > class_quota),
+            'users': sorted(u for u, size in user_bytes.items() if user_quota and size > user_quota),
+        }
+
+    def sweep_extract_blobs(self):
+        """去重存储中只剩自身一个链接的内容已无学生文件引用；闲置时间按 ctime（建立/删除链接时更新）判断"""
+        for entry, stat in scan_files(Config.EXTRACT_STORE_FOLDER):
+            if stat.st_nlink <= 1 and stat.st_ctime < self.orphan_cutoff:
+                self.remove('extract_blob_orphans', entry.path, 1, stat.st_size)
+            else:
+                self.keep('extract_blobs', 1, stat.st_size)
+
+    # ---- 导出文件与签名 ----
+
+    def sweep_exports(self):
+        if not os.path.isdir(Config.UPLOAD_FOLDER):
+            return
+        export_cutoff = self.now - Config.GC_EXPORT_TTL
+        with os.scandir(Config.UPLOAD_FOLDER) as it:
+            for entry in it:
+                if not entry.name.startswith(EXPORT_PREFIX) or not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime < export_cutoff:
+                    self.remove('exports', entry.path, 1, stat.st_size)
+                else:
+                    self.keep('exports', 1, stat.st_size)
+
+    def sweep_signatures(self):
+        hashes = db.get_signature_hashes()
+        for entry, stat in scan_files(Config.SIGNATURES_FOLDER):
+            if os.path.splitext(entry.name)[0] not in hashes and stat.st_mtime < self.orphan_cutoff:
+                self.remove('signature_orphans', entry.path, 1, stat.st_size)
+            else:
+                self.keep('signatures', 1, stat.st_size)
+
+
+# ================= 入口 =================
+
+def collect(dry_run=False, detail=True):
+    """
+    执行一次存储回收
+    :param dry_run: 只统计不删除
+    :param detail: 是否附带按班级、按用户的用量明细（维护任务只记录汇总）
+    :return: {'dry_run', 'usage': {类别: {'files', 'bytes'}}, 'reclaimed': {原因: {'files', 'bytes'}},
+              'over_quota': {'classes', 'users'}, 'errors', 'duration_ms'[, 'classes', 'users']}
+    """
+    collector = _Collector(dry_run)
+    owners = db.get_class_owners()
+
+    collector.sweep_repo()
+    candidates = collector.sweep_workspaces(set(owners))
+    over_quota = collector.enforce_quotas(candidates, owners)
+    collector.sweep_extract_blobs()
+    collector.sweep_exports()
+    collector.sweep_signatures()
+
+    report = {
+        'dry_run': dry_run,
+        'usage': collector.usage,
+        'reclaimed': collector.reclaimed,
+        'reclaimed_bytes': sum(item['bytes'] for item in collector.reclaimed.values()),
+        'over_quota': over_quota,
+        'errors': collector.errors,
+        'duration_ms': int((time.time() - collector.now) * 1000),
+    }
+    if detail:
+        users = {}
+
+        def user_usage(user_id):
+            return users.setdefault(user_id, {'workspace_bytes': 0, 'library_files': 0, 'library_bytes': 0,
+                                              'library_categories': {}})
+
+        for class_id, item in collector.classes.items():
+            user_usage(owners[class_id])['workspace_bytes'] += item['bytes']
+        for row in db.get_file_usage_by_user():
+            user = user_usage(row['user_id'])
+            user['library_bytes'] += row['bytes']
+            user['library_files'] += row['files']
+            _add(user['library_categories'], row['doc_category'] or 'unknown', row['files'], row['bytes'])
+        report['classes'] = {class_id: dict(item, owner=owners[class_id])
+                             for class_id, item in collector.classes.items()}
+        report['users'] = users
+    return report
@@ -0,0 +1,164 @@
+# services/welcome_refresher.py
+"""
+AI 欢迎语后台预生成
+记录最近访问过的 (用户, 页面)，由后台线程在其缓存过期前逐条重新生成，
+使页面加载总能命中缓存而不必同步等待 AI 网关。
+刷新串行执行、每周期限量，并受每日 token 预算（估算值）约束。
+"""
+
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from config import Config
+from services.ai_content_service import (
+    MessageContext,
+    build_welcome_prompt,
+    generate_welcome_message,
+    get_cache_expiry,
+)
+from services.ai_context_service import estimate_tokens
+from utils.async_runner import run_async
+
+logger = logging.getLogger(__name__)
+
+
+class WelcomeRefresher:
+    """欢迎语缓存预热"""
+
+    def __init__(self):
+        self._active = {}  # (user_id, page_context) -> {'user_info': {...}, 'last_seen': ts}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._budget_day = date.today()
+        self._stats = {'hits': 0, 'misses': 0, 'refreshed': 0, 'failed': 0,
+                       'skipped_budget': 0, 'tokens_today': 0}
+
+    # ================= 对外接口 =================
+
+    def touch(self, user_id, page_context, user_info):
+        """页面加载时调用：登记为活跃并确保后台线程运行"""
+        with self._lock:
+            self._active[(user_id, page_context)] = {
+                'user_info': {'id': user_id, 'username': user_info.get('username', '老师')},
+                'last_seen': time.time(),
+            }
+        self._ensure_worker()
+
+    def record_lookup(self, hit):
+        """记录一次页面加载的缓存命中/未命中"""
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+
+    def get_stats(self):
+        """命中率、预生成次数与当日 token 用量"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = len(self._active)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['daily_token_budget'] = Config.AI_WELCOME_DAILY_TOKEN_BUDGET
+        return stats
+
+    def refresh_due(self, now=None):
+        """
+        刷新即将过期（或已过期）的活跃条目
+        :return: 本轮刷新条数
+        """
+        now = now or time.time()
+        deadline = datetime.fromtimestamp(now) + timedelta(seconds=Config.AI_WELCOME_REFRESH_LEAD)
+        with self._lock:
+            for key in [k for k, v in self._active.items()
+                        if now - v['last_seen'] > Config.AI_WELCOME_ACTIVE_WINDOW]:
+                del self._active[key]
+            # 最近访问的优先
+            candidates = sorted(self._active.items(), key=lambda kv: kv[1]['last_seen'], reverse=True)
+
+        refreshed = 0
+        for (user_id, page_context), entry in candidates:
+            if refreshed >= Config.AI_WELCOME_REFRESH_MAX_PER_CYCLE:
+                break
+            expires_at = get_cache_expiry(user_id, page_context)
+            if expires_at and expires_at > deadline:
+                continue
+            if not self._refresh(user_id, page_context, entry['user_info']):
+                break
+            refreshed += 1
+        return refreshed
+
+    # ================= 内部实现 =================
+
+    def _refresh(self, user_id, page_context, user_info):
+        """重新生成一条缓存；预算不足时返回 False 以结束本轮"""
+        from blueprints.ai_welcome import get_recent_actions, get_user_stats
+
+        stats = get_user_stats(user_id)
+        recent_actions = get_recent_actions(user_id)
+        prompt = build_welcome_prompt(MessageContext.from_request(user_info, stats, page_context, recent_actions))
+        cost = estimate_tokens(prompt)
+        if not self._reserve(cost):
+            with self._lock:
+                self._stats['skipped_budget'] += 1
+            return False
+
+        try:
+            message, status = run_async(generate_welcome_message(
+                user_id=user_id,
+                page_context=page_context,
+                user_info=user_info,
+                stats=stats,
+                recent_actions=recent_actions,
+                force_refresh=True,
+            ))
+            self._reserve(estimate_tokens(message.message_content) if message else 0, force=True)
+            with self._lock:
+                self._stats['refreshed' if status == 'generated' else 'failed'] += 1
+        except Exception as e:
+            logger.warning(f"[Welcome Refresher] refresh failed for user {user_id} ({page_context}): {e}")
+            with self._lock:
+                self._stats['failed'] += 1
+        return True
+
+    def _reserve(self, tokens, force=False):
+        """从当日预算扣除 tokens；超出预算时不扣除并返回 False（force 时总是扣除）"""
+        with self._lock:
+            today = date.today()
+            if today != self._budget_day:
+                self._budget_day = today
+                self._stats['tokens_today'] = 0
+            if not force and self._stats['tokens_today'] + tokens > Config.AI_WELCOME_DAILY_TOKEN_BUDGET:
+                return False
+            self._stats['tokens_today'] += tokens
+            return True
+
+    def _ensure_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='welcome-refresher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(Config.AI_WELCOME_REFRESH_INTERVAL)
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logger.warning(f"[Welcome Refresher] cycle failed: {e}")
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_welcome_refresher():
+    """进程级欢迎语预热器"""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = WelcomeRefresher()
+    return _refresher
@@ -4,7 +4,7 @@
  */
 
 // 1. 导入通用工具
-import { showMessage } from './modules/utils.js';
+import { showMessage, waitForParseJob } from './modules/utils.js';
 
 // 2. 导入业务模块
 import { initBankForm } from './modules/forms/bank-form.js';
@@ -35,6 +35,9 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // 3. 轮询后台解析任务 (上传解析 / 重新解析 / 粘贴解析)
+    window.waitForParseJob = waitForParseJob;
+
     // --- 业务模块路由 (根据页面 DOM ID 按需加载) ---
 
     // 1. 题库列表页 / 新建题库
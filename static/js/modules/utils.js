@@ -64,4 +64,27 @@ export function showMessage(message, type = 'success', duration = 3000) {
         div.style.transform = 'translateY(-20px)';
         div.addEventListener('transitionend', () => div.remove());
     }, duration);
-}
\ No newline at end of file
+}
+/**
+ * 轮询后台解析任务直到结束
+ * 接受 /api/parse_file_asset 等接口的响应：已完成（status=success）直接返回，受理（status=accepted）则轮询任务状态
+ * @param {Object} data - 提交接口返回的 JSON
+ * @param {Function} onProgress - 进度回调 (job) => void，可选
+ * @param {number} interval - 轮询间隔(ms), 默认 2000
+ * @returns {Promise<Object>} 成功时的任务状态 {status, progress, msg, data}；失败时 reject
+ */
+export async function waitForParseJob(data, onProgress = null, interval = 2000) {
+    if (data.status !== 'accepted') {
+        if (data.status === 'success') return data;
+        throw new Error(data.msg || '解析失败');
+    }
+    while (true) {
+        const res = await fetch(`/api/parse_jobs/${data.job_id}`);
+        const job = await res.json();
+        if (!res.ok) throw new Error(job.msg || `请求失败: ${res.status}`);
+        if (job.status === 'success') return job;
+        if (job.status === 'failed') throw new Error(job.msg || '解析失败');
+        if (onProgress) onProgress(job);
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
@@ -31,3 +31,49 @@ def infer_academic_year_semester(date=None):
     else:
         # 2月-8月：上一学年第二学期
         return f"{year-1}-{year}学年度第二学期"
+
+
+def infer_academic_year(date=None):
+    """根据日期推断学年（不含学期）
+
+    学年从 9 月 1 日开始，到次年 8 月 31 日结束，与 infer_academic_year_semester 的规则一致。
+
+    Returns:
+        str: 学年字符串，如 "2025-2026"
+    """
+    if date is None:
+        date = datetime.now()
+    start_year = date.year if date.month >= 9 else date.year - 1
+    return f"{start_year}-{start_year + 1}"
+
+
+def academic_year_bounds(academic_year):
+    """学年的时间范围 [开始, 结束)，格式与 SQLite CURRENT_TIMESTAMP 一致，可直接用于字符串比较
+
+    Args:
+        academic_year: 学年字符串，如 "2024-2025"
+
+    Returns:
+        tuple: ("2024-09-01 00:00:00", "2025-09-01 00:00:00")
+
+    Raises:
+        ValueError: 学年格式不正确
+    """
+    start_year = parse_academic_year(academic_year)
+    return f"{start_year}-09-01 00:00:00", f"{start_year + 1}-09-01 00:00:00"
+
+
+def parse_academic_year(academic_year):
+    """解析 "2024-2025" / "2024-2025学年度第一学期" 形式的学年，返回起始年份"""
+    text = str(academic_year or '').strip()
+    parts = text[:9].split('-')
+    if len(parts) != 2 or not all(p.isdigit() and len(p) == 4 for p in parts) \
+            or int(parts[1]) != int(parts[0]) + 1:
+        raise ValueError(f"Invalid academic year: {academic_year}")
+    return int(parts[0])
+
+
+def is_academic_year_closed(academic_year, date=None):
+    """学年是否已结束（当前日期已进入之后的学年）"""
+    current_start = parse_academic_year(infer_academic_year(date))
+    return parse_academic_year(academic_year) < current_start
@@ -0,0 +1,48 @@
+# utils/async_runner.py
+"""
+协程执行工具
+同步的 Flask 视图与工作线程通过 run_async 在调用线程上以 asyncio.run 执行协程。
+AI 调用内的厂商并发控制使用阻塞式 threading.Semaphore，只能阻塞发起调用的线程，
+因此不能把这些协程放在多个调用共享的事件循环上（等待信号量会卡住持有信号量的其他协程）。
+submit_async 用于投递不等待结果的后台协程：交给一个小线程池，在工作线程中各自 asyncio.run。
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='async-bg')
+    return _executor
+
+
+def run_async(coro, timeout=None):
+    """在调用线程上执行协程并返回结果；timeout 为秒，超时抛出 TimeoutError"""
+    if timeout is not None:
+        coro = asyncio.wait_for(coro, timeout)
+    return asyncio.run(coro)
+
+
+def submit_async(coro):
+    """投递后台协程，立即返回 concurrent.futures.Future；异常只记录日志"""
+    future = _get_executor().submit(asyncio.run, coro)
+
+    def log_error(f):
+        if not f.cancelled() and f.exception():
+            logger.warning(f"[Async] background task failed: {f.exception()}")
+
+    future.add_done_callback(log_error)
+    return future
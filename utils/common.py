@@ -5,9 +5,9 @@ import os
 import re
 import time
 
-from config import Config
 from export_core.doc_config import DocumentTypeConfig
 from extensions import db
+from utils.file_store import store_bytes
 
 
 def calculate_file_hash(file_stream):
@@ -62,14 +62,9 @@ def generate_title_from_content(content, doc_type=None):
 
 def create_text_asset(content, title, user_id, ext=".md"):
     encoded = content.encode('utf-8')
-    file_hash = hashlib.sha256(encoded).hexdigest()
+    file_hash, physical_path = store_bytes(encoded, ext)
     safe_title = sanitize_filename(title)
     filename = f"{safe_title}{ext}"
-    physical_path = os.path.normpath(os.path.join(Config.FILE_REPO_FOLDER, f"{file_hash}{ext}"))
-
-    if not os.path.exists(physical_path):
-        with open(physical_path, 'wb') as f:
-            f.write(encoded)
 
     file_id = db.save_file_asset(file_hash, filename, len(encoded), physical_path, user_id)
     if file_id:
@@ -0,0 +1,311 @@
+# utils/db_benchmark.py
+"""
+数据库基准测试工具
+通过真实的 Database API 在临时库中灌入合成数据（中文姓名、JSON 分项成绩、大段 parsed_content），
+然后对热点查询计时，输出可在不同提交之间 diff 的 JSON 报告。
+
+用法:
+    python -m utils.db_benchmark --scale small --out bench_before.json
+    python -m utils.db_benchmark --scale small --compare bench_before.json
+    python -m utils.db_benchmark --scale full --keep /tmp/bench_full.db   # 500 班 / 5 万学生 / 100 万通知 / 10 万文档
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from database import Database  # noqa: E402
+
+# 数据规模预设
+SCALES = {
+    'small': {'teachers': 10, 'classes': 20, 'students': 2000, 'notifications': 20000, 'documents': 2000},
+    'medium': {'teachers': 40, 'classes': 100, 'students': 10000, 'notifications': 200000, 'documents': 20000},
+    'full': {'teachers': 100, 'classes': 500, 'students': 50000, 'notifications': 1000000, 'documents': 100000},
+}
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢'
+GIVEN_CHARS = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英文华建国志红玉梅晓东海宇浩然子轩欣怡梓涵一诺思远'
+COURSES = ['Python程序设计', '数据结构', '计算机网络', '操作系统', '数据库原理', 'Web前端开发',
+           'Java程序设计', '人工智能导论', '软件工程', '计算机组成原理', '离散数学', '机器学习']
+DOC_CATEGORIES = ['exam', 'exam', 'exam', 'course_material', 'syllabus', 'score_sheet']
+NOTIFICATION_TYPES = ['task_pending', 'task_processing', 'task_success', 'task_failed', 'system']
+SENTENCES = ['请根据题目要求完成以下程序设计。', '本题考查循环结构与条件判断的综合运用。',
+             '评分标准：代码能正确运行得满分，逻辑错误酌情扣分。', '第{}题（{}分）编写函数实现指定功能。',
+             '参考答案如下，注意边界条件的处理。', '学生需提交源代码及运行截图。']
+
+# 每个基准的重复次数
+DEFAULT_RUNS = 7
+
+
+def chinese_name(rng):
+    given = ''.join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2))))
+    return rng.choice(SURNAMES) + given
+
+
+def parsed_content(rng, median_kb):
+    """长尾分布的文档解析内容（中位数约 median_kb KB，上限 64 KB）"""
+    size = min(int(rng.lognormvariate(0, 0.8) * median_kb * 1024), 64 * 1024)
+    parts, length = ['# 试卷解析\n'], 0
+    while length < size:
+        line = rng.choice(SENTENCES).format(rng.randint(1, 20), rng.choice((5, 10, 15, 20)))
+        parts.append(line)
+        length += len(line.encode('utf-8'))
+    return '\n'.join(parts)
+
+
+def academic_year_for(dt):
+    start = dt.year if dt.month >= 9 else dt.year - 1
+    return f"{start}-{start + 1}"
+
+
+# ================= 数据生成 =================
+
+def seed(db, scale, rng, median_kb=4, log=print):
+    """按规模灌入合成数据，返回各表行数"""
+    conn = db.get_connection()
+    # 临时库，关闭同步以加快逐条提交的 API 写入
+    conn.execute('PRAGMA synchronous=OFF')
+    now = datetime.now()
+    started = time.perf_counter()
+
+    teachers = [db.login_simple_user(f'teacher{i:03d}')['id'] for i in range(scale['teachers'])]
+
+    # 班级 + 学生 + 成绩
+    class_ids = []
+    per_class = max(1, scale['students'] // scale['classes'])
+    student_seq = 0
+    for c in range(scale['classes']):
+        course = rng.choice(COURSES)
+        owner = rng.choice(teachers)
+        class_id = db.create_class(f'{2021 + c % 5}级{c % 12 + 1}班', course, 'bench_grader', owner)
+        created = now - timedelta(days=rng.randint(0, 4 * 365))
+        db.update_class_details(class_id, semester=f'{academic_year_for(created)}-{rng.choice((1, 2))}')
+        class_ids.append(class_id)
+
+        questions = rng.randint(3, 10)
+        for _ in range(per_class):
+            student_seq += 1
+            sid = f'2{student_seq:09d}'
+            db.add_student(sid, chinese_name(rng), class_id)
+            if rng.random() < 0.9:
+                details = [{'name': f'第{q + 1}题', 'score': rng.randint(0, 20), 'max_score': 20}
+                           for q in range(questions)]
+                total = sum(d['score'] for d in details)
+                deducts = [f'第{q + 1}题：{rng.choice(SENTENCES)}' for q in range(rng.randint(0, 3))]
+                db.save_grade(sid, class_id, total, json.dumps(details, ensure_ascii=False),
+                              json.dumps(deducts, ensure_ascii=False), 'PASS' if total >= 60 else 'FAIL',
+                              f'{sid}_作业.zip')
+    log(f'[Bench] classes/students/grades seeded in {time.perf_counter() - started:.1f}s')
+
+    # 批改核心任务（get_all_strategies 会与之合并）
+    for i in range(scale['classes'] // 5 or 1):
+        db.insert_ai_task(f'{rng.choice(COURSES)}批改核心{i}', status='success', user_id=rng.choice(teachers),
+                          grader_id=f'bench_grader_{i}', course_name=rng.choice(COURSES))
+
+    # 通知：按用户呈长尾分布
+    weights = [1 / (i + 1) for i in range(len(teachers))]
+    for _ in range(scale['notifications']):
+        db.create_notification(rng.choices(teachers, weights)[0], rng.choice(NOTIFICATION_TYPES),
+                               '批改任务状态更新', rng.choice(SENTENCES), link='/tasks',
+                               related_id=str(rng.randint(1, 10000)))
+    # 其中大部分已读
+    conn.execute("UPDATE notifications SET is_read = 1 WHERE id % 5 != 0")
+    conn.commit()
+    log(f'[Bench] notifications seeded in {time.perf_counter() - started:.1f}s')
+
+    # 文档库
+    for i in range(scale['documents']):
+        created = now - timedelta(days=rng.randint(0, 4 * 365))
+        name = f'{rng.choice(COURSES)}期末试卷{i}.docx'
+        file_id = db.save_file_asset(hashlib.sha256(f'bench-{i}'.encode()).hexdigest(), name,
+                                     rng.randint(10_000, 5_000_000), f'/bench/{i}.docx', rng.choice(teachers))
+        if rng.random() < 0.85:
+            db.update_file_parsed_content(file_id, parsed_content(rng, median_kb))
+        db.update_file_metadata(file_id, {'pages': rng.randint(1, 30)}, doc_category=rng.choice(DOC_CATEGORIES),
+                                course_name=rng.choice(COURSES), academic_year=academic_year_for(created))
+    log(f'[Bench] documents seeded in {time.perf_counter() - started:.1f}s')
+
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    with db.read_connection() as rconn:
+        return {t: rconn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                for t in ('users', 'classes', 'students', 'grades', 'grade_items', 'notifications', 'file_assets')}
+
+
+# ================= 计时 =================
+
+def timed(fn, runs):
+    """运行 runs 次，返回耗时分布 (ms) 与结果行数"""
+    samples, rows = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        rows = len(result) if hasattr(result, '__len__') else None
+    samples.sort()
+    return {
+        'runs': runs,
+        'rows': rows,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def run_benchmarks(db, runs=DEFAULT_RUNS):
+    """对热点方法计时，返回 {基准名: 结果}"""
+    from grading_core.factory import GraderFactory
+    from services.stats_service import StatsService
+
+    with db.read_connection() as conn:
+        class_ids = [r[0] for r in conn.execute('SELECT id FROM classes ORDER BY id')]
+        busiest = conn.execute('SELECT user_id FROM notifications GROUP BY user_id '
+                               'ORDER BY COUNT(*) DESC LIMIT 1').fetchone()[0]
+        teacher = conn.execute('SELECT created_by FROM classes GROUP BY created_by '
+                               'ORDER BY COUNT(*) DESC LIMIT 1').fetchone()[0]
+        year, course = conn.execute('SELECT academic_year, course_name FROM file_assets '
+                                    'WHERE course_name IS NOT NULL LIMIT 1').fetchone()
+    sample_class = class_ids[len(class_ids) // 2]
+
+    def uncached(method):
+        # 统计服务带共享缓存，基准测量的是缓存未命中时的查询成本
+        def run():
+            StatsService.invalidate()
+            return [getattr(StatsService(), method)(teacher)]
+        return run
+
+    benches = {
+        'get_students_with_grades': lambda: db.get_students_with_grades(sample_class),
+        'get_students_with_grades.all_classes': lambda: [db.get_students_with_grades(c) for c in class_ids[:20]],
+        'get_class_score_matrix': lambda: db.get_class_score_matrix(sample_class)[1],
+        'get_files_by_filter.all': lambda: db.get_files_by_filter(teacher),
+        'get_files_by_filter.year_course': lambda: db.get_files_by_filter(teacher, year=year, course=course),
+        'get_files_by_filter.search': lambda: db.get_files_by_filter(teacher, search='边界条件'),
+        'get_notifications.unread': lambda: db.get_notifications(busiest, limit=20),
+        'get_notifications.all': lambda: db.get_notifications(busiest, limit=50, include_read=True),
+        'get_unread_notification_count': lambda: [db.get_unread_notification_count(busiest)],
+        'get_document_library_tree': lambda: db.get_document_library_tree(teacher),
+        'get_all_strategies': GraderFactory.get_all_strategies,
+        'stats.get_dashboard_stats': uncached('get_dashboard_stats'),
+        'stats.get_recent_activities': uncached('get_recent_activities'),
+        'stats.get_all_data.cached': lambda: [StatsService().get_all_data(teacher)],
+    }
+    return {name: timed(fn, runs) for name, fn in benches.items()}
+
+
+# ================= 报告 =================
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline, threshold=0.2):
+    """与基线报告对比 median_ms，返回变慢超过阈值的基准列表"""
+    regressions = []
+    print(f"{'benchmark':42s} {'base ms':>10s} {'now ms':>10s} {'change':>8s}")
+    for name, result in report['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base:
+            print(f'{name:42s} {"-":>10s} {result["median_ms"]:10.2f} {"new":>8s}')
+            continue
+        change = (result['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0
+        flag = ' !' if change > threshold else ''
+        print(f'{name:42s} {base["median_ms"]:10.2f} {result["median_ms"]:10.2f} {change:+8.1%}{flag}')
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='数据库合成数据基准测试')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=20240901, help='随机种子（相同种子生成相同数据）')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--content-kb', type=int, default=4, help='parsed_content 中位大小 (KB)')
+    parser.add_argument('--db', help='复用已生成的基准库（跳过数据生成）')
+    parser.add_argument('--keep', help='生成后把基准库保存到该路径，便于之后 --db 复用')
+    parser.add_argument('--out', help='JSON 报告输出路径（默认打印到标准输出）')
+    parser.add_argument('--compare', help='基线 JSON 报告，median 变慢超过 --threshold 时返回非零')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    log = lambda msg: print(msg, file=sys.stderr)  # noqa: E731
+    workdir = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        workdir = tempfile.mkdtemp(prefix='db_bench_')
+        db_path = os.path.join(workdir, 'bench.db')
+
+    # 服务层在首次导入时才构造 extensions.db 单例（未指定路径时读取 Config.DB_PATH），使其也指向基准库
+    Config.DB_PATH = db_path
+    db = None
+    try:
+        db = Database(db_path)
+        counts = None if args.db else seed(db, SCALES[args.scale], rng, args.content_kb, log)
+        if counts is None:
+            with db.read_connection() as conn:
+                counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                          for t in ('users', 'classes', 'students', 'grades', 'grade_items',
+                                    'notifications', 'file_assets')}
+        report = {
+            'meta': {
+                'scale': args.scale if not args.db else None,
+                'seed': args.seed,
+                'git_revision': git_revision(),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'db_size': os.path.getsize(db_path),
+            },
+            'rows': counts,
+            'benchmarks': run_benchmarks(db, args.runs),
+        }
+    finally:
+        if db is not None:
+            db.close()
+        if args.keep and workdir and os.path.exists(db_path):
+            shutil.copy(db_path, args.keep)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            log(f'[Bench] regressions: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# utils/db_pool_loadtest.py
+"""
+只读连接池负载测试
+在临时基准库上同时运行批改写入线程（save_grade）和文档库查询线程（get_files_by_filter / 成绩表），
+结束后输出连接池利用率（借出次数、等待次数与时长、峰值占用、超时次数）和各类操作的吞吐。
+
+用法:
+    python -m utils.db_pool_loadtest --writers 8 --readers 8 --pool-size 4 --seconds 20
+    python -m utils.db_pool_loadtest --db /tmp/bench_full.db --readers 16
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from database import Database  # noqa: E402
+from utils.db_benchmark import SCALES, seed  # noqa: E402
+
+
+def run_load(db, writers, readers, seconds, seed_value):
+    """并发运行写入与查询线程 seconds 秒，返回 {'operations', 'errors'}"""
+    with db.read_connection() as conn:
+        grades = conn.execute('SELECT student_id, class_id FROM grades').fetchall()
+        teachers = [r[0] for r in conn.execute('SELECT DISTINCT created_by FROM classes')]
+        class_ids = [r[0] for r in conn.execute('SELECT id FROM classes')]
+
+    deadline = time.monotonic() + seconds
+    counts = {'save_grade': 0, 'get_files_by_filter': 0, 'get_students_with_grades': 0}
+    errors = []
+    lock = threading.Lock()
+
+    def record(name):
+        with lock:
+            counts[name] += 1
+
+    def writer(index):
+        rng = random.Random(seed_value + index)
+        while time.monotonic() < deadline:
+            sid, class_id = rng.choice(grades)
+            details = [{'name': f'第{q + 1}题', 'score': rng.randint(0, 20), 'max_score': 20} for q in range(5)]
+            db.save_grade(sid, class_id, sum(d['score'] for d in details), json.dumps(details, ensure_ascii=False),
+                          '', 'PASS', f'{sid}_作业.zip')
+            record('save_grade')
+
+    def reader(index):
+        rng = random.Random(seed_value + 1000 + index)
+        while time.monotonic() < deadline:
+            if rng.random() < 0.5:
+                db.get_files_by_filter(rng.choice(teachers), search=rng.choice(('边界条件', '循环', '函数')))
+                record('get_files_by_filter')
+            else:
+                db.get_students_with_grades(rng.choice(class_ids))
+                record('get_students_with_grades')
+
+    def guarded(fn, index):
+        try:
+            fn(index)
+        except Exception as e:
+            with lock:
+                errors.append(f'{fn.__name__}[{index}]: {e}')
+
+    threads = ([threading.Thread(target=guarded, args=(writer, i)) for i in range(writers)]
+               + [threading.Thread(target=guarded, args=(reader, i)) for i in range(readers)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {'operations': {name: {'count': n, 'per_second': round(n / seconds, 1)} for name, n in counts.items()},
+            'errors': errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='只读连接池负载测试（批改写入 + 文档库查询）')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--db', help='复用已生成的基准库（跳过数据生成；写入会修改该库）')
+    parser.add_argument('--writers', type=int, default=8, help='批改写入线程数')
+    parser.add_argument('--readers', type=int, default=8, help='文档库/成绩查询线程数')
+    parser.add_argument('--pool-size', type=int, default=Config.DB_READER_POOL_SIZE)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=20240901)
+    args = parser.parse_args(argv)
+
+    log = lambda msg: print(msg, file=sys.stderr)  # noqa: E731
+    workdir = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        workdir = tempfile.mkdtemp(prefix='db_pool_load_')
+        db_path = os.path.join(workdir, 'bench.db')
+
+    Config.DB_READER_POOL_SIZE = args.pool_size
+    db = None
+    try:
+        db = Database(db_path)
+        if not args.db:
+            seed(db, SCALES[args.scale], random.Random(args.seed), log=log)
+        log(f'[LoadTest] {args.writers} writers + {args.readers} readers, pool size {args.pool_size}, '
+            f'{args.seconds:g}s')
+        result = run_load(db, args.writers, args.readers, args.seconds, args.seed)
+        result.update({'writers': args.writers, 'readers': args.readers, 'seconds': args.seconds,
+                       'pool': db.get_reader_pool_stats()})
+    finally:
+        if db is not None:
+            db.close()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# utils/events.py
+"""
+进程内领域事件
+数据层在关键写操作完成后 emit 事件，缓存、通知等模块通过 subscribe 订阅，
+避免 Database 直接依赖上层服务。处理函数异常只记录日志，不影响写操作本身。
+"""
+
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# 事件名
+CLASS_CREATED = 'class_created'      # payload: class_id, user_id
+CLASS_DELETED = 'class_deleted'      # payload: class_id, user_id
+GRADE_SAVED = 'grade_saved'          # payload: class_id, student_id
+TASK_CREATED = 'task_created'        # payload: task_id, user_id
+TASK_FINISHED = 'task_finished'      # payload: task_id, status
+FILE_UPLOADED = 'file_uploaded'      # payload: file_id, user_id
+FILE_CONTENT_UPDATED = 'file_content_updated'  # payload: file_id (parsed_content 写入或修改)
+FILE_DELETED = 'file_deleted'        # payload: file_id
+GRADER_CATALOG_CHANGED = 'grader_catalog_changed'  # payload: grader_ids (目录写入已提交)
+PARSE_JOB_UPDATED = 'parse_job_updated'  # payload: job_id, user_id, status, stage, progress
+
+_handlers = defaultdict(list)
+_lock = threading.Lock()
+
+
+def subscribe(event, handler=None):
+    """
+    订阅事件，可作为装饰器使用:
+        @subscribe(GRADE_SAVED)
+        def on_grade_saved(class_id, **_): ...
+    """
+    def register(fn):
+        with _lock:
+            if fn not in _handlers[event]:
+                _handlers[event].append(fn)
+        return fn
+
+    return register(handler) if handler else register
+
+
+def unsubscribe(event, handler):
+    with _lock:
+        if handler in _handlers[event]:
+            _handlers[event].remove(handler)
+
+
+def emit(event, **payload):
+    """同步调用所有订阅者"""
+    for handler in list(_handlers.get(event, ())):
+        try:
+            handler(**payload)
+        except Exception as e:
+            logger.warning(f"[Events] {event} handler {getattr(handler, '__name__', handler)} failed: {e}")
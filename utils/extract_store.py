@@ -0,0 +1,180 @@
+# utils/extract_store.py
+"""
+学生提交的去重解压存储
+同一班级中大量学生提交相同的文件（起始代码、模板图片、依赖库、.idea 等），逐个解压会存下几十份相同内容。
+批改完成后按 SHA-256 把每个文件放入 EXTRACT_STORE_FOLDER/ab/cd/<hash>，学生目录中的文件替换为指向它的硬链接，
+相同内容在磁盘上只存一份。仓库文件的硬链接数即引用它的学生文件数，链接数为 1 的即无人引用，由存储回收删除。
+
+链接在批改之后进行，批改核心运行时学生目录中的文件都是独立副本；共享的文件在 POSIX 上设为只读。
+链接到已有的仓库文件前校验其大小与哈希，内容不符（被改写过）时用当前文件替换。
+文件系统不支持硬链接（或仓库与工作区不同盘）时保留原文件，只计算哈希。
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import stat as stat_module
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+# 这些错误说明文件系统不支持硬链接（或仓库与工作区不同盘），本次不再尝试
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def blob_path(file_hash):
+    return os.path.join(Config.EXTRACT_STORE_FOLDER, file_hash[:2], file_hash[2:4], file_hash)
+
+
+def _hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _iter_files(root):
+    """逐层遍历 root 下的普通文件，产出 (路径, stat)；不跟随符号链接"""
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+
+def _make_readonly(path):
+    if os.name != 'nt':
+        os.chmod(path, stat_module.S_IMODE(os.stat(path).st_mode) & ~0o222)
+
+
+def _blob_matches(blob, size, file_hash):
+    try:
+        return os.stat(blob).st_size == size and _hash_file(blob) == file_hash
+    except FileNotFoundError:
+        return False
+
+
+def _replace_with_link(src, dest):
+    """先在 dest 同目录建 src 的临时链接，再原子替换 dest"""
+    tmp = f"{dest}.dedup-tmp"
+    os.link(src, tmp)
+    try:
+        os.replace(tmp, dest)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+def _link_to_blob(path, file_hash, size):
+    """
+    把 path 换成仓库文件的硬链接：仓库中没有该内容时 path 自身成为仓库文件
+    :return: 是否链接成功
+    """
+    blob = blob_path(file_hash)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        os.link(path, blob)
+        _make_readonly(blob)
+        return True
+    except FileExistsError:
+        pass
+    if not _blob_matches(blob, size, file_hash):
+        # 仓库文件已被改写（或刚被存储回收删除）：改由当前文件充当仓库文件，已链接旧内容的学生文件不受影响
+        logger.warning(f"[ExtractStore] blob {file_hash} missing or corrupted, replacing it")
+        _replace_with_link(path, blob)
+        _make_readonly(blob)
+        return True
+    try:
+        _replace_with_link(blob, path)
+    except FileNotFoundError:
+        # 仓库文件刚被存储回收删除，下次链接时重新放入
+        return False
+    return True
+
+
+def _rel(path, root):
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def hash_tree(root):
+    """
+    计算解压目录中各文件的内容哈希（不链接）；无法读取的文件跳过
+    :return: {相对路径（/ 分隔）: 内容哈希}
+    """
+    hashes = {}
+    for path, _ in _iter_files(root):
+        try:
+            hashes[_rel(path, root)] = _hash_file(path)
+        except OSError:
+            continue
+    return hashes
+
+
+def dedupe_tree(root, hashes=None):
+    """
+    把解压目录中的文件换成去重存储中的硬链接；须在批改核心读完该目录之后调用
+    无法读取的文件跳过（保留原文件）
+    :param hashes: hash_tree 已算好的哈希，命中的文件不再重新计算（链接到已有内容前仍会校验仓库文件）
+    :return: {相对路径（/ 分隔）: 内容哈希}
+    """
+    known = hashes or {}
+    hashes = {}
+    enabled = Config.EXTRACT_DEDUP_ENABLED
+    for path, stat in _iter_files(root):
+        rel = _rel(path, root)
+        try:
+            file_hash = known.get(rel) or _hash_file(path)
+        except OSError:
+            continue
+        hashes[rel] = file_hash
+        if not enabled or stat.st_size < Config.EXTRACT_DEDUP_MIN_BYTES or stat.st_nlink > 1:
+            continue
+        try:
+            _link_to_blob(path, file_hash, stat.st_size)
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                logger.warning(f"[ExtractStore] hard link unavailable under {root}, keeping copies: {e}")
+                enabled = False
+            # 其他错误（如单个仓库文件链接数达到上限）只保留这一个文件的副本
+    return hashes
+
+
+def dedup_stats(extract_base):
+    """
+    班级解压目录的去重统计
+    :return: {'files', 'logical_bytes'（各学生文件大小之和）, 'physical_bytes'（按 inode 去重后）,
+              'linked_files'（已放入去重存储的文件数）, 'dedup_ratio'（logical / physical）}
+    """
+    files = logical = physical = linked = 0
+    seen = set()
+    for _, stat in _iter_files(extract_base):
+        files += 1
+        logical += stat.st_size
+        if stat.st_nlink > 1:
+            linked += 1
+            key = (stat.st_dev, stat.st_ino)
+            if key in seen:
+                continue
+            seen.add(key)
+        physical += stat.st_size
+    return {
+        'files': files,
+        'logical_bytes': logical,
+        'physical_bytes': physical,
+        'linked_files': linked,
+        'dedup_ratio': round(logical / physical, 2) if physical else 1.0,
+    }
@@ -1,72 +1,308 @@
-import sys
-import subprocess
+"""
+Office 文档转 PDF
+Linux 下维护少量常驻的 headless soffice 实例，每个实例有独立的用户配置目录，经 UNO pipe
+连接（UNIX 域套接字）提交转换，免去每次冷启动；单次转换超时即杀掉实例，处理一定数量后主动回收重启。
+未安装 UNO 桥 (python3-uno) 时退回为每次启动一个 soffice 子进程，仍按槽位使用独立配置目录，可并发。
+转换结果按源文件哈希缓存在仓库 .converted 目录，同一文档重复解析不再转换。
+"""
+
+import atexit
 import os
 import platform
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+from config import Config
+from utils.file_store import converted_path, file_hash_of, tmp_dir
+
+# UNO 导出 PDF 需按文档类型选择过滤器（命令行 --convert-to pdf 会自动选择）
+PDF_FILTERS = {
+    '.xls': 'calc_pdf_Export', '.xlsx': 'calc_pdf_Export', '.csv': 'calc_pdf_Export', '.ods': 'calc_pdf_Export',
+    '.ppt': 'impress_pdf_Export', '.pptx': 'impress_pdf_Export', '.odp': 'impress_pdf_Export',
+}
+
+
+def _file_url(path):
+    return 'file://' + os.path.abspath(path).replace(os.sep, '/')
+
+
+def _spawn(args):
+    """在新会话中启动 soffice：soffice 是包装进程 (oosplash)，真正工作的 soffice.bin 是其子进程"""
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def _kill_group(process):
+    """杀掉整个进程组（包装进程已退出时 soffice.bin 可能仍在组内）"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        if process.poll() is None:
+            process.kill()
+
+
+def _props(**kwargs):
+    from com.sun.star.beans import PropertyValue
 
+    props = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name, prop.Value = name, value
+        props.append(prop)
+    return tuple(props)
 
-def convert_to_pdf(input_path, output_dir=None):
+
+class SofficeSlot:
+    """一个转换槽位：独立的用户配置目录，UNO 模式下还持有一个常驻 soffice 进程"""
+
+    def __init__(self, index):
+        self.index = index
+        self.profile_dir = os.path.join(Config.OFFICE_PROFILE_ROOT, str(index))
+        self.pipe_name = f"tas_soffice_{os.getpid()}_{index}"
+        self.process = None
+        self.desktop = None
+        self.jobs = 0
+        self.timed_out = False
+
+    def _base_args(self):
+        return [Config.OFFICE_BINARY, f'-env:UserInstallation={_file_url(self.profile_dir)}',
+                '--headless', '--invisible', '--nologo', '--norestore', '--nodefault', '--nolockcheck']
+
+    # ---- 常驻实例 (UNO) ----
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None and self.desktop is not None
+
+    def start(self):
+        import uno
+        from com.sun.star.connection import NoConnectException
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        connect = f'pipe,name={self.pipe_name};urp;StarOffice.ComponentContext'
+        self.process = _spawn(self._base_args() + [f'--accept={connect}'])
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.monotonic() + Config.OFFICE_START_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(f'uno:{connect}')
+                break
+            except NoConnectException:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"soffice 实例 {self.index} 启动失败")
+                time.sleep(0.1)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+        self.jobs, self.timed_out = 0, False
+
+    def convert(self, src, dest):
+        doc = self.desktop.loadComponentFromURL(_file_url(src), '_blank', 0, _props(Hidden=True, ReadOnly=True))
+        if doc is None:
+            raise RuntimeError("soffice 无法打开文档")
+        try:
+            pdf_filter = PDF_FILTERS.get(os.path.splitext(src)[1].lower(), 'writer_pdf_Export')
+            doc.storeToURL(_file_url(dest), _props(FilterName=pdf_filter))
+        finally:
+            doc.close(True)
+        self.jobs += 1
+
+    def kill(self):
+        """超时看门狗调用：杀掉进程使阻塞中的 UNO 调用立即失败"""
+        self.timed_out = True
+        if self.process:
+            _kill_group(self.process)
+
+    def stop(self):
+        self.desktop = None
+        if self.process:
+            _kill_group(self.process)
+            self.process.wait()
+        self.process = None
+
+    # ---- 一次性子进程 ----
+
+    def convert_once(self, src, dest):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        workdir = tempfile.mkdtemp(dir=tmp_dir())
+        try:
+            args = self._base_args() + ['--convert-to', 'pdf', '--outdir', workdir, src]
+            process = _spawn(args)
+            try:
+                returncode = process.wait(timeout=Config.OFFICE_CONVERT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.timed_out = True
+                _kill_group(process)
+                process.wait()
+                raise
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, args)
+            output = os.path.join(workdir, os.path.splitext(os.path.basename(src))[0] + '.pdf')
+            os.replace(output, dest)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+class OfficeConverter:
+    """soffice 槽位池；同一时刻每个槽位只处理一个转换"""
+
+    def __init__(self, use_uno):
+        self.use_uno = use_uno
+        self._slots = [SofficeSlot(i) for i in range(Config.OFFICE_POOL_SIZE)]
+        self._idle = queue.Queue()
+        for slot in self._slots:
+            self._idle.put(slot)
+        self._lock = threading.Lock()
+        self._latency = {'cache': deque(maxlen=500), 'convert': deque(maxlen=500)}  # 毫秒
+        self._stats = {'cache_hits': 0, 'converted': 0, 'failed': 0, 'timeouts': 0, 'recycled': 0}
+
+    def convert(self, src, dest):
+        """把 src 转换为 PDF 写入 dest；等待空闲槽位最多 OFFICE_CONVERT_TIMEOUT 秒"""
+        started = time.perf_counter()
+        slot = self._idle.get(timeout=Config.OFFICE_CONVERT_TIMEOUT)
+        try:
+            if self.use_uno:
+                self._convert_uno(slot, src, dest)
+            else:
+                slot.convert_once(src, dest)
+            self._record('convert', started, converted=1)
+        except Exception:
+            self._record(None, started, failed=1, timeouts=1 if slot.timed_out else 0)
+            slot.timed_out = False
+            raise
+        finally:
+            self._idle.put(slot)
+
+    def _convert_uno(self, slot, src, dest):
+        if not slot.running:
+            slot.stop()
+            slot.start()
+        watchdog = threading.Timer(Config.OFFICE_CONVERT_TIMEOUT, slot.kill)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            slot.convert(src, dest)
+        except Exception:
+            slot.stop()  # 下次使用时重启
+            raise
+        finally:
+            watchdog.cancel()
+        if slot.jobs >= Config.OFFICE_MAX_JOBS_PER_INSTANCE:
+            slot.stop()
+            self._record(None, None, recycled=1)
+
+    def record_cache_hit(self, started):
+        self._record('cache', started, cache_hits=1)
+
+    def _record(self, path, started, **counters):
+        with self._lock:
+            if path:
+                self._latency[path].append((time.perf_counter() - started) * 1000)
+            for key, value in counters.items():
+                self._stats[key] += value
+
+    def get_stats(self):
+        """命中/转换/失败次数与最近转换耗时分位数"""
+        def percentile(values, q):
+            return round(values[min(len(values) - 1, int(len(values) * q))], 1) if values else None
+
+        with self._lock:
+            stats = dict(self._stats)
+            latency = {path: sorted(values) for path, values in self._latency.items()}
+        stats['mode'] = 'uno' if self.use_uno else 'subprocess'
+        stats['pool_size'] = len(self._slots)
+        stats['running'] = sum(1 for slot in self._slots if slot.running)
+        for path, values in latency.items():
+            stats[f'{path}_p50_ms'] = percentile(values, 0.5)
+            stats[f'{path}_p95_ms'] = percentile(values, 0.95)
+        return stats
+
+    def shutdown(self):
+        for slot in self._slots:
+            slot.stop()
+
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_office_converter():
+    """进程级转换池；soffice 实例在首次转换时启动，之后常驻"""
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                try:
+                    import uno  # noqa: F401
+                    use_uno = True
+                except ImportError:
+                    print("[Converter] 未安装 UNO 桥 (python3-uno)，回退为每次启动 soffice 子进程")
+                    use_uno = False
+                converter = OfficeConverter(use_uno)
+                atexit.register(converter.shutdown)
+                _converter = converter
+    return _converter
+
+
+def _convert_windows(input_path, target_pdf_path):
+    # [关键修复] 引入 pythoncom 处理多线程 COM 调用
+    import pythoncom
+
+    # 在当前线程初始化 COM 库
+    pythoncom.CoInitialize()
+    try:
+        from docx2pdf import convert
+        # docx2pdf 可能会因为 Word 弹窗或卡死而报错，由调用方统一捕获
+        convert(input_path, target_pdf_path)
+    finally:
+        # 释放 COM 资源，防止内存泄漏
+        pythoncom.CoUninitialize()
+
+
+def convert_to_pdf(input_path, source_hash=None):
     """
-    将 Word 文档 (.docx, .doc) 转换为 PDF。
+    将 Word 文档 (.docx, .doc) 转换为 PDF，返回缓存中的 PDF 路径；失败返回 None。
     依赖:
-    1. Linux: 需要安装 LibreOffice (apt-get install libreoffice)
+    1. Linux: 需要安装 LibreOffice (apt-get install libreoffice)，建议同时安装 python3-uno 以启用常驻实例
     2. Windows: 需要安装 Microsoft Word，并 pip install docx2pdf pywin32
+    :param source_hash: 源文件 SHA-256（仓库文件可省略，从文件名得到）
     """
-    if not output_dir:
-        output_dir = os.path.dirname(input_path)
-
     filename = os.path.basename(input_path)
-    name, ext = os.path.splitext(filename)
-
-    # 目标 PDF 路径
-    target_pdf_path = os.path.join(output_dir, f"{name}.pdf")
 
     # 如果已经是 PDF，直接返回
-    if ext.lower() == '.pdf':
+    if os.path.splitext(filename)[1].lower() == '.pdf':
         return input_path
 
+    started = time.perf_counter()
     try:
-        # === Windows 环境使用 docx2pdf (依赖 MS Word) ===
-        if platform.system() == "Windows":
-            # [关键修复] 引入 pythoncom 处理多线程 COM 调用
-            import pythoncom
-
-            # 在当前线程初始化 COM 库
-            pythoncom.CoInitialize()
-
-            try:
-                from docx2pdf import convert
-                print(f"[Converter] Converting {filename} to PDF using docx2pdf...")
-
-                # docx2pdf 可能会因为 Word 弹窗或卡死而报错，加一层保护
-                convert(input_path, target_pdf_path)
-                return target_pdf_path
-            except Exception as e:
-                print(f"[Converter] Windows Conversion Error: {e}")
-                return None
-            finally:
-                # 释放 COM 资源，防止内存泄漏
-                pythoncom.CoUninitialize()
-
-        # === Linux 环境使用 LibreOffice (Headless) ===
-        else:
-            # 检查 libreoffice 是否存在
-            # 常用命令: libreoffice, libreoffice7.x, soffice
-            cmd = "libreoffice"
-            # 简单的检查逻辑，实际生产环境建议在 Dockerfile 中保证环境
-
-            print(f"[Converter] Converting {filename} to PDF using LibreOffice...")
-            # --outdir 指定输出目录
-            result = subprocess.run(
-                [cmd, '--headless', '--convert-to', 'pdf', '--outdir', output_dir, input_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            if result.returncode != 0:
-                print(f"[Converter] LibreOffice conversion failed: {result.stderr.decode()}")
-                return None
-
+        target_pdf_path = converted_path(source_hash or file_hash_of(input_path), '.pdf')
+        if os.path.exists(target_pdf_path):
+            if platform.system() != "Windows":
+                get_office_converter().record_cache_hit(started)
             return target_pdf_path
 
+        print(f"[Converter] Converting {filename} to PDF...")
+        os.makedirs(os.path.dirname(target_pdf_path), exist_ok=True)
+        partial = os.path.join(tmp_dir(), f"{uuid.uuid4().hex}.pdf")
+        try:
+            # === Windows 环境使用 docx2pdf (依赖 MS Word) ===
+            if platform.system() == "Windows":
+                _convert_windows(input_path, partial)
+            # === Linux 环境使用 LibreOffice (Headless) ===
+            else:
+                get_office_converter().convert(input_path, partial)
+            os.replace(partial, target_pdf_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return target_pdf_path
+
     except Exception as e:
-        print(f"[Converter] Conversion Exception: {e}")
-        return None
\ No newline at end of file
+        print(f"[Converter] Conversion Exception for {filename}: {e}")
+        return None
@@ -0,0 +1,245 @@
+# utils/file_store.py
+"""
+内容寻址文件仓库
+文件按 SHA-256 存放在 FILE_REPO_FOLDER/ab/cd/<hash><ext> 分片目录下，避免单目录堆积大量文件。
+上传时 HashingUpload 作为 multipart 解析的落盘目标，在写入的同一遍中计算哈希；
+查重后只需把临时文件原子重命名到分片路径，不再「读一遍算哈希、保存、再读一遍算哈希」。
+"""
+
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+
+from flask import Request
+
+from config import Config
+
+TMP_DIR_NAME = '.tmp'  # 临时文件与仓库同盘，保证 os.replace 为原子重命名
+CONVERTED_DIR_NAME = '.converted'  # 格式转换结果缓存，按源文件哈希分片
+HASH_NAME = re.compile(r'[0-9a-f]{64}')
+MIGRATE_BATCH_SIZE = 500  # 平铺布局迁移每批提交的文件数
+
+
+def repo_path(file_hash, ext=''):
+    """哈希对应的分片存储路径"""
+    return os.path.normpath(os.path.join(Config.FILE_REPO_FOLDER, file_hash[:2], file_hash[2:4], f"{file_hash}{ext}"))
+
+
+def converted_path(source_hash, ext):
+    """源文件转换结果（如 docx -> pdf）的缓存路径"""
+    return os.path.normpath(os.path.join(Config.FILE_REPO_FOLDER, CONVERTED_DIR_NAME,
+                                         source_hash[:2], source_hash[2:4], f"{source_hash}{ext}"))
+
+
+def file_hash_of(path):
+    """文件内容的 SHA-256：仓库文件名即哈希，其他路径读文件计算"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if HASH_NAME.fullmatch(stem):
+        return stem
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def tmp_dir():
+    path = os.path.join(Config.FILE_REPO_FOLDER, TMP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class HashingUpload(io.RawIOBase):
+    """
+    边写边算 SHA-256 的上传缓冲：不超过 UPLOAD_SPOOL_MAX_MEMORY 时留在内存，
+    超过后转存到仓库临时目录；commit() 原子移入目标路径，未提交的临时文件在 close() 时删除。
+    """
+
+    def __init__(self, max_memory=None):
+        super().__init__()
+        self.max_memory = Config.UPLOAD_SPOOL_MAX_MEMORY if max_memory is None else max_memory
+        self._file = io.BytesIO()
+        self._path = None
+        self._sha256 = hashlib.sha256()
+        self._hashed = 0  # 已计入哈希的字节数（只追加写入时等于文件大小）
+        self.size = 0
+
+    # ---- 文件接口（供 werkzeug 表单解析与 FileStorage 使用） ----
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        pos = self._file.tell()
+        if pos == self._hashed:
+            self._sha256.update(data)
+            self._hashed += len(data)
+        else:
+            self._hashed = -1  # 非追加写入，提交时重新计算
+        if self._path is None and pos + len(data) > self.max_memory:
+            self._rollover()
+        written = self._file.write(data)
+        self.size = max(self.size, self._file.tell())
+        return written
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        data = self._file.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+        super().close()
+
+    # ---- 仓库接口 ----
+
+    def hexdigest(self):
+        if self._hashed != self.size:
+            pos = self._file.tell()
+            self._file.seek(0)
+            self._sha256 = hashlib.sha256()
+            while chunk := self._file.read(1024 * 1024):
+                self._sha256.update(chunk)
+            self._hashed = self.size
+            self._file.seek(pos)
+        return self._sha256.hexdigest()
+
+    def commit(self, dest):
+        """
+        移入目标路径并关闭；目标已存在（内容相同）时丢弃临时文件
+        :return: 本次是否新写入了文件
+        """
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            self.close()
+            return False
+        if self._path is None:
+            self._rollover()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._path, dest)
+        self._path = None
+        self.close()
+        return True
+
+    def _rollover(self):
+        """内存缓冲转存到仓库临时目录"""
+        fd, path = tempfile.mkstemp(dir=tmp_dir(), suffix='.part')
+        disk = os.fdopen(fd, 'w+b')
+        pos = self._file.tell()
+        disk.write(self._file.getbuffer())
+        disk.seek(pos)
+        self._file, self._path = disk, path
+
+    @classmethod
+    def from_stream(cls, stream, chunk_size=1024 * 1024):
+        """从已有的文件流复制（非 multipart 上传、或流不是 HashingUpload 时使用）"""
+        upload = cls()
+        stream.seek(0)
+        while chunk := stream.read(chunk_size):
+            upload.write(chunk)
+        upload.seek(0)
+        return upload
+
+
+class HashingRequest(Request):
+    """上传文件在 multipart 解析时直接写入 HashingUpload"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUpload()
+
+
+def as_hashing_upload(file_obj):
+    """上传文件的 HashingUpload（经 HashingRequest 解析的直接复用，否则复制一遍）"""
+    stream = file_obj.stream
+    return stream if isinstance(stream, HashingUpload) else HashingUpload.from_stream(stream)
+
+
+def store_bytes(data, ext):
+    """把内存中的内容放入仓库，返回 (file_hash, physical_path)"""
+    upload = HashingUpload()
+    upload.write(data)
+    file_hash = upload.hexdigest()
+    dest = repo_path(file_hash, ext)
+    upload.commit(dest)
+    return file_hash, dest
+
+
+def migrate_flat_layout(db):
+    """
+    把旧版平铺在 FILE_REPO_FOLDER 根目录的文件迁入分片目录并更新 file_assets.physical_path
+    每 MIGRATE_BATCH_SIZE 个文件一批：先在新路径建硬链接（不支持时复制），提交这批新路径后再删除旧文件，
+    迁移过程中每条记录指向的文件始终存在（迁移在后台运行时不影响预览、下载和解析）
+    :return: {'moved', 'relinked', 'missing'}
+    """
+    report = {'moved': 0, 'relinked': 0, 'missing': 0}
+    updates, sources = [], []
+
+    def flush():
+        db.update_file_asset_paths(updates)
+        for source in sources:
+            try:
+                os.remove(source)
+            except FileNotFoundError:
+                pass
+        updates.clear()
+        sources.clear()
+
+    for file_id, file_hash, path in db.get_file_asset_locations():
+        if not path or not file_hash:
+            continue
+        ext = os.path.splitext(path.replace('\\', '/'))[1]
+        dest = repo_path(file_hash, ext)
+        if os.path.normcase(os.path.normpath(path)) == os.path.normcase(dest):
+            continue
+        # 只迁移平铺在仓库根目录下的文件（按文件名定位，兼容跨平台/部署目录变化后的旧路径）
+        source = os.path.join(Config.FILE_REPO_FOLDER, os.path.basename(path.replace('\\', '/')))
+        if os.path.exists(dest):
+            report['relinked'] += 1  # 内容相同的平铺副本在记录更新后删除
+        else:
+            if not os.path.exists(source):
+                report['missing'] += 0 if os.path.exists(path) else 1
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            try:
+                os.link(source, dest)
+            except OSError:
+                shutil.copy2(source, dest)
+            report['moved'] += 1
+        updates.append((dest, file_id))
+        if os.path.isfile(source):
+            sources.append(source)
+        if len(updates) >= MIGRATE_BATCH_SIZE:
+            flush()
+    flush()
+    return report
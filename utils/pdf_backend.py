@@ -0,0 +1,58 @@
+# utils/pdf_backend.py
+"""
+PDF 文本提取后端（PyMuPDF，未安装时退回 PyPDF2）
+提取子进程以 `python -m utils.pdf_backend <路径> <起始页> <结束页>` 运行本模块，把 [起始页, 结束页) 的文本以 JSON 数组
+写到标准输出；本模块不依赖 config / 数据库 / Flask，子进程启动时不会创建应用或连接。
+"""
+
+import json
+import sys
+
+
+def _load_backend():
+    try:
+        import pymupdf
+        return 'pymupdf', pymupdf
+    except ImportError:
+        pass
+    try:
+        import fitz  # PyMuPDF 旧包名
+        return 'pymupdf', fitz
+    except ImportError:
+        import PyPDF2
+        return 'pypdf2', PyPDF2
+
+
+BACKEND, _lib = _load_backend()
+
+
+def open_pdf(path):
+    return _lib.open(path) if BACKEND == 'pymupdf' else _lib.PdfReader(path)
+
+
+def close_pdf(doc):
+    if BACKEND == 'pymupdf':
+        doc.close()
+
+
+def page_count_of(doc):
+    return doc.page_count if BACKEND == 'pymupdf' else len(doc.pages)
+
+
+def extract_pages(doc, start, end):
+    if BACKEND == 'pymupdf':
+        return [doc[i].get_text('text') or '' for i in range(start, end)]
+    return [doc.pages[i].extract_text() or '' for i in range(start, end)]
+
+
+def extract_range(path, start, end):
+    """提取 [start, end) 页的文本"""
+    doc = open_pdf(path)
+    try:
+        return extract_pages(doc, start, end)
+    finally:
+        close_pdf(doc)
+
+
+if __name__ == '__main__':
+    json.dump(extract_range(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])), sys.stdout)
@@ -0,0 +1,114 @@
+# utils/pdf_text.py
+"""
+PDF 逐页文本提取
+提取后端见 utils.pdf_backend（PyMuPDF，未安装时退回 PyPDF2）。页数较多的 PDF 按页段分给提取子进程并行提取，
+结果按 (文件哈希, 页码) 缓存在 pdf_page_texts 表，再次解析时只提取缺失的页。
+iter_pdf_pages 按页序流式返回，供分块处理的调用方边提取边消费。
+"""
+
+import atexit
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from extensions import db
+from utils.file_store import file_hash_of
+from utils.pdf_backend import close_pdf, extract_pages, open_pdf, page_count_of
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def page_count(path):
+    """只读取页数（不提取文本）"""
+    doc = open_pdf(path)
+    try:
+        return page_count_of(doc)
+    finally:
+        close_pdf(doc)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    进程级提取池：线程池中每个任务启动一个 `python -m utils.pdf_backend` 子进程提取一个页段
+    不用 multiprocessing 进程池：fork 在多线程的 Web 进程中按需创建子进程，子进程可能继承其他线程持有的锁而死锁；
+    spawn/forkserver 的子进程会重新导入入口脚本（app.py 导入时即 create_app）。
+    子进程只导入 pdf_backend，不接触配置、数据库与 Flask
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=Config.PDF_EXTRACT_WORKERS, thread_name_prefix='pdf-extract')
+                atexit.register(_pool.shutdown, cancel_futures=True)
+    return _pool
+
+
+def _extract_in_subprocess(path, start, end):
+    proc = subprocess.run([sys.executable, '-m', 'utils.pdf_backend', os.path.abspath(path), str(start), str(end)],
+                          cwd=PROJECT_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          timeout=Config.PDF_EXTRACT_TIMEOUT, check=True)
+    return json.loads(proc.stdout)
+
+
+def _missing_ranges(missing, size):
+    """把缺失页码切成连续且不超过 size 页的段"""
+    ranges = []
+    for page in missing:
+        if ranges and ranges[-1][1] == page and ranges[-1][1] - ranges[-1][0] < size:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([page, page + 1])
+    return ranges
+
+
+def iter_pdf_pages(path, file_hash=None):
+    """
+    按页序逐页产出 (页码, 文本)
+    :param file_hash: 源文件 SHA-256（仓库文件可省略，从文件名得到）
+    """
+    file_hash = file_hash or file_hash_of(path)
+    cached = db.get_pdf_page_texts(file_hash)
+    doc = open_pdf(path)  # 页数及串行提取共用同一次打开
+    total = page_count_of(doc)
+    ranges = _missing_ranges([p for p in range(total) if p not in cached], Config.PDF_PAGES_PER_TASK)
+
+    futures = {}
+    if Config.PDF_EXTRACT_WORKERS > 1 and total >= Config.PDF_PARALLEL_MIN_PAGES and len(ranges) > 1:
+        pool = _get_pool()
+        futures = {start: pool.submit(_extract_in_subprocess, path, start, end) for start, end in ranges}
+
+    page = 0
+    try:
+        for start, end in ranges:
+            while page < start:
+                yield page, cached[page]
+                page += 1
+            try:
+                texts = futures[start].result() if start in futures else extract_pages(doc, start, end)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                # 子进程失败或超时：在当前线程重新提取该页段
+                logger.warning(f"[PdfText] subprocess extraction of pages {start}-{end} failed: {e}")
+                texts = extract_pages(doc, start, end)
+            db.save_pdf_page_texts(file_hash, list(zip(range(start, end), texts)))
+            for text in texts:
+                yield page, text
+                page += 1
+        while page < total:
+            yield page, cached[page]
+            page += 1
+    finally:
+        # 调用方提前停止消费时取消尚未开始的页段
+        for future in futures.values():
+            future.cancel()
+        close_pdf(doc)
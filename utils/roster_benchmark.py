@@ -0,0 +1,126 @@
+# utils/roster_benchmark.py
+"""
+学生名单解析基准测试
+生成多工作表的合成名单（每个工作表有标题行、表头行，学号为数值单元格），
+对读取、列识别与提取分别计时，输出与 utils/db_benchmark 相同格式、可在不同提交之间 diff 的 JSON 报告。
+
+用法:
+    python -m utils.roster_benchmark --out roster_before.json            # 默认 2 万行 / 4 个工作表
+    python -m utils.roster_benchmark --compare roster_before.json
+    python -m utils.roster_benchmark --rows 100000 --sheets 10
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_benchmark import DEFAULT_RUNS, chinese_name, compare, git_revision, timed  # noqa: E402
+
+HEADER = ['序号', '学号', '姓名', '性别', '手机', '邮箱']
+
+
+def roster_rows(rng, rows, sheets):
+    """{工作表名: [行, ...]}，学号全局唯一"""
+    per_sheet, number = rows // sheets, 0
+    result = {}
+    for s in range(sheets):
+        data = [[f'2023级计算机科学与技术{s + 1}班学生名单'], HEADER]
+        for i in range(per_sheet):
+            number += 1
+            data.append([i + 1, 2023100000 + number, chinese_name(rng), rng.choice('男女'),
+                         f'13{rng.randrange(10 ** 9):09d}', f's{number}@example.edu.cn'])
+        result[f'{s + 1}班'] = data
+    return result
+
+
+def write_xlsx(path, sheets):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        worksheet = workbook.create_sheet(name)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def write_csv(path, rows, encoding='gb18030'):
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def run_benchmarks(xlsx_path, csv_path, runs=DEFAULT_RUNS):
+    from services import roster_service
+
+    sheets = roster_service.load_sheets(xlsx_path)
+    texts = [roster_service._as_text(raw) for _, raw in sheets]
+    benches = {
+        'xlsx.load_sheets': lambda: roster_service.load_sheets(xlsx_path),
+        'xlsx.normalize': lambda: [roster_service._as_text(raw) for _, raw in sheets],
+        'xlsx.detect_extract': lambda: [s for t in texts for s in [roster_service.extract_sheet(t)] if s],
+        'xlsx.parse_roster': lambda: roster_service.parse_roster(xlsx_path, 'roster.xlsx')['students'],
+        'csv_gb18030.parse_roster': lambda: roster_service.parse_roster(csv_path, 'roster.csv')['students'],
+    }
+    return {name: timed(fn, runs) for name, fn in benches.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='学生名单解析基准测试')
+    parser.add_argument('--rows', type=int, default=20000, help='学生总数')
+    parser.add_argument('--sheets', type=int, default=4, help='工作表数')
+    parser.add_argument('--seed', type=int, default=20240901, help='随机种子（相同种子生成相同数据）')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--out', help='JSON 报告输出路径（默认打印到标准输出）')
+    parser.add_argument('--compare', help='基线 JSON 报告，median 变慢超过 --threshold 时返回非零')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='roster_bench_')
+    try:
+        sheets = roster_rows(rng, args.rows, args.sheets)
+        xlsx_path, csv_path = os.path.join(workdir, 'roster.xlsx'), os.path.join(workdir, 'roster.csv')
+        write_xlsx(xlsx_path, sheets)
+        write_csv(csv_path, [row for rows in sheets.values() for row in rows])
+        report = {
+            'meta': {
+                'rows': args.rows,
+                'sheets': args.sheets,
+                'seed': args.seed,
+                'git_revision': git_revision(),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'xlsx_size': os.path.getsize(xlsx_path),
+            },
+            'benchmarks': run_benchmarks(xlsx_path, csv_path, args.runs),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f'[Bench] regressions: {", ".join(regressions)}', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
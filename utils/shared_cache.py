@@ -0,0 +1,179 @@
+# utils/shared_cache.py
+"""
+进程级共享缓存
+所有请求/用户共享同一份缓存，取代写在 Flask session（签名 Cookie）里的缓存。
+后端由 Config.SHARED_CACHE_BACKEND 选择：
+    memory - 进程内字典（默认）
+    sqlite - 本地 SQLite 文件，多 worker 进程共享
+    redis  - Redis 兼容服务（需安装 redis 包，地址取 Config.SHARED_CACHE_URL）
+值须可 JSON 序列化。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+
+class MemoryCache:
+    """进程内缓存"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self):
+        """删除已过期条目，返回删除数"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._data.items() if expires_at < now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class SQLiteCache:
+    """基于本地 SQLite 文件的缓存，供多进程部署共享"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key        TEXT PRIMARY KEY,
+                value      TEXT,
+                expires_at REAL
+            )
+        ''')
+        conn.commit()
+
+    def _conn(self):
+        if not hasattr(self._local, 'connection'):
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.connection = conn
+        return self._local.connection
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires_at FROM cache_entries WHERE key=?", (key,)).fetchone()
+        if not row or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False), time.time() + ttl))
+        conn.commit()
+
+    def delete(self, *keys):
+        conn = self._conn()
+        conn.executemany("DELETE FROM cache_entries WHERE key=?", [(k,) for k in keys])
+        conn.commit()
+
+    def delete_prefix(self, prefix):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries")
+        conn.commit()
+
+    def purge_expired(self):
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+        return cursor.rowcount
+
+
+class RedisCache:
+    """Redis 兼容服务（Redis / KeyDB / Valkey 等）"""
+
+    def __init__(self, url, namespace='tas:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+
+    def get(self, key):
+        raw = self.client.get(self.namespace + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.namespace + key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.namespace + k for k in keys])
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def purge_expired(self):
+        # Redis 自行淘汰过期键
+        return 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """按配置创建（并复用）进程级缓存实例；redis 不可用时回退到内存缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = Config.SHARED_CACHE_BACKEND
+                if backend == 'sqlite':
+                    _cache = SQLiteCache(Config.SHARED_CACHE_PATH)
+                elif backend == 'redis':
+                    try:
+                        _cache = RedisCache(Config.SHARED_CACHE_URL)
+                    except ImportError:
+                        print("[Cache] redis 包未安装，回退到内存缓存")
+                        _cache = MemoryCache()
+                else:
+                    _cache = MemoryCache()
+    return _cache